@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# 日志追加路径基准测试
+#
+# 对比客户端去重（LRANGE最近N行 -> 比较 -> RPUSH -> PUBLISH）与服务端Lua脚本（EVALSHA一次调用）：
+#   1. 逐行 append_log 与批量 batch_append_logs 的吞吐（行/秒）
+#   2. 多个写入方同时追加同一行时，重复行被重复写入的数量（客户端读-改-写的竞争）
+#
+# 用法（需要可访问的Redis，默认 redis://localhost:6379/0）：
+#   cd apps/server/src && python ../benchmarks/bench_log_append.py --lines 20000
+
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from core.config import settings
+from utils.redis_manager import RedisManager
+
+BENCH_EVAL_ID = 990000001
+
+
+def make_lines(count: int):
+    # 约每8行出现一次与上一行相同的内容，覆盖去重分支
+    return [f"[bench] inference step {i - (i % 8 == 7)} dataset=demo_gsm8k rpm=12.5" for i in range(count)]
+
+
+def run_single(lines) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        RedisManager.append_log(BENCH_EVAL_ID, line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def run_batch(lines, batch_size: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(lines), batch_size):
+        RedisManager.batch_append_logs(BENCH_EVAL_ID, lines[i:i + batch_size])
+    return len(lines) / (time.perf_counter() - start)
+
+
+def run_concurrent(rounds: int, writers: int) -> int:
+    """每轮所有写入方同时追加同一行，返回超出轮数的行数（即去重竞争漏掉的重复行）"""
+    barrier = threading.Barrier(writers)
+
+    def writer():
+        for r in range(rounds):
+            barrier.wait()
+            RedisManager.append_log(BENCH_EVAL_ID, f"[bench] round {r} finished")
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(RedisManager.get_logs(BENCH_EVAL_ID)) - rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志追加路径基准测试")
+    parser.add_argument("--lines", type=int, default=20000, help="测试行数")
+    parser.add_argument("--batch-size", type=int, default=200, help="批量写入的批大小")
+    parser.add_argument("--writers", type=int, default=4, help="并发写入方数量")
+    args = parser.parse_args()
+
+    # 避免落盘干扰测量
+    settings.log_hot_tail_lines = args.lines * (args.writers + 1)
+    lines = make_lines(args.lines)
+    print(f"测试行数: {args.lines}，批大小 {args.batch_size}，并发写入方 {args.writers}，后端 {settings.log_backend}")
+    print(f"{'追加方式':<10}{'逐行(行/s)':>14}{'批量(行/s)':>14}{'并发重复行':>12}")
+
+    for mode in ("client", "script"):
+        settings.log_append_mode = mode
+        RedisManager.clear_logs(BENCH_EVAL_ID)
+        single_rate = run_single(lines[:max(args.lines // 4, 1)])
+        RedisManager.clear_logs(BENCH_EVAL_ID)
+        batch_rate = run_batch(lines, args.batch_size)
+        RedisManager.clear_logs(BENCH_EVAL_ID)
+        duplicates = run_concurrent(max(args.lines // 20, 1), args.writers)
+        RedisManager.clear_logs(BENCH_EVAL_ID)
+        print(f"{mode:<10}{single_rate:>14.0f}{batch_rate:>14.0f}{duplicates:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# 日志记录编解码基准测试
+#
+# 对比JSON（旧版格式）与紧凑格式：
+#   1. 编码/解码吞吐（行/秒），以及只提取日志文本（decode_text）的吞吐
+#   2. Redis列表与Stream中每百万行的内存占用（MEMORY USAGE，按实际写入行数折算）
+#
+# 用法（需要可访问的Redis，默认 redis://localhost:6379/0）：
+#   cd apps/server/src && python ../benchmarks/bench_log_codec.py --lines 200000
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils.redis_manager import RedisManager
+from utils.log_codec import get_codec, new_record, decode_text, encode_stream_fields
+
+SAMPLE_LINES = [
+    "[2024-05-01 10:00:00,000] [opencompass.openicl.icl_inferencer] [INFO] Starting inference process...",
+    "100%|██████████| 64/64 [00:12<00:00,  5.21it/s]",
+    "05/01 10:00:03 - OpenCompass - WARNING - Max Completion tokens for demo_model is 2048",
+    "Traceback (most recent call last): File \"run.py\", line 42, in <module>",
+    "dataset    version    metric    mode    demo_model",
+    "gsm8k    1d7fe4    accuracy    gen    57.62",
+]
+
+
+def make_lines(count: int):
+    rng = random.Random(0)
+    return [f"{rng.choice(SAMPLE_LINES)} #{i}" for i in range(count)]
+
+
+def throughput(func, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def memory_per_million(redis_client, key: str, lines: int) -> float:
+    usage = redis_client.memory_usage(key, samples=0) or 0
+    return usage / lines * 1_000_000 / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志记录编解码基准测试")
+    parser.add_argument("--lines", type=int, default=200000, help="测试行数")
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines)
+    redis_client = RedisManager.get_instance()
+    print(f"测试行数: {args.lines}，平均行长 {sum(map(len, lines)) / len(lines):.0f} 字符")
+    print(f"{'编码':<10}{'编码(万行/s)':>14}{'解码(万行/s)':>14}{'提取文本(万行/s)':>18}"
+          f"{'平均记录(B)':>14}{'列表(MB/百万行)':>18}{'Stream(MB/百万行)':>20}")
+
+    for name in ("json", "compact"):
+        codec = get_codec(name)
+        records = [new_record(line, i + 1 if codec.uses_seq else 0) for i, line in enumerate(lines)]
+        encoded = [codec.encode(record) for record in records]
+
+        encode_rate = throughput(codec.encode, records)
+        decode_rate = throughput(codec.decode, encoded)
+        text_rate = throughput(decode_text, encoded)
+        avg_size = sum(len(item.encode("utf-8")) for item in encoded) / len(encoded)
+
+        list_key = f"bench:codec:{name}:list"
+        stream_key = f"bench:codec:{name}:stream"
+        redis_client.delete(list_key, stream_key)
+        for start in range(0, len(encoded), 5000):
+            with redis_client.pipeline() as pipe:
+                pipe.rpush(list_key, *encoded[start:start + 5000])
+                for record in records[start:start + 5000]:
+                    pipe.xadd(stream_key, encode_stream_fields(codec, record))
+                pipe.execute()
+        list_mb = memory_per_million(redis_client, list_key, len(encoded))
+        stream_mb = memory_per_million(redis_client, stream_key, len(encoded))
+        redis_client.delete(list_key, stream_key)
+
+        print(f"{name:<10}{encode_rate / 1e4:>14.1f}{decode_rate / 1e4:>14.1f}{text_rate / 1e4:>18.1f}"
+              f"{avg_size:>14.1f}{list_mb:>18.1f}{stream_mb:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
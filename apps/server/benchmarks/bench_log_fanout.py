@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# 实时日志扇出基准测试
+#
+# 模拟一个API进程中大量同时打开的日志查看连接，对比：
+#   per-connection  每个连接一个同步PubSub，在事件循环中 get_message(timeout=0.1) 轮询（旧实现）
+#   shared          进程内一个异步PSUBSCRIBE订阅器，按任务ID分发到各连接的内存队列（LogBroadcaster），
+#                   连接按batch协议把50ms内的消息合并为一帧
+# 发布方在独立进程中以固定速率向各任务的日志通道PUBLISH，统计API进程的：
+#   事件循环延迟   探针协程每10ms醒来一次，记录实际唤醒比预期晚多少（p50/p99/max）
+#   CPU时间        进程CPU时间（用户态+内核态）
+#   送达消息数     所有连接收到的消息总数
+# --stalled N 额外模拟N个完全不读取的客户端（shared方式），统计其队列积压与丢弃的消息数，
+# 用于验证每连接队列有上限时API进程内存不随慢速客户端增长。
+#
+# 用法（需要可访问的Redis，默认 redis://localhost:6379/0）：
+#   cd apps/server/src && python ../benchmarks/bench_log_fanout.py --viewers 500 --evals 20 --rate 200
+#   cd apps/server/src && python ../benchmarks/bench_log_fanout.py --modes shared --stalled 2000 --rate 2000
+
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils.redis_manager import RedisManager
+from utils.log_codec import decode_text
+from services.log_broadcaster import LogBroadcaster
+
+BENCH_EVAL_BASE = 990000200
+
+
+class CountingWebSocket:
+    """只计数的WebSocket替身"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def send_text(self, text: str):
+        self.received += 1
+
+    async def send_lines(self, lines: list):
+        self.received += len(lines)
+
+
+def publisher(evals: int, rate: int, duration: float):
+    """按固定总速率轮流向各任务的日志通道发布消息"""
+    redis_client = RedisManager.get_instance()
+    interval = 1.0 / rate
+    deadline = time.monotonic() + duration
+    next_at = time.monotonic()
+    i = 0
+    while time.monotonic() < deadline:
+        eval_id = BENCH_EVAL_BASE + i % evals
+        redis_client.publish(RedisManager.get_log_channel(eval_id), f"[bench] eval {eval_id} inference step {i}")
+        i += 1
+        next_at += interval
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+async def per_connection_viewer(websocket: CountingWebSocket, eval_id: int, stop: asyncio.Event):
+    """旧实现：每个连接一个同步PubSub并轮询"""
+    pubsub = RedisManager.get_instance().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(RedisManager.get_log_channel(eval_id))
+    try:
+        while not stop.is_set():
+            message = pubsub.get_message(timeout=0.1)
+            if message and message["type"] == "message":
+                await websocket.send_text(decode_text(message["data"]))
+            await asyncio.sleep(0.01)
+    finally:
+        pubsub.close()
+
+
+async def shared_viewer(broadcaster: LogBroadcaster, websocket: CountingWebSocket, eval_id: int, stop: asyncio.Event):
+    """新实现：等待共享订阅器投递到本连接队列的消息，按batch协议合并为帧"""
+    subscription = await broadcaster.subscribe(eval_id)
+    try:
+        while not stop.is_set():
+            try:
+                batch = await asyncio.wait_for(subscription.get_batch(500, 0.05), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            await websocket.send_lines([decode_text(data) for data in batch])
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def lag_probe(samples: list, stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - expected)
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run_mode(mode: str, viewers: int, evals: int, rate: int, duration: float, stalled: int = 0):
+    stop = asyncio.Event()
+    websockets = [CountingWebSocket() for _ in range(viewers)]
+    broadcaster = LogBroadcaster()
+    RedisManager._async_redis_instance = None
+    # 完全不读取的客户端：只订阅，从不消费队列
+    stalled_subscriptions = [await broadcaster.subscribe(BENCH_EVAL_BASE + i % evals) for i in range(stalled)] if mode == "shared" else []
+
+    if mode == "shared":
+        tasks = [asyncio.create_task(shared_viewer(broadcaster, ws, BENCH_EVAL_BASE + i % evals, stop))
+                 for i, ws in enumerate(websockets)]
+    else:
+        tasks = [asyncio.create_task(per_connection_viewer(ws, BENCH_EVAL_BASE + i % evals, stop))
+                 for i, ws in enumerate(websockets)]
+    # 等待订阅建立
+    await asyncio.sleep(1.0)
+
+    samples = []
+    probe = asyncio.create_task(lag_probe(samples, stop))
+    process = multiprocessing.Process(target=publisher, args=(evals, rate, duration))
+    cpu_before = time.process_time()
+    process.start()
+    await asyncio.get_running_loop().run_in_executor(None, process.join)
+    # 留出时间消化已发布的消息
+    await asyncio.sleep(0.5)
+    cpu_used = time.process_time() - cpu_before
+    metrics = broadcaster.get_metrics()
+
+    stop.set()
+    await asyncio.gather(probe, *tasks, return_exceptions=True)
+    await broadcaster.stop()
+    return {
+        "lag_p50": percentile(samples, 0.5) * 1000,
+        "lag_p99": percentile(samples, 0.99) * 1000,
+        "lag_max": max(samples, default=0.0) * 1000,
+        "cpu": cpu_used,
+        "delivered": sum(ws.received for ws in websockets),
+        "expected": int(rate * duration) * viewers // evals,
+        "stalled_backlog": sum(sub.depth() for sub in stalled_subscriptions),
+        "dropped": metrics["messages_dropped"],
+        "slow_disconnects": metrics["slow_disconnects"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实时日志扇出基准测试")
+    parser.add_argument("--viewers", type=int, default=500, help="同时打开的日志查看连接数")
+    parser.add_argument("--evals", type=int, default=20, help="被查看的评估任务数")
+    parser.add_argument("--rate", type=int, default=200, help="所有任务合计每秒发布的日志行数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种方式的测量时长（秒）")
+    parser.add_argument("--modes", default="per-connection,shared", help="要测试的方式，逗号分隔")
+    parser.add_argument("--stalled", type=int, default=0, help="额外的不读取客户端数（仅shared方式）")
+    args = parser.parse_args()
+
+    print(f"查看连接: {args.viewers}，任务数 {args.evals}，发布速率 {args.rate} 行/s，时长 {args.duration}s")
+    print(f"{'方式':<16}{'延迟p50(ms)':>12}{'延迟p99(ms)':>12}{'延迟max(ms)':>12}{'CPU(s)':>9}{'CPU(μs/条)':>12}{'送达/应送达':>18}")
+    for mode in args.modes.split(","):
+        result = asyncio.run(run_mode(mode, args.viewers, args.evals, args.rate, args.duration, args.stalled))
+        delivered = f"{result['delivered']}/{result['expected']}"
+        per_message = result["cpu"] / max(result["delivered"], 1) * 1e6
+        print(f"{mode:<16}{result['lag_p50']:>12.1f}{result['lag_p99']:>12.1f}{result['lag_max']:>12.1f}"
+              f"{result['cpu']:>9.2f}{per_message:>12.1f}{delivered:>18}")
+        if args.stalled and mode == "shared":
+            print(f"  不读取客户端 {args.stalled} 个：队列积压 {result['stalled_backlog']} 条，丢弃 {result['dropped']} 条，"
+                  f"断开 {result['slow_disconnects']} 个，进程峰值RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# 无人观看任务的日志发布开销基准测试
+#
+# 模拟多个并发运行、没有任何WebSocket日志连接的评估任务，对比：
+#   always      每行日志都PUBLISH（旧行为）
+#   subscribed  只在有在线订阅者时PUBLISH（订阅者在线状态保存在 eval:{id}:subscribers）
+# 统计Redis服务端CPU时间（INFO cpu 的 used_cpu_sys + used_cpu_user 增量）与写入吞吐。
+# 另有一个进程模式订阅（PSUBSCRIBE eval:*:logs）的监听者，模拟日志通道上的模式匹配开销。
+#
+# 用法（需要可访问的Redis，默认 redis://localhost:6379/0）：
+#   cd apps/server/src && python ../benchmarks/bench_log_publish.py --evals 20 --lines 20000
+
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from core.config import settings
+from utils.redis_manager import RedisManager
+
+BENCH_EVAL_BASE = 990000100
+
+
+def redis_cpu_seconds(redis_client) -> float:
+    info = redis_client.info("cpu")
+    return float(info["used_cpu_sys"]) + float(info["used_cpu_user"])
+
+
+def run_evaluation(eval_id: int, lines: int, batch_size: int):
+    """模拟一个评估任务的日志投递（与LogShipper相同的批量写入）"""
+    for start in range(0, lines, batch_size):
+        batch = [f"[bench] eval {eval_id} inference step {i} dataset=demo_gsm8k" for i in range(start, min(start + batch_size, lines))]
+        RedisManager.batch_append_logs(eval_id, batch)
+
+
+def run_round(evals: int, lines: int, batch_size: int):
+    redis_client = RedisManager.get_instance()
+    for i in range(evals):
+        RedisManager.clear_logs(BENCH_EVAL_BASE + i)
+
+    cpu_before = redis_cpu_seconds(redis_client)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_evaluation, args=(BENCH_EVAL_BASE + i, lines, batch_size)) for i in range(evals)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu_used = redis_cpu_seconds(redis_client) - cpu_before
+
+    for i in range(evals):
+        RedisManager.clear_logs(BENCH_EVAL_BASE + i)
+    return cpu_used, evals * lines / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无人观看任务的日志发布开销基准测试")
+    parser.add_argument("--evals", type=int, default=20, help="并发评估任务数")
+    parser.add_argument("--lines", type=int, default=20000, help="每个任务的日志行数")
+    parser.add_argument("--batch-size", type=int, default=200, help="批量写入的批大小")
+    args = parser.parse_args()
+
+    # 避免落盘干扰测量
+    settings.log_hot_tail_lines = args.lines * 2
+
+    # 模式订阅者：每次PUBLISH都要与所有模式匹配
+    pubsub = RedisManager.get_instance().pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe("eval:*:logs")
+    stop = threading.Event()
+
+    def drain():
+        while not stop.is_set():
+            pubsub.get_message(timeout=0.1)
+
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+
+    print(f"并发任务: {args.evals}，每任务 {args.lines} 行，批大小 {args.batch_size}，"
+          f"追加方式 {settings.log_append_mode}，后端 {settings.log_backend}")
+    print(f"{'发布方式':<12}{'Redis CPU(s)':>14}{'CPU(μs/行)':>14}{'吞吐(行/s)':>14}")
+    for mode in ("always", "subscribed"):
+        settings.log_publish_mode = mode
+        cpu_used, rate = run_round(args.evals, args.lines, args.batch_size)
+        per_line = cpu_used / (args.evals * args.lines) * 1e6
+        print(f"{mode:<12}{cpu_used:>14.2f}{per_line:>14.2f}{rate:>14.0f}")
+
+    stop.set()
+    drainer.join()
+    pubsub.close()
+
+
+if __name__ == "__main__":
+    main()
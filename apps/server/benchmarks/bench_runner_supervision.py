@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# RunnerBase 监督循环基准测试
+#
+# 对比旧实现（主线程阻塞readline、每行检查一次Redis终止标志）与
+# 新实现（读取线程 + 有界队列 + 独立时钟的监督循环）：
+#   1. 每行日志的处理开销（扣除直接读取子进程输出的基线耗时）
+#   2. 子进程静默期间的终止响应延迟（旧版写状态中的终止标志，新版经控制通道推送terminate指令）
+#
+# 用法（需要可访问的Redis，默认 redis://localhost:6379/0）：
+#   cd apps/server/src && python ../benchmarks/bench_runner_supervision.py --lines 20000
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils.redis_manager import RedisManager
+from tasks.runners.runner_base import RunnerBase
+
+CHATTY_SCRIPT = """
+import sys
+for i in range(int(sys.argv[1])):
+    print(f"[bench] inference step {i} rpm=12.5 dataset=demo_gsm8k", flush=False)
+"""
+
+SILENT_SCRIPT = """
+import sys, time
+for i in range(3):
+    print(f"[bench] warmup {i}", flush=True)
+time.sleep(float(sys.argv[1]))
+"""
+
+
+class LegacyRunner(RunnerBase):
+    """旧版监督逻辑：主线程阻塞读取，每读一行检查一次终止标志"""
+
+    def run_sync(self, command: str) -> int:
+        self.process = subprocess.Popen(
+            command.split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=0, cwd=self.working_dir
+        )
+        try:
+            while self.process.poll() is None:
+                if self.is_task_terminated():
+                    self.terminate()
+                    self.return_code = 143
+                    return self.return_code
+                line = self.process.stdout.readline()
+                if not line:
+                    break
+                cleaned_line = line.strip()
+                self.log_handler.process_line(cleaned_line)
+                self._update_log(cleaned_line)
+                print(f"OpenCompass输出: {cleaned_line}")
+            self.return_code = self.process.wait()
+            return self.return_code
+        finally:
+            self.log_handler.close()
+
+
+def write_script(tmp_dir: Path, name: str, content: str) -> Path:
+    path = tmp_dir / name
+    path.write_text(content)
+    return path
+
+
+def baseline_read(command: str) -> float:
+    """直接读取子进程全部输出的耗时（不做任何处理）"""
+    start = time.perf_counter()
+    process = subprocess.Popen(command.split(), stdout=subprocess.PIPE, text=True, bufsize=0)
+    for _ in iter(process.stdout.readline, ''):
+        pass
+    process.wait()
+    return time.perf_counter() - start
+
+
+def measure_per_line(runner_cls, eval_id: int, work_dir: Path, command: str, lines: int, baseline: float) -> float:
+    RedisManager.clear_logs(eval_id)
+    RedisManager.update_task_status(eval_id, {"status": "running"})
+    runner = runner_cls(eval_id=eval_id, working_dir=work_dir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        runner.run_sync(command)
+        elapsed = time.perf_counter() - start
+    return max(elapsed - baseline, 0) / lines * 1e6
+
+
+def measure_cancellation(runner_cls, eval_id: int, work_dir: Path, command: str, delay: float, send_terminate) -> float:
+    RedisManager.clear_logs(eval_id)
+    RedisManager.update_task_status(eval_id, {"status": "running"})
+    runner = runner_cls(eval_id=eval_id, working_dir=work_dir)
+    runner.terminate_grace_seconds = 0
+    flagged_at = {}
+
+    def set_flag():
+        time.sleep(delay)
+        flagged_at["t"] = time.perf_counter()
+        send_terminate(eval_id)
+
+    threading.Thread(target=set_flag, daemon=True).start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        runner.run_sync(command)
+        finished = time.perf_counter()
+    runner.terminate()
+    return (finished - flagged_at["t"]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RunnerBase 监督循环基准测试")
+    parser.add_argument("--lines", type=int, default=20000, help="吞吐测试输出的日志行数")
+    parser.add_argument("--silent-seconds", type=float, default=10.0, help="取消测试中子进程静默的秒数")
+    parser.add_argument("--eval-id", type=int, default=990001, help="测试使用的评估任务ID")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        chatty = f"{sys.executable} {write_script(tmp_dir, 'chatty.py', CHATTY_SCRIPT)} {args.lines}"
+        silent = f"{sys.executable} {write_script(tmp_dir, 'silent.py', SILENT_SCRIPT)} {args.silent_seconds}"
+
+        baseline = baseline_read(chatty)
+        print(f"基线：直接读取 {args.lines} 行耗时 {baseline * 1000:.1f} ms")
+        print(f"{'实现':<10}{'每行开销(us)':>16}{'取消延迟(ms)':>16}")
+        cases = (
+            ("旧版", LegacyRunner, lambda eval_id: RedisManager.update_task_status(eval_id, {"terminate_flag": True})),
+            ("新版", RunnerBase, lambda eval_id: RedisManager.send_control_command(eval_id, "terminate")),
+        )
+        for name, runner_cls, send_terminate in cases:
+            per_line = measure_per_line(runner_cls, args.eval_id, tmp_dir, chatty, args.lines, baseline)
+            cancel = measure_cancellation(runner_cls, args.eval_id, tmp_dir, silent, 1.0, send_terminate)
+            print(f"{name:<10}{per_line:>16.1f}{cancel:>16.1f}")
+
+        RedisManager.clear_logs(args.eval_id)
+        RedisManager.get_instance().delete(RedisManager.get_status_key(args.eval_id),
+                                           RedisManager.get_control_key(args.eval_id))
+
+
+if __name__ == "__main__":
+    main()
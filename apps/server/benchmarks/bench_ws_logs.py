@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# WebSocket实时日志压测工具
+#
+# 在子进程中以uvicorn启动FastAPI应用（连接本地Redis），然后：
+#   1. 发布进程：模拟N个评估任务，每个任务按固定速率通过 RedisManager.append_log 写入日志，
+#      每行日志携带写入时刻的时间戳
+#   2. 客户端进程：打开M个WebSocket连接（均匀分配到各任务）订阅 /api/v1/evaluations/{id}/ws_logs，
+#      收到日志后用当前时刻减去行内时间戳得到端到端投递延迟
+#   3. 采样API进程的CPU与内存（psutil）
+# 汇总投递延迟分位数、投递吞吐、送达率、API进程CPU与峰值RSS，便于比较 WebSocketLogService 的改动。
+#
+# 用法（需要可访问的Redis，默认 redis://localhost:6379/0；需要uvicorn、websockets、psutil）：
+#   cd apps/server/src && python ../benchmarks/bench_ws_logs.py --evals 10 --rate 50 --clients 200
+#   cd apps/server/src && python ../benchmarks/bench_ws_logs.py --clients 1000 --client-procs 4 --framing batch --json result.json
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import subprocess
+import multiprocessing
+import urllib.request
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+import psutil
+import websockets
+
+from core.config import settings
+from utils.redis_manager import RedisManager
+
+BENCH_EVAL_BASE = 990000500
+LINE_PREFIX = "[loadtest]"
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+# ------------------------------------------------------------------
+# API进程
+# ------------------------------------------------------------------
+
+def start_server(port: int, env_overrides: dict) -> subprocess.Popen:
+    """以子进程启动uvicorn，等待健康检查通过"""
+    env = os.environ.copy()
+    env.update(env_overrides)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--ws-max-queue", "1024"],
+        cwd=str(SRC_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"API进程启动失败，退出码 {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/healthcheck", timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("等待API进程启动超时")
+
+
+class ProcessSampler(threading.Thread):
+    """定期采样进程的CPU时间与RSS"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.peak_rss = 0
+        self.rss_samples = []
+
+    def cpu_seconds(self) -> float:
+        times = self.process.cpu_times()
+        return times.user + times.system
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                rss = self.process.memory_info().rss
+            except psutil.Error:
+                break
+            self.peak_rss = max(self.peak_rss, rss)
+            self.rss_samples.append(rss)
+            self.stop_event.wait(self.interval)
+
+
+# ------------------------------------------------------------------
+# 发布方：模拟评估任务写日志
+# ------------------------------------------------------------------
+
+def emit_logs(eval_ids: list, rate: float, duration: float, ready, start):
+    """每个任务一个线程，按固定速率逐行 append_log，行内携带写入时间戳"""
+    for eval_id in eval_ids:
+        RedisManager.clear_logs(eval_id)
+    ready.set()
+    start.wait()
+
+    counts = {}
+
+    def run(eval_id: int):
+        interval = 1.0 / rate
+        next_at = time.monotonic()
+        deadline = next_at + duration
+        seq = 0
+        while time.monotonic() < deadline:
+            RedisManager.append_log(eval_id, f"{LINE_PREFIX} eval={eval_id} seq={seq} ts={time.time():.6f} "
+                                             f"inference step {seq} dataset=demo_gsm8k")
+            seq += 1
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        counts[eval_id] = seq
+
+    threads = [threading.Thread(target=run, args=(eval_id,)) for eval_id in eval_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def emitter_process(eval_ids, rate, duration, ready, start, result_queue):
+    result_queue.put(emit_logs(eval_ids, rate, duration, ready, start))
+
+
+# ------------------------------------------------------------------
+# 客户端：WebSocket日志查看者
+# ------------------------------------------------------------------
+
+def extract_lines(message: str):
+    """从一帧中取出日志行（兼容line与batch两种分帧协议）"""
+    if message.startswith("{"):
+        try:
+            frame = json.loads(message)
+        except ValueError:
+            return [message]
+        return frame.get("lines") or []
+    return [message]
+
+
+async def run_viewer(port: int, eval_id: int, framing: str, stop: asyncio.Event, stats: dict, handshake: asyncio.Semaphore):
+    url = f"ws://127.0.0.1:{port}/api/v1/evaluations/{eval_id}/ws_logs?framing={framing}"
+    try:
+        async with handshake:
+            connection = await websockets.connect(url, max_size=None, open_timeout=30, ping_interval=None)
+    except Exception:
+        stats["connect_errors"] += 1
+        return
+    stats["connected"] += 1
+    connected_at = time.time()
+    try:
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(connection.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            now = time.time()
+            stats["frames"] += 1
+            for line in extract_lines(message):
+                if not line.startswith(LINE_PREFIX):
+                    continue
+                ts_at = line.find(" ts=")
+                if ts_at < 0:
+                    continue
+                sent_at = float(line[ts_at + 4:line.index(" ", ts_at + 4)])
+                # 连接前写入的行作为历史日志补发，不计入实时投递延迟
+                if sent_at < connected_at:
+                    stats["history_lines"] += 1
+                    continue
+                stats["lines"] += 1
+                stats["latencies"].append(now - sent_at)
+    except websockets.ConnectionClosed:
+        stats["closed_by_server"] += 1
+    finally:
+        await connection.close()
+
+
+async def run_viewers(port: int, assignments: list, framing: str, duration: float, ready, start) -> dict:
+    stats = {"connected": 0, "connect_errors": 0, "closed_by_server": 0, "frames": 0,
+             "lines": 0, "history_lines": 0, "latencies": []}
+    stop = asyncio.Event()
+    handshake = asyncio.Semaphore(64)
+    tasks = [asyncio.create_task(run_viewer(port, eval_id, framing, stop, stats, handshake)) for eval_id in assignments]
+    # 等待全部连接建立后再通知开始发布
+    while stats["connected"] + stats["connect_errors"] < len(assignments):
+        await asyncio.sleep(0.1)
+    ready.set()
+    await asyncio.get_running_loop().run_in_executor(None, start.wait)
+    # 发布结束后留出时间接收在途日志
+    await asyncio.sleep(duration + 2.0)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+def client_process(port, assignments, framing, duration, ready, start, result_queue):
+    result_queue.put(asyncio.run(run_viewers(port, assignments, framing, duration, ready, start)))
+
+
+# ------------------------------------------------------------------
+# 主流程
+# ------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket实时日志压测工具")
+    parser.add_argument("--evals", type=int, default=10, help="同时输出日志的评估任务数")
+    parser.add_argument("--rate", type=float, default=50, help="每个任务每秒写入的日志行数")
+    parser.add_argument("--clients", type=int, default=100, help="WebSocket日志查看连接总数（均匀分配到各任务）")
+    parser.add_argument("--client-procs", type=int, default=1, help="运行客户端的进程数，连接数较多时避免客户端成为瓶颈")
+    parser.add_argument("--duration", type=float, default=20.0, help="发布日志的时长（秒）")
+    parser.add_argument("--framing", choices=("line", "batch"), default="line", help="ws_logs分帧协议")
+    parser.add_argument("--port", type=int, default=18700, help="API进程监听端口")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="传给API进程的环境变量（可重复），如 LOG_BACKEND=stream")
+    parser.add_argument("--json", help="把结果另存为JSON文件")
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    eval_ids = [BENCH_EVAL_BASE + i for i in range(args.evals)]
+    assignments = [eval_ids[i % args.evals] for i in range(args.clients)]
+    shards = [assignments[i::args.client_procs] for i in range(args.client_procs)]
+
+    print(f"任务: {args.evals}，每任务 {args.rate:g} 行/s，查看连接: {args.clients}（{args.client_procs}个客户端进程），"
+          f"时长 {args.duration:g}s，分帧 {args.framing}，后端 {env_overrides.get('LOG_BACKEND', settings.log_backend)}")
+
+    server = start_server(args.port, env_overrides)
+    sampler = ProcessSampler(server.pid)
+    sampler.start()
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    try:
+        emitter_ready = context.Event()
+        emitter = context.Process(target=emitter_process, args=(eval_ids, args.rate, args.duration, emitter_ready, start, results))
+        emitter.start()
+        emitter_ready.wait()
+
+        client_ready = [context.Event() for _ in shards]
+        clients = [context.Process(target=client_process, args=(args.port, shard, args.framing, args.duration, ready, start, results))
+                   for shard, ready in zip(shards, client_ready)]
+        for client in clients:
+            client.start()
+        for ready in client_ready:
+            ready.wait()
+
+        idle_rss = sampler.process.memory_info().rss
+        cpu_before = sampler.cpu_seconds()
+        started_at = time.monotonic()
+        start.set()
+        # 先取结果再join：子进程要等队列中的数据被取走后才能退出
+        collected = [results.get() for _ in range(1 + len(clients))]
+        cpu_used = sampler.cpu_seconds() - cpu_before
+        elapsed = time.monotonic() - started_at
+        for process in [emitter, *clients]:
+            process.join()
+    finally:
+        sampler.stop_event.set()
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        for eval_id in eval_ids:
+            RedisManager.clear_logs(eval_id)
+
+    emitted = next(item for item in collected if "latencies" not in item)
+    viewer_stats = [item for item in collected if "latencies" in item]
+    latencies = [latency for stats in viewer_stats for latency in stats["latencies"]]
+    delivered = sum(stats["lines"] for stats in viewer_stats)
+    expected = sum(emitted.get(eval_id, 0) for eval_id in assignments)
+
+    report = {
+        "evals": args.evals,
+        "rate_per_eval": args.rate,
+        "clients": args.clients,
+        "framing": args.framing,
+        "env": env_overrides,
+        "connected": sum(stats["connected"] for stats in viewer_stats),
+        "connect_errors": sum(stats["connect_errors"] for stats in viewer_stats),
+        "closed_by_server": sum(stats["closed_by_server"] for stats in viewer_stats),
+        "lines_emitted": sum(emitted.values()),
+        "lines_expected": expected,
+        "lines_delivered": delivered,
+        "delivery_ratio": delivered / expected if expected else 0.0,
+        "frames": sum(stats["frames"] for stats in viewer_stats),
+        "throughput_lines_per_s": delivered / args.duration,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5) * 1000,
+            "p90": percentile(latencies, 0.9) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+        },
+        "server_cpu_seconds": cpu_used,
+        "server_cpu_percent": cpu_used / elapsed * 100 if elapsed else 0.0,
+        "server_rss_idle_mb": idle_rss / 2 ** 20,
+        "server_rss_peak_mb": sampler.peak_rss / 2 ** 20,
+    }
+
+    latency = report["latency_ms"]
+    print(f"连接: {report['connected']}/{args.clients}（失败 {report['connect_errors']}，被服务端断开 {report['closed_by_server']}）")
+    print(f"日志: 写入 {report['lines_emitted']} 行，应送达 {expected} 行，实际送达 {delivered} 行"
+          f"（{report['delivery_ratio'] * 100:.1f}%），{report['frames']} 帧，吞吐 {report['throughput_lines_per_s']:.0f} 行/s")
+    print(f"投递延迟(ms): p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}  p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+    print(f"API进程: CPU {cpu_used:.2f}s（{report['server_cpu_percent']:.0f}%），"
+          f"RSS 空载 {report['server_rss_idle_mb']:.0f} MiB / 峰值 {report['server_rss_peak_mb']:.0f} MiB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,26 +3,47 @@ from models.user import User
 from sqlalchemy.orm import Session
 from typing import Dict, Any, List, Optional
 from api.deps import get_db, get_current_user
-from schemas.eval import EvaluationCreate, EvaluationResponse, EvaluationStatusResponse
+from schemas.eval import EvaluationCreate, EvaluationResponse, EvaluationStatusResponse, LogQueryParams, LogResponse
 from services.eval_service import EvaluationService
 from services.rlog_service import WebSocketLogService
-from fastapi import APIRouter, HTTPException, status, Depends, Query, WebSocket
-from fastapi.responses import FileResponse
+from services.log_events_service import LogEventStreamService
+from services.log_broadcaster import log_broadcaster
+from services.multiplex_ws_service import MultiplexWebSocketService
+from utils.redis_manager import RedisManager
+from tasks.task_dispatcher import task_dispatcher
+from services.evaluation.result_cache import iter_cache_entries, invalidate_cache
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Header, WebSocket
+from fastapi.responses import FileResponse, StreamingResponse
 
 
 router = APIRouter()
 eval_service = EvaluationService()
 websocket_log_service = WebSocketLogService()
+log_event_service = LogEventStreamService()
+multiplex_ws_service = MultiplexWebSocketService()
 
 @router.websocket("/evaluations/{eval_id}/ws_logs")
-async def websocket_logs(websocket: WebSocket, eval_id: int):
+async def websocket_logs(websocket: WebSocket, eval_id: int, since: Optional[str] = None, framing: str = "line"):
     """通过WebSocket提供实时日志
     
     Args:
         websocket: WebSocket连接
         eval_id: 评估任务ID
+        since: 日志游标，重连时只推送该游标之后的日志
+        framing: 分帧协议，line（每行一个文本帧）或batch（历史日志一帧、实时日志按窗口合并，带行序号）
     """
-    await websocket_log_service.handle_websocket_logs(websocket, eval_id)
+    await websocket_log_service.handle_websocket_logs(websocket, eval_id, since, framing)
+
+@router.websocket("/ws")
+async def websocket_multiplex(websocket: WebSocket):
+    """多路复用WebSocket：一个连接订阅多个评估任务的状态、进度、结果与日志
+    
+    协议见 MultiplexWebSocketService。
+    
+    Args:
+        websocket: WebSocket连接
+    """
+    await multiplex_ws_service.handle_connection(websocket)
 
 @router.post("/evaluations", 
              response_model=EvaluationResponse,
@@ -122,37 +143,252 @@ def get_evaluation(eval_id: int, db: Session = Depends(get_db)):
         )
 
 @router.get("/evaluations/{eval_id}/logs", response_model=List[str])
-def get_logs(eval_id: int, lines: Optional[int] = Query(50, description="获取的日志行数")):
+def get_logs(
+    eval_id: int,
+    lines: Optional[int] = Query(50, description="获取的日志行数"),
+    since: Optional[str] = Query(None, description="日志游标，只返回该游标之后的日志")
+):
     """获取评估任务的实时日志
     
     Args:
         eval_id: 评估任务ID
         lines: 要获取的日志行数，默认50行
+        since: 日志游标，指定时从游标之后顺序返回
         
     Returns:
         List[str]: 日志行列表
     """
     try:
-        return eval_service.get_evaluation_logs(eval_id, lines)
+        return eval_service.get_evaluation_logs(eval_id, lines, since)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取评估任务日志失败: {str(e)}"
         )
 
+@router.get("/evaluations/{eval_id}/logs/window", response_model=LogResponse)
+def get_log_window(
+    eval_id: int,
+    params: LogQueryParams = Depends()
+):
+    """按行号窗口分页获取评估任务的日志，用于日志查看器的虚拟滚动
+    
+    Args:
+        eval_id: 评估任务ID
+        params: 窗口参数，返回 [from_line, from_line+lines) 区间的日志；
+            reverse为True时from_line表示距末尾的行数
+        
+    Returns:
+        LogResponse: 窗口内的日志、窗口首行行号、总行数及是否有更多日志
+    """
+    try:
+        return eval_service.get_evaluation_log_window(eval_id, params.from_line, params.lines, params.reverse)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取评估任务日志失败: {str(e)}"
+        )
+
+@router.get("/evaluations/{eval_id}/logs/download")
+def download_logs(
+    eval_id: int,
+    compress: bool = Query(False, alias="gzip", description="是否以gzip格式下载"),
+    source: str = Query("auto", pattern="^(auto|file|store)$", description="日志来源：auto、file（日志文件）或store（日志存储）")
+):
+    """流式下载评估任务的完整日志
+    
+    内容分块输出，API进程的内存占用与日志大小无关。
+    
+    Args:
+        eval_id: 评估任务ID
+        compress: 是否以gzip格式下载
+        source: 日志来源
+        
+    Returns:
+        StreamingResponse: 纯文本或gzip格式的日志流
+    """
+    try:
+        blocks, filename = eval_service.stream_evaluation_logs(eval_id, compress, source)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"下载评估任务日志失败: {str(e)}"
+        )
+    if blocks is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"评估任务 {eval_id} 的日志文件不存在"
+        )
+    
+    return StreamingResponse(
+        blocks,
+        media_type="application/gzip" if compress else "text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/evaluations/{eval_id}/events")
+async def stream_events(
+    eval_id: int,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    since: Optional[str] = Query(None, description="日志游标，与Last-Event-ID等价，供无法设置请求头的客户端使用"),
+    lines: int = Query(200, ge=0, le=5000, description="首次连接时发送的历史日志行数")
+):
+    """以Server-Sent Events推送评估任务的日志与状态变化
+    
+    每条日志事件的ID为日志游标，客户端重连时携带Last-Event-ID即可从断点续传；
+    任务结束且日志发送完毕后推送end事件并关闭连接。
+    
+    Args:
+        eval_id: 评估任务ID
+        last_event_id: 客户端收到的最后一个事件ID（重连时由浏览器自动携带）
+        since: 日志游标，Last-Event-ID存在时忽略
+        lines: 首次连接时发送的历史日志行数
+        
+    Returns:
+        StreamingResponse: text/event-stream事件流
+    """
+    return StreamingResponse(
+        log_event_service.stream_events(eval_id, last_event_id or since, lines),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/evaluations/{eval_id}/viewers", response_model=Dict[str, Any])
+def get_evaluation_viewers(eval_id: int):
+    """获取评估任务当前的查看连接（所有API进程），并清理已退出的API进程遗留的连接记录
+    
+    Args:
+        eval_id: 评估任务ID
+        
+    Returns:
+        Dict[str, Any]: count连接数，connections每项包含client_id、所在进程、连接类型与连接时间
+    """
+    connections = RedisManager.list_connections(eval_id)
+    return {
+        "count": len(connections),
+        "connections": [{"client_id": client_id, **info} for client_id, info in connections.items()]
+    }
+
+@router.get("/log_stream/metrics", response_model=Dict[str, Any])
+def get_log_stream_metrics():
+    """获取本API进程实时日志推送的运行指标
+    
+    Returns:
+        Dict[str, Any]: 订阅数、队列深度、丢弃消息数、因接收过慢被断开的客户端数、多路复用连接数等
+    """
+    return {**log_broadcaster.get_metrics(), "multiplex": multiplex_ws_service.get_metrics()}
+
+@router.get("/scheduler/slots", response_model=Dict[str, Any])
+def get_scheduler_slots():
+    """获取各评估Worker的资源占用
+    
+    Returns:
+        Dict[str, Any]: workers列表，每项包含容量、已用CPU/内存、各API地址的并发占用、运行中与排队中的任务
+    """
+    return {"workers": RedisManager.get_worker_slots()}
+
+@router.get("/scheduler/queue", response_model=Dict[str, Any])
+def get_scheduler_queue():
+    """获取评估任务分发队列
+    
+    Returns:
+        Dict[str, Any]: 各优先级通道中每个用户的排队任务数、已派发的任务与派发上限
+    """
+    return task_dispatcher.snapshot()
+
+@router.get("/results/cache", response_model=Dict[str, Any])
+def get_result_cache(
+    model_name: Optional[str] = Query(None, description="只统计该模型的条目"),
+    dataset: Optional[str] = Query(None, description="只统计该数据集的条目")
+):
+    """获取评估结果缓存的条目
+    
+    Args:
+        model_name: 模型名称
+        dataset: 数据集配置名
+        
+    Returns:
+        Dict[str, Any]: 条目数、占用空间与各条目的元信息
+    """
+    entries = [
+        entry for entry in iter_cache_entries()
+        if (model_name is None or entry.get("model_name") == model_name)
+        and (dataset is None or entry.get("dataset") == dataset)
+    ]
+    return {
+        "count": len(entries),
+        "size_bytes": sum(entry["size_bytes"] for entry in entries),
+        "entries": entries
+    }
+
+@router.delete("/results/cache", response_model=Dict[str, Any])
+def delete_result_cache(
+    model_name: Optional[str] = Query(None, description="只删除该模型的条目"),
+    dataset: Optional[str] = Query(None, description="只删除该数据集的条目"),
+    fingerprint: Optional[str] = Query(None, description="只删除该指纹的条目")
+):
+    """使评估结果缓存失效，条件都为空时清空缓存
+    
+    Args:
+        model_name: 模型名称
+        dataset: 数据集配置名
+        fingerprint: 条目指纹
+        
+    Returns:
+        Dict[str, Any]: 删除的条目数
+    """
+    try:
+        return {"success": True, "removed": invalidate_cache(model_name, dataset, fingerprint)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"删除结果缓存失败: {str(e)}"
+        )
+
+@router.get("/evaluations/{eval_id}/logs/search", response_model=Dict[str, Any])
+def search_logs(
+    eval_id: int,
+    q: str = Query(..., min_length=1, description="查询字符串，不区分大小写"),
+    limit: int = Query(100, ge=1, le=1000, description="最多返回的匹配数"),
+    context: int = Query(2, ge=0, le=20, description="每个匹配前后附带的上下文行数")
+):
+    """检索评估任务的完整日志
+    
+    Args:
+        eval_id: 评估任务ID
+        q: 查询字符串
+        limit: 最多返回的匹配数
+        context: 上下文行数
+        
+    Returns:
+        Dict[str, Any]: 匹配行及其上下文
+    """
+    try:
+        return eval_service.search_evaluation_logs(eval_id, q, limit, context)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"检索评估任务日志失败: {str(e)}"
+        )
+
 @router.post("/evaluations/{eval_id}/terminate", response_model=Dict[str, Any])
-def terminate_eval(eval_id: int, db: Session = Depends(get_db)):
+def terminate_eval(
+    eval_id: int,
+    force: bool = Query(False, description="是否立即强制结束进程"),
+    db: Session = Depends(get_db)
+):
     """终止评估任务
     
     Args:
         eval_id: 评估任务ID
+        force: 为True时立即强制结束进程，否则先等待进程优雅退出
         db: 数据库会话
         
     Returns:
         Dict[str, Any]: 操作结果
     """
     try:
-        result = eval_service.terminate_evaluation(eval_id, db)
+        result = eval_service.terminate_evaluation(eval_id, db, force)
         if not result.get("success", False):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -167,6 +403,58 @@ def terminate_eval(eval_id: int, db: Session = Depends(get_db)):
             detail=f"终止评估任务失败: {str(e)}"
         )
 
+@router.post("/evaluations/{eval_id}/pause", response_model=Dict[str, Any])
+def pause_eval(eval_id: int):
+    """暂停评估任务
+    
+    Args:
+        eval_id: 评估任务ID
+        
+    Returns:
+        Dict[str, Any]: 操作结果
+    """
+    try:
+        result = eval_service.pause_evaluation(eval_id)
+        if not result.get("success", False):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=result.get("message", "暂停评估任务失败")
+            )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"暂停评估任务失败: {str(e)}"
+        )
+
+@router.post("/evaluations/{eval_id}/resume", response_model=Dict[str, Any])
+def resume_eval(eval_id: int):
+    """恢复评估任务
+    
+    Args:
+        eval_id: 评估任务ID
+        
+    Returns:
+        Dict[str, Any]: 操作结果
+    """
+    try:
+        result = eval_service.resume_evaluation(eval_id)
+        if not result.get("success", False):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=result.get("message", "恢复评估任务失败")
+            )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"恢复评估任务失败: {str(e)}"
+        )
+
 @router.delete("/evaluations/{eval_id}", response_model=Dict[str, Any])
 async def delete_eval(eval_id: int, db: Session = Depends(get_db)):
     """删除评估任务
@@ -36,12 +36,12 @@ celery_app.conf.update(
     # 默认队列
     task_default_queue='eval_tasks',
 
-    # 限制并发任务数量
-    task_acks_late=True,                  # 任务完成后确认
-    worker_prefetch_multiplier=1,         # 严格并发控制
-    worker_concurrency=1,                 # 单worker模式
-    worker_max_tasks_per_child=1,         # 每个进程只处理一个任务
-    task_concurrency=1,                   # 全局并发限制
+    # 并发：评估任务的主要工作在opencompass子进程中，Worker进程只负责监督与日志投递，
+    # 以线程池同时接收多个任务，实际何时开始执行由资源调度器（tasks.resource_scheduler）按资源需求决定
+    task_acks_late=True,                                  # 任务完成后确认
+    worker_prefetch_multiplier=1,                         # 不预取超出线程数的任务
+    worker_pool="threads",                                # 线程池
+    worker_concurrency=int(settings.celery_concurrency),  # 同时接收的任务数（含排队等待资源的任务）
 
     # 结果后端设置
     result_extended=True                  # 启用扩展结果
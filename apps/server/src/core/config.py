@@ -15,6 +15,7 @@ class Settings(BaseSettings):
     # 服务器配置
     SERVER_HOST: str = "0.0.0.0"
     SERVER_PORT: int = 8000
+    API_WORKERS: int = os.getenv("API_WORKERS", 1)    # API Worker进程数（DEBUG模式下热重载只支持单进程）
 
     # 路径配置
     opencompass_path: Path = Path(
@@ -54,8 +55,98 @@ class Settings(BaseSettings):
     # Dify2OpenAI服务
     dify2openai_url: str = os.getenv("DIFY2OPENAI_URL", "http://localhost:3099/v1/")
 
-    # 并发配置
-    celery_concurrency: int = os.getenv("CELERY_CONCURRENCY", 1)
+    # 并发配置：Worker以线程池同时接收多个评估任务，由资源调度器按资源需求决定何时开始执行
+    celery_concurrency: int = os.getenv("CELERY_CONCURRENCY", 8)                 # 同时接收的任务数（含排队等待资源的任务）
+    eval_worker_cpus: float = os.getenv("EVAL_WORKER_CPUS", 0)                   # 可分配给评估任务的CPU核数，0表示本机核数
+    eval_worker_memory_mb: int = os.getenv("EVAL_WORKER_MEMORY_MB", 0)           # 可分配给评估任务的内存（MB），0表示本机内存的80%
+    eval_api_task_cpus: float = os.getenv("EVAL_API_TASK_CPUS", 1)               # API模型任务（配置了API_URL）默认需要的CPU核数
+    eval_api_task_memory_mb: int = os.getenv("EVAL_API_TASK_MEMORY_MB", 2048)    # API模型任务默认需要的内存（MB）
+    eval_local_task_cpus: float = os.getenv("EVAL_LOCAL_TASK_CPUS", 4)           # 本地模型任务默认需要的CPU核数
+    eval_local_task_memory_mb: int = os.getenv("EVAL_LOCAL_TASK_MEMORY_MB", 16384)  # 本地模型任务默认需要的内存（MB）
+    eval_endpoint_concurrency: int = os.getenv("EVAL_ENDPOINT_CONCURRENCY", 2)   # 同一API_URL同时运行的任务数
+    eval_endpoint_limits: str = os.getenv("EVAL_ENDPOINT_LIMITS", "")            # 按API_URL单独设置的并发数，JSON格式，如 {"https://api.example.com/v1": 4}
+    eval_slots_report_interval: float = os.getenv("EVAL_SLOTS_REPORT_INTERVAL", 10.0)  # Worker资源占用上报间隔（秒），上报记录有效期为其3倍
+    eval_admission_poll_interval: float = os.getenv("EVAL_ADMISSION_POLL_INTERVAL", 2.0)  # 排队等待资源的任务检查是否已被终止的间隔（秒）
+    eval_shard_size: int = os.getenv("EVAL_SHARD_SIZE", 0)                       # 按数据集分片并行执行时每个分片的数据集数，0表示不分片（任务可用eval_config.shard_size单独设置）
+    eval_shard_lost_timeout: float = os.getenv("EVAL_SHARD_LOST_TIMEOUT", 3600.0)  # 分片子任务超过该时间（秒）仍未被Worker接收视为丢失，任务标记为失败
+    eval_dispatch_limit: int = os.getenv("EVAL_DISPATCH_LIMIT", 8)               # 同时派发到Celery的任务数（所有Worker合计），其余任务在分发队列中按用户公平排队，0表示不限制
+    eval_user_weights: str = os.getenv("EVAL_USER_WEIGHTS", "")                  # 按用户设置的分发权重，JSON格式，如 {"1": 2}，未设置的用户权重为1
+    eval_default_priority: str = os.getenv("EVAL_DEFAULT_PRIORITY", "default")   # 未指定eval_config.priority的任务所在的优先级通道（interactive/default/batch）
+    eval_dispatch_reap_interval: float = os.getenv("EVAL_DISPATCH_REAP_INTERVAL", 60.0)  # Worker检查已派发任务是否丢失的间隔（秒）
+    eval_dispatch_reap_timeout: float = os.getenv("EVAL_DISPATCH_REAP_TIMEOUT", 600.0)   # 派发超过该时间（秒）仍未开始或Celery任务已异常结束的任务视为丢失，标记失败并释放名额
+    eval_result_cache: str = os.getenv("EVAL_RESULT_CACHE", "off")               # 按数据集复用相同配置的历史结果（默认关闭）：on（复用并保存）、refresh（重新执行并覆盖）、off（不复用，任务可用eval_config.cache单独开启）或disabled（所有任务都关闭）
+    eval_result_cache_dir: Path = Path(os.getenv("EVAL_RESULT_CACHE_DIR", workspace / "cache" / "results"))  # 结果缓存目录
+
+    # 日志投递配置（Runner -> Redis 批量写入）
+    log_ship_batch_size: int = os.getenv("LOG_SHIP_BATCH_SIZE", 200)        # 累积多少行触发一次刷新
+    log_ship_interval_ms: int = os.getenv("LOG_SHIP_INTERVAL_MS", 500)      # 最长多久刷新一次（毫秒）
+
+    # 日志存储后端：list（兼容的Redis列表）或 stream（Redis Streams，支持游标续传）
+    log_backend: str = os.getenv("LOG_BACKEND", "list")
+    log_stream_maxlen: int = os.getenv("LOG_STREAM_MAXLEN", 200000)        # Stream近似最大长度（XADD MAXLEN ~）
+    log_codec: str = os.getenv("LOG_CODEC", "json")                         # 新日志键的记录编码：json（旧版格式）或compact（紧凑格式，含序号与级别）
+    log_append_mode: str = os.getenv("LOG_APPEND_MODE", "script")          # 日志追加方式：script（服务端Lua脚本原子去重追加）或client（客户端去重后管道写入）
+
+    # 日志发布：只在有在线订阅者（WebSocket日志连接）时逐行PUBLISH，日志本身始终写入存储
+    log_publish_mode: str = os.getenv("LOG_PUBLISH_MODE", "subscribed")    # subscribed（按订阅者在线情况发布）或always（始终发布）
+    log_unwatched_publish_every: int = os.getenv("LOG_UNWATCHED_PUBLISH_EVERY", 0)  # 无订阅者时每N行发布一行，0表示不发布
+    log_presence_ttl_seconds: int = os.getenv("LOG_PRESENCE_TTL_SECONDS", 90)    # 订阅者在线状态的有效期（秒），连接按其1/3间隔续期
+
+    # WebSocket日志分帧（batch协议）：实时日志按时间窗口或行数合并为一帧
+    ws_log_frame_interval_ms: int = os.getenv("WS_LOG_FRAME_INTERVAL_MS", 50)    # 合并窗口（毫秒）
+    ws_log_frame_max_lines: int = os.getenv("WS_LOG_FRAME_MAX_LINES", 500)       # 单帧最多行数
+
+    # 实时日志连接的背压控制：每个连接的待发送队列有上限，慢速客户端不会让API内存无限增长
+    ws_log_queue_max_lines: int = os.getenv("WS_LOG_QUEUE_MAX_LINES", 2000)          # 每个连接最多缓存的消息数
+    ws_log_overflow_policy: str = os.getenv("WS_LOG_OVERFLOW_POLICY", "drop_oldest")  # 溢出策略：drop_oldest（丢弃最旧并提示跳过行数）或sample（进入抽样模式）
+    ws_log_sample_every: int = os.getenv("WS_LOG_SAMPLE_EVERY", 10)                  # 抽样模式下每N条保留一条
+    ws_log_saturation_timeout: float = os.getenv("WS_LOG_SATURATION_TIMEOUT", 30.0)   # 队列持续满载超过该时间（秒）后断开客户端，0表示不断开
+    ws_max_subscriptions: int = os.getenv("WS_MAX_SUBSCRIPTIONS", 500)                # 多路复用连接（/ws）最多订阅的任务数
+    ws_multiplex_queue_max_messages: int = os.getenv("WS_MULTIPLEX_QUEUE_MAX_MESSAGES", 10000)  # 多路复用连接（/ws）队列最多缓存的消息数（所有订阅合计）
+
+    # 多Worker部署：查看连接注册表记录在Redis中，归属进程按租约判断存活
+    api_process_lease_seconds: int = os.getenv("API_PROCESS_LEASE_SECONDS", 30)   # API进程租约有效期（秒），按其1/3间隔续期
+
+    # SSE日志/状态事件流
+    sse_retry_ms: int = os.getenv("SSE_RETRY_MS", 3000)          # 建议客户端断线后的重连间隔（毫秒）
+    sse_page_lines: int = os.getenv("SSE_PAGE_LINES", 1000)      # 按游标补发日志时每次读取的行数
+
+    # 单任务日志速率控制（只约束写入Redis/推送的量，日志文件保留完整输出）
+    log_rate_limit_lines: float = os.getenv("LOG_RATE_LIMIT_LINES", 200)    # 每秒最多写入的行数，0表示不限流
+    log_rate_burst_lines: int = os.getenv("LOG_RATE_BURST_LINES", 2000)      # 令牌桶容量（允许的突发行数）
+    log_collapse_interval: float = os.getenv("LOG_COLLAPSE_INTERVAL", 2.0)   # 同类重复行（进度条、RPM等）的最短输出间隔（秒）
+
+    # 日志分层保留：Redis只保留热尾部，更早的日志压缩落盘
+    log_hot_tail_lines: int = os.getenv("LOG_HOT_TAIL_LINES", 5000)        # Redis中保留的最近日志行数
+    log_spill_batch_lines: int = os.getenv("LOG_SPILL_BATCH_LINES", 5000)  # 超出热尾部多少行后触发一次落盘
+    log_segment_compression: str = os.getenv("LOG_SEGMENT_COMPRESSION", "zstd")  # zstd或gzip（zstd不可用时回退gzip）
+    log_final_ttl_seconds: int = os.getenv("LOG_FINAL_TTL_SECONDS", 7 * 86400)  # 任务结束后Redis日志数据的过期时间
+
+    # 日志文件检索索引
+    log_index_flush_lines: int = os.getenv("LOG_INDEX_FLUSH_LINES", 5000)        # 累积多少行写出一个索引分段
+    log_index_flush_interval: float = os.getenv("LOG_INDEX_FLUSH_INTERVAL", 5.0)  # 最长多久写出一个索引分段（秒）
+
+    # 执行器日志文件
+    runner_log_buffer_bytes: int = os.getenv("RUNNER_LOG_BUFFER_BYTES", 256 * 1024)       # 写缓冲大小（字节）
+    runner_log_flush_interval: float = os.getenv("RUNNER_LOG_FLUSH_INTERVAL", 1.0)        # 缓冲刷新到文件的最长间隔（秒）
+    runner_log_fsync_interval: float = os.getenv("RUNNER_LOG_FSYNC_INTERVAL", 30.0)       # fsync的最长间隔（秒），0表示只在轮转与关闭时fsync
+    runner_log_max_bytes: int = os.getenv("RUNNER_LOG_MAX_BYTES", 64 * 1024 * 1024)       # 单个日志文件超过该大小后轮转，0表示不轮转
+    runner_log_compression: str = os.getenv("RUNNER_LOG_COMPRESSION", "zstd")             # 轮转分段的压缩方式：zstd、gzip或none（zstd不可用时回退gzip）
+
+    # 日志下载
+    log_download_chunk_lines: int = os.getenv("LOG_DOWNLOAD_CHUNK_LINES", 5000)  # 从日志存储流式导出时每个窗口的行数
+
+    # 任务执行器监督循环配置
+    runner_output_queue_size: int = os.getenv("RUNNER_OUTPUT_QUEUE_SIZE", 10000)         # 输出读取队列容量（行）
+    runner_supervisor_tick: float = os.getenv("RUNNER_SUPERVISOR_TICK", 0.2)             # 监督循环节拍（秒）
+    runner_control_check_interval: float = os.getenv("RUNNER_CONTROL_CHECK_INTERVAL", 5.0)  # 控制指令兜底轮询间隔（秒），指令本身经控制通道推送
+    runner_terminate_grace_seconds: float = os.getenv("RUNNER_TERMINATE_GRACE_SECONDS", 5.0)  # terminate指令等待进程自行退出的时间（秒）
+    runner_heartbeat_interval: float = os.getenv("RUNNER_HEARTBEAT_INTERVAL", 10.0)      # 心跳发布间隔（秒）
+    eval_timeout_seconds: int = os.getenv("EVAL_TIMEOUT_SECONDS", 0)                     # 任务最长执行时间，0表示不限制
+
+    # 任务进度上报配置
+    progress_publish_interval: float = os.getenv("PROGRESS_PUBLISH_INTERVAL", 1.0)  # 进度发布到状态通道的最小间隔（秒）
+    progress_persist_interval: float = os.getenv("PROGRESS_PERSIST_INTERVAL", 5.0)  # 进度写入数据库的最小间隔（秒）
 
 
     # 头像相关配置
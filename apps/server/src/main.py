@@ -7,6 +7,7 @@ from api.routers import auth
 from api.routers import eval
 from api.routers import model
 from api.routers import dataset
+from services.log_broadcaster import log_broadcaster
 from fastapi.staticfiles import StaticFiles
 import os
 
@@ -64,11 +65,19 @@ async def startup_event():
     # logger.info(f"头像存储目录: {settings.avatar_storage_dir}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时执行的操作"""
+    # 停止进程内共享的日志订阅器
+    await log_broadcaster.stop()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
         "main:app",
         host=settings.SERVER_HOST,
         port=settings.SERVER_PORT,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        workers=1 if settings.DEBUG else settings.API_WORKERS
     )
@@ -48,6 +48,7 @@ class EvaluationResponse(BaseModel):
     dataset_names: Union[List[str], str] = Field(..., description="数据集名称")
     status: str = Field(..., description="评估任务状态")
     task_id: Optional[str] = Field(None, description="Celery 任务ID")
+    queue: Optional[Dict[str, Any]] = Field(None, description="排队信息（优先级通道、排队位置），已派发时为空")
     created_at: datetime = Field(..., description="创建时间")
     updated_at: datetime = Field(..., description="更新时间")
 
@@ -87,14 +88,16 @@ class OpenCompassConfig(BaseModel):
 
 class LogQueryParams(BaseModel):
     """日志查询参数"""
-    lines: Optional[int] = Field(50, description="要获取的日志行数")
-    from_line: Optional[int] = Field(0, description="起始行号")
+    lines: Optional[int] = Field(50, ge=1, le=5000, description="要获取的日志行数")
+    from_line: Optional[int] = Field(0, ge=0, description="起始行号；reverse为True时表示距末尾的行数")
+    reverse: bool = Field(False, description="是否从日志末尾向前翻页")
 
 class LogResponse(BaseModel):
     """日志响应模式"""
     logs: List[str] = Field(..., description="日志行列表")
+    from_line: int = Field(0, description="本页第一行的行号（从0开始）")
     total_lines: int = Field(..., description="总行数")
-    has_more: bool = Field(..., description="是否有更多日志") 
+    has_more: bool = Field(..., description="翻页方向上是否有更多日志")
 
 class DatasetResult(BaseModel):
     dataset: str
@@ -2,7 +2,7 @@ import os
 import logging
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Union, Iterator, Dict, Any, List
+from typing import Optional, Union, Iterator, Dict, Any, List, Tuple
 from api.deps import get_db
 from sqlalchemy import select, func, or_, desc, String, cast
 from sqlalchemy.orm import joinedload
@@ -13,8 +13,11 @@ from fastapi import HTTPException, status
 from models.eval import Evaluation, EvaluationStatus
 from schemas.eval import EvaluationCreate, EvaluationResponse, EvaluationStatusResponse
 from tasks.task_manager import TaskManager
+from tasks.task_dispatcher import task_dispatcher
 from core.repositories.evaluation_repository import EvaluationRepository
 from utils.redis_manager import RedisManager
+from utils.log_index import LogIndex, find_latest_log_file
+from utils.log_export import iter_file_blocks, iter_line_chunks, gzip_stream
 from tasks.runners.runner_base import get_runner
 from core.config import settings
 
@@ -82,7 +85,8 @@ class EvaluationService:
                 status=db_eval.status,
                 created_at=db_eval.created_at,
                 updated_at=db_eval.updated_at,
-                task_id=task_result["task_id"]
+                task_id=task_result["task_id"],
+                queue=task_result.get("queue")
             )
         except Exception as e:
             # 详细日志记录帮助调试
@@ -125,7 +129,8 @@ class EvaluationService:
                     created_at=status_info.get("created_at", datetime.now()),
                     updated_at=status_info.get("updated_at"),
                     task_id=status_info.get("celery_id"),
-                    error_message=status_info.get("message") if "error" in status_info else None
+                    error_message=status_info.get("message") if "error" in status_info else None,
+                    details={key: status_info[key] for key in ("log_stats", "shards", "queue") if status_info.get(key)}
                 )
         except Exception as task_manager_error:
             logger.warning(f"从TaskManager获取任务状态出错: {str(task_manager_error)}")
@@ -175,7 +180,7 @@ class EvaluationService:
                 model_name=eval_task.model_name or "",
                 dataset_names=self._ensure_dataset_names_format(eval_task.dataset_names),
                 status=eval_task.status or EvaluationStatus.UNKNOWN.value,
-                progress=0,
+                progress=float(eval_task.progress or 0),
                 results=eval_task.results or {},
                 created_at=eval_task.created_at or datetime.now(),
                 updated_at=eval_task.updated_at,
@@ -201,20 +206,21 @@ class EvaluationService:
             return status_response
 
     
-    def get_evaluation_logs(self, eval_id: int, lines: Optional[int] = 50):
+    def get_evaluation_logs(self, eval_id: int, lines: Optional[int] = 50, since: Optional[str] = None):
         """获取评估任务的日志
         
         Args:
             eval_id: 评估任务ID
             lines: 要获取的日志行数，默认50行
+            since: 日志游标，只返回该游标之后的日志
             
         Returns:
             List[str]: 日志行列表
         """
         # 从Redis获取日志
-        logs = RedisManager.get_logs(eval_id, max_lines=lines)
+        logs = RedisManager.get_logs(eval_id, max_lines=lines, since=since)
         
-        if logs:
+        if logs or since is not None:
             return logs
         
         # 如果Redis中没有日志，尝试从运行器获取
@@ -225,6 +231,63 @@ class EvaluationService:
         # 没有找到日志，返回空列表
         return []
 
+    def get_evaluation_log_window(self, eval_id: int, from_line: int = 0, lines: int = 50, reverse: bool = False) -> Dict[str, Any]:
+        """按行号窗口获取评估任务的日志
+        
+        Args:
+            eval_id: 评估任务ID
+            from_line: 起始行号；reverse为True时表示距末尾的行数
+            lines: 窗口大小
+            reverse: 是否从末尾向前翻页
+            
+        Returns:
+            Dict[str, Any]: 窗口内的日志行、窗口首行行号、总行数及是否有更多日志
+        """
+        return RedisManager.get_log_window(eval_id, from_line=from_line, lines=lines, reverse=reverse)
+
+    def stream_evaluation_logs(self, eval_id: int, compress: bool = False, source: str = "auto") -> Tuple[Iterator[bytes], str]:
+        """以固定内存流式导出评估任务的完整日志
+        
+        优先按块读取执行器写入的原始日志文件；文件不存在时按窗口遍历日志存储（Redis热尾部与落盘分段）。
+        
+        Args:
+            eval_id: 评估任务ID
+            compress: 是否以gzip格式输出
+            source: 日志来源：auto（优先日志文件）、file（只用日志文件）或store（只用日志存储）
+            
+        Returns:
+            Tuple[Iterator[bytes], str]: 内容块迭代器和下载文件名；找不到日志时迭代器为None
+        """
+        log_path = find_latest_log_file(eval_id) if source != "store" else None
+        if log_path:
+            blocks = iter_file_blocks(log_path)
+        elif source == "file":
+            return None, ""
+        else:
+            blocks = iter_line_chunks(RedisManager.iter_logs(eval_id, int(settings.log_download_chunk_lines)))
+        
+        filename = f"evaluation_{eval_id}.log"
+        if compress:
+            return gzip_stream(blocks), filename + ".gz"
+        return blocks, filename
+
+    def search_evaluation_logs(self, eval_id: int, query: str, limit: int = 100, context: int = 2) -> Dict[str, Any]:
+        """在评估任务的完整日志文件中检索
+        
+        Args:
+            eval_id: 评估任务ID
+            query: 查询字符串（不区分大小写）
+            limit: 最多返回的匹配数
+            context: 每个匹配前后附带的上下文行数
+            
+        Returns:
+            Dict[str, Any]: 匹配行（行号从1开始）及其上下文
+        """
+        log_path = find_latest_log_file(eval_id)
+        if not log_path:
+            return {"query": query, "matches": [], "total_lines": 0, "indexed_lines": 0, "truncated": False}
+        return LogIndex(log_path).search(query, limit=limit, context=context)
+
     async def list_evaluations(
         self, 
         status: Optional[str] = None, 
@@ -368,6 +431,10 @@ class EvaluationService:
                 if runner and runner.is_running:
                     runner.terminate()
             
+            # 移出分发队列，已派发的任务释放派发名额
+            if not task_dispatcher.cancel(eval_id):
+                task_dispatcher.release(eval_id)
+            
             # 从数据库中删除任务
             db.delete(eval_task)
             db.commit()
@@ -442,18 +509,19 @@ class EvaluationService:
             )
 
 
-    def terminate_evaluation(self, eval_id: int, db: Session) -> Dict[str, Any]:
+    def terminate_evaluation(self, eval_id: int, db: Session, force: bool = False) -> Dict[str, Any]:
         """终止评估任务
         Args:
             eval_id: 评估任务ID
             db: 数据库会话
+            force: 是否立即强制结束进程（kill），默认允许进程优雅退出
             
         Returns:
             Dict[str, Any]: 包含操作结果的字典
         """
         try:
             # 调用TaskManager的terminate_task方法
-            result = self.task_manager.terminate_task(eval_id)
+            result = self.task_manager.terminate_task(eval_id, force=force)
             if result.get("success"):
                 # 正常发送指令后，更新数据库中的任务状态为TERMINATED
                 with db_operation(db) as db_session:
@@ -469,6 +537,28 @@ class EvaluationService:
                 "message": f"终止评估任务失败: {str(e)}"
             }
 
+    def pause_evaluation(self, eval_id: int) -> Dict[str, Any]:
+        """暂停运行中的评估任务（挂起进程树）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            Dict[str, Any]: 包含操作结果的字典
+        """
+        return self.task_manager.control_task(eval_id, "pause")
+
+    def resume_evaluation(self, eval_id: int) -> Dict[str, Any]:
+        """恢复已暂停的评估任务
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            Dict[str, Any]: 包含操作结果的字典
+        """
+        return self.task_manager.control_task(eval_id, "resume")
+
     def get_evaluation_results(self, eval_id: int, db: Session) -> Dict[str, Any]:
         """获取评测任务的详细结果
         
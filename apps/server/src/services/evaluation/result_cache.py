@@ -0,0 +1,368 @@
+import os
+import re
+import csv
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import functools
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from core.config import settings
+
+
+logger = logging.getLogger("eval_tasks")
+
+# 缓存条目格式版本，格式变化时递增使旧条目失效
+CACHE_FORMAT = 1
+
+# 缓存模式：on 复用并保存、refresh 不复用但重新保存（覆盖旧结果）、off 不复用也不保存
+CACHE_MODES = ("on", "refresh", "off")
+
+# 名称（整体，不区分大小写）匹配这些模式的字段视为密钥，不参与指纹计算（也不写入缓存元信息）。
+# 按完整字段名匹配，max_tokens、tokenizer_path 等影响结果的字段仍参与指纹计算
+_SECRET_KEY_RE = re.compile(
+    r"(?:\w+_)?(?:api_?key|access_?key|secret_?key|private_?key|secret|password|passwd|credentials?)"
+    r"|(?:\w+_)?(?:access|auth|api|bearer|refresh|session|hf|hub)_token|token|authorization",
+    re.IGNORECASE
+)
+
+# 只影响执行方式、不影响评估结果的eval_config字段
+_VOLATILE_CONFIG_KEYS = {"debug", "verbose", "timeout", "priority", "shard_size", "resources", "cache", "gpu_count"}
+
+
+def get_cache_mode(eval_config: Optional[Dict[str, Any]]) -> str:
+    """任务的缓存模式：eval_config.cache优先，未设置时取全局EVAL_RESULT_CACHE（默认off，需显式开启）
+
+    eval_config.cache 可以是 on/refresh/off，也可以是布尔值（true等同on，false等同off），无法识别的值按off处理；
+    全局EVAL_RESULT_CACHE为disabled时所有任务都不使用缓存；dry_run任务不产生结果，不使用缓存。
+    """
+    default = str(settings.eval_result_cache).lower()
+    if default == "disabled":
+        return "off"
+    eval_config = eval_config or {}
+    if eval_config.get("dry_run"):
+        return "off"
+    mode = eval_config.get("cache", default)
+    if isinstance(mode, bool):
+        return "on" if mode else "off"
+    mode = str(mode).lower()
+    return mode if mode in CACHE_MODES else "off"
+
+
+def strip_secrets(value: Any) -> Any:
+    """递归去掉字典中的密钥字段"""
+    if isinstance(value, dict):
+        return {key: strip_secrets(item) for key, item in value.items() if not _SECRET_KEY_RE.fullmatch(str(key))}
+    if isinstance(value, list):
+        return [strip_secrets(item) for item in value]
+    return value
+
+
+@functools.lru_cache(maxsize=1)
+def get_opencompass_version() -> str:
+    """已安装的OpenCompass版本，版本变化后旧的缓存结果不再命中"""
+    try:
+        from importlib.metadata import version
+        return version("opencompass")
+    except Exception:
+        return "unknown"
+
+
+def dataset_fingerprint(eval_task: Any, dataset_name: str) -> str:
+    """计算一个数据集结果的内容指纹
+
+    由模型标识（model_name、去掉密钥的model_configuration与env_vars）、数据集配置名、
+    dataset_configuration、影响结果的eval_config字段与OpenCompass版本决定。
+
+    Args:
+        eval_task: 评估任务（Evaluation或具有相同字段的对象）
+        dataset_name: 数据集配置名
+
+    Returns:
+        str: SHA-256指纹
+    """
+    eval_config = {key: value for key, value in (eval_task.eval_config or {}).items()
+                   if key not in _VOLATILE_CONFIG_KEYS}
+    identity = {
+        "format": CACHE_FORMAT,
+        "opencompass": get_opencompass_version(),
+        "model_name": eval_task.model_name,
+        "model_configuration": strip_secrets(getattr(eval_task, "model_configuration", None) or {}),
+        "env_vars": strip_secrets(eval_task.env_vars or {}),
+        "dataset": dataset_name,
+        "dataset_configuration": strip_secrets(getattr(eval_task, "dataset_configuration", None) or {}),
+        "eval_config": eval_config
+    }
+    payload = json.dumps(identity, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=256)
+def resolve_dataset_abbrs(dataset_name: str) -> Optional[Tuple[str, ...]]:
+    """通过OpenCompass的数据集配置解析一个数据集配置名对应的输出名（abbr）
+
+    OpenCompass按abbr命名results、predictions下的文件，一个配置名可能包含多个abbr（如mmlu的各科目）。
+    OpenCompass不可用或解析失败时返回None。
+    """
+    try:
+        import opencompass
+        from mmengine.config import Config
+        from opencompass.utils import dataset_abbr_from_cfg
+        from opencompass.utils.run import match_cfg_file
+    except ImportError:
+        return None
+    config_dirs = [Path(settings.opencompass_path) / "configs", Path(opencompass.__file__).parent / "configs"]
+    dataset_dirs = [str(path / name) for path in config_dirs for name in ("datasets", "dataset_collections")
+                    if (path / name).is_dir()]
+    try:
+        abbrs = []
+        for _, config_path in match_cfg_file(dataset_dirs, [dataset_name]):
+            config = Config.fromfile(config_path)
+            for key in config.keys():
+                if key.endswith("_datasets"):
+                    abbrs.extend(dataset_abbr_from_cfg(dataset) for dataset in config[key])
+        return tuple(abbrs) or None
+    except Exception as e:
+        logger.warning(f"解析数据集配置 {dataset_name} 失败: {str(e)}")
+        return None
+
+
+def _belongs_to(stem: str, abbrs: Optional[Tuple[str, ...]]) -> bool:
+    """输出文件是否属于这些abbr（predictions较大时OpenCompass拆分为 {abbr}_0.json、{abbr}_1.json ...）"""
+    if abbrs is None:
+        return True
+    return any(stem == abbr or re.fullmatch(rf"{re.escape(abbr)}_\d+", stem) for abbr in abbrs)
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    """硬链接文件（不占用额外空间），跨文件系统时复制"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _read_summary(summary_dir: Path) -> Tuple[List[str], List[Dict[str, str]]]:
+    """读取summary目录下的CSV汇总表：(表头, 行)"""
+    header, rows = [], []
+    if not summary_dir.is_dir():
+        return header, rows
+    for summary_file in sorted(summary_dir.glob("*.csv")):
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for field in reader.fieldnames or []:
+                if field not in header:
+                    header.append(field)
+            rows.extend(reader)
+    return header, rows
+
+
+class ResultCache:
+    """按数据集复用评估结果的内容寻址缓存
+
+    每个数据集的结果以 dataset_fingerprint 为键保存在 EVAL_RESULT_CACHE_DIR/<指纹前2位>/<指纹>/ 下：
+        results/<模型>/<abbr>.json、predictions/<模型>/<abbr>*.json   OpenCompass的输出文件（硬链接）
+        summary.json                                                    汇总表中属于该数据集的行
+        meta.json                                                       模型、数据集、来源任务等元信息
+    执行前命中缓存的数据集不再执行，执行完成后先保存新执行的数据集，再把命中的结果链接到本次的输出目录，
+    ResultCollector按正常流程收集。
+    """
+
+    def __init__(self, eval_task: Any, eval_id: Optional[int] = None, cache_dir: Optional[Path] = None):
+        """初始化
+
+        Args:
+            eval_task: 评估任务
+            eval_id: 评估任务ID，写入缓存元信息
+            cache_dir: 缓存目录，默认取配置
+        """
+        self.eval_task = eval_task
+        self.eval_id = eval_id if eval_id is not None else getattr(eval_task, "id", None)
+        self.mode = get_cache_mode(eval_task.eval_config)
+        self.cache_dir = Path(cache_dir or settings.eval_result_cache_dir)
+
+    def entry_dir(self, fingerprint: str) -> Path:
+        """缓存条目目录"""
+        return self.cache_dir / fingerprint[:2] / fingerprint
+
+    def plan(self, datasets: List[str]) -> Tuple[Dict[str, Path], List[str]]:
+        """查找已缓存的数据集
+
+        Args:
+            datasets: 任务的数据集配置名
+
+        Returns:
+            Tuple[Dict[str, Path], List[str]]: (命中的数据集 -> 缓存条目, 需要执行的数据集)
+        """
+        if self.mode != "on":
+            return {}, list(datasets)
+        cached, to_run = {}, []
+        for dataset in datasets:
+            entry = self.entry_dir(dataset_fingerprint(self.eval_task, dataset))
+            if (entry / "meta.json").is_file():
+                cached[dataset] = entry
+            else:
+                to_run.append(dataset)
+        return cached, to_run
+
+    def store(self, timestamp_dir: Path, datasets: List[str]) -> List[str]:
+        """保存一次执行中各数据集的结果
+
+        只执行了一个数据集时，输出目录中的文件都属于它；执行了多个数据集时通过OpenCompass的数据集配置
+        把输出文件对应到数据集，无法对应的数据集不保存。
+
+        Args:
+            timestamp_dir: 本次执行的输出目录（OpenCompass时间戳目录）
+            datasets: 本次执行的数据集配置名
+
+        Returns:
+            List[str]: 已保存的数据集
+        """
+        if self.mode == "off" or not datasets:
+            return []
+        try:
+            header, rows = _read_summary(timestamp_dir / "summary")
+        except (OSError, ValueError, csv.Error) as e:
+            logger.warning(f"读取汇总表失败，不保存到结果缓存: {str(e)}")
+            return []
+        stored = []
+        for dataset in datasets:
+            abbrs = None if len(datasets) == 1 else resolve_dataset_abbrs(dataset)
+            if abbrs is None and len(datasets) > 1:
+                logger.info(f"无法确定数据集 {dataset} 的输出文件，不保存到结果缓存")
+                continue
+            try:
+                if self._store_dataset(timestamp_dir, dataset, abbrs, header, rows):
+                    stored.append(dataset)
+            except Exception as e:
+                logger.warning(f"保存数据集 {dataset} 的结果缓存失败: {str(e)}")
+        return stored
+
+    def link(self, timestamp_dir: Path, cached: Dict[str, Path]) -> None:
+        """把命中的缓存结果链接到本次的输出目录，汇总表行追加到CSV汇总表
+
+        Args:
+            timestamp_dir: 本次执行的输出目录
+            cached: 命中的数据集 -> 缓存条目
+        """
+        if not cached:
+            return
+        header, rows = _read_summary(timestamp_dir / "summary")
+        manifest = {}
+        for dataset, entry in cached.items():
+            for kind in ("results", "predictions"):
+                for source in sorted((entry / kind).rglob("*.json")):
+                    _link_or_copy(source, timestamp_dir / kind / source.relative_to(entry / kind))
+            with open(entry / "summary.json", 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+            for field in summary["header"]:
+                if field not in header:
+                    header.append(field)
+            rows.extend(summary["rows"])
+            with open(entry / "meta.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            manifest[dataset] = {"fingerprint": entry.name, "source_eval_id": meta.get("eval_id"),
+                                 "created_at": meta.get("created_at")}
+
+        summary_dir = timestamp_dir / "summary"
+        summary_dir.mkdir(parents=True, exist_ok=True)
+        for summary_file in summary_dir.glob("*.csv"):
+            summary_file.unlink()
+        if header:
+            with open(summary_dir / f"summary_{timestamp_dir.name}.csv", 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=header, restval="-")
+                writer.writeheader()
+                writer.writerows(rows)
+        (timestamp_dir / "results").mkdir(exist_ok=True)
+        (timestamp_dir / "predictions").mkdir(exist_ok=True)
+        with open(timestamp_dir / "cache.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    def _store_dataset(self, timestamp_dir: Path, dataset: str, abbrs: Optional[Tuple[str, ...]],
+                       header: List[str], rows: List[Dict[str, str]]) -> bool:
+        """在临时目录中组装缓存条目后整体移入，其他进程不会读到不完整的条目"""
+        files = [
+            (kind, path) for kind in ("results", "predictions") if (timestamp_dir / kind).is_dir()
+            for path in sorted((timestamp_dir / kind).rglob("*.json")) if _belongs_to(path.stem, abbrs)
+        ]
+        if not any(kind == "results" for kind, _ in files):
+            return False
+
+        fingerprint = dataset_fingerprint(self.eval_task, dataset)
+        staging = self.cache_dir / ".staging" / uuid.uuid4().hex
+        for kind, path in files:
+            _link_or_copy(path, staging / kind / path.relative_to(timestamp_dir / kind))
+        with open(staging / "summary.json", 'w', encoding='utf-8') as f:
+            json.dump({"header": header, "rows": [row for row in rows if abbrs is None or row.get("dataset") in abbrs]},
+                      f, ensure_ascii=False)
+        with open(staging / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "fingerprint": fingerprint,
+                "model_name": self.eval_task.model_name,
+                "dataset": dataset,
+                "abbrs": list(abbrs) if abbrs is not None else None,
+                "eval_id": self.eval_id,
+                "opencompass": get_opencompass_version(),
+                "created_at": time.time()
+            }, f, ensure_ascii=False)
+
+        entry = self.entry_dir(fingerprint)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        if entry.exists():
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # 其他任务同时保存了相同的条目
+            shutil.rmtree(staging, ignore_errors=True)
+        return True
+
+
+def iter_cache_entries(cache_dir: Optional[Path] = None) -> Iterator[Dict[str, Any]]:
+    """遍历缓存条目的元信息（附带条目路径path与占用空间size_bytes）"""
+    cache_dir = Path(cache_dir or settings.eval_result_cache_dir)
+    if not cache_dir.is_dir():
+        return
+    for meta_file in cache_dir.glob("??/*/meta.json"):
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        entry = meta_file.parent
+        meta["path"] = str(entry)
+        meta["size_bytes"] = sum(path.stat().st_size for path in entry.rglob("*") if path.is_file())
+        yield meta
+
+
+def invalidate_cache(model_name: Optional[str] = None, dataset: Optional[str] = None,
+                     fingerprint: Optional[str] = None, cache_dir: Optional[Path] = None) -> int:
+    """删除匹配条件的缓存条目，条件都为空时清空缓存
+
+    Args:
+        model_name: 模型名称
+        dataset: 数据集配置名
+        fingerprint: 条目指纹
+        cache_dir: 缓存目录，默认取配置
+
+    Returns:
+        int: 删除的条目数
+    """
+    removed = 0
+    for meta in list(iter_cache_entries(cache_dir)):
+        if model_name is not None and meta.get("model_name") != model_name:
+            continue
+        if dataset is not None and meta.get("dataset") != dataset:
+            continue
+        if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+            continue
+        shutil.rmtree(meta["path"], ignore_errors=True)
+        removed += 1
+    logger.info(f"已删除{removed}个结果缓存条目 (model_name={model_name}, dataset={dataset}, fingerprint={fingerprint})")
+    return removed
@@ -6,6 +6,57 @@ from typing import Dict, List
 from models.eval import Evaluation
 from core.database import SessionLocal
 import re
+from datetime import datetime, timedelta
+
+
+def find_latest_timestamp_dir(base_dir: Path) -> Path:
+    """查找OpenCompass输出目录下最新的时间戳目录
+
+    Args:
+        base_dir: OpenCompass的--work-dir目录
+
+    Returns:
+        Path: 最新的时间戳目录
+    """
+    if not base_dir.exists():
+        raise FileNotFoundError(f"基础目录不存在: {base_dir}")
+
+    # 使用正则表达式匹配 8位日期_6位时间 格式
+    pattern = re.compile(r"^\d{8}_\d{6}$")
+    dirs = [
+        d for d in base_dir.iterdir()
+        if d.is_dir() and pattern.match(d.name)
+    ]
+
+    if not dirs:
+        raise FileNotFoundError(f"在 {base_dir} 中未找到时间戳目录")
+
+    # 按目录名降序排列（时间戳越大表示越新）
+    dirs.sort(key=lambda d: d.name, reverse=True)
+    return dirs[0]
+
+
+def new_timestamp_dir(base_dir: Path) -> Path:
+    """在OpenCompass输出目录下创建新的时间戳目录，保证比已有的时间戳目录都新（ResultCollector取最新的目录）
+
+    Args:
+        base_dir: OpenCompass的--work-dir目录
+
+    Returns:
+        Path: 新建的时间戳目录
+    """
+    base_dir.mkdir(parents=True, exist_ok=True)
+    now = datetime.now()
+    try:
+        latest = datetime.strptime(find_latest_timestamp_dir(base_dir).name, "%Y%m%d_%H%M%S")
+        if latest >= now.replace(microsecond=0):
+            now = latest + timedelta(seconds=1)
+    except FileNotFoundError:
+        pass
+    target = base_dir / now.strftime("%Y%m%d_%H%M%S")
+    target.mkdir()
+    return target
+
 
 class ResultCollector:
     def __init__(self, eval_id: int, work_dir: Path):
@@ -23,22 +74,8 @@ class ResultCollector:
         
     def _find_latest_timestamp_dir(self) -> Path:
         """安全查找最新时间戳目录"""
-        if not self.base_dir.exists():
-            raise FileNotFoundError(f"基础目录不存在: {self.base_dir}")
-
-        # 使用正则表达式匹配 8位日期_6位时间 格式
-        pattern = re.compile(r"^\d{8}_\d{6}$")
-        dirs = [
-            d for d in self.base_dir.iterdir() 
-            if d.is_dir() and pattern.match(d.name)
-        ]
-        
-        if not dirs:
-            raise FileNotFoundError(f"在 {self.base_dir} 中未找到时间戳目录")
-            
-        # 按目录名降序排列（时间戳越大表示越新）
-        dirs.sort(key=lambda d: d.name, reverse=True)
-        return dirs[0]
+        return find_latest_timestamp_dir(self.base_dir)
+
     def collect_results(self) -> dict:
         """执行完整结果收集"""
         self._validate_dirs()
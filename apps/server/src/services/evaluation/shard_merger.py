@@ -0,0 +1,76 @@
+import csv
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, List
+from services.evaluation.result_collector import find_latest_timestamp_dir, new_timestamp_dir
+
+
+class ShardResultMerger:
+    """合并分片执行的输出
+
+    每个分片的OpenCompass输出在 eval_{id}/shards/shard_{序号}/<时间戳>/ 下，合并后在 eval_{id}/<时间戳>/
+    生成与单次执行相同的目录结构，ResultCollector与结果接口无需区分任务是否分片执行：
+        results/、predictions/   按 模型/数据集.json 合并（各分片的数据集互不重叠）
+        summary/                 CSV汇总表按行合并为一个文件，其他格式的汇总文件加上分片前缀后保留
+        shards.json              各分片包含的数据集及其原始输出目录
+    """
+
+    def __init__(self, eval_id: int, work_dir: Path):
+        """
+        Args:
+            eval_id: 评估任务ID
+            work_dir: 工作目录（与ResultCollector相同）
+        """
+        self.eval_id = eval_id
+        self.base_dir = work_dir / "logs" / f"eval_{eval_id}"
+
+    def merge(self, shards: List[Dict]) -> Path:
+        """合并各分片的输出
+
+        Args:
+            shards: 分片执行结果，包含 shard、datasets、output_dir
+
+        Returns:
+            Path: 合并后的时间戳目录
+        """
+        target = new_timestamp_dir(self.base_dir)
+        summary_header: List[str] = []
+        summary_rows: List[Dict] = []
+        manifest = []
+
+        for shard in sorted(shards, key=lambda item: item["shard"]):
+            source = find_latest_timestamp_dir(Path(shard["output_dir"]))
+            for name in ("results", "predictions"):
+                if (source / name).is_dir():
+                    shutil.copytree(source / name, target / name, dirs_exist_ok=True)
+
+            summary_dir = source / "summary"
+            if summary_dir.is_dir():
+                for summary_file in sorted(summary_dir.iterdir()):
+                    if not summary_file.is_file():
+                        continue
+                    if summary_file.suffix.lower() == ".csv":
+                        with open(summary_file, 'r', encoding='utf-8') as f:
+                            reader = csv.DictReader(f)
+                            for field in reader.fieldnames or []:
+                                if field not in summary_header:
+                                    summary_header.append(field)
+                            summary_rows.extend(reader)
+                    else:
+                        (target / "summary").mkdir(parents=True, exist_ok=True)
+                        shutil.copy2(summary_file, target / "summary" / f"shard_{shard['shard']}_{summary_file.name}")
+
+            manifest.append({"shard": shard["shard"], "datasets": shard.get("datasets", []), "output_dir": str(source)})
+
+        (target / "results").mkdir(exist_ok=True)
+        (target / "predictions").mkdir(exist_ok=True)
+        (target / "summary").mkdir(exist_ok=True)
+        if summary_header:
+            with open(target / "summary" / f"summary_{target.name}.csv", 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=summary_header, restval="-")
+                writer.writeheader()
+                writer.writerows(summary_rows)
+        with open(target / "shards.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return target
@@ -0,0 +1,561 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from core.config import settings
+from utils.redis_manager import RedisManager
+
+
+# 日志配置
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionQueue(asyncio.Queue):
+    """多个订阅共用的队列，元素为 (eval_id, topic, 消息原文)
+
+    按 (eval_id, topic) 统计各订阅在队列中的消息数，订阅溢出时只丢弃它自己最旧的消息，
+    不会挤掉同一连接其他订阅的消息（如状态消息、关闭通知）。
+    max_items限制整个队列（所有订阅合计）的消息数，达到上限后日志订阅按各自的溢出策略处理。
+    """
+
+    def __init__(self, max_items: int = 0):
+        super().__init__()
+        self.max_items = max(int(max_items or 0), 0)   # 所有订阅合计的消息数上限，0表示不限
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._counts: Dict[Tuple[Any, str], int] = {}
+
+    def _put(self, item):
+        super()._put(item)
+        key = (item[0], item[1])
+        self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _get(self):
+        item = super()._get()
+        self._forget((item[0], item[1]))
+        return item
+
+    def count(self, eval_id: Any, topic: str) -> int:
+        """某个订阅在队列中的消息数"""
+        return self._counts.get((eval_id, topic), 0)
+
+    def drop_oldest(self, eval_id: Any, topic: str) -> bool:
+        """丢弃某个订阅最旧的一条消息
+
+        Returns:
+            bool: 是否有消息被丢弃
+        """
+        for item in self._queue:
+            if item[0] == eval_id and item[1] == topic:
+                self._queue.remove(item)
+                self._forget((eval_id, topic))
+                return True
+        return False
+
+    def over_limit(self, fraction: float = 1.0) -> bool:
+        """队列总消息数是否达到上限的fraction倍（未设置上限时始终为False）"""
+        return self.max_items > 0 and self.qsize() >= self.max_items * fraction
+
+    def replace(self, old: Any, new: Any) -> bool:
+        """把队列中尚未取出的消息old（按对象标识查找）替换为new，位置不变
+
+        Returns:
+            bool: 是否替换成功（old已被取出时返回False）
+        """
+        for index, item in enumerate(self._queue):
+            if item is old:
+                self._queue[index] = new
+                return True
+        return False
+
+    def _forget(self, key: Tuple[Any, str]) -> None:
+        count = self._counts.get(key, 0) - 1
+        if count > 0:
+            self._counts[key] = count
+        else:
+            self._counts.pop(key, None)
+
+
+class LogSubscription:
+    """单个连接对某个评估任务某类消息（日志或状态）的订阅
+
+    默认每个订阅独占一个队列，队列中是消息原文；多个订阅共用同一个队列时（queue参数，须为SubscriptionQueue），
+    队列中是 (eval_id, topic, 消息原文) 元组，便于一个连接在同一处等待多类消息。
+
+    日志订阅的消息数有上限（max_lines，共用队列时按订阅分别计数），消费者（慢速客户端）跟不上时按溢出策略处理，
+    只丢弃本订阅的日志行：
+        drop_oldest  丢弃最旧的消息，消费者通过take_skipped取得跳过的行数并提示客户端
+        sample       在丢弃最旧消息的基础上进入抽样模式，每sample_every条只保留一条，
+                     队列回落到一半以下后恢复逐条投递
+    共用队列整体达到上限（SubscriptionQueue.max_items）时同样视为满载，本订阅没有可腾出的消息时丢弃新到的日志行。
+    队列持续满载超过saturation_timeout秒时调用on_saturated（通常用于断开该客户端），之后不再投递。
+    状态消息（含任务结束状态）不可丢失，状态订阅不做溢出处理；传入classify时（须为共用队列）按其返回的类别
+    过滤与合并：返回None的消息不入队，同一类别在队列中只保留最新一条，积压量与消息频率无关。
+    with_ids为True时（仅独立队列）队列元素为 (Stream条目ID, 消息原文)，通道消息的条目ID为None，
+    stream后端的消费者据此推进游标并跳过已补发的条目。
+    """
+
+    def __init__(self,
+                 eval_id: int,
+                 topic: str = "logs",
+                 queue: Optional[asyncio.Queue] = None,
+                 max_lines: Optional[int] = None,
+                 policy: Optional[str] = None,
+                 on_saturated: Optional[Callable[["LogSubscription"], None]] = None,
+                 classify: Optional[Callable[[str], Optional[str]]] = None,
+                 with_ids: bool = False):
+        if queue is not None and not isinstance(queue, SubscriptionQueue):
+            raise TypeError("多个订阅共用的队列须为SubscriptionQueue")
+        if classify is not None and queue is None:
+            raise ValueError("按类别合并的状态订阅须使用共用队列")
+        if with_ids and queue is not None:
+            raise ValueError("带条目ID的订阅须使用独立队列")
+        self.eval_id = eval_id
+        self.topic = topic
+        self.shared = queue is not None
+        self.queue: asyncio.Queue = queue if queue is not None else asyncio.Queue()
+        self.max_lines = max(int(max_lines if max_lines is not None else settings.ws_log_queue_max_lines), 1)
+        self.policy = policy or str(settings.ws_log_overflow_policy)
+        self.sample_every = max(int(settings.ws_log_sample_every), 1)
+        self.saturation_timeout = float(settings.ws_log_saturation_timeout)
+        self.on_saturated = on_saturated
+        self.classify = classify
+        self.with_ids = with_ids
+
+        self.sampling = False
+        self.saturated_since: Optional[float] = None
+        self.closed = False
+        self.dropped = 0           # 累计丢弃的消息数
+        self._skipped = 0          # 尚未告知客户端的跳过行数
+        self._sample_counter = 0
+        self._latest: Dict[str, Any] = {}   # 状态消息类别 -> 队列中该类别最新的一条
+
+    def put(self, data: str, entry_id: Optional[str] = None) -> int:
+        """由广播器调用，投递一条消息
+
+        Args:
+            data: 消息原文
+            entry_id: Stream条目ID（stream后端读取的日志），通道消息为None
+
+        Returns:
+            int: 本次丢弃的消息数
+        """
+        if self.closed:
+            return 0
+        if self.topic != "logs":
+            self._put_status(data)
+            return 0
+        item = self._item(data, entry_id)
+        depth = self.depth()
+        if depth < self.max_lines // 2 and not (self.shared and self.queue.over_limit(0.5)):
+            self.sampling = False
+            self.saturated_since = None
+
+        if self.sampling:
+            self._sample_counter += 1
+            if self._sample_counter % self.sample_every:
+                self._drop()
+                self._check_saturation()
+                return 1
+
+        dropped = 0
+        if depth >= self.max_lines or (self.shared and self.queue.over_limit()):
+            self._drop()
+            dropped = 1
+            if self.saturated_since is None:
+                self.saturated_since = time.monotonic()
+            if self.policy == "sample" and not self.sampling:
+                self.sampling = True
+                self._sample_counter = 0
+            if not depth:
+                # 连接队列整体已满且本订阅没有积压：丢弃新到的日志行
+                self._check_saturation()
+                return dropped
+            # 队列已满：丢弃本订阅最旧的日志行腾出位置
+            if self.shared:
+                self.queue.drop_oldest(self.eval_id, self.topic)
+            else:
+                self.queue.get_nowait()
+        self.queue.put_nowait(item)
+        self._check_saturation()
+        return dropped
+
+    def _put_status(self, data: str) -> None:
+        """投递状态消息：按classify过滤，同一类别尚未取出时以新消息替换旧消息"""
+        if self.classify is None:
+            self.queue.put_nowait(self._item(data))
+            return
+        kind = self.classify(data)
+        if kind is None:
+            return
+        item = self._item(data)
+        previous = self._latest.get(kind)
+        self._latest[kind] = item
+        if previous is not None and self.queue.replace(previous, item):
+            return
+        self.queue.put_nowait(item)
+
+    def take_skipped(self) -> int:
+        """取出自上次调用以来跳过的行数（由消费者调用，用于向客户端提示）"""
+        skipped, self._skipped = self._skipped, 0
+        return skipped
+
+    def depth(self) -> int:
+        """本订阅在队列中的消息数"""
+        if self.shared:
+            return self.queue.count(self.eval_id, self.topic)
+        return self.queue.qsize()
+
+    def _item(self, data: str, entry_id: Optional[str] = None) -> Any:
+        if self.shared:
+            return (self.eval_id, self.topic, data)
+        return (entry_id, data) if self.with_ids else data
+
+    def _drop(self) -> None:
+        self.dropped += 1
+        self._skipped += 1
+
+    def _check_saturation(self) -> None:
+        """满载持续超过阈值时关闭订阅并通知连接处理方"""
+        if (self.saturated_since is None or self.saturation_timeout <= 0
+                or time.monotonic() - self.saturated_since < self.saturation_timeout):
+            return
+        self.closed = True
+        if not self.shared:
+            # 释放积压的消息，不必等连接清理完成
+            while not self.queue.empty():
+                self.queue.get_nowait()
+        if self.on_saturated is not None:
+            self.on_saturated(self)
+
+    async def get(self) -> Any:
+        """等待下一条消息"""
+        return await self.queue.get()
+
+    async def get_batch(self, max_items: int, max_wait: float) -> List[Any]:
+        """等待至少一条消息，再在合并窗口内继续收集，凑成一批返回（见 get_batch）"""
+        return await get_batch(self.queue, max_items, max_wait)
+
+
+async def get_batch(queue: asyncio.Queue, max_items: int, max_wait: float) -> List[Any]:
+    """等待至少一条消息，再在合并窗口内继续收集，凑成一批返回
+
+    Args:
+        queue: 消息队列
+        max_items: 单批最多消息数
+        max_wait: 收到第一条消息后最多再等待的时间（秒）
+
+    Returns:
+        List[Any]: 消息列表（至少一条）
+    """
+    batch = [await queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait
+    while len(batch) < max_items:
+        if not queue.empty():
+            batch.append(queue.get_nowait())
+            continue
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+
+class LogBroadcaster:
+    """API进程内共享的日志订阅器
+
+    每个进程只持有一个异步PubSub连接，以 PSUBSCRIBE eval:*:logs、eval:*:status 接收所有任务的
+    日志与状态消息，再按 (消息类别, 任务ID) 分发到各连接的内存队列；连接处理协程只需等待自己的队列，
+    不再为每个连接创建同步PubSub并在事件循环中轮询。
+    stream后端的写入方不发布日志通道消息，由本进程以一次XREAD BLOCK读取所有有日志订阅的任务的Stream，
+    新条目按日志消息同样分发。
+    """
+
+    # stream后端每次XREAD的最长阻塞时间（毫秒），新订阅的任务最迟在下一次读取时加入
+    STREAM_BLOCK_MS = 1000
+
+    # 消息类别 -> 通道模式
+    CHANNEL_PATTERNS = {
+        "logs": RedisManager.get_log_channel("*"),
+        "status": RedisManager.get_status_channel("*"),
+        "viewers": RedisManager.get_viewers_channel("*"),
+    }
+
+    def __init__(self):
+        self._subscriptions: Dict[Tuple[str, int], Set[LogSubscription]] = {}
+        self._viewers: Dict[int, Dict[str, Callable[[str], None]]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+        self._stream_task: Optional[asyncio.Task] = None
+        self._stream_ids: Dict[int, str] = {}
+        self._ready: Optional[asyncio.Event] = None
+        self.messages_received = 0
+        self.messages_dispatched = 0
+        self.messages_dropped = 0
+        self.slow_disconnects = 0
+
+    async def subscribe(self,
+                        eval_id: int,
+                        topic: str = "logs",
+                        queue: Optional[asyncio.Queue] = None,
+                        on_saturated: Optional[Callable[[LogSubscription], None]] = None,
+                        classify: Optional[Callable[[str], Optional[str]]] = None,
+                        with_ids: bool = False) -> LogSubscription:
+        """订阅任务日志或状态消息（首次调用时在当前事件循环中启动监听任务）
+
+        Args:
+            eval_id: 评估任务ID
+            topic: 消息类别，logs或status
+            queue: 与其他订阅共用的队列（SubscriptionQueue），None表示使用独立队列
+            on_saturated: 队列持续满载超过阈值时的回调（通常断开慢速客户端）
+            classify: 状态消息分类函数，返回None的消息不入队，同类消息只保留最新一条（见LogSubscription）
+            with_ids: 队列元素带Stream条目ID（见LogSubscription）
+
+        Returns:
+            LogSubscription: 订阅对象，使用完毕后需调用unsubscribe
+        """
+        if topic not in self.CHANNEL_PATTERNS:
+            raise ValueError(f"不支持的订阅类别: {topic}")
+        if topic == "logs" and RedisManager.is_stream_backend() and eval_id not in self._stream_ids:
+            # 从订阅时Stream的末尾开始读取，之前的日志由连接按游标自行读取
+            last_id = await RedisManager.get_log_stream_last_id(eval_id)
+            self._stream_ids.setdefault(eval_id, last_id)
+        subscription = LogSubscription(eval_id, topic, queue, on_saturated=self._saturated_callback(on_saturated),
+                                       classify=classify, with_ids=with_ids)
+        self._subscriptions.setdefault((topic, eval_id), set()).add(subscription)
+        await self._ensure_listener()
+        return subscription
+
+    def unsubscribe(self, subscription: Optional[LogSubscription]) -> None:
+        """取消订阅
+
+        Args:
+            subscription: 订阅对象
+        """
+        if subscription is None:
+            return
+        key = (subscription.topic, subscription.eval_id)
+        subscribers = self._subscriptions.get(key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[key]
+                if subscription.topic == "logs":
+                    self._stream_ids.pop(subscription.eval_id, None)
+
+    async def register_viewer(self, eval_id: int, client_id: str, kind: str, on_close: Callable[[str], None]) -> None:
+        """登记一个查看连接（本进程内存 + Redis连接注册表）
+        
+        Args:
+            eval_id: 评估任务ID
+            client_id: 客户端唯一标识
+            kind: 连接类型（ws_logs、sse、multiplex）
+            on_close: 收到关闭指令时的回调，参数为关闭原因
+        """
+        self._viewers.setdefault(eval_id, {})[client_id] = on_close
+        await self._ensure_listener()
+        RedisManager.register_connection(eval_id, client_id, kind)
+    
+    def unregister_viewer(self, eval_id: int, client_id: str) -> None:
+        """注销查看连接
+        
+        Args:
+            eval_id: 评估任务ID
+            client_id: 客户端唯一标识
+        """
+        viewers = self._viewers.get(eval_id)
+        if viewers is not None and viewers.pop(client_id, None) is not None:
+            if not viewers:
+                del self._viewers[eval_id]
+            RedisManager.unregister_connection(eval_id, client_id)
+    
+    def _saturated_callback(self, callback: Optional[Callable[[LogSubscription], None]]):
+        """包装满载回调：移除订阅、计数并通知连接处理方"""
+        def on_saturated(subscription: LogSubscription) -> None:
+            self.slow_disconnects += 1
+            self.unsubscribe(subscription)
+            logger.warning(f"日志订阅持续满载，断开慢速客户端 [eval_id={subscription.eval_id}, dropped={subscription.dropped}]")
+            if callback is not None:
+                callback(subscription)
+        return on_saturated
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取订阅队列的运行指标
+
+        Returns:
+            Dict[str, Any]: 订阅数、队列深度、抽样/满载中的订阅数、丢弃消息数等
+        """
+        subscriptions = [sub for subscribers in self._subscriptions.values() for sub in subscribers]
+        depths = [sub.depth() for sub in subscriptions if sub.topic == "logs"]
+        return {
+            "subscriptions": len(subscriptions),
+            "log_subscriptions": len(depths),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "sampling_subscriptions": sum(1 for sub in subscriptions if sub.sampling),
+            "saturated_subscriptions": sum(1 for sub in subscriptions if sub.saturated_since is not None),
+            "messages_received": self.messages_received,
+            "messages_dispatched": self.messages_dispatched,
+            "messages_dropped": self.messages_dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "viewers": sum(len(viewers) for viewers in self._viewers.values()),
+            "process_id": RedisManager.get_process_id(),
+            "listener_running": self._listener is not None and not self._listener.done(),
+            "stream_tails": len(self._stream_ids)
+        }
+
+    def subscriber_count(self, eval_id: Optional[int] = None, topic: str = "logs") -> int:
+        """当前进程中的订阅数量
+
+        Args:
+            eval_id: 评估任务ID，None表示所有任务
+            topic: 消息类别
+
+        Returns:
+            int: 订阅数量
+        """
+        if eval_id is not None:
+            return len(self._subscriptions.get((topic, eval_id), ()))
+        return sum(len(subscribers) for (sub_topic, _), subscribers in self._subscriptions.items() if sub_topic == topic)
+
+    async def _ensure_listener(self) -> None:
+        """确保监听任务在运行，并等待模式订阅生效"""
+        if self._listener is None or self._listener.done():
+            self._ready = asyncio.Event()
+            self._listener = asyncio.create_task(self._listen())
+        if self._lease_task is None or self._lease_task.done():
+            self._lease_task = asyncio.create_task(self._renew_lease())
+        if RedisManager.is_stream_backend() and (self._stream_task is None or self._stream_task.done()):
+            self._stream_task = asyncio.create_task(self._tail_streams())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("等待日志通道模式订阅超时，实时日志可能延迟")
+
+    async def _listen(self) -> None:
+        """接收模式订阅的消息并分发，连接异常时退避重连"""
+        backoff = 0.5
+        while True:
+            pubsub = None
+            try:
+                redis = await RedisManager.get_async_instance()
+                if not redis:
+                    raise ConnectionError("无法获取异步Redis连接")
+                pubsub = redis.pubsub()
+                patterns = list(self.CHANNEL_PATTERNS.values())
+                await pubsub.psubscribe(*patterns)
+                self._ready.set()
+                logger.info(f"已订阅通道模式 {patterns}")
+                backoff = 0.5
+
+                async for message in pubsub.listen():
+                    if message.get("type") == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"日志通道订阅中断，{backoff}秒后重连: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    async def _tail_streams(self) -> None:
+        """stream后端：读取有日志订阅的任务的Stream新条目并按日志消息分发，读取异常时退避重试"""
+        backoff = 0.5
+        while True:
+            try:
+                if not self._stream_ids:
+                    await asyncio.sleep(self.STREAM_BLOCK_MS / 1000)
+                    continue
+                results = await RedisManager.read_log_streams(dict(self._stream_ids), block_ms=self.STREAM_BLOCK_MS)
+                for eval_id, entries in results.items():
+                    # 读取期间已取消全部订阅的任务不再跟踪
+                    if eval_id not in self._stream_ids:
+                        continue
+                    self._stream_ids[eval_id] = entries[-1][0]
+                    channel = RedisManager.get_log_channel(eval_id)
+                    for entry_id, data in entries:
+                        self._dispatch(channel, data, entry_id)
+                backoff = 0.5
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"读取日志Stream中断，{backoff}秒后重试: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+
+    async def _renew_lease(self) -> None:
+        """定期续期本进程的租约，连接注册表据此判断本进程名下的连接是否有效"""
+        interval = max(int(settings.api_process_lease_seconds) / 3, 1)
+        while True:
+            await asyncio.to_thread(RedisManager.renew_process_lease)
+            await asyncio.sleep(interval)
+    
+    def _dispatch(self, channel: str, data: str, entry_id: Optional[str] = None) -> None:
+        """按通道名中的任务ID与消息类别分发消息（eval:{id}:logs、eval:{id}:status、eval:{id}:viewers），
+        stream后端读取的日志附带条目ID"""
+        self.messages_received += 1
+        try:
+            _, raw_id, topic = channel.split(":", 2)
+            eval_id = int(raw_id)
+        except ValueError:
+            return
+        if topic == "viewers":
+            self._handle_viewers_command(eval_id, data)
+            return
+        for subscription in tuple(self._subscriptions.get((topic, eval_id), ())):
+            self.messages_dropped += subscription.put(data, entry_id)
+            self.messages_dispatched += 1
+
+    def _handle_viewers_command(self, eval_id: int, data: str) -> None:
+        """执行查看者控制指令：close 关闭本进程中该任务的所有查看连接"""
+        try:
+            command = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(command, dict) or command.get("action") != "close":
+            return
+        # 连接在自身清理时注销，这里只通知
+        viewers = dict(self._viewers.get(eval_id, {}))
+        if viewers:
+            logger.info(f"关闭任务的查看连接 [eval_id={eval_id}, count={len(viewers)}, reason={command.get('reason')}]")
+        for on_close in viewers.values():
+            try:
+                on_close(str(command.get("reason") or "closed"))
+            except Exception as e:
+                logger.warning(f"关闭查看连接失败 [eval_id={eval_id}]: {str(e)}")
+    
+    async def stop(self) -> None:
+        """停止监听与租约续期任务，注销本进程的查看连接并释放租约（应用关闭时调用）"""
+        for task in (self._listener, self._lease_task, self._stream_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = None
+        self._lease_task = None
+        self._stream_task = None
+        self._stream_ids.clear()
+        
+        for eval_id, viewers in list(self._viewers.items()):
+            for client_id in list(viewers):
+                RedisManager.unregister_connection(eval_id, client_id)
+        self._viewers.clear()
+        RedisManager.release_process_lease()
+
+
+# 进程级单例
+log_broadcaster = LogBroadcaster()
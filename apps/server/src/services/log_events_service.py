@@ -0,0 +1,198 @@
+import json
+import uuid
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from core.config import settings
+from models.eval import EvaluationStatus
+from utils.redis_manager import RedisManager
+from services.log_broadcaster import log_broadcaster, SubscriptionQueue
+
+
+# 日志配置
+logger = logging.getLogger(__name__)
+
+# 进入这些状态后不会再产生新日志，补发完剩余日志即结束事件流
+END_STATUSES = {
+    EvaluationStatus.COMPLETED.value,
+    EvaluationStatus.FAILED.value,
+    EvaluationStatus.STOPPED.value,
+    EvaluationStatus.TERMINATED.value
+}
+
+# 收到结束状态后再等待的时间（秒），让执行器关闭时最后投递的日志也能写入存储
+END_GRACE_SECONDS = 2.0
+
+
+def format_event(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """格式化一条SSE事件
+
+    Args:
+        data: 事件数据（多行数据拆分为多个data字段）
+        event: 事件类型，None表示默认的message
+        event_id: 事件ID，客户端重连时通过Last-Event-ID回传
+
+    Returns:
+        str: SSE事件文本
+    """
+    parts = []
+    if event_id is not None:
+        parts.append(f"id: {event_id}\n")
+    if event is not None:
+        parts.append(f"event: {event}\n")
+    for line in data.split("\n"):
+        parts.append(f"data: {line}\n")
+    parts.append("\n")
+    return "".join(parts)
+
+
+class LogEventStreamService:
+    """基于Server-Sent Events的日志与状态事件流
+
+    事件类型：
+        log     一行日志，事件ID为日志游标（list后端为全局行号，stream后端为Stream条目ID）
+        status  任务状态或运行时信息更新（不带ID，不影响续传位置）
+        end     任务已结束且日志已全部发送，或服务端要求关闭（带reason，如任务已删除）
+    客户端断线重连时浏览器自动携带Last-Event-ID，服务端从该游标之后继续发送，不重复、不遗漏。
+
+    实时部分不轮询：连接通过进程内共享的订阅器等待日志/状态通道消息，日志消息只作为唤醒信号，
+    唤醒后按游标从日志存储读取，因此即使通道消息被抽样或丢失，事件ID也始终与存储中的游标一致。
+    """
+
+    async def stream_events(self, eval_id: int, last_event_id: Optional[str] = None,
+                            tail_lines: int = 200) -> AsyncIterator[str]:
+        """生成任务的SSE事件流
+
+        Args:
+            eval_id: 评估任务ID
+            last_event_id: 续传游标，None表示从最近tail_lines行开始
+            tail_lines: 首次连接时发送的历史日志行数
+
+        Yields:
+            str: SSE事件文本
+        """
+        client_id = f"sse-{uuid.uuid4()}"
+        queue = SubscriptionQueue()
+        subscriptions = [
+            await log_broadcaster.subscribe(eval_id, "logs", queue),
+            await log_broadcaster.subscribe(eval_id, "status", queue)
+        ]
+        # 登记订阅者在线状态，执行器只在有在线订阅者时发布日志通道消息
+        RedisManager.touch_log_subscriber(eval_id, client_id)
+        # 登记到跨进程的连接注册表，收到关闭指令时把原因放入队列，由事件循环结束事件流
+        await log_broadcaster.register_viewer(
+            eval_id, client_id, "sse",
+            on_close=lambda reason: queue.put_nowait((eval_id, "viewers", reason))
+        )
+        keepalive = min(15, int(settings.log_presence_ttl_seconds) / 3)
+        loop = asyncio.get_running_loop()
+        touched_at = loop.time()
+        logger.info(f"已建立SSE事件流 [eval_id={eval_id}, client_id={client_id}, last_event_id={last_event_id}]")
+
+        try:
+            yield f"retry: {int(settings.sse_retry_ms)}\n\n"
+
+            status = RedisManager.get_task_status(eval_id)
+            if status:
+                yield format_event(json.dumps(status, ensure_ascii=False), event="status")
+            finished = self._is_end_status(status)
+            end_at = loop.time()
+
+            cursor = last_event_id
+            if cursor is None:
+                entries = await asyncio.to_thread(RedisManager.get_log_entries, eval_id, max_lines=tail_lines)
+                for event in self._log_events(entries):
+                    yield event
+                cursor = entries[-1][0] if entries else self._initial_cursor(eval_id)
+
+            while True:
+                # 补发游标之后的全部日志
+                async for entries in self._read_after(eval_id, cursor):
+                    for event in self._log_events(entries):
+                        yield event
+                    cursor = entries[-1][0]
+
+                if finished and loop.time() >= end_at:
+                    yield format_event(json.dumps({"eval_id": eval_id, "cursor": cursor}), event="end")
+                    break
+
+                try:
+                    timeout = end_at - loop.time() if finished else keepalive
+                    items = [await asyncio.wait_for(queue.get(), timeout=timeout)]
+                    # 突发输出时等待一个合并窗口，让一次读取覆盖多条通道消息
+                    await asyncio.sleep(int(settings.ws_log_frame_interval_ms) / 1000)
+                except asyncio.TimeoutError:
+                    items = []
+                    if not finished:
+                        yield ": keepalive\n\n"
+                while not queue.empty():
+                    items.append(queue.get_nowait())
+
+                # 持续跟不上推送速度的连接已被关闭订阅，结束事件流，客户端重连后按Last-Event-ID续传
+                if any(subscription.closed for subscription in subscriptions):
+                    logger.warning(f"SSE客户端接收过慢，结束事件流 [eval_id={eval_id}, client_id={client_id}]")
+                    break
+
+                # 服务端要求关闭（如任务已删除）：发送end事件，客户端收到后不再重连
+                closed_reason = next((data for _, topic, data in items if topic == "viewers"), None)
+                if closed_reason is not None:
+                    yield format_event(json.dumps({"eval_id": eval_id, "cursor": cursor, "reason": closed_reason}), event="end")
+                    break
+
+                # 日志消息只用于唤醒；状态消息原样转发
+                for _, topic, data in items:
+                    if topic != "status":
+                        continue
+                    yield format_event(data, event="status")
+                    if not finished and self._is_end_status(self._parse_status(data)):
+                        finished = True
+                        end_at = loop.time() + END_GRACE_SECONDS
+
+                if loop.time() - touched_at >= keepalive:
+                    RedisManager.touch_log_subscriber(eval_id, client_id)
+                    touched_at = loop.time()
+        finally:
+            for subscription in subscriptions:
+                log_broadcaster.unsubscribe(subscription)
+            log_broadcaster.unregister_viewer(eval_id, client_id)
+            RedisManager.remove_log_subscriber(eval_id, client_id)
+            logger.info(f"SSE事件流已结束 [eval_id={eval_id}, client_id={client_id}]")
+
+    async def _read_after(self, eval_id: int, cursor: str) -> AsyncIterator[List[Tuple[str, str]]]:
+        """在线程池中按游标分页读取日志，直到追上最新日志
+
+        Args:
+            eval_id: 评估任务ID
+            cursor: 起始游标（不含）
+
+        Yields:
+            List[Tuple[str, str]]: 一页 (游标, 日志行) 记录
+        """
+        page_size = int(settings.sse_page_lines)
+        while True:
+            entries = await asyncio.to_thread(RedisManager.get_log_entries, eval_id, max_lines=page_size, since=cursor)
+            if not entries:
+                break
+            yield entries
+            cursor = entries[-1][0]
+            if len(entries) < page_size:
+                break
+
+    def _log_events(self, entries: List[Tuple[str, str]]) -> List[str]:
+        """把日志记录格式化为log事件"""
+        return [format_event(log_line, event="log", event_id=cursor) for cursor, log_line in entries]
+
+    def _initial_cursor(self, eval_id: int) -> str:
+        """尚无日志时的起始游标（之后的第一条日志即为全部日志的开头），与get_log_entries选择的存储一致"""
+        return "0-0" if RedisManager.reads_from_stream(eval_id) else "-1"
+
+    def _parse_status(self, data: str) -> Optional[Dict[str, Any]]:
+        try:
+            status = json.loads(data)
+        except (TypeError, ValueError):
+            return None
+        return status if isinstance(status, dict) else None
+
+    def _is_end_status(self, status: Optional[Dict[str, Any]]) -> bool:
+        """状态消息是否表示任务已结束（运行时信息消息带type字段，不是状态更新）"""
+        return bool(status) and "type" not in status and status.get("status") in END_STATUSES
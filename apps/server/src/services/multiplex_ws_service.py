@@ -0,0 +1,333 @@
+import json
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+from core.config import settings
+from utils.redis_manager import RedisManager
+from utils.log_codec import decode_text
+from services.log_broadcaster import log_broadcaster, get_batch, LogSubscription, SubscriptionQueue
+
+
+# 日志配置
+logger = logging.getLogger(__name__)
+
+# 客户端可订阅的消息类别
+TOPICS = ("status", "progress", "results", "runtime", "logs")
+DEFAULT_TOPICS = ("status", "progress", "results")
+
+
+def classify_status_message(message: Dict[str, Any]) -> str:
+    """判断状态通道消息属于哪个类别
+
+    状态通道上有两类消息：RedisManager.update_task_status 发布的状态更新（不带type字段），
+    以及 RedisManager.update_runtime_info 发布的运行时信息（按type字段区分）。
+
+    Args:
+        message: 状态通道消息
+
+    Returns:
+        str: status、progress、results或runtime（心跳、控制命令回执、日志统计等）
+    """
+    message_type = message.get("type")
+    if message_type is None:
+        return "status"
+    if message_type == "progress":
+        return "progress"
+    if message_type == "results_ready":
+        return "results"
+    return "runtime"
+
+
+class MultiplexConnection:
+    """一个多路复用WebSocket连接的订阅状态
+
+    每个任务最多持有两个底层订阅（日志通道、状态通道），共用连接的一个有总量上限的队列；
+    状态通道的消息入队前按客户端订阅的类别过滤，同一任务同一类别只保留最新一条。
+    """
+
+    def __init__(self, websocket: WebSocket, client_id: str):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.queue = SubscriptionQueue(max_items=int(settings.ws_multiplex_queue_max_messages))
+        self.topics: Dict[int, Set[str]] = {}
+        self.subscriptions: Dict[Tuple[int, str], LogSubscription] = {}
+        self.saturated = False
+
+    def channel_topics(self, eval_id: int) -> Set[str]:
+        """任务需要订阅的底层通道（logs、status）"""
+        wanted = self.topics.get(eval_id, set())
+        channels = set()
+        if "logs" in wanted:
+            channels.add("logs")
+        if wanted - {"logs"}:
+            channels.add("status")
+        return channels
+
+    def status_kind(self, eval_id: int, data: str) -> Optional[str]:
+        """状态通道消息的类别，客户端未订阅该类别（或消息无法解析）时返回None"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(message, dict):
+            return None
+        topic = classify_status_message(message)
+        return topic if topic in self.topics.get(eval_id, ()) else None
+
+    def log_eval_ids(self) -> List[int]:
+        """订阅了日志的任务ID"""
+        return [eval_id for (eval_id, channel) in self.subscriptions if channel == "logs"]
+
+
+class MultiplexWebSocketService:
+    """多路复用WebSocket服务：一个连接订阅多个任务的状态、进度、结果与日志
+
+    客户端消息（JSON）：
+        {"action": "subscribe", "eval_ids": [1, 2], "topics": ["status", "progress"]}
+        {"action": "unsubscribe", "eval_ids": [1], "topics": ["logs"]}    topics省略表示全部
+        {"action": "ping"}
+    服务端消息（JSON）：
+        {"type": "subscribed" | "unsubscribed", "eval_ids": [...], "topics": [...]}
+        {"type": "status" | "progress" | "results" | "runtime", "eval_id": 1, "data": {...}}
+        {"type": "logs", "eval_id": 1, "lines": [...]}                     按合并窗口合并的实时日志
+        {"type": "skipped", "eval_id": 1, "topic": "logs", "count": N}    接收过慢被跳过的消息数
+        {"type": "closed", "eval_id": 1, "reason": "deleted"}             服务端取消了该任务的全部订阅（如任务已删除）
+        {"type": "heartbeat"} / {"type": "pong"} / {"type": "error", "error": "..."}
+    订阅status、progress时先推送一次当前快照，之后只推送变化。
+    """
+
+    def __init__(self):
+        self.active_connections: Dict[str, MultiplexConnection] = {}
+
+    async def handle_connection(self, websocket: WebSocket):
+        """处理多路复用WebSocket连接
+
+        Args:
+            websocket: WebSocket连接
+        """
+        await websocket.accept()
+        client_id = str(uuid.uuid4())
+        connection = MultiplexConnection(websocket, client_id)
+        self.active_connections[client_id] = connection
+        logger.info(f"已建立多路复用WebSocket连接 [client_id={client_id}]")
+
+        forward_task = asyncio.create_task(self._forward_messages(connection))
+        heartbeat_task = asyncio.create_task(self._heartbeat(connection))
+        try:
+            while True:
+                raw = await websocket.receive_text()
+                await self._handle_client_message(connection, raw)
+        except WebSocketDisconnect:
+            logger.info(f"客户端断开多路复用WebSocket连接 [client_id={client_id}]")
+        except Exception as e:
+            logger.error(f"多路复用WebSocket处理出错 [client_id={client_id}]: {str(e)}")
+        finally:
+            for task in (forward_task, heartbeat_task):
+                task.cancel()
+            await asyncio.gather(forward_task, heartbeat_task, return_exceptions=True)
+            for eval_id in list(connection.topics):
+                self._unsubscribe(connection, eval_id, TOPICS)
+            self.active_connections.pop(client_id, None)
+            if websocket.client_state == WebSocketState.CONNECTED:
+                try:
+                    await websocket.close()
+                except Exception:
+                    pass
+            logger.info(f"多路复用WebSocket连接资源已清理 [client_id={client_id}]")
+
+    async def _handle_client_message(self, connection: MultiplexConnection, raw: str):
+        """处理客户端发来的订阅/取消订阅/ping消息"""
+        try:
+            message = json.loads(raw)
+            action = message.get("action")
+        except (ValueError, AttributeError):
+            await self._send(connection, {"type": "error", "error": "消息必须是JSON对象"})
+            return
+
+        if action == "ping":
+            await self._send(connection, {"type": "pong"})
+            return
+        if action not in ("subscribe", "unsubscribe"):
+            await self._send(connection, {"type": "error", "error": f"不支持的操作: {action}"})
+            return
+
+        try:
+            eval_ids = [int(eval_id) for eval_id in message.get("eval_ids") or []]
+        except (TypeError, ValueError):
+            await self._send(connection, {"type": "error", "error": "eval_ids必须是任务ID列表"})
+            return
+        topics = message.get("topics") or (DEFAULT_TOPICS if action == "subscribe" else TOPICS)
+        if isinstance(topics, str):
+            topics = [topics]
+        unknown = [topic for topic in topics if topic not in TOPICS]
+        if unknown:
+            await self._send(connection, {"type": "error", "error": f"不支持的订阅类别: {unknown}"})
+            return
+
+        if action == "unsubscribe":
+            for eval_id in eval_ids:
+                self._unsubscribe(connection, eval_id, topics)
+            await self._send(connection, {"type": "unsubscribed", "eval_ids": eval_ids, "topics": list(topics)})
+            return
+
+        new_ids = [eval_id for eval_id in eval_ids if eval_id not in connection.topics]
+        limit = int(settings.ws_max_subscriptions)
+        if len(connection.topics) + len(new_ids) > limit:
+            await self._send(connection, {"type": "error", "error": f"单个连接最多订阅{limit}个任务"})
+            return
+        for eval_id in eval_ids:
+            await self._subscribe(connection, eval_id, topics)
+        await self._send(connection, {"type": "subscribed", "eval_ids": eval_ids, "topics": list(topics)})
+        for eval_id in eval_ids:
+            await self._send_snapshot(connection, eval_id, topics)
+
+    async def _subscribe(self, connection: MultiplexConnection, eval_id: int, topics):
+        """为任务增加订阅类别，并按需建立底层通道订阅"""
+        if eval_id not in connection.topics:
+            # 每个订阅的任务登记为一个查看连接，任务删除时由任一API进程广播的指令取消订阅
+            await log_broadcaster.register_viewer(
+                eval_id, connection.client_id, "multiplex",
+                on_close=lambda reason: self._close_evaluation(connection, eval_id, reason)
+            )
+        connection.topics.setdefault(eval_id, set()).update(topics)
+        for channel in connection.channel_topics(eval_id):
+            if (eval_id, channel) in connection.subscriptions:
+                continue
+            connection.subscriptions[(eval_id, channel)] = await log_broadcaster.subscribe(
+                eval_id, channel, connection.queue,
+                on_saturated=lambda _: self._disconnect_slow_client(connection),
+                classify=(lambda data, eval_id=eval_id: connection.status_kind(eval_id, data)) if channel == "status" else None
+            )
+            if channel == "logs":
+                # 登记订阅者在线状态，执行器只在有在线订阅者时发布日志
+                RedisManager.touch_log_subscriber(eval_id, connection.client_id)
+
+    def _unsubscribe(self, connection: MultiplexConnection, eval_id: int, topics):
+        """移除任务的订阅类别，并释放不再需要的底层通道订阅"""
+        wanted = connection.topics.get(eval_id)
+        if wanted is None:
+            return
+        wanted.difference_update(topics)
+        channels = connection.channel_topics(eval_id)
+        for channel in ("logs", "status"):
+            if channel in channels:
+                continue
+            subscription = connection.subscriptions.pop((eval_id, channel), None)
+            if subscription is None:
+                continue
+            log_broadcaster.unsubscribe(subscription)
+            if channel == "logs":
+                RedisManager.remove_log_subscriber(eval_id, connection.client_id)
+        if not wanted:
+            del connection.topics[eval_id]
+            log_broadcaster.unregister_viewer(eval_id, connection.client_id)
+
+    def _close_evaluation(self, connection: MultiplexConnection, eval_id: int, reason: str):
+        """按服务端指令取消任务的全部订阅并通知客户端（查看者关闭指令回调）"""
+        self._unsubscribe(connection, eval_id, TOPICS)
+
+        async def notify():
+            try:
+                await self._send(connection, {"type": "closed", "eval_id": eval_id, "reason": reason})
+            except Exception as e:
+                logger.debug(f"发送订阅关闭通知失败 [client_id={connection.client_id}]: {str(e)}")
+
+        asyncio.create_task(notify())
+
+    async def _send_snapshot(self, connection: MultiplexConnection, eval_id: int, topics):
+        """推送任务当前的状态与进度快照"""
+        if "status" in topics:
+            status = RedisManager.get_task_status(eval_id)
+            if status:
+                await self._send(connection, {"type": "status", "eval_id": eval_id, "data": status})
+        if "progress" in topics:
+            runtime = RedisManager.get_runtime_info(eval_id)
+            if "progress" in runtime:
+                await self._send(connection, {"type": "progress", "eval_id": eval_id, "data": runtime})
+
+    async def _forward_messages(self, connection: MultiplexConnection):
+        """把连接队列中的通道消息按订阅类别过滤、合并后发送给客户端"""
+        max_items = int(settings.ws_log_frame_max_lines)
+        frame_interval = int(settings.ws_log_frame_interval_ms) / 1000
+        try:
+            while True:
+                batch = await get_batch(connection.queue, max_items, frame_interval)
+                for (eval_id, channel), subscription in list(connection.subscriptions.items()):
+                    skipped = subscription.take_skipped()
+                    if skipped:
+                        await self._send(connection, {"type": "skipped", "eval_id": eval_id, "topic": channel, "count": skipped})
+
+                # 同一任务的日志行合并为一帧，其他消息保持到达顺序逐条发送
+                log_lines: Dict[int, List[str]] = {}
+                events = []
+                for eval_id, channel, data in batch:
+                    wanted = connection.topics.get(eval_id, set())
+                    if channel == "logs":
+                        if "logs" in wanted:
+                            log_lines.setdefault(eval_id, []).append(decode_text(data))
+                        continue
+                    try:
+                        message = json.loads(data)
+                    except (TypeError, ValueError):
+                        continue
+                    if not isinstance(message, dict):
+                        continue
+                    topic = classify_status_message(message)
+                    if topic in wanted:
+                        events.append({"type": topic, "eval_id": eval_id, "data": message})
+
+                for event in events:
+                    await self._send(connection, event)
+                for eval_id, lines in log_lines.items():
+                    await self._send(connection, {"type": "logs", "eval_id": eval_id, "lines": lines})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"多路复用消息转发结束 [client_id={connection.client_id}]: {str(e)}")
+
+    async def _heartbeat(self, connection: MultiplexConnection):
+        """定期发送心跳，并续期订阅了日志的任务的订阅者在线状态"""
+        interval = min(30, int(settings.log_presence_ttl_seconds) / 3)
+        try:
+            while connection.websocket.client_state == WebSocketState.CONNECTED:
+                await asyncio.sleep(interval)
+                await self._send(connection, {"type": "heartbeat"})
+                for eval_id in connection.log_eval_ids():
+                    RedisManager.touch_log_subscriber(eval_id, connection.client_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"心跳发送失败: {str(e)}")
+
+    async def _send(self, connection: MultiplexConnection, message: Dict[str, Any]):
+        await connection.websocket.send_text(json.dumps(message, ensure_ascii=False))
+
+    def _disconnect_slow_client(self, connection: MultiplexConnection):
+        """断开持续跟不上推送速度的客户端（连接队列满载回调，多个订阅只处理一次）"""
+        if connection.saturated:
+            return
+        connection.saturated = True
+
+        async def close():
+            try:
+                await asyncio.wait_for(connection.websocket.close(code=1013, reason="consumer too slow"), timeout=5)
+            except Exception as e:
+                logger.debug(f"关闭慢速客户端连接失败 [client_id={connection.client_id}]: {str(e)}")
+
+        asyncio.create_task(close())
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取多路复用连接的运行指标
+
+        Returns:
+            Dict[str, Any]: 连接数、订阅的任务数与底层通道订阅数
+        """
+        connections = list(self.active_connections.values())
+        return {
+            "connections": len(connections),
+            "subscribed_evaluations": sum(len(connection.topics) for connection in connections),
+            "channel_subscriptions": sum(len(connection.subscriptions) for connection in connections)
+        }
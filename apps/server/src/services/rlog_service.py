@@ -2,14 +2,119 @@ import logging
 import traceback
 import asyncio
 import uuid
+import json
+from typing import List, Optional, Tuple
 from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.websockets import WebSocketState
+from core.config import settings
 from utils.redis_manager import RedisManager
+from utils.log_codec import decode_record, decode_text
+from services.log_broadcaster import log_broadcaster, LogSubscription
 
 
 # 日志配置
 logger = logging.getLogger(__name__)
 
+# 服务端按指令关闭查看连接（如任务已删除）时使用的关闭码，客户端收到后不再重连
+VIEWER_CLOSE_CODE = 4404
+
+
+def entry_position(cursor: str) -> int:
+    """由日志游标得到存储位置
+    
+    Args:
+        cursor: get_log_entries返回的游标
+        
+    Returns:
+        int: list后端为全局行号+1；Stream条目ID无法换算为位置，返回0
+    """
+    try:
+        return int(cursor) + 1
+    except (TypeError, ValueError):
+        return 0
+
+
+def stream_position(entry_id: str) -> Tuple[int, int]:
+    """由Stream条目ID得到可比较的位置
+    
+    Args:
+        entry_id: Stream条目ID（毫秒时间戳-序号）
+        
+    Returns:
+        Tuple[int, int]: (毫秒时间戳, 序号)
+    """
+    milliseconds, _, sequence = str(entry_id).partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class LogFrameSender:
+    """按连接选择的分帧协议发送日志行
+    
+    line协议（默认，兼容旧客户端）：每行日志一个文本帧。
+    batch协议：多行日志合并为一个JSON帧
+        {"type": "history" | "logs", "seq": 首行序号, "lines": [...], "cursor": 最后一行的游标}
+    序号取自日志在存储中的位置（list后端为全局行号+1，与紧凑编码的记录序号一致），帧内各行序号连续，
+    客户端发现某帧的seq大于上一帧seq加行数时即可判断中间有日志缺失（如订阅前写入、无订阅者时未发布的日志）。
+    位置未知的行（旧版纯文本记录、Stream条目）沿用上一行序号加1。
+    """
+    
+    def __init__(self, websocket: WebSocket, batched: bool = False):
+        self.websocket = websocket
+        self.batched = batched
+        self.next_seq = 1
+    
+    async def send(self, lines: List[str], kind: str = "logs", cursor: Optional[str] = None,
+                   seqs: Optional[List[int]] = None):
+        """发送一批日志行
+        
+        Args:
+            lines: 日志行列表
+            kind: 帧类型，history（历史日志）或logs（实时日志），仅batch协议使用
+            cursor: 最后一行日志的游标，仅batch协议随帧发送
+            seqs: 每行日志的存储位置，0或None表示未知；序号不连续时拆分为多帧
+        """
+        if not lines:
+            return
+        if not self.batched:
+            for line in lines:
+                await self.websocket.send_text(line)
+            return
+        
+        # 按序号连续的区间分帧
+        runs = []
+        expected = self.next_seq
+        for line, seq in zip(lines, seqs or [None] * len(lines)):
+            seq = seq or expected
+            if not runs or seq != expected:
+                runs.append((seq, []))
+            runs[-1][1].append(line)
+            expected = seq + 1
+        self.next_seq = expected
+        
+        for i, (seq, run) in enumerate(runs):
+            frame = {"type": kind, "seq": seq, "lines": run}
+            if cursor is not None and i == len(runs) - 1:
+                frame["cursor"] = cursor
+            await self.websocket.send_text(json.dumps(frame, ensure_ascii=False))
+    
+    async def send_skipped(self, count: int):
+        """提示客户端有日志因接收过慢被跳过
+        
+        batch协议发送 {"type": "skipped", "seq": 首个被跳过行的序号, "count": 行数}，并让序号跳过这些行；
+        line协议发送一行提示文本。
+        
+        Args:
+            count: 跳过的行数
+        """
+        if count <= 0:
+            return
+        if not self.batched:
+            await self.websocket.send_text(f"[日志推送] 客户端接收过慢，已跳过 {count} 行，完整日志请下载查看")
+            return
+        frame = {"type": "skipped", "seq": self.next_seq, "count": count}
+        self.next_seq += count
+        await self.websocket.send_text(json.dumps(frame))
+
 
 class WebSocketLogService:
     """WebSocket日志服务"""
@@ -18,7 +123,7 @@ class WebSocketLogService:
         # 存储活动连接的后台任务，用于清理
         self.active_tasks = {}
     
-    async def handle_websocket_logs(self, websocket: WebSocket, eval_id: int):
+    async def handle_websocket_logs(self, websocket: WebSocket, eval_id: int, since: Optional[str] = None, framing: str = "line"):
         """处理WebSocket日志连接
         
         将WebSocket日志处理逻辑从路由层移到服务层，提高代码可维护性
@@ -26,48 +131,75 @@ class WebSocketLogService:
         Args:
             websocket: WebSocket连接
             eval_id: 评估任务ID
+            since: 日志游标，断线重连时只补发该游标之后的日志
+            framing: 分帧协议，line（每行一帧）或batch（合并为带序号的JSON帧），见LogFrameSender
         """
         # 接受WebSocket连接
         await websocket.accept()
         
         # 生成唯一的客户端ID
         client_id = str(uuid.uuid4())
+        sender = LogFrameSender(websocket, batched=framing == "batch")
         logger.info(f"已建立WebSocket连接 [eval_id={eval_id}, client_id={client_id}]")
         
         # 资源初始化为None
-        redis_client = None
-        pubsub = None
+        subscription = None
         background_task = None
         heartbeat_task = None
         
         try:
+            # 登记订阅者在线状态，执行器只在有在线订阅者时逐行发布日志
+            RedisManager.touch_log_subscriber(eval_id, client_id)
+            
+            # 登记到跨进程的连接注册表，任务删除等场景下任一API进程都能关闭本连接
+            await log_broadcaster.register_viewer(
+                eval_id, client_id, "ws_logs",
+                on_close=lambda reason: self._close_client(websocket, client_id, VIEWER_CLOSE_CODE, reason)
+            )
+            
             # 1. 发送当前任务状态
             await self._send_task_status(websocket, eval_id)
             
             # 2. 发送历史日志
-            await self._send_historical_logs(websocket, eval_id)
+            last_cursor = await self._send_historical_logs(sender, eval_id, since)
             
-            # 3. 订阅Redis日志通道
-            redis_client, pubsub = await self._subscribe_to_log_channel(websocket, eval_id)
-            if not redis_client or not pubsub:
-                await websocket.send_json({"error": "无法连接到日志服务"})
-                return
+            if RedisManager.is_stream_backend():
+                # 3. Stream后端：由进程内共享的订阅器读取Stream新条目，队列元素带条目ID
+                subscription = await log_broadcaster.subscribe(
+                    eval_id, with_ids=True, on_saturated=lambda _: self._disconnect_slow_client(websocket, client_id)
+                )
                 
-            # 4. 启动心跳任务
-            heartbeat_task = asyncio.create_task(self._websocket_heartbeat(websocket))
-            
-            # 5. 创建后台任务来处理日志消息，而不是直接调用
-            background_task = asyncio.create_task(
-                self._listen_for_log_messages(websocket, pubsub, client_id, eval_id)
-            )
+                # 订阅建立后按游标补读Stream，订阅中已补发的条目由监听任务按ID跳过
+                last_cursor = await self._send_stream_catch_up(
+                    sender, eval_id, RedisManager.to_stream_cursor(eval_id, last_cursor)
+                )
+                background_task = asyncio.create_task(
+                    self._listen_for_stream_entries(sender, subscription, client_id, eval_id, last_cursor)
+                )
+            else:
+                # 3. 通过进程内共享的订阅器接收日志通道消息
+                subscription = await log_broadcaster.subscribe(
+                    eval_id, on_saturated=lambda _: self._disconnect_slow_client(websocket, client_id)
+                )
+                
+                # 订阅建立后按游标补发读取历史之后写入的日志，通道中已补发的日志由监听任务按位置跳过
+                last_cursor = await self._send_catch_up_logs(sender, eval_id, last_cursor)
+                
+                # 创建后台任务来处理日志消息，而不是直接调用
+                background_task = asyncio.create_task(
+                    self._listen_for_log_messages(sender, subscription, client_id, eval_id,
+                                                  sent_position=entry_position(last_cursor))
+                )
+                
+            # 4. 启动心跳任务（同时续期订阅者在线状态）
+            heartbeat_task = asyncio.create_task(self._websocket_heartbeat(websocket, eval_id, client_id))
             
             # 存储后台任务引用以便清理
             self.active_tasks[client_id] = {
                 "task": background_task,
                 "heartbeat": heartbeat_task,
                 "eval_id": eval_id,
-                "pubsub": pubsub,
-                "redis_client": redis_client
+                "subscription": subscription
             }
             
             # 等待连接关闭
@@ -84,7 +216,9 @@ class WebSocketLogService:
                 pass
         finally:
             # 清理资源
-            await self._cleanup_connection(client_id, pubsub, redis_client, websocket)
+            RedisManager.remove_log_subscriber(eval_id, client_id)
+            log_broadcaster.unregister_viewer(eval_id, client_id)
+            await self._cleanup_connection(client_id, subscription, websocket)
 
     async def _wait_for_disconnect(self, websocket: WebSocket, client_id: str):
         """等待WebSocket连接断开
@@ -102,13 +236,12 @@ class WebSocketLogService:
             logger.info(f"客户端断开连接 [client_id={client_id}]")
             raise
 
-    async def _cleanup_connection(self, client_id: str, pubsub=None, redis_client=None, websocket=None):
+    async def _cleanup_connection(self, client_id: str, subscription: Optional[LogSubscription] = None, websocket=None):
         """清理连接资源
         
         Args:
             client_id: 客户端ID
-            pubsub: Redis PubSub对象
-            redis_client: Redis客户端
+            subscription: 日志订阅对象
             websocket: WebSocket连接
         """
         # 获取并取消后台任务
@@ -137,8 +270,8 @@ class WebSocketLogService:
                 except Exception as e:
                     logger.warning(f"取消心跳任务时出错: {str(e)}")
         
-        # 清理Redis资源
-        await self._cleanup_websocket_resources(pubsub, redis_client)
+        # 取消日志订阅
+        log_broadcaster.unsubscribe(subscription)
         
         # 关闭WebSocket连接
         if websocket and websocket.client_state == WebSocketState.CONNECTED:
@@ -149,6 +282,40 @@ class WebSocketLogService:
         
         logger.info(f"WebSocket连接资源已清理 [client_id={client_id}]")
 
+    def _disconnect_slow_client(self, websocket: WebSocket, client_id: str):
+        """断开持续跟不上日志推送速度的客户端（由订阅队列满载回调触发）
+        
+        客户端可稍后重连并按游标续传。
+        
+        Args:
+            websocket: WebSocket连接
+            client_id: 客户端ID
+        """
+        self._close_client(websocket, client_id, 1013, "log consumer too slow")
+
+    def _close_client(self, websocket: WebSocket, client_id: str, code: int, reason: str):
+        """从回调中关闭客户端连接
+        
+        先取消日志转发任务（可能正阻塞在发送上），再发送关闭帧；连接处理协程随后完成清理。
+        
+        Args:
+            websocket: WebSocket连接
+            client_id: 客户端ID
+            code: WebSocket关闭码
+            reason: 关闭原因
+        """
+        task_info = self.active_tasks.get(client_id)
+        if task_info and task_info.get("task") and not task_info["task"].done():
+            task_info["task"].cancel()
+        
+        async def close():
+            try:
+                await asyncio.wait_for(websocket.close(code=code, reason=reason), timeout=5)
+            except Exception as e:
+                logger.debug(f"关闭客户端连接失败 [client_id={client_id}]: {str(e)}")
+        
+        asyncio.create_task(close())
+
     async def _send_task_status(self, websocket: WebSocket, eval_id: int):
         """发送任务当前状态信息
         
@@ -167,148 +334,198 @@ class WebSocketLogService:
         except Exception as e:
             logger.warning(f"发送任务状态失败 [eval_id={eval_id}]: {str(e)}")
 
-    async def _send_historical_logs(self, websocket: WebSocket, eval_id: int):
+    async def _send_historical_logs(self, sender: LogFrameSender, eval_id: int, since: Optional[str] = None) -> Optional[str]:
         """发送历史日志到WebSocket
         
+        未指定since时发送最近200行；指定since时分页补发游标之后的全部日志。
+        batch协议下每页历史日志合并为一帧。
+        发送完成后推送一条cursor消息，客户端重连时携带该游标即可续传。
+        
         Args:
-            websocket: WebSocket连接
+            sender: 日志帧发送器
             eval_id: 评估任务ID
+            since: 日志游标
+            
+        Returns:
+            Optional[str]: 已发送的最后一条日志的游标
         """
+        websocket = sender.websocket
+        last_cursor = since
         try:
             # 从Redis获取历史日志
-            logs = RedisManager.get_logs(eval_id, max_lines=200)
+            if since is None:
+                pages = [RedisManager.get_log_entries(eval_id, max_lines=200)]
+            else:
+                pages = self._iter_log_pages(eval_id, since)
+            
+            sent_count = 0
+            for entries in pages:
+                if not entries:
+                    continue
+                last_cursor = entries[-1][0]
+                await sender.send([log_line for _, log_line in entries], kind="history", cursor=last_cursor,
+                                  seqs=[entry_position(entry_cursor) for entry_cursor, _ in entries])
+                sent_count += len(entries)
             
-            if logs and len(logs) > 0:
-                logger.debug(f"从Redis获取到{len(logs)}条历史日志 [eval_id={eval_id}]")
+            if sent_count > 0:
+                logger.debug(f"从Redis获取到{sent_count}条历史日志 [eval_id={eval_id}]")
                 await websocket.send_json({
                     "type": "info", 
-                    "data": f"已加载{len(logs)}条历史日志"
+                    "data": f"已加载{sent_count}条历史日志"
                 })
-                
-                # 批量发送日志以提高性能
-                for log_line in logs:
-                    await websocket.send_text(log_line)
             else:
                 logger.debug(f"Redis中无历史日志 [eval_id={eval_id}]")
                 await websocket.send_json({
                     "type": "info", 
                     "data": "暂无历史日志"
                 })
+            
+            if last_cursor is not None:
+                await websocket.send_json({"type": "cursor", "data": last_cursor})
         except Exception as e:
             logger.warning(f"发送历史日志失败 [eval_id={eval_id}]: {str(e)}")
             await websocket.send_json({
                 "type": "warning", 
                 "data": f"获取历史日志失败: {str(e)}"
             })
+        return last_cursor
     
-    async def _subscribe_to_log_channel(self, websocket: WebSocket, eval_id: int):
-        """订阅Redis日志通道
+    async def _send_catch_up_logs(self, sender: LogFrameSender, eval_id: int, last_cursor: Optional[str]) -> Optional[str]:
+        """订阅日志通道后补发游标之后的日志
+        
+        读取历史日志与订阅通道之间写入的日志既不在历史中，也不会再从通道收到，
+        订阅建立后按游标补读一次即可覆盖这段间隙。
         
         Args:
+            sender: 日志帧发送器
             eval_id: 评估任务ID
+            last_cursor: 已发送的最后一条日志的游标，None表示尚未发送任何日志
             
         Returns:
-            Tuple[redis.Redis, redis.client.PubSub]: Redis客户端和PubSub对象
+            Optional[str]: 补发后的最后一条日志的游标
         """
         try:
-            # 获取Redis连接
-            redis_client = RedisManager.get_instance()
-            if not redis_client:
-                logger.error(f"无法获取Redis客户端 [eval_id={eval_id}]")
-                return None, None
-                
-            # 创建PubSub对象并订阅日志通道
-            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
-            log_channel = RedisManager.get_log_channel(eval_id)
-            pubsub.subscribe(log_channel)
+            for entries in self._iter_log_pages(eval_id, last_cursor if last_cursor is not None else "-1"):
+                last_cursor = entries[-1][0]
+                await sender.send([log_line for _, log_line in entries], cursor=last_cursor,
+                                  seqs=[entry_position(entry_cursor) for entry_cursor, _ in entries])
+        except Exception as e:
+            logger.warning(f"补发订阅前写入的日志失败 [eval_id={eval_id}]: {str(e)}")
+        return last_cursor
+    
+    async def _send_stream_catch_up(self, sender: LogFrameSender, eval_id: int, last_id: str,
+                                    page_size: int = 1000) -> str:
+        """订阅建立后按条目ID补读Stream中游标之后的日志（不阻塞，读到末尾即返回）
+        
+        Args:
+            sender: 日志帧发送器
+            eval_id: 评估任务ID
+            last_id: 已发送的最后一个条目ID，"0-0"表示从头读取
+            page_size: 每次读取的条目数
             
-            logger.debug(f"已订阅Redis日志通道 [eval_id={eval_id}, channel={log_channel}]")
-            return redis_client, pubsub
+        Returns:
+            str: 补发后的最后一个条目ID
+        """
+        try:
+            while True:
+                entries = await RedisManager.read_log_stream(eval_id, last_id, block_ms=None, count=page_size)
+                if not entries:
+                    break
+                last_id = entries[-1][0]
+                await self._send_stream_entries(sender, entries)
+                if len(entries) < page_size:
+                    break
         except Exception as e:
-            logger.error(f"订阅日志通道失败 [eval_id={eval_id}]: {str(e)}")
-            return None, None
-
-    async def _websocket_heartbeat(self, websocket: WebSocket):
-        """定期发送心跳消息，保持WebSocket连接活跃
+            logger.warning(f"补读日志Stream失败 [eval_id={eval_id}]: {str(e)}")
+        return last_id
+    
+    async def _send_stream_entries(self, sender: LogFrameSender, entries: List[Tuple[str, str]]):
+        """发送一批Stream日志，batch协议的帧自带游标，line协议随后推送一次游标供断线重连续传"""
+        last_id = entries[-1][0]
+        await sender.send([log_line for _, log_line in entries], cursor=last_id)
+        if not sender.batched:
+            await sender.websocket.send_json({"type": "cursor", "data": last_id})
+    
+    def _iter_log_pages(self, eval_id: int, since: str, page_size: int = 1000):
+        """按游标分页读取日志，直到追上最新日志
+        
+        Args:
+            eval_id: 评估任务ID
+            since: 起始游标
+            page_size: 每页行数
+            
+        Yields:
+            List[Tuple[str, str]]: 一页 (游标, 日志行) 记录
+        """
+        cursor = since
+        while True:
+            entries = RedisManager.get_log_entries(eval_id, max_lines=page_size, since=cursor)
+            if not entries:
+                break
+            yield entries
+            cursor = entries[-1][0]
+            if len(entries) < page_size:
+                break
+    
+    async def _websocket_heartbeat(self, websocket: WebSocket, eval_id: int, client_id: str):
+        """定期发送心跳消息，保持WebSocket连接活跃，并续期订阅者在线状态
         
         Args:
             websocket: WebSocket连接
+            eval_id: 评估任务ID
+            client_id: 客户端唯一标识
         """
+        # 至少每30秒一次心跳，且在在线状态过期前续期两次
+        interval = min(30, int(settings.log_presence_ttl_seconds) / 3)
         try:
             while True:
                 if websocket.client_state != WebSocketState.CONNECTED:
                     break
                     
                 await websocket.send_json({"type": "heartbeat"})
-                await asyncio.sleep(30)  # 每30秒发送一次心跳
+                RedisManager.touch_log_subscriber(eval_id, client_id)
+                await asyncio.sleep(interval)
         except Exception as e:
             logger.debug(f"心跳发送失败: {str(e)}")
 
-    async def _listen_for_log_messages(self, websocket: WebSocket, pubsub, client_id: str, eval_id: int):
-        """监听Redis日志消息并转发到WebSocket
+    async def _listen_for_log_messages(self, sender: LogFrameSender, subscription: LogSubscription, client_id: str, eval_id: int,
+                                       sent_position: int = 0):
+        """等待订阅队列中的日志消息并转发到WebSocket
+        
+        batch协议下收到第一条消息后在合并窗口内继续收集，凑成一帧发送。
         
         Args:
-            websocket: WebSocket连接
-            pubsub: Redis PubSub对象
+            sender: 日志帧发送器
+            subscription: 日志订阅对象（由进程内共享的订阅器投递消息）
             client_id: 客户端唯一标识
             eval_id: 评估任务ID
+            sent_position: 历史与补发日志的最后存储位置，位置不超过它的通道消息已经发送过，直接跳过
         """
-        logger.debug(f"开始监听Redis日志消息 [client_id={client_id}, eval_id={eval_id}]")
+        logger.debug(f"开始监听日志消息 [client_id={client_id}, eval_id={eval_id}]")
         
-        # 添加超时控制，防止任务无限运行
+        websocket = sender.websocket
+        # 长时间没有消息时自动断开
         max_idle_time = 3600  # 最大空闲时间（秒）
-        last_message_time = asyncio.get_event_loop().time()
+        max_lines = int(settings.ws_log_frame_max_lines) if sender.batched else 1
+        frame_interval = int(settings.ws_log_frame_interval_ms) / 1000
         
         try:
-            while True:
-                # 1. 检查WebSocket连接状态
-                if websocket.client_state != WebSocketState.CONNECTED:
-                    logger.debug(f"WebSocket连接已断开，停止监听 [client_id={client_id}]")
-                    break
-                
-                # 2. 检查超时 - 长时间没有消息时自动断开
-                current_time = asyncio.get_event_loop().time()
-                if current_time - last_message_time > max_idle_time:
+            while websocket.client_state == WebSocketState.CONNECTED:
+                try:
+                    batch = await asyncio.wait_for(subscription.get_batch(max_lines, frame_interval), timeout=max_idle_time)
+                except asyncio.TimeoutError:
                     logger.warning(f"日志监听超时，停止监听 [client_id={client_id}]")
                     break
                 
                 try:
-                    # 3. 非阻塞方式获取消息
-                    message = pubsub.get_message(timeout=0.1)
-                    
-                    # 4. 处理消息
-                    if message and message["type"] == "message":
-                        # 更新最后收到消息的时间
-                        last_message_time = asyncio.get_event_loop().time()
-                        
-                        # 解析消息内容
-                        data = message["data"]
-                        if isinstance(data, bytes):
-                            data = data.decode("utf-8")
-                        
-                        # 提取log字段内容
-                        try:
-                            import json
-                            log_data = json.loads(data)
-                            log_content = log_data.get("log", data)  # 如果解析失败则回退到原始数据
-                        except json.JSONDecodeError:
-                            log_content = data  # 非JSON格式则直接使用原始数据
-                        
-                        # 发送到WebSocket
-                        await websocket.send_text(log_content)
-                    
-                    # 5. 短暂休眠，避免CPU占用过高，同时也使任务可被取消
-                    await asyncio.sleep(0.01)
-                    
-                except asyncio.CancelledError:
-                    logger.info(f"日志监听任务被取消 [client_id={client_id}]")
-                    raise
+                    # 先提示因队列溢出跳过的行，再发送本批日志（自动识别紧凑、JSON或纯文本格式，记录序号即存储位置）
+                    records = [record for record in map(decode_record, batch) if not 0 < record.seq <= sent_position]
+                    await sender.send_skipped(subscription.take_skipped())
+                    await sender.send([record.log for record in records], seqs=[record.seq for record in records])
                 except Exception as e:
-                    logger.warning(f"处理Redis消息失败: {str(e)}")
+                    logger.warning(f"转发日志消息失败: {str(e)}")
                     if "connection closed" in str(e).lower() or "close message has been sent" in str(e).lower():
                         break
-                    # 短暂停顿后继续尝试
-                    await asyncio.sleep(1)
                     
         except asyncio.CancelledError:
             logger.info(f"日志监听任务被取消 [client_id={client_id}]")
@@ -318,19 +535,51 @@ class WebSocketLogService:
         finally:
             logger.info(f"日志监听任务结束 [client_id={client_id}]")
 
-    async def _cleanup_websocket_resources(self, pubsub=None, redis_client=None):
-        """清理WebSocket相关资源
+    async def _listen_for_stream_entries(self, sender: LogFrameSender, subscription: LogSubscription, client_id: str,
+                                         eval_id: int, last_cursor: str):
+        """等待订阅队列中的Stream条目并转发到WebSocket
+        
+        进程内共享的订阅器以一次XREAD读取所有有订阅的任务的Stream，连接只等待自己的队列；
+        batch协议下收到第一条后在合并窗口内继续收集，凑成一帧发送。
         
         Args:
-            pubsub: Redis PubSub对象
-            redis_client: Redis客户端
+            sender: 日志帧发送器
+            subscription: 日志订阅对象（队列元素为 (条目ID, 记录原文)）
+            client_id: 客户端唯一标识
+            eval_id: 评估任务ID
+            last_cursor: 历史与补读日志的最后一个条目ID，不超过它的条目已经发送过，直接跳过
         """
-        # 关闭PubSub
-        if pubsub:
-            try:
-                pubsub.unsubscribe()
-                pubsub.close()
-                logger.debug("已关闭Redis PubSub连接")
-            except Exception as e:
-                logger.warning(f"关闭PubSub连接失败: {str(e)}")
-    
\ No newline at end of file
+        logger.debug(f"开始监听Redis日志Stream [client_id={client_id}, eval_id={eval_id}]")
+        websocket = sender.websocket
+        sent_position = stream_position(last_cursor)
+        max_idle_time = 3600  # 最大空闲时间（秒）
+        max_lines = int(settings.ws_log_frame_max_lines)
+        frame_interval = int(settings.ws_log_frame_interval_ms) / 1000
+        
+        try:
+            while websocket.client_state == WebSocketState.CONNECTED:
+                try:
+                    batch = await asyncio.wait_for(subscription.get_batch(max_lines, frame_interval), timeout=max_idle_time)
+                except asyncio.TimeoutError:
+                    logger.warning(f"日志监听超时，停止监听 [client_id={client_id}]")
+                    break
+                
+                try:
+                    entries = [(entry_id, decode_text(data)) for entry_id, data in batch
+                               if entry_id is not None and stream_position(entry_id) > sent_position]
+                    await sender.send_skipped(subscription.take_skipped())
+                    if not entries:
+                        continue
+                    sent_position = stream_position(entries[-1][0])
+                    await self._send_stream_entries(sender, entries)
+                except Exception as e:
+                    logger.warning(f"转发Stream日志失败: {str(e)}")
+                    if "connection closed" in str(e).lower() or "close message has been sent" in str(e).lower():
+                        break
+        except asyncio.CancelledError:
+            logger.info(f"日志监听任务被取消 [client_id={client_id}]")
+            raise
+        except Exception as e:
+            logger.error(f"日志监听异常 [client_id={client_id}]: {str(e)}")
+        finally:
+            logger.info(f"日志Stream监听任务结束 [client_id={client_id}]")
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# 评估任务资源调度器
+
+import json
+import time
+import logging
+import threading
+import contextlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+import psutil
+from core.config import settings
+from utils.redis_manager import RedisManager
+
+
+# 配置日志
+logger = logging.getLogger("eval_tasks")
+
+
+def normalize_endpoint(api_url: Optional[str]) -> Optional[str]:
+    """规范化API地址，作为接口并发预算的键（协议与主机名小写，去掉末尾斜杠）
+
+    Args:
+        api_url: 任务环境变量中的API_URL
+
+    Returns:
+        Optional[str]: 规范化后的地址，未配置时返回None
+    """
+    if not api_url or not str(api_url).strip():
+        return None
+    parts = urlsplit(str(api_url).strip())
+    if not parts.netloc:
+        return str(api_url).strip().rstrip("/")
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+class ResourceDemand:
+    """一个评估任务需要的资源"""
+
+    def __init__(self, cpus: float, memory_mb: int, endpoint: Optional[str] = None):
+        """初始化
+
+        Args:
+            cpus: CPU核数
+            memory_mb: 内存（MB）
+            endpoint: 占用并发预算的API地址（规范化后），None表示不调用外部接口
+        """
+        self.cpus = float(cpus)
+        self.memory_mb = int(memory_mb)
+        self.endpoint = endpoint
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"cpus": self.cpus, "memory_mb": self.memory_mb, "endpoint": self.endpoint}
+
+
+def estimate_demand(eval_config: Optional[Dict[str, Any]], env_vars: Optional[Dict[str, Any]]) -> ResourceDemand:
+    """根据任务配置估算资源需求
+
+    eval_config.resources 中声明的 cpus、memory_mb 优先；未声明时按任务类型取默认值：
+    配置了API_URL的任务主要在等待HTTP响应，按API模型任务估算，否则按本地模型任务估算。
+
+    Args:
+        eval_config: 任务的评估配置
+        env_vars: 任务的环境变量
+
+    Returns:
+        ResourceDemand: 资源需求
+    """
+    declared = (eval_config or {}).get("resources") or {}
+    endpoint = normalize_endpoint((env_vars or {}).get("API_URL"))
+    if endpoint:
+        cpus, memory_mb = settings.eval_api_task_cpus, settings.eval_api_task_memory_mb
+    else:
+        cpus, memory_mb = settings.eval_local_task_cpus, settings.eval_local_task_memory_mb
+    return ResourceDemand(
+        cpus=declared.get("cpus", cpus),
+        memory_mb=declared.get("memory_mb", memory_mb),
+        endpoint=endpoint
+    )
+
+
+class _Entry:
+    """调度器中的一个任务（排队或运行中）"""
+
+    def __init__(self, eval_id: int, demand: ResourceDemand, shard: Optional[int] = None):
+        self.eval_id = eval_id
+        self.shard = shard
+        self.demand = demand
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None
+
+    @property
+    def key(self) -> Tuple[int, Optional[int]]:
+        return self.eval_id, self.shard
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"eval_id": self.eval_id, "shard": self.shard, **self.demand.to_dict(),
+                "enqueued_at": self.enqueued_at, "started_at": self.started_at}
+
+
+class ResourceScheduler:
+    """Worker进程内的评估任务准入控制
+
+    Worker以线程池同时接收多个评估任务，每个任务开始执行前向调度器申请资源：
+        CPU、内存    所有运行中任务的需求之和不超过Worker容量
+        接口并发     同一API_URL同时运行的任务数不超过其并发预算
+    资源不足的任务按到达顺序排队。排在前面的任务只因接口并发预算已满而等待时，后面调用其他接口的任务
+    可以先开始；因CPU或内存不足而等待时后面的任务不能越过它，避免大任务被小任务持续插队。
+    需求超过Worker总容量的任务按总容量计，在空闲时单独运行。
+    """
+
+    def __init__(self,
+                 cpus: Optional[float] = None,
+                 memory_mb: Optional[int] = None,
+                 endpoint_concurrency: Optional[int] = None,
+                 endpoint_limits: Optional[Dict[str, int]] = None,
+                 on_change: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """初始化
+
+        Args:
+            cpus: 可分配的CPU核数，默认取配置，配置为0时取本机核数
+            memory_mb: 可分配的内存（MB），默认取配置，配置为0时取本机内存的80%
+            endpoint_concurrency: 每个API地址默认的并发预算
+            endpoint_limits: 按API地址单独设置的并发预算
+            on_change: 运行/排队任务变化时的回调，参数为资源占用快照
+        """
+        cpus = float(cpus if cpus is not None else settings.eval_worker_cpus)
+        memory_mb = int(memory_mb if memory_mb is not None else settings.eval_worker_memory_mb)
+        self.cpus = cpus if cpus > 0 else float(psutil.cpu_count() or 1)
+        self.memory_mb = memory_mb if memory_mb > 0 else int(psutil.virtual_memory().total * 0.8 / 2 ** 20)
+        self.endpoint_concurrency = max(int(endpoint_concurrency if endpoint_concurrency is not None
+                                            else settings.eval_endpoint_concurrency), 1)
+        if endpoint_limits is None:
+            endpoint_limits = self._load_endpoint_limits(settings.eval_endpoint_limits)
+        self.endpoint_limits = {normalize_endpoint(url): int(limit) for url, limit in endpoint_limits.items()}
+        self.on_change = on_change
+
+        self._condition = threading.Condition()
+        self._generation = 0   # 每次唤醒排队任务时递增，排队任务据此判断锁外上报期间是否错过了唤醒
+        self._running: Dict[Tuple[int, Optional[int]], _Entry] = {}
+        self._waiting: List[_Entry] = []
+
+    @staticmethod
+    def _load_endpoint_limits(raw: str) -> Dict[str, int]:
+        if not raw:
+            return {}
+        try:
+            limits = json.loads(raw)
+            return limits if isinstance(limits, dict) else {}
+        except ValueError:
+            logger.warning(f"EVAL_ENDPOINT_LIMITS不是有效的JSON，已忽略: {raw}")
+            return {}
+
+    def endpoint_limit(self, endpoint: str) -> int:
+        """API地址的并发预算"""
+        return max(self.endpoint_limits.get(endpoint, self.endpoint_concurrency), 1)
+
+    def acquire(self, eval_id: int, demand: ResourceDemand, timeout: Optional[float] = None,
+                on_wait: Optional[Callable[[int, List[str]], None]] = None, shard: Optional[int] = None,
+                cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """申请资源，资源不足时阻塞排队
+
+        排队期间每隔 EVAL_ADMISSION_POLL_INTERVAL 秒调用一次cancelled，返回True时放弃排队；
+        获得资源后再检查一次，已取消时立即释放资源。cancelled在调度器锁外调用，可以查询数据库。
+
+        Args:
+            eval_id: 评估任务ID
+            demand: 资源需求
+            timeout: 最长等待时间（秒），None表示一直等待
+            on_wait: 排队状态变化时的回调，参数为 (排队位置, 等待的资源)
+            shard: 分片序号，分片执行时同一任务的多个分片分别申请
+            cancelled: 检查任务是否已被取消（如已终止）的回调
+
+        Returns:
+            bool: 是否获得资源（超时或已取消返回False）
+        """
+        entry = _Entry(eval_id, ResourceDemand(min(demand.cpus, self.cpus), min(demand.memory_mb, self.memory_mb), demand.endpoint), shard)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        poll_interval = max(float(settings.eval_admission_poll_interval), 0.01)
+        label = '' if shard is None else f'分片{shard}'
+        with self._condition:
+            self._waiting.append(entry)
+        admitted = False
+        last_state = None
+        try:
+            while True:
+                usage = None
+                with self._condition:
+                    if self._admissible(entry):
+                        admitted = True
+                        entry.started_at = time.time()
+                        self._running[entry.key] = entry
+                        logger.info(f"评估任务[{eval_id}]{label}获得资源开始执行: {entry.demand.to_dict()}")
+                        break
+                    if last_state is None:
+                        usage = self._snapshot()
+                    state = (self._waiting.index(entry) + 1, self._blocked_by(entry.demand))
+                    generation = self._generation
+                # 上报（写Redis）在锁外进行，不阻塞其他任务申请与释放资源
+                self._notify_change(usage)
+                if on_wait is not None and state != last_state:
+                    on_wait(*state)
+                last_state = state
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                if cancelled is not None:
+                    remaining = poll_interval if remaining is None else min(remaining, poll_interval)
+                with self._condition:
+                    # 上报期间已有资源释放时立即重新检查，不再等待
+                    if self._generation == generation:
+                        self._condition.wait(remaining)
+                if cancelled is not None and cancelled():
+                    logger.info(f"评估任务[{eval_id}]{label}已取消，放弃排队")
+                    return False
+        finally:
+            with self._condition:
+                self._waiting.remove(entry)
+                if not admitted:
+                    # 放弃排队可能让后面的任务变为可执行
+                    self._wake()
+                usage = self._snapshot()
+            self._notify_change(usage)
+
+        # 排队期间最后一次检查之后取消的任务不再执行
+        if cancelled is not None and cancelled():
+            logger.info(f"评估任务[{eval_id}]{label}获得资源时已取消，不再执行")
+            self.release(eval_id, shard)
+            return False
+        return True
+
+    def release(self, eval_id: int, shard: Optional[int] = None) -> None:
+        """释放任务占用的资源并唤醒排队的任务
+
+        Args:
+            eval_id: 评估任务ID
+            shard: 分片序号
+        """
+        with self._condition:
+            if self._running.pop((eval_id, shard), None) is None:
+                return
+            self._wake()
+            usage = self._snapshot()
+        self._notify_change(usage)
+
+    @contextlib.contextmanager
+    def admit(self, eval_id: int, demand: ResourceDemand,
+              on_wait: Optional[Callable[[int, List[str]], None]] = None, shard: Optional[int] = None,
+              cancelled: Optional[Callable[[], bool]] = None) -> Iterator[bool]:
+        """在获得资源后执行代码块，结束时释放资源
+
+        Args:
+            eval_id: 评估任务ID
+            demand: 资源需求
+            on_wait: 排队状态变化时的回调，见acquire
+            shard: 分片序号
+            cancelled: 检查任务是否已被取消的回调，见acquire
+
+        Yields:
+            bool: 是否获得资源，为False（任务已取消）时代码块不应执行任务
+        """
+        admitted = self.acquire(eval_id, demand, on_wait=on_wait, shard=shard, cancelled=cancelled)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release(eval_id, shard)
+
+    def usage(self) -> Dict[str, Any]:
+        """当前资源占用快照
+
+        Returns:
+            Dict[str, Any]: 容量、已用资源、各API地址的并发占用、运行中与排队中的任务
+        """
+        with self._condition:
+            running = list(self._running.values())
+            endpoints = {}
+            for entry in running + self._waiting:
+                endpoint = entry.demand.endpoint
+                if endpoint is not None and endpoint not in endpoints:
+                    endpoints[endpoint] = {"running": self._endpoint_running(endpoint), "limit": self.endpoint_limit(endpoint)}
+            return {
+                "capacity": {"cpus": self.cpus, "memory_mb": self.memory_mb},
+                "used": {
+                    "cpus": sum(entry.demand.cpus for entry in running),
+                    "memory_mb": sum(entry.demand.memory_mb for entry in running)
+                },
+                "endpoints": endpoints,
+                "running": [entry.to_dict() for entry in running],
+                "waiting": [entry.to_dict() for entry in self._waiting],
+                "updated_at": time.time()
+            }
+
+    def _admissible(self, entry: _Entry) -> bool:
+        """任务当前能否开始：资源足够，且前面没有只因CPU/内存不足而等待的任务"""
+        for earlier in self._waiting:
+            if earlier is entry:
+                break
+            if self._endpoint_available(earlier.demand):
+                return False
+        return not self._blocked_by(entry.demand)
+
+    def _blocked_by(self, demand: ResourceDemand) -> List[str]:
+        """任务在等待的资源（cpus、memory_mb、endpoint），为空表示资源足够"""
+        blocked = []
+        if sum(entry.demand.cpus for entry in self._running.values()) + demand.cpus > self.cpus + 1e-9:
+            blocked.append("cpus")
+        if sum(entry.demand.memory_mb for entry in self._running.values()) + demand.memory_mb > self.memory_mb:
+            blocked.append("memory_mb")
+        if not self._endpoint_available(demand):
+            blocked.append("endpoint")
+        return blocked
+
+    def _endpoint_available(self, demand: ResourceDemand) -> bool:
+        return demand.endpoint is None or self._endpoint_running(demand.endpoint) < self.endpoint_limit(demand.endpoint)
+
+    def _endpoint_running(self, endpoint: str) -> int:
+        return sum(1 for entry in self._running.values() if entry.demand.endpoint == endpoint)
+
+    def _wake(self) -> None:
+        """唤醒排队的任务重新检查资源（须持有锁）"""
+        self._generation += 1
+        self._condition.notify_all()
+
+    def _snapshot(self) -> Optional[Dict[str, Any]]:
+        """在锁内取得待上报的资源占用快照，未设置on_change时为None"""
+        return self.usage() if self.on_change is not None else None
+
+    def _notify_change(self, usage: Optional[Dict[str, Any]]) -> None:
+        """上报资源占用快照（在锁外调用，on_change可能写Redis）"""
+        if self.on_change is None or usage is None:
+            return
+        try:
+            self.on_change(usage)
+        except Exception as e:
+            logger.warning(f"上报资源占用失败: {str(e)}")
+
+
+def report_usage(usage: Dict[str, Any]) -> None:
+    """把资源占用快照写入Redis（API通过 /scheduler/slots 查询所有Worker）"""
+    worker_id = RedisManager.get_process_id()
+    RedisManager.set_worker_slots(worker_id, {"worker": worker_id, **usage},
+                                  ttl=int(float(settings.eval_slots_report_interval) * 3))
+
+
+def start_usage_reporter(scheduler: "ResourceScheduler") -> threading.Thread:
+    """启动后台线程定期刷新资源占用快照，Worker空闲时也保持在线
+
+    Args:
+        scheduler: 资源调度器
+
+    Returns:
+        threading.Thread: 上报线程
+    """
+    def run():
+        while True:
+            report_usage(scheduler.usage())
+            time.sleep(float(settings.eval_slots_report_interval))
+
+    thread = threading.Thread(target=run, name="slots-reporter", daemon=True)
+    thread.start()
+    return thread
+
+
+# Worker进程级单例
+resource_scheduler = ResourceScheduler(on_change=report_usage)
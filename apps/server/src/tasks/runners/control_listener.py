@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# 任务控制指令监听器
+
+import json
+import logging
+import threading
+from typing import Callable, Dict, Any, Optional
+from utils.redis_manager import RedisManager
+
+logger = logging.getLogger(__name__)
+
+# 支持的控制指令
+CONTROL_COMMANDS = ("terminate", "kill", "pause", "resume")
+
+
+class ControlListener:
+    """任务控制指令监听器
+
+    在后台线程中订阅 eval:{id}:control 通道，收到指令后立即回调执行器，
+    执行器无需逐行轮询Redis。连接异常时自动重新订阅；重连期间错过的指令
+    由执行器对控制键的低频轮询补偿。
+    """
+
+    def __init__(self, eval_id, on_command: Callable[[Dict[str, Any]], None], reconnect_delay: float = 1.0):
+        """初始化
+
+        Args:
+            eval_id: 评估任务ID
+            on_command: 收到控制指令时的回调，参数为指令消息
+            reconnect_delay: 订阅异常后重连的等待时间（秒）
+        """
+        self.eval_id = eval_id
+        self.on_command = on_command
+        self.reconnect_delay = reconnect_delay
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, wait_ready: float = 2.0) -> None:
+        """启动监听线程
+
+        Args:
+            wait_ready: 等待订阅建立的最长时间（秒），保证启动后发送的指令不会丢失
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen,
+            name=f"runner-control-{self.eval_id}",
+            daemon=True
+        )
+        self._thread.start()
+        self._ready.wait(wait_ready)
+
+    def stop(self, timeout: float = 0) -> None:
+        """停止监听线程
+
+        Args:
+            timeout: 等待线程退出的时间（秒），默认不等待，线程在下一次轮询超时后自行退出
+        """
+        self._stop.set()
+        if self._thread:
+            if timeout:
+                self._thread.join(timeout)
+            self._thread = None
+
+    def _listen(self) -> None:
+        """监听线程：订阅控制通道并分发指令"""
+        channel = RedisManager.get_control_channel(self.eval_id)
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                redis_client = RedisManager.get_instance()
+                if not redis_client:
+                    raise ConnectionError("无法获取Redis连接")
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                self._ready.set()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=0.5)
+                    if message and message.get("type") == "message":
+                        self._dispatch(message.get("data"))
+            except Exception as e:
+                logger.warning(f"任务 {self.eval_id} 控制通道订阅异常，{self.reconnect_delay}秒后重试: {str(e)}")
+                self._ready.set()
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, data) -> None:
+        """解析并分发一条控制指令"""
+        try:
+            message = json.loads(data)
+        except (TypeError, json.JSONDecodeError):
+            logger.warning(f"任务 {self.eval_id} 收到无法解析的控制指令: {data}")
+            return
+        if message.get("command") not in CONTROL_COMMANDS:
+            logger.warning(f"任务 {self.eval_id} 收到未知控制指令: {message.get('command')}")
+            return
+        try:
+            self.on_command(message)
+        except Exception as e:
+            logger.error(f"任务 {self.eval_id} 处理控制指令失败: {str(e)}")
@@ -2,17 +2,30 @@
 # OpenCompass评测任务执行器
 
 import os
+import queue
 import subprocess
+import threading
 import time
 import logging
 from typing import Dict, Any, Optional, List, Tuple, Callable
 from utils.redis_manager import RedisManager
 from datetime import datetime
 from utils.log_handler import LogHandler
+from utils.log_index import LogIndexWriter
+from utils.rotating_log import RotatingLogWriter
+from tasks.runners.control_listener import ControlListener
+from core.config import settings
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# 输出读取线程的结束标记
+_OUTPUT_EOF = object()
+# 收到控制指令时唤醒监督循环的标记
+_CONTROL_WAKE = object()
+# 监督循环每轮最多处理的日志行数
+_DRAIN_BATCH_SIZE = 500
+
 
 class RunnerBase:
     """任务执行器基础类"""
@@ -43,9 +56,10 @@ class RunnerBase:
         self.process = None
         # 设置OpenCompass路径
         self.opencompass_path = opencompass_path
-        # 日志文件
+        # 日志文件及其检索索引
         self.log_file_path = None
-        self.log_file = None
+        self.log_file: Optional[RotatingLogWriter] = None
+        self.log_index: Optional[LogIndexWriter] = None
         # 运行状态
         self.is_running = False
         self.is_finished = False
@@ -54,14 +68,88 @@ class RunnerBase:
         self.start_time = None
         self.end_time = None
         self.log_handler = LogHandler(self.eval_id)  # 新增
-    def terminate(self) -> bool:
-        """终止进程"""
+
+        # 输出读取线程与监督循环
+        self._output_queue: Optional[queue.Queue] = None
+        self._reader_thread: Optional[threading.Thread] = None
+        self._stop_reading = threading.Event()
+        self.output_queue_size = int(settings.runner_output_queue_size)
+        self.supervisor_tick = float(settings.runner_supervisor_tick)
+        self.control_check_interval = float(settings.runner_control_check_interval)
+        self.heartbeat_interval = float(settings.runner_heartbeat_interval)
+        self.timeout_seconds = int(settings.eval_timeout_seconds)
+        self.terminate_grace_seconds = float(settings.runner_terminate_grace_seconds)
+        self.lines_read = 0
+
+        # 控制指令（terminate/kill/pause/resume）
+        self._control_listener: Optional[ControlListener] = None
+        self._control_queue: queue.Queue = queue.Queue()
+        self._applied_commands = set()
+        # 本次执行开始时的控制指令序号，只应用之后发出的指令；由任务执行器在派发开始时记录，未设置时在启动监听时记录
+        self.control_after: Optional[int] = None
+        self.is_paused = False
+    def terminate(self, grace_seconds: float = 0) -> bool:
+        """终止进程树
+        
+        Args:
+            grace_seconds: 大于0时先发送SIGTERM，等待进程退出，超时后再强制结束
+            
+        Returns:
+            bool: 进程仍在运行并已发出终止信号时返回True
+        """
+        import psutil
+        if not self.process or self.process.poll() is not None:
+            return False
+        parent = psutil.Process(self.process.pid)
+        procs = parent.children(recursive=True) + [parent]
+        if self.is_paused:
+            # 已挂起的进程无法处理SIGTERM，先恢复
+            self._signal_tree(procs, "resume")
+            self.is_paused = False
+        if grace_seconds > 0:
+            self._signal_tree(procs, "terminate")
+            _, procs = psutil.wait_procs(procs, timeout=grace_seconds)
+        self._signal_tree(procs, "kill")
+        return True
+
+    @staticmethod
+    def _signal_tree(procs, action: str) -> None:
+        """对进程列表执行psutil操作（terminate/kill/suspend/resume），忽略已退出的进程"""
+        import psutil
+        for proc in procs:
+            try:
+                getattr(proc, action)()
+            except psutil.NoSuchProcess:
+                pass
+
+    def pause(self) -> bool:
+        """挂起进程树
+        
+        Returns:
+            bool: 是否执行了挂起
+        """
+        import psutil
+        if self.is_paused or not self.process or self.process.poll() is not None:
+            return False
+        parent = psutil.Process(self.process.pid)
+        # 先挂起父进程，避免其继续派生子进程
+        self._signal_tree([parent] + parent.children(recursive=True), "suspend")
+        self.is_paused = True
+        return True
+
+    def resume(self) -> bool:
+        """恢复已挂起的进程树
+        
+        Returns:
+            bool: 是否执行了恢复
+        """
         import psutil
-        if self.process:
-            parent = psutil.Process(self.process.pid)
-            for child in parent.children(recursive=True):
-                child.kill()
-            parent.kill()
+        if not self.is_paused or not self.process or self.process.poll() is not None:
+            return False
+        parent = psutil.Process(self.process.pid)
+        self._signal_tree(parent.children(recursive=True) + [parent], "resume")
+        self.is_paused = False
+        return True
     @property
     def pid(self) -> Optional[int]:
         """获取进程ID"""
@@ -138,20 +226,23 @@ class RunnerBase:
             if not log_file_path:
                 return True
                 
-            # 创建日志文件目录
-            log_dir = os.path.dirname(log_file_path)
-            os.makedirs(log_dir, exist_ok=True)
-            
-            # 打开日志文件
-            self.log_file = open(log_file_path, 'w', encoding='utf-8')
+            # 带缓冲、按大小轮转并在后台压缩旧分段的日志文件（自动创建目录）
+            self.log_file = RotatingLogWriter(log_file_path)
             print(f"OpenCompass输出将记录到: {log_file_path}")
-            return True
         except Exception as e:
             print(f"设置日志文件时出错: {str(e)}")
             self.log_file_path = None
             self.log_file = None
             return False
 
+        # 检索索引创建失败不影响日志记录
+        try:
+            self.log_index = LogIndexWriter(log_file_path)
+        except Exception as e:
+            logger.warning(f"创建日志索引失败: {str(e)}")
+            self.log_index = None
+        return True
+
 
         """仅保留基础日志缓冲"""
         # 移除Redis相关代码
@@ -159,14 +250,28 @@ class RunnerBase:
             self.log_buffer.pop(0)
         self.log_buffer.append(line)
     def _close_log_file(self) -> None:
-        """安全地关闭日志文件"""
+        """安全地关闭日志文件（等待后台压缩完成），并完成检索索引"""
         if self.log_file:
             try:
-                self.log_file.close()
+                self.log_file.flush()
+                if self.log_index:
+                    self.log_index.close()
+                self.log_file.close(wait=True)
             except Exception as e:
                 print(f"关闭日志文件时出错: {str(e)}")
             finally:
                 self.log_file = None
+                self.log_index = None
+
+    def _flush_log_file(self) -> None:
+        """按刷新策略刷新日志文件缓冲，并按需写出索引分段（索引只引用已写入文件的数据）"""
+        if not self.log_file:
+            return
+        try:
+            if self.log_file.flush_if_due() and self.log_index:
+                self.log_index.flush_if_due()
+        except Exception as e:
+            logger.warning(f"刷新日志文件失败: {str(e)}")
     def _update_log(self, line: str):
         """仅保留基础日志缓冲"""
         # 移除Redis相关代码
@@ -174,11 +279,13 @@ class RunnerBase:
             self.log_buffer.pop(0)
         self.log_buffer.append(line)
 
-        # 写入日志文件
+        # 写入日志文件（由监督循环按刷新策略刷新），同时登记到检索索引
         if self.log_file:
             try:
-                self.log_file.write(line)
-                self.log_file.flush()
+                data = (line + "\n").encode("utf-8")
+                offset = self.log_file.write(data)
+                if self.log_index:
+                    self.log_index.add(line, offset, len(data))
             except Exception as e:
                 print(f"写入日志文件时出错: {str(e)}")
 
@@ -219,7 +326,13 @@ class RunnerBase:
         return status_data.get('status') == 'terminated' or status_data.get('terminate_flag', False)
 
     def run_sync(self, command: str) -> int:
-        """同步执行命令并实时处理输出"""
+        """同步执行命令并实时处理输出
+        
+        输出读取与任务监督解耦：
+        1. 读取线程阻塞在子进程stdout上，将日志行放入有界队列
+        2. 监督循环按自己的时钟从队列取日志，并独立处理终止检查、心跳发布和超时，
+           即使子进程长时间无输出也能及时响应终止
+        """
         self.start_time = datetime.now()
         try:
             print(f"执行命令: {command}")
@@ -237,43 +350,31 @@ class RunnerBase:
             self._update_status("running")
             # 2. 设置日志文件
             self._setup_log_file(self.log_file_path)
+            # 3. 启动输出读取线程与控制指令监听
+            self._start_output_reader()
+            self._start_control_listener()
         
-            # 3. 实时处理输出并检查终止标志
-            while self.process.poll() is None:
-                # 检查任务是否被终止
-                if self.is_task_terminated():
-                    logger.warning(f"检测到任务 {self.eval_id} 终止标志，正在停止执行...")
-                    # 记录终止日志
-                    termination_message = "任务被用户终止，强制停止执行"
-                    self._update_log(termination_message)
-                    self.log_handler.process_line(termination_message)
-                    
-                    # 设置返回码表示终止
-                    self.return_code = 143  # SIGTERM 信号对应的退出码
-                    self._update_status("terminated")
-                    return self.return_code
-
-                # 读取输出
-                line = self.process.stdout.readline()
-                if not line:
-                    break
-                # 4. 清洗日志
-                cleaned_line = line.strip()
-                # 5. 处理日志
-                self.log_handler.process_line(cleaned_line) 
-
-                # 6. 更新日志缓冲
-                self._update_log(cleaned_line)
-                print(f"OpenCompass输出: {cleaned_line}")
+            # 4. 监督循环：处理输出、控制指令、心跳与超时
+            outcome = self._supervise()
+            if outcome == "terminated":
+                return self._stop_process("任务被用户终止，停止执行", 143, "terminated",  # SIGTERM 信号对应的退出码
+                                          grace_seconds=self.terminate_grace_seconds)
+            if outcome == "killed":
+                return self._stop_process("任务被用户强制结束", 137, "terminated")  # SIGKILL 信号对应的退出码
+            if outcome == "timeout":
+                return self._stop_process(f"任务执行超过 {self.timeout_seconds} 秒，强制停止执行", 124, "failed")
 
-            # 7. 获取返回码
+            # 5. 获取返回码
             exit_status = self.process.wait()
             print(f"进程已结束，exit_status: {exit_status}")
 
             self.return_code = self.process.poll()
             print(f"进程已结束，返回码: {self.return_code}")
             
-            # 8. 更新状态为已完成
+            # 6. 在发布最终状态前刷新剩余日志，保证客户端先收到完整日志
+            self.log_handler.flush()
+
+            # 7. 更新状态为已完成
             if self.is_task_terminated():
                 self._update_status("terminated")
             else:
@@ -283,8 +384,259 @@ class RunnerBase:
         except Exception as e:
             error_msg = f"监控进程输出时出错: {str(e)}"
             print(error_msg)
+            self.log_handler.flush()
             self._update_status("failed")
             return -1
+        finally:
+            self._stop_reading.set()
+            self._stop_control_listener()
+            self._close_log_file()
+            # 最终刷新并停止日志投递
+            self._close_log_shipping()
+
+    def _start_output_reader(self) -> None:
+        """启动子进程输出读取线程"""
+        self._stop_reading.clear()
+        self._output_queue = queue.Queue(maxsize=self.output_queue_size)
+        self._reader_thread = threading.Thread(
+            target=self._read_output,
+            name=f"runner-reader-{self.eval_id}",
+            daemon=True
+        )
+        self._reader_thread.start()
+
+    def _read_output(self) -> None:
+        """读取线程：逐行读取子进程输出并放入有界队列
+        
+        队列满时阻塞读取，从而对子进程形成背压；输出结束后等待队列有空位放入结束标记（停止读取时除外）。
+        """
+        try:
+            for line in iter(self.process.stdout.readline, ''):
+                while not self._stop_reading.is_set():
+                    try:
+                        self._output_queue.put(line, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop_reading.is_set():
+                    return
+        except (ValueError, OSError) as e:
+            # 进程被终止后管道关闭
+            logger.debug(f"读取子进程输出结束: {str(e)}")
+        finally:
+            while not self._stop_reading.is_set():
+                try:
+                    self._output_queue.put(_OUTPUT_EOF, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def _start_control_listener(self) -> None:
+        """订阅任务控制通道，指令由监听线程推送，无需逐行轮询"""
+        if self.eval_id is None:
+            return
+        # 忽略本次执行开始前遗留的控制指令
+        if self.control_after is None:
+            self.control_after = RedisManager.get_control_seq(self.eval_id)
+        self._control_listener = ControlListener(self.eval_id, self._on_control_command)
+        self._control_listener.start()
+
+    def _stop_control_listener(self) -> None:
+        """停止控制指令监听"""
+        if self._control_listener:
+            self._control_listener.stop()
+            self._control_listener = None
+
+    def _on_control_command(self, message: Dict[str, Any]) -> None:
+        """控制指令回调（监听线程中执行）：放入指令队列并唤醒监督循环"""
+        self._control_queue.put(message)
+        if self._output_queue is not None:
+            try:
+                self._output_queue.put_nowait(_CONTROL_WAKE)
+            except queue.Full:
+                # 队列满说明监督循环正在处理日志，本轮结束后会检查指令队列
+                pass
+
+    def _poll_control(self) -> None:
+        """兜底轮询：补偿订阅断开期间错过的控制指令，并兼容状态中的终止标志"""
+        message = RedisManager.get_control_command(self.eval_id)
+        if message and message.get("id") not in self._applied_commands \
+                and int(message.get("seq", 0)) > (self.control_after or 0):
+            self._control_queue.put(message)
+        if self.is_task_terminated():
+            self._control_queue.put({"id": "status_terminate_flag", "command": "terminate"})
+
+    def _apply_control_commands(self) -> Optional[str]:
+        """执行已收到的控制指令
+        
+        Returns:
+            Optional[str]: 需要结束监督循环时返回 "terminated" 或 "killed"，否则返回None
+        """
+        while True:
+            try:
+                message = self._control_queue.get_nowait()
+            except queue.Empty:
+                return None
+            command_id = message.get("id")
+            if command_id in self._applied_commands:
+                continue
+            self._applied_commands.add(command_id)
+            command = message.get("command")
+            logger.warning(f"任务 {self.eval_id} 收到控制指令: {command}")
+
+            if command == "terminate":
+                return "terminated"
+            if command == "kill":
+                return "killed"
+            if command == "pause":
+                changed = self.pause()
+            elif command == "resume":
+                changed = self.resume()
+            else:
+                continue
+            if changed:
+                state = "paused" if self.is_paused else "running"
+                self._update_log(f"任务已{'暂停' if self.is_paused else '恢复'}执行")
+                self.log_handler.process_line(f"任务已{'暂停' if self.is_paused else '恢复'}执行")
+                RedisManager.update_runtime_info(self.eval_id, {
+                    "type": "control",
+                    "command": command,
+                    "state": state
+                })
+
+    def _supervise(self) -> str:
+        """监督循环
+        
+        Returns:
+            str: "eof"（输出结束）、"terminated"（收到终止指令）、"killed"（收到强制结束指令）
+                 或 "timeout"（执行超时）
+        """
+        started = time.monotonic()
+        next_control_poll = started + self.control_check_interval
+        next_heartbeat = started + self.heartbeat_interval
+        deadline = started + self.timeout_seconds if self.timeout_seconds else None
+        paused_at = None
+
+        while True:
+            # 1. 按时钟节拍等待输出，每轮最多处理一批日志，避免输出密集时饿死时钟检查
+            try:
+                line = self._output_queue.get(timeout=self.supervisor_tick)
+                handled = 0
+                while True:
+                    if line is _OUTPUT_EOF:
+                        return "eof"
+                    if line is _CONTROL_WAKE:
+                        break
+                    self._handle_output_line(line)
+                    handled += 1
+                    if handled >= _DRAIN_BATCH_SIZE:
+                        break
+                    line = self._output_queue.get_nowait()
+            except queue.Empty:
+                # 兜底：读取线程已退出且队列已取空时，即使结束标记未能放入也视为输出结束
+                if self._reader_thread is not None and not self._reader_thread.is_alive() \
+                        and self._output_queue.empty():
+                    return "eof"
+
+            # 上报节流期间积压的进度变化，刷新日志文件与索引
+            self.log_handler.tick()
+            self._flush_log_file()
+
+            now = time.monotonic()
+            # 2. 兜底轮询控制指令（低频，与日志行数无关）
+            if self.eval_id is not None and now >= next_control_poll:
+                next_control_poll = now + self.control_check_interval
+                self._poll_control()
+            # 3. 执行控制指令
+            outcome = self._apply_control_commands()
+            if outcome:
+                return outcome
+            # 暂停期间不计入执行超时
+            if self.is_paused and paused_at is None:
+                paused_at = now
+            elif not self.is_paused and paused_at is not None:
+                if deadline:
+                    deadline += now - paused_at
+                paused_at = None
+            # 4. 心跳发布
+            if now >= next_heartbeat:
+                next_heartbeat = now + self.heartbeat_interval
+                self._publish_heartbeat(now - started)
+            # 5. 超时检查
+            if deadline and paused_at is None and now >= deadline:
+                logger.warning(f"任务 {self.eval_id} 执行超时（{self.timeout_seconds}秒），正在停止执行...")
+                return "timeout"
+
+    def _handle_output_line(self, line: str) -> None:
+        """处理一行子进程输出"""
+        # 清洗日志
+        cleaned_line = line.strip()
+        self.lines_read += 1
+        # 处理日志
+        self.log_handler.process_line(cleaned_line)
+        # 更新日志缓冲
+        self._update_log(cleaned_line)
+        print(f"OpenCompass输出: {cleaned_line}")
+
+    def _stop_process(self, message: str, return_code: int, status: str, grace_seconds: float = 0) -> int:
+        """终止子进程并发布最终状态
+        
+        Args:
+            message: 写入日志的终止说明
+            return_code: 返回码
+            status: 最终状态
+            grace_seconds: 强制结束前等待进程自行退出的秒数
+            
+        Returns:
+            int: 返回码
+        """
+        self._stop_reading.set()
+        try:
+            self.terminate(grace_seconds)
+        except Exception as e:
+            logger.warning(f"终止子进程失败: {str(e)}")
+
+        # 记录终止日志
+        self._update_log(message)
+        self.log_handler.process_line(message)
+        self.log_handler.flush()
+
+        self.return_code = return_code
+        self._update_status(status)
+        return self.return_code
+
+    def _publish_heartbeat(self, elapsed: float) -> None:
+        """发布心跳与运行时信息到状态通道
+        
+        Args:
+            elapsed: 已运行的秒数
+        """
+        if self.eval_id is None:
+            return
+        RedisManager.update_runtime_info(self.eval_id, {
+            "type": "heartbeat",
+            "pid": self.pid,
+            "elapsed_seconds": round(elapsed, 1),
+            "lines_read": self.lines_read,
+            "queue_depth": self._output_queue.qsize() if self._output_queue else 0,
+            "paused": self.is_paused,
+            "log_stats": self.log_handler.get_stats()
+        })
+
+    def _close_log_shipping(self) -> None:
+        """停止日志投递并记录投递统计"""
+        try:
+            stats = self.log_handler.close()
+            logger.info(f"任务 {self.eval_id} 日志投递统计: {stats}")
+            if self.eval_id is not None:
+                # 最终的投递统计（含折叠、限流丢弃的行数）随运行时信息保留
+                RedisManager.update_runtime_info(self.eval_id, {"type": "log_stats", "log_stats": stats})
+        except Exception as e:
+            logger.warning(f"关闭日志投递失败: {str(e)}")
+
+    def get_log_stats(self) -> Dict[str, Any]:
+        """获取日志投递统计信息（行数、批次、刷新耗时）"""
+        return self.log_handler.get_stats()
 
 
 # 单例模式，保存正在运行的任务
@@ -3,6 +3,20 @@ from tasks.runners.env_manager import EnvManager
 from schemas.eval import EvaluationCreate
 
 
+def parse_dataset_names(dataset_names) -> list:
+    """把任务的数据集字段统一为列表（数据库中可能是JSON字符串）"""
+    if isinstance(dataset_names, str):
+        try:
+            import json
+            dataset_names = json.loads(dataset_names)
+        except ValueError:
+            # 如果解析失败，确保至少有一个有效的数据集名称
+            dataset_names = [dataset_names.strip('"[]')]
+    if not isinstance(dataset_names, list):
+        return [str(dataset_names)]
+    return list(dataset_names)
+
+
 class OpenCompassRunner(RunnerBase):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -14,6 +28,11 @@ class OpenCompassRunner(RunnerBase):
             # 1. 配置环境变量
             self.env_manager.load_env_json(eval_data.env_vars)
 
+            # 任务级超时配置（秒），未配置时使用全局默认值
+            eval_config = eval_data.eval_config or {}
+            if eval_config.get("timeout"):
+                self.timeout_seconds = int(eval_config["timeout"])
+
             # 2. 环境变量注入
             full_cmd = self._build_command(eval_data)
             
@@ -29,19 +48,13 @@ class OpenCompassRunner(RunnerBase):
         """根据配置构建命令"""
         
         # 数据集处理 - 确保是正确的列表格式
-        datasets = eval_data.dataset_names
-        
-        # 如果是字符串（JSON），尝试解析为Python列表
-        if isinstance(datasets, str):
-            try:
-                import json
-                datasets = json.loads(datasets)
-            except:
-                # 如果解析失败，确保至少有一个有效的数据集名称
-                datasets = [datasets.strip('"[]')]
+        datasets = parse_dataset_names(eval_data.dataset_names)
         
+        # 预期数据集数量用于估算总进度
+        self.log_handler.set_expected_datasets(len(datasets))
+
         # 将数据集列表合并为空格分隔的字符串
-        datasets_str = " ".join(datasets) if isinstance(datasets, list) else str(datasets)
+        datasets_str = " ".join(datasets)
         
         cmd = [
             "opencompass",
@@ -0,0 +1,55 @@
+import os
+import time
+from pathlib import Path
+from tasks.runners.runner_opencompass import OpenCompassRunner
+from utils.progress_tracker import ShardProgressReporter
+from utils.redis_manager import RedisManager
+
+
+class ShardRunner(OpenCompassRunner):
+    """分片执行器：只评估任务的部分数据集，输出写入分片自己的工作目录
+
+    分片的运行状态与进度记录在任务的分片状态中，任务状态由合并步骤统一发布，
+    避免先结束的分片把整个任务标记为已完成。
+    """
+
+    def __init__(self, eval_id: int, shard_index: int, *args, **kwargs):
+        """初始化
+
+        Args:
+            eval_id: 评估任务ID
+            shard_index: 分片序号
+        """
+        self.shard_index = shard_index
+        super().__init__(eval_id, *args, **kwargs)
+        self.log_handler.progress = ShardProgressReporter(eval_id, shard_index)
+
+    def _prepare_output_dir(self) -> Path:
+        """准备分片专属工作目录（eval_{id}/shards/shard_{序号}）"""
+        work_dir = self.working_dir / "logs" / f"eval_{self.eval_id}" / "shards" / f"shard_{self.shard_index}"
+        os.makedirs(work_dir, exist_ok=True)
+        return work_dir
+
+    def _update_status(self, status: str):
+        """更新分片状态
+        Args:
+            status: running or finished or failed or terminated
+        """
+        self.is_running = status == "running"
+        self.is_finished = not self.is_running
+        if status == "finished":
+            status = "completed" if self.return_code == 0 else "failed"
+        RedisManager.update_shard(self.eval_id, self.shard_index, {
+            "status": status,
+            "return_code": self.return_code,
+            "timestamp": time.time()
+        })
+        if self.is_finished:
+            # 重新发布汇总进度，使状态通道中的分片状态包含本分片的结束
+            self.log_handler.progress.publish_status()
+
+    def _handle_output_line(self, line: str) -> None:
+        """处理一行子进程输出，日志行加上分片标记以便区分各分片的输出"""
+        if line.strip():
+            line = f"[shard {self.shard_index}] {line.strip()}"
+        super()._handle_output_line(line)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# 评估任务分发器：在提交任务与Celery之间按优先级通道和用户公平排队
+
+import time
+import uuid
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from celery_app import celery_app
+from core.config import settings
+from core.database import SessionLocal
+from models.eval import Evaluation, EvaluationStatus
+from utils.redis_manager import RedisManager
+from utils.fair_queue import dispatch_order, load_user_weights
+
+
+# 配置日志
+logger = logging.getLogger("eval_tasks")
+
+# 优先级通道，从高到低：高优先级通道有排队任务时低优先级通道的任务不派发
+PRIORITY_LANES = ("interactive", "default", "batch")
+
+
+def get_priority(eval_config: Optional[Dict[str, Any]]) -> str:
+    """任务所在的优先级通道，eval_config.priority 优先于全局配置，无效值按default处理"""
+    lane = (eval_config or {}).get("priority") or settings.eval_default_priority
+    return lane if lane in PRIORITY_LANES else "default"
+
+
+class TaskDispatcher:
+    """评估任务分发器
+
+    Celery队列按到达顺序执行，一个用户集中提交大量任务会让其他用户长时间等待。
+    提交的任务先进入Redis中的分发队列（多个API进程与Worker共享），已派发未结束的任务数
+    低于 EVAL_DISPATCH_LIMIT 时才派发到Celery：
+        优先级通道   interactive > default > batch，按通道严格优先
+        通道内       按用户加权公平轮转（用户每派发一个任务虚拟时间增加 1/权重，虚拟时间最小的用户先派发），
+                     同一用户的任务按提交顺序
+    任务进入最终状态时释放名额并派发下一个任务（见 TaskEvaluator._update_task_status）。
+    Worker被强制结束、消息丢失等情况下任务不会进入最终状态，由Worker定期执行的reap回收其名额（见start_reaper）。
+    """
+
+    def __init__(self):
+        self.weights = load_user_weights(settings.eval_user_weights)
+
+    @property
+    def limit(self) -> int:
+        return int(settings.eval_dispatch_limit)
+
+    def submit(self, eval_id: int, user_id: Any, eval_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """提交任务：加入分发队列并尝试立即派发
+
+        Args:
+            eval_id: 评估任务ID
+            user_id: 提交任务的用户ID
+            eval_config: 任务的评估配置（priority字段指定优先级通道）
+
+        Returns:
+            Dict[str, Any]: task_id（已派发时）与queue（仍在排队时的排队信息）
+        """
+        lane = get_priority(eval_config)
+        RedisManager.enqueue_dispatch(eval_id, user_id if user_id is not None else "anonymous", lane)
+        dispatched = self.dispatch_ready()
+        if eval_id in dispatched:
+            if dispatched[eval_id] is None:
+                raise RuntimeError("派发任务到消息队列失败")
+            return {"task_id": dispatched[eval_id], "queue": None}
+        return {"task_id": None, "queue": self.queue_position(eval_id)}
+
+    def dispatch_ready(self) -> Dict[int, Optional[str]]:
+        """在名额允许的范围内派发排队的任务
+
+        Returns:
+            Dict[int, Optional[str]]: 本次派发的任务ID -> Celery任务ID（派发失败为None）
+        """
+        dispatched = {}
+        while True:
+            picked = RedisManager.pop_dispatch(self.limit, list(PRIORITY_LANES), self.weights)
+            if picked is None:
+                return dispatched
+            eval_id, lane, user_id = picked
+            dispatched[eval_id] = self._send(eval_id, lane, user_id)
+            if dispatched[eval_id] is None:
+                # 消息队列不可用时停止派发，其余任务留在队列中
+                return dispatched
+
+    def release(self, eval_id: int) -> None:
+        """任务结束后释放名额并派发下一个任务
+
+        Args:
+            eval_id: 评估任务ID
+        """
+        try:
+            if RedisManager.release_dispatch(eval_id):
+                self.dispatch_ready()
+        except Exception as e:
+            logger.error(f"释放评估任务[{eval_id}]的派发名额失败: {str(e)}")
+
+    def reap(self, timeout: Optional[float] = None) -> List[int]:
+        """回收丢失任务的派发名额
+
+        已派发的任务满足以下条件之一时释放名额：
+            数据库中任务已删除或已进入最终状态（释放名额的调用未执行）
+            派发超过timeout秒，数据库中仍为pending且Celery不知道该任务（消息丢失，任务从未开始）
+            派发超过timeout秒，Celery任务已失败或被撤销而数据库中未进入最终状态（Worker异常结束）
+            派发超过timeout秒，分片执行的任务有分片任务丢失（见_lost_shards），chord不会触发合并任务
+        后三种情况把任务标记为失败。
+
+        Args:
+            timeout: 判定任务丢失的派发时长（秒），默认取 EVAL_DISPATCH_REAP_TIMEOUT
+
+        Returns:
+            List[int]: 释放了名额的任务ID
+        """
+        from tasks.task_evaluator import TaskEvaluator, FINAL_STATUSES, db_session
+
+        timeout = float(settings.eval_dispatch_reap_timeout if timeout is None else timeout)
+        now = time.time()
+        reaped = []
+        for eval_id, dispatched_at in RedisManager.get_dispatch_inflight().items():
+            eval_id = int(eval_id)
+            with db_session() as db:
+                evaluation = db.query(Evaluation).filter(Evaluation.id == eval_id).first()
+                if evaluation is None or evaluation.status in FINAL_STATUSES:
+                    logger.warning(f"评估任务[{eval_id}]已结束但仍占用派发名额，已释放")
+                    RedisManager.release_dispatch(eval_id)
+                    reaped.append(eval_id)
+                    continue
+                if now - dispatched_at < timeout:
+                    continue
+                state = celery_app.AsyncResult(evaluation.task_id).state if evaluation.task_id else "PENDING"
+                if state in ("FAILURE", "REVOKED"):
+                    error = f"Celery任务已异常结束（{state}）"
+                elif state == "PENDING" and evaluation.status == EvaluationStatus.PENDING.value:
+                    error = f"派发{int(now - dispatched_at)}秒后仍未开始执行，派发的任务已丢失"
+                else:
+                    # 分片执行的任务ID指向合并任务，合并前一直为PENDING
+                    lost = self._lost_shards(eval_id, now) if state == "PENDING" else []
+                    if not lost:
+                        continue
+                    error = f"分片{'、'.join(str(index) for index in lost)}的任务已丢失或异常结束，无法合并结果"
+                logger.warning(f"评估任务[{eval_id}]{error}，标记为失败并释放派发名额")
+                evaluator = TaskEvaluator(None, eval_id)
+                evaluator._update_task_error(db, eval_id, error)
+                # 进入最终状态时释放名额并派发下一个任务
+                evaluator._update_task_status(db, eval_id, EvaluationStatus.FAILED.value)
+                reaped.append(eval_id)
+        if reaped:
+            self.dispatch_ready()
+        return reaped
+
+    def _lost_shards(self, eval_id: int, now: float) -> List[int]:
+        """查找分片执行的任务中丢失的分片
+
+        未结束的分片满足以下条件之一时视为丢失：Celery任务已失败或被撤销；
+        仍为pending（未被任何Worker接收）且超过 EVAL_SHARD_LOST_TIMEOUT 秒，Celery也不知道该任务。
+
+        Args:
+            eval_id: 评估任务ID
+            now: 当前时间戳
+
+        Returns:
+            List[int]: 丢失的分片序号，未分片执行的任务为空列表
+        """
+        lost = []
+        for index, shard in sorted(RedisManager.get_shards(eval_id).items()):
+            status = shard.get("status")
+            if status not in ("pending", "queued", "running") or not shard.get("task_id"):
+                continue
+            state = celery_app.AsyncResult(shard["task_id"]).state
+            if state in ("FAILURE", "REVOKED"):
+                lost.append(index)
+            elif state == "PENDING" and status == "pending" \
+                    and now - float(shard.get("updated_at") or now) >= float(settings.eval_shard_lost_timeout):
+                lost.append(index)
+        return lost
+
+    def cancel(self, eval_id: int) -> bool:
+        """把尚未派发的任务移出分发队列
+
+        Args:
+            eval_id: 评估任务ID
+
+        Returns:
+            bool: 任务是否还在排队
+        """
+        return RedisManager.cancel_dispatch(eval_id)
+
+    def queue_position(self, eval_id: int) -> Optional[Dict[str, Any]]:
+        """计算排队中任务的位置
+
+        Args:
+            eval_id: 评估任务ID
+
+        Returns:
+            Optional[Dict[str, Any]]: lane通道、position排队位置（1表示下一个派发）、pending排队总数、
+            inflight已派发任务数、limit派发上限；任务不在排队时返回None
+        """
+        state = RedisManager.get_dispatch_state(list(PRIORITY_LANES))
+        meta = state["pending"].get(str(eval_id))
+        if meta is None:
+            return None
+        position = 0
+        for lane in PRIORITY_LANES:
+            lane_state = state["lanes"][lane]
+            if lane == meta["lane"]:
+                position += len(dispatch_order(lane_state["passes"], lane_state["queues"], self.weights,
+                                               until=str(eval_id)))
+                break
+            position += sum(len(queue) for queue in lane_state["queues"].values())
+        return {
+            "lane": meta["lane"],
+            "position": position,
+            "pending": len(state["pending"]),
+            "inflight": len(state["inflight"]),
+            "limit": self.limit,
+            "enqueued_at": meta["enqueued_at"]
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """分发队列概览：各通道中每个用户的排队任务数与虚拟时间
+
+        Returns:
+            Dict[str, Any]: lanes、inflight、limit
+        """
+        state = RedisManager.get_dispatch_state(list(PRIORITY_LANES))
+        return {
+            "lanes": {
+                lane: [
+                    {"user_id": user_id, "pending": len(lane_state["queues"].get(user_id, [])),
+                     "pass": lane_state["passes"][user_id], "weight": self.weights.get(user_id, 1.0)}
+                    for user_id in sorted(lane_state["passes"], key=lambda item: (lane_state["passes"][item], item))
+                ]
+                for lane, lane_state in state["lanes"].items()
+            },
+            "inflight": [int(eval_id) for eval_id in state["inflight"]],
+            "limit": self.limit
+        }
+
+    def _send(self, eval_id: int, lane: str, user_id: str) -> Optional[str]:
+        """把任务发送到Celery，发送失败时释放名额并把任务标记为失败
+
+        Celery任务ID在发送前写入数据库：分片执行的任务在Worker中会把任务ID改为合并任务的ID，不能被这里覆盖。
+        """
+        task_id = str(uuid.uuid4())
+        try:
+            self._update_evaluation(eval_id, task_id=task_id)
+            celery_app.send_task(
+                'task_eval.run_evaluation',
+                args=(eval_id,),
+                task_id=task_id,
+                queue='eval_tasks',
+                serializer='json'
+            )
+        except Exception as e:
+            logger.error(f"派发评估任务[{eval_id}]失败: {str(e)}")
+            RedisManager.release_dispatch(eval_id)
+            self._update_evaluation(eval_id, status=EvaluationStatus.FAILED.value, error_message=f"派发任务失败: {str(e)}")
+            return None
+        logger.info(f"已派发评估任务[{eval_id}]（通道 {lane}，用户 {user_id}），Celery任务ID: {task_id}")
+        return task_id
+
+    @staticmethod
+    def _update_evaluation(eval_id: int, **fields) -> None:
+        with SessionLocal() as db:
+            evaluation = db.query(Evaluation).filter(Evaluation.id == eval_id).first()
+            if evaluation:
+                for name, value in fields.items():
+                    setattr(evaluation, name, value)
+                db.commit()
+
+
+# 全局分发器
+task_dispatcher = TaskDispatcher()
+
+
+def start_reaper(dispatcher: TaskDispatcher = task_dispatcher) -> threading.Thread:
+    """启动后台线程定期回收丢失任务的派发名额（多个Worker同时执行是安全的）
+
+    Args:
+        dispatcher: 分发器
+
+    Returns:
+        threading.Thread: 回收线程
+    """
+    def run():
+        while True:
+            time.sleep(float(settings.eval_dispatch_reap_interval))
+            try:
+                dispatcher.reap()
+            except Exception as e:
+                logger.error(f"回收派发名额失败: {str(e)}")
+
+    thread = threading.Thread(target=run, name="dispatch-reaper", daemon=True)
+    thread.start()
+    return thread
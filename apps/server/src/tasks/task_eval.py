@@ -1,8 +1,16 @@
 import logging
 import contextlib
+from celery.signals import worker_ready
 from celery_app import celery_app
 from core.database import SessionLocal
-from tasks.task_evaluator import TaskEvaluator
+from models.eval import Evaluation, EvaluationStatus
+from utils.redis_manager import RedisManager
+from tasks.task_evaluator import TaskEvaluator, db_session
+from tasks.resource_scheduler import resource_scheduler, estimate_demand, start_usage_reporter
+from tasks.task_dispatcher import start_reaper
+from tasks.task_shards import ShardedTaskEvaluator, get_shard_size, plan_shards
+from tasks.runners.runner_opencompass import parse_dataset_names
+from services.evaluation.result_cache import ResultCache
 
 
 # 配置日志
@@ -35,16 +43,125 @@ logger.setLevel(logging.DEBUG)
 #             return func(session, *args, **kwargs)
 #     return wrapper
 
+@worker_ready.connect
+def on_worker_ready(**kwargs):
+    """Worker启动后开始定期上报资源占用、回收丢失任务的派发名额"""
+    start_usage_reporter(resource_scheduler)
+    start_reaper()
+
+
+def _load_task(eval_id: int, plan_cache: bool = True):
+    """读取任务配置：(评估配置, 环境变量, 未命中结果缓存的数据集)，任务不存在时均为None
+
+    plan_cache为False时不检查结果缓存，第三项为None（分片的数据集由派发时的检查结果决定）
+    """
+    with db_session() as db:
+        eval_task = db.query(Evaluation).filter(Evaluation.id == eval_id).first()
+        if not eval_task:
+            return None, None, None
+        to_run = None
+        if plan_cache:
+            _, to_run = ResultCache(eval_task, eval_id).plan(parse_dataset_names(eval_task.dataset_names))
+        return eval_task.eval_config, eval_task.env_vars, to_run
+
+
+def _is_terminated(eval_id: int) -> bool:
+    """任务是否已被终止（排队等待资源期间被终止的任务不再执行）"""
+    with db_session() as db:
+        eval_task = db.query(Evaluation).filter(Evaluation.id == eval_id).first()
+        return eval_task is None or eval_task.status == EvaluationStatus.TERMINATED.value
+
+
+def _report_queued(eval_id: int, position: int, waiting_for: list, shard: int = None):
+    """通知客户端任务正在等待资源"""
+    logger.info(f"评估任务[{eval_id}]{'' if shard is None else f'分片{shard}'}等待资源，排队位置 {position}，等待: {waiting_for}")
+    if shard is None:
+        RedisManager.update_runtime_info(eval_id, {"type": "queued", "position": position, "waiting_for": waiting_for})
+    else:
+        RedisManager.update_shard(eval_id, shard, {"status": "queued", "position": position, "waiting_for": waiting_for})
+
+
 @celery_app.task(bind=True, name='task_eval.run_evaluation', queue='eval_tasks')
 def run_evaluation(self, eval_id: int):
     """
     运行评估任务
 
+    Worker同时接收多个任务，每个任务先向资源调度器申请CPU、内存与接口并发预算，获得后再执行；
+    排队期间被终止的任务放弃排队，不再执行。
+    未命中结果缓存的数据集数超过分片大小（EVAL_SHARD_SIZE 或 eval_config.shard_size）的任务拆分为多个分片子任务
+    并行执行，本任务只负责派发。
+
     Args:
         eval_id: 评估任务ID
         
     Returns:
         dict: 任务状态信息
     """
-    evaluator = TaskEvaluator(self, eval_id)
-    return evaluator.execute_sync()
+    eval_config, env_vars, to_run = _load_task(eval_id)
+    if to_run:
+        shards = plan_shards(to_run, get_shard_size(eval_config))
+        if len(shards) > 1:
+            return ShardedTaskEvaluator(self, eval_id).dispatch(shards, run_evaluation_shard, merge_evaluation_shards,
+                                                                fail_evaluation_shards)
+
+    demand = estimate_demand(eval_config, env_vars)
+    with resource_scheduler.admit(eval_id, demand,
+                                  on_wait=lambda position, waiting_for: _report_queued(eval_id, position, waiting_for),
+                                  cancelled=lambda: _is_terminated(eval_id)) as admitted:
+        if not admitted:
+            return {"success": False, "exit_code": 143, "terminated": True}
+        evaluator = TaskEvaluator(self, eval_id)
+        return evaluator.execute_sync()
+
+
+@celery_app.task(bind=True, name='task_eval.run_evaluation_shard', queue='eval_tasks')
+def run_evaluation_shard(self, eval_id: int, shard_index: int, datasets: list):
+    """
+    执行评估任务的一个分片，与普通任务一样先申请资源
+
+    Args:
+        eval_id: 评估任务ID
+        shard_index: 分片序号
+        datasets: 分片包含的数据集（派发时已排除命中结果缓存的数据集，分片不再检查缓存）
+
+    Returns:
+        dict: 分片执行结果
+    """
+    eval_config, env_vars, _ = _load_task(eval_id, plan_cache=False)
+    demand = estimate_demand(eval_config, env_vars)
+    with resource_scheduler.admit(eval_id, demand, shard=shard_index,
+                                  on_wait=lambda position, waiting_for: _report_queued(eval_id, position, waiting_for, shard_index),
+                                  cancelled=lambda: _is_terminated(eval_id)) as admitted:
+        if not admitted:
+            RedisManager.update_shard(eval_id, shard_index, {"status": "terminated"})
+            return {"shard": shard_index, "datasets": datasets, "exit_code": 143, "output_dir": None}
+        return ShardedTaskEvaluator(self, eval_id).execute_shard(shard_index, datasets)
+
+
+@celery_app.task(bind=True, name='task_eval.merge_evaluation_shards', queue='eval_tasks')
+def merge_evaluation_shards(self, shard_results: list, eval_id: int):
+    """
+    所有分片结束后合并结果并发布任务的最终状态
+
+    Args:
+        shard_results: 各分片的执行结果
+        eval_id: 评估任务ID
+
+    Returns:
+        dict: 任务状态信息
+    """
+    return ShardedTaskEvaluator(self, eval_id).merge(shard_results)
+
+
+@celery_app.task(name='task_eval.fail_evaluation_shards', queue='eval_tasks')
+def fail_evaluation_shards(request, exc, traceback, eval_id: int):
+    """
+    分片子任务异常结束时chord不会执行合并任务，由本错误回调把任务标记为失败
+
+    Args:
+        request: 出错任务的请求信息
+        exc: 异常
+        traceback: 异常堆栈
+        eval_id: 评估任务ID
+    """
+    ShardedTaskEvaluator(None, eval_id).fail(f"分片子任务异常结束: {exc}")
@@ -5,18 +5,29 @@ import os
 import logging
 import contextlib
 from datetime import datetime
+from types import SimpleNamespace
 from sqlalchemy.orm import Session
 from core.database import SessionLocal
 from core.config import settings
 from models.eval import Evaluation, EvaluationStatus
 from utils.redis_manager import RedisManager
-from tasks.runners.runner_opencompass import OpenCompassRunner
-from services.evaluation.result_collector import ResultCollector
+from utils.log_retention import LogRetentionManager
+from tasks.runners.runner_opencompass import OpenCompassRunner, parse_dataset_names
+from tasks.task_dispatcher import task_dispatcher
+from services.evaluation.result_collector import ResultCollector, find_latest_timestamp_dir, new_timestamp_dir
+from services.evaluation.result_cache import ResultCache
 
 
 # 配置日志
 logger = logging.getLogger("eval_tasks")
 
+# 最终状态：进入这些状态后不会再产生新日志
+FINAL_STATUSES = {
+    EvaluationStatus.COMPLETED.value,
+    EvaluationStatus.FAILED.value,
+    EvaluationStatus.TERMINATED.value
+}
+
 @contextlib.contextmanager
 def db_session():
     """数据库会话上下文管理器
@@ -53,6 +64,9 @@ class TaskEvaluator:
         """同步执行评估任务"""
         logger.info(f"开始同步执行评估任务[{self.eval_id}]")
         
+        # 先记录控制指令序号再检查任务状态：检查之后发出的终止等指令序号更大，执行器启动后仍会应用
+        control_after = RedisManager.get_control_seq(self.eval_id)
+        
         # 使用数据库会话上下文管理器处理任务启动
         with db_session() as db:
             try:
@@ -63,6 +77,10 @@ class TaskEvaluator:
                     raise ValueError(f"评估任务[{self.eval_id}]已经完成")
                 elif eval_task and eval_task.status == EvaluationStatus.FAILED.value:
                     raise ValueError(f"评估任务[{self.eval_id}]已经失败")
+                elif eval_task and eval_task.status == EvaluationStatus.TERMINATED.value:
+                    # 开始执行前已被终止（如排队等待资源期间），保持终止状态，不再执行
+                    logger.info(f"评估任务[{self.eval_id}]已终止，不再执行")
+                    return {"success": False, "exit_code": 143, "terminated": True}
                 
                 # 2. 更新任务状态为运行中
                 self._update_task_status(db, self.eval_id, EvaluationStatus.RUNNING.value)
@@ -78,27 +96,53 @@ class TaskEvaluator:
                     working_dir=settings.workspace,
                     opencompass_path=settings.opencompass_path
                 )
+                runner.control_after = control_after
                 
-                # 5. 创建日志文件
+                # 5. 创建日志文件（执行器写入完整输出并建立检索索引）
                 self.log_file = self._create_log_file()
+                runner.log_file_path = self.log_file
 
-                # 6. 清空之前的日志记录
+                # 6. 清空之前的日志记录与运行时信息（心跳、进度）
                 RedisManager.clear_logs(self.eval_id)
+                RedisManager.clear_runtime_info(self.eval_id)
 
-                # 7. 执行任务
-                exit_code = runner.execute(eval_task)
+                # 7. 查找结果缓存，已缓存的数据集不再执行
+                cache = ResultCache(eval_task, self.eval_id)
+                cached, to_run = cache.plan(parse_dataset_names(eval_task.dataset_names))
+                if cached:
+                    self._batch_append_logs(self.eval_id, [
+                        f"结果缓存命中{len(cached)}个数据集: {' '.join(cached)}，"
+                        + (f"仅执行: {' '.join(to_run)}" if to_run else "无需执行")
+                    ])
+
+                # 8. 执行任务（全部命中缓存时不启动OpenCompass）
+                if not to_run:
+                    exit_code = 0
+                elif cached:
+                    exit_code = runner.execute(SimpleNamespace(
+                        model_name=eval_task.model_name,
+                        dataset_names=to_run,
+                        eval_config=eval_task.eval_config or {},
+                        env_vars=eval_task.env_vars
+                    ))
+                else:
+                    exit_code = runner.execute(eval_task)
                 
-                # 8. 结果处理
+                # 9. 结果处理：保存新执行的数据集到缓存，链接命中的缓存结果后收集
                 if exit_code == 0:
                     final_status = EvaluationStatus.COMPLETED
+                    timestamp_dir = find_latest_timestamp_dir(runner.output_dir) if to_run else new_timestamp_dir(runner.output_dir)
+                    cache.store(timestamp_dir, to_run)
+                    cache.link(timestamp_dir, cached)
                     # 收集结果
                     collector = ResultCollector(self.eval_id, runner.working_dir)
                     results = collector.collect_results()
+                    results["cache"] = {"mode": cache.mode, "hits": list(cached), "executed": to_run}
                 else:
                     final_status = EvaluationStatus.FAILED
                     results = {"error": f"非零退出码: {exit_code}"}
                 
-                # 9. 更新最终状态(使用同步方式)
+                # 10. 更新最终状态(使用同步方式)
                 self._update_task_status(db, self.eval_id, final_status.value)
                 self._update_task_results(db, self.eval_id, results)
                 
@@ -154,6 +198,11 @@ class TaskEvaluator:
             eval_task.status = status
             if results:
                 eval_task.results = results
+            # 进度：开始执行时归零，完成时置为100，执行中由进度上报器更新
+            if status == EvaluationStatus.RUNNING.value:
+                eval_task.progress = 0.0
+            elif status == EvaluationStatus.COMPLETED.value:
+                eval_task.progress = 100.0
             db.commit()
         else:
             logger.warning(f"找不到评估任务: {eval_id}")
@@ -169,6 +218,11 @@ class TaskEvaluator:
         except Exception as e:
             logger.error(f"Redis更新任务状态失败: {str(e)}")
 
+        # 3. 任务进入最终状态后归档日志，并为Redis中的日志数据设置过期时间；释放派发名额，派发排队中的下一个任务
+        if status in FINAL_STATUSES:
+            LogRetentionManager.finalize(eval_id)
+            task_dispatcher.release(eval_id)
+
     def _update_task_metadata(self, db: Session, eval_id: int, metadata: dict):
         """更新任务元数据
         
@@ -209,6 +263,12 @@ class TaskEvaluator:
             eval_task.results = results
             db.commit()
             logger.info(f"任务[{eval_id}]结果已更新")
+            
+            # 通知订阅了结果的客户端（多路复用WebSocket的results类别），只发布不写入运行时信息
+            RedisManager.publish_status_event(eval_id, {
+                "type": "results_ready",
+                "has_error": isinstance(results, dict) and "error" in results
+            })
 
     def _update_task_error(self, db: Session, eval_id: int, error_message: str):
         """更新任务错误信息
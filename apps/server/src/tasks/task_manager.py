@@ -5,7 +5,7 @@ from datetime import datetime
 from celery.result import AsyncResult
 from core.database import SessionLocal
 from models.eval import Evaluation, EvaluationStatus
-from tasks.task_eval import run_evaluation
+from tasks.task_dispatcher import task_dispatcher
 from tasks.runners.runner_base import get_runner
 from utils.redis_manager import RedisManager
 import psutil
@@ -46,29 +46,15 @@ class TaskManager:
                     "message": f"未找到ID为 {eval_id} 的评估任务"
                 }
             
-            # 创建Celery任务
-            task = run_evaluation.apply_async(
-                args=(eval_id,),
-                queue='eval_tasks',  # 显式指定队列
-                priority=0,
-                serializer='json'
-                # 添加以下参数确保严格顺序
-                # ignore_result=False,
-                # acks_late=True,
-                # track_started=True
-            )
-
-            # 更新数据库中的任务ID
-            with db_operation(db) as session:
-                eval_record = session.query(Evaluation).filter(Evaluation.id == eval_id).first()
-                if eval_record:
-                    eval_record.task_id = task.id
-                    session.commit()
+            # 加入分发队列，名额允许时立即派发到Celery（任务ID由分发器写入数据库）
+            dispatch = task_dispatcher.submit(eval_id, eval_data.user_id, eval_data.eval_config)
+            queue = dispatch["queue"]
             
             return {
                 "success": True,
-                "task_id": task.id,
-                "message": "任务已创建并开始执行"
+                "task_id": dispatch["task_id"],
+                "queue": queue,
+                "message": "任务已创建并开始执行" if queue is None else f"任务已进入{queue['lane']}通道排队，排队位置 {queue['position']}"
             }
         except Exception as e:
             logger.error(f"创建任务失败 [eval_id={eval_id}]: {str(e)}")
@@ -97,18 +83,46 @@ class TaskManager:
                 'RETRY': EvaluationStatus.PENDING
             }
             
+            # 运行中优先使用实时上报的进度，否则使用数据库中持久化的进度
+            runtime_info = RedisManager.get_runtime_info(eval_id)
+            runtime_progress = runtime_info.get("progress")
+            progress = runtime_progress if runtime_progress is not None else evaluation.progress
+            
+            # 分片执行的任务ID指向合并任务，分片运行期间合并任务尚未开始，以数据库状态为准
+            shards = RedisManager.get_shards(eval_id)
+            status = status_mapping.get(celery_status, EvaluationStatus.UNKNOWN)
+            if shards and celery_status == 'PENDING' and evaluation.status == EvaluationStatus.RUNNING.value:
+                status = EvaluationStatus.RUNNING
+            
+            # 尚未派发到Celery的任务在分发队列中排队
+            queue = task_dispatcher.queue_position(eval_id) if not evaluation.task_id else None
+            if queue is not None:
+                status = EvaluationStatus.PENDING
+            
             return {
-                "status": status_mapping.get(celery_status, EvaluationStatus.UNKNOWN).value,
+                "status": status.value,
                 "task_id": evaluation.task_id,
                 "eval_status": evaluation.status,  # 数据库状态
+                "progress": 100.0 if evaluation.status == EvaluationStatus.COMPLETED.value else (progress or 0.0),
+                # 日志投递统计（含被折叠、被限流丢弃的行数），由执行器心跳上报
+                "log_stats": runtime_info.get("log_stats"),
+                # 分片执行时各分片的状态与进度
+                "shards": shards or None,
+                # 分发队列中的排队信息（优先级通道、排队位置）
+                "queue": queue,
                 "success": "true",
                 "return_code": 0
             }
         except Exception as e:
             return {"error": str(e)}
 
-    def terminate_task(self, eval_id: int) -> dict:
-        """使用Celery原生终止功能"""
+    def terminate_task(self, eval_id: int, force: bool = False) -> dict:
+        """通过控制通道终止任务，并使用Celery原生终止功能兜底
+        
+        Args:
+            eval_id: 评估任务ID
+            force: 为True时发送kill指令立即结束进程，否则发送terminate指令允许进程优雅退出
+        """
         try:
             with SessionLocal() as db:  # 使用上下文管理器管理会话
                 # 获取最小必要字段
@@ -118,16 +132,29 @@ class TaskManager:
                     Evaluation.status
                 ).filter(Evaluation.id == eval_id).first()
 
-                if not evaluation or not evaluation.task_id:
+                if not evaluation:
+                    return {"success": False, "message": "任务不存在"}
+                
+                # 尚未派发的任务直接移出分发队列
+                if task_dispatcher.cancel(eval_id):
+                    db_eval = db.query(Evaluation).filter(Evaluation.id == eval_id).first()
+                    db_eval.status = EvaluationStatus.TERMINATED.value
+                    db.commit()
+                    return {"success": True, "message": "任务已移出排队队列"}
+                
+                if not evaluation.task_id:
                     return {"success": False, "message": "任务不存在"}
 
                 try:
-                    # 首先在Redis中设置终止标志
-                    RedisManager.update_task_status(eval_id, {
-                        "terminate_flag": True,
-                        "timestamp": time.time()
-                    })
-                    logger.info(f"已在Redis中设置任务 {eval_id} 的终止标志")
+                    # 首先通过控制通道通知执行器（执行器订阅通道，毫秒级响应）
+                    command = "kill" if force else "terminate"
+                    RedisManager.send_control_command(eval_id, command)
+                    logger.info(f"已向任务 {eval_id} 发送 {command} 指令")
+                    
+                    # 同时在Redis状态中设置终止标志，兼容检查该标志的执行器
+                    status_data = RedisManager.get_task_status(eval_id) or {}
+                    status_data.update({"terminate_flag": True, "timestamp": time.time()})
+                    RedisManager.update_task_status(eval_id, status_data)
                     
                     task = AsyncResult(evaluation.task_id)
                     
@@ -142,15 +169,15 @@ class TaskManager:
                     # 直接尝试中止任务，不再检查任务状态
                     logger.info(f"尝试终止任务 {evaluation.task_id}")
                     
-                    # 使用Redis终止标志通知运行中的任务
-                    # 任务会在下一次循环中检查此标志并自行终止
-                    
-                    # 为确保安全，仍然发送信号尝试终止
-                    try:
-                        # 先尝试温和地终止
-                        task.revoke(terminate=True, signal='SIGTERM', timeout=10)
-                    except Exception as e:
-                        logger.warning(f"发送SIGTERM信号失败: {str(e)}")
+                    # 运行中的任务已通过控制通道收到指令并自行终止
+                    # （Worker使用threads池，revoke(terminate=True)无法结束执行中的线程）
+                    never_started = (evaluation.status or "").lower() == EvaluationStatus.PENDING.value
+                    if never_started:
+                        try:
+                            # 已派发但尚未开始的任务：撤销后Worker收到消息时直接丢弃
+                            task.revoke()
+                        except Exception as e:
+                            logger.warning(f"撤销Celery任务失败: {str(e)}")
                     
                     # 清理子进程（关键修复点）
                     self._cleanup_child_processes(eval_id)
@@ -161,6 +188,11 @@ class TaskManager:
                         db_eval.status = EvaluationStatus.TERMINATED.value
                         db.commit()
                     
+                    if never_started:
+                        # 从未开始的任务不会再执行，在此释放派发名额并派发排队中的下一个任务；
+                        # 运行中的任务可能还在终止宽限期内，名额由执行器进入最终状态时释放
+                        task_dispatcher.release(eval_id)
+                    
                     return {"success": True, "message": "任务终止指令已发送"}
                     
                 except Exception as e:
@@ -174,6 +206,31 @@ class TaskManager:
             logger.exception("系统级错误")
             return {"success": False, "message": "内部服务错误"}
 
+    def control_task(self, eval_id: int, command: str) -> dict:
+        """向运行中的任务发送控制指令（pause/resume）
+        
+        Args:
+            eval_id: 评估任务ID
+            command: 控制指令
+            
+        Returns:
+            dict: 操作结果
+        """
+        try:
+            evaluation = self._get_db_evaluation(eval_id)
+            if not evaluation or not evaluation.task_id:
+                return {"success": False, "message": "任务不存在"}
+            if (evaluation.status or "").lower() != EvaluationStatus.RUNNING.value:
+                return {"success": False, "message": "只能控制运行中的任务"}
+            
+            message = RedisManager.send_control_command(eval_id, command)
+            if not message:
+                return {"success": False, "message": "控制指令发送失败"}
+            return {"success": True, "message": f"{command} 指令已发送", "command_id": message["id"]}
+        except Exception as e:
+            logger.error(f"发送控制指令失败 [eval_id={eval_id}, command={command}]: {str(e)}")
+            return {"success": False, "message": f"发送控制指令失败: {str(e)}"}
+
     def _cleanup_child_processes(self, task_id: str):
         """清理子进程"""
         try:
@@ -198,6 +255,7 @@ class TaskManager:
             return db.query(
                 Evaluation.id,
                 Evaluation.task_id,
-                Evaluation.status
+                Evaluation.status,
+                Evaluation.progress
             ).filter(Evaluation.id == eval_id).first()
     
\ No newline at end of file
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# 评估任务分片执行：按数据集拆分为多个Celery子任务并行执行，全部结束后合并结果
+
+import os
+import uuid
+import logging
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from celery import chord
+from core.config import settings
+from models.eval import Evaluation, EvaluationStatus
+from utils.redis_manager import RedisManager
+from tasks.task_evaluator import TaskEvaluator, FINAL_STATUSES, db_session
+from tasks.runners.runner_shard import ShardRunner
+from tasks.runners.runner_opencompass import parse_dataset_names
+from services.evaluation.result_collector import ResultCollector, find_latest_timestamp_dir
+from services.evaluation.result_cache import ResultCache
+from services.evaluation.shard_merger import ShardResultMerger
+
+
+# 配置日志
+logger = logging.getLogger("eval_tasks")
+
+
+def get_shard_size(eval_config: Optional[Dict[str, Any]]) -> int:
+    """每个分片的数据集数，eval_config.shard_size 优先于全局配置，0表示不分片"""
+    value = (eval_config or {}).get("shard_size", settings.eval_shard_size)
+    try:
+        return max(int(value or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def plan_shards(dataset_names: Any, shard_size: int) -> List[List[str]]:
+    """按数据集拆分分片
+
+    Args:
+        dataset_names: 任务的数据集列表
+        shard_size: 每个分片的数据集数
+
+    Returns:
+        List[List[str]]: 每个分片的数据集，只有一个分片表示不需要分片执行
+    """
+    datasets = parse_dataset_names(dataset_names)
+    if shard_size <= 0 or len(datasets) <= shard_size:
+        return [datasets]
+    return [datasets[i:i + shard_size] for i in range(0, len(datasets), shard_size)]
+
+
+class ShardedTaskEvaluator(TaskEvaluator):
+    """分片执行的评估任务
+
+    dispatch   在父任务中登记分片计划，以Celery chord派发分片子任务，全部结束后触发合并任务
+    execute_shard   在子任务中执行一个分片（见ShardRunner），不抛出异常，结果交给合并任务
+    merge      合并各分片输出（见ShardResultMerger），链接命中结果缓存的数据集，收集结果并发布任务的最终状态
+
+    分片只包含派发时未命中结果缓存的数据集，其余数据集在合并时从缓存链接。
+    """
+
+    def dispatch(self, shards: List[List[str]], shard_task, merge_task, error_task=None) -> dict:
+        """派发分片子任务
+
+        分片子任务异常结束时chord不会触发合并任务，由合并任务的错误回调error_task把任务标记为失败；
+        分片任务丢失（从未开始或被撤销）的情况由派发名额回收器检查（见TaskDispatcher.reap）。
+
+        Args:
+            shards: 每个分片的数据集
+            shard_task: 执行分片的Celery任务
+            merge_task: 合并结果的Celery任务
+            error_task: 分片子任务异常时执行的错误回调任务
+
+        Returns:
+            dict: 派发信息
+        """
+        with db_session() as db:
+            eval_task = db.query(Evaluation).filter(Evaluation.id == self.eval_id).first()
+            if not eval_task:
+                raise ValueError(f"找不到评估任务: {self.eval_id}")
+            if eval_task.status in (EvaluationStatus.COMPLETED.value, EvaluationStatus.FAILED.value):
+                raise ValueError(f"评估任务[{self.eval_id}]已经结束")
+            if eval_task.status == EvaluationStatus.TERMINATED.value:
+                logger.info(f"评估任务[{self.eval_id}]已终止，不再派发分片")
+                return {"sharded": False, "terminated": True}
+
+            self._update_task_status(db, self.eval_id, EvaluationStatus.RUNNING.value)
+            RedisManager.clear_logs(self.eval_id)
+            RedisManager.clear_runtime_info(self.eval_id)
+            # 预先生成分片任务ID并登记，回收器据此检查分片任务是否丢失
+            signatures = [shard_task.s(self.eval_id, index, datasets).set(task_id=str(uuid.uuid4()))
+                          for index, datasets in enumerate(shards)]
+            RedisManager.init_shards(self.eval_id, shards, task_ids=[signature.id for signature in signatures])
+            self._batch_append_logs(self.eval_id, [
+                f"任务按数据集拆分为{len(shards)}个分片并行执行: "
+                + "; ".join(f"shard {index}: {' '.join(datasets)}" for index, datasets in enumerate(shards))
+            ])
+
+            callback = merge_task.s(self.eval_id)
+            if error_task is not None:
+                callback = callback.on_error(error_task.s(self.eval_id))
+            result = chord(signatures)(callback)
+
+            # 任务ID指向合并任务：查询状态时合并完成即任务完成，撤销时不再合并
+            eval_task = db.query(Evaluation).filter(Evaluation.id == self.eval_id).first()
+            eval_task.task_id = result.id
+            db.commit()
+
+        logger.info(f"评估任务[{self.eval_id}]已派发{len(shards)}个分片，合并任务: {result.id}")
+        return {"sharded": True, "shards": len(shards), "merge_task_id": result.id}
+
+    def execute_shard(self, shard_index: int, datasets: List[str]) -> dict:
+        """执行一个分片
+
+        Args:
+            shard_index: 分片序号
+            datasets: 分片包含的数据集
+
+        Returns:
+            dict: 分片执行结果（shard、datasets、exit_code、output_dir）
+        """
+        shard = {"shard": shard_index, "datasets": datasets, "exit_code": -1, "output_dir": None}
+        try:
+            # 先记录控制指令序号再检查任务状态，检查之后发出的指令仍会被分片执行器应用
+            control_after = RedisManager.get_control_seq(self.eval_id)
+            with db_session() as db:
+                eval_task = db.query(Evaluation).filter(Evaluation.id == self.eval_id).first()
+                if not eval_task:
+                    raise ValueError(f"找不到评估任务: {self.eval_id}")
+                if eval_task.status == EvaluationStatus.TERMINATED.value:
+                    RedisManager.update_shard(self.eval_id, shard_index, {"status": "terminated"})
+                    return {**shard, "exit_code": 143}
+                shard_task = SimpleNamespace(
+                    model_name=eval_task.model_name,
+                    dataset_names=datasets,
+                    eval_config=eval_task.eval_config or {},
+                    env_vars=eval_task.env_vars
+                )
+
+            runner = ShardRunner(
+                self.eval_id,
+                shard_index,
+                working_dir=settings.workspace,
+                opencompass_path=settings.opencompass_path
+            )
+            runner.control_after = control_after
+            runner.log_file_path = self._create_shard_log_file(shard_index)
+            shard["output_dir"] = str(runner.output_dir)
+            shard["exit_code"] = runner.execute(shard_task)
+        except Exception as e:
+            logger.exception(f"评估任务[{self.eval_id}]分片{shard_index}执行失败: {str(e)}")
+            RedisManager.update_shard(self.eval_id, shard_index, {"status": "failed", "error": str(e)})
+            self._batch_append_logs(self.eval_id, [f"错误: 分片{shard_index}执行失败: {str(e)}"])
+        return shard
+
+    def merge(self, shard_results: List[dict]) -> dict:
+        """合并分片输出并发布任务的最终状态
+
+        Args:
+            shard_results: 各分片的执行结果（execute_shard的返回值）
+
+        Returns:
+            dict: 任务状态信息
+        """
+        failed = [shard for shard in shard_results if shard["exit_code"] != 0]
+        shards = [{"shard": shard["shard"], "datasets": shard["datasets"], "exit_code": shard["exit_code"]}
+                  for shard in sorted(shard_results, key=lambda item: item["shard"])]
+
+        with db_session() as db:
+            try:
+                eval_task = db.query(Evaluation).filter(Evaluation.id == self.eval_id).first()
+                if eval_task and eval_task.status == EvaluationStatus.TERMINATED.value:
+                    logger.info(f"评估任务[{self.eval_id}]已终止，不再合并分片结果")
+                    return {"success": False, "exit_code": 143, "shards": shards}
+
+                if failed:
+                    final_status = EvaluationStatus.FAILED
+                    results = {"error": f"{len(failed)}/{len(shard_results)}个分片执行失败", "shards": shards}
+                else:
+                    merged_dir = ShardResultMerger(self.eval_id, settings.workspace).merge(shard_results)
+                    self._batch_append_logs(self.eval_id, [f"已合并{len(shard_results)}个分片的结果: {merged_dir}"])
+                    cached = self._link_cached(eval_task, merged_dir, shard_results)
+                    results = ResultCollector(self.eval_id, settings.workspace).collect_results()
+                    results["shards"] = shards
+                    results["cache"] = {"mode": ResultCache(eval_task).mode, "hits": list(cached),
+                                        "executed": [dataset for shard in shards for dataset in shard["datasets"]]}
+                    final_status = EvaluationStatus.COMPLETED
+
+                self._update_task_status(db, self.eval_id, final_status.value)
+                self._update_task_results(db, self.eval_id, results)
+                return {
+                    "success": not failed,
+                    "exit_code": 0 if not failed else failed[0]["exit_code"],
+                    "results": results
+                }
+            except Exception as e:
+                logger.exception(f"合并评估任务[{self.eval_id}]的分片结果失败: {str(e)}")
+                self._update_task_error(db, self.eval_id, str(e))
+                self._update_task_status(db, self.eval_id, EvaluationStatus.FAILED.value)
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "exit_code": -1
+                }
+
+    def fail(self, error: str) -> bool:
+        """分片执行异常或丢失、合并任务不会执行时把任务标记为失败
+
+        Args:
+            error: 错误信息
+
+        Returns:
+            bool: 任务尚未结束并已标记为失败时返回True
+        """
+        with db_session() as db:
+            eval_task = db.query(Evaluation).filter(Evaluation.id == self.eval_id).first()
+            if eval_task is None or eval_task.status in FINAL_STATUSES:
+                return False
+            logger.warning(f"评估任务[{self.eval_id}]{error}，标记为失败")
+            self._update_task_error(db, self.eval_id, error)
+            # 进入最终状态时释放派发名额
+            self._update_task_status(db, self.eval_id, EvaluationStatus.FAILED.value)
+            return True
+
+    def _link_cached(self, eval_task: Evaluation, merged_dir, shard_results: List[dict]) -> Dict[str, Any]:
+        """把各分片新执行的数据集保存到结果缓存，并链接派发时已命中缓存的数据集
+
+        Returns:
+            Dict[str, Any]: 命中的数据集 -> 缓存条目
+        """
+        cache = ResultCache(eval_task, self.eval_id)
+        for shard in shard_results:
+            cache.store(find_latest_timestamp_dir(Path(shard["output_dir"])), shard["datasets"])
+
+        executed = {dataset for shard in shard_results for dataset in shard["datasets"]}
+        reused = [dataset for dataset in parse_dataset_names(eval_task.dataset_names) if dataset not in executed]
+        cached, missing = cache.plan(reused)
+        if missing:
+            raise ValueError(f"派发后结果缓存已失效的数据集: {' '.join(missing)}")
+        cache.link(merged_dir, cached)
+        return cached
+
+    def _create_shard_log_file(self, shard_index: int) -> str:
+        """创建分片的日志文件"""
+        logs_dir = settings.logs_dir
+        os.makedirs(logs_dir, exist_ok=True)
+        return os.path.join(logs_dir, f"eval_{self.eval_id}_shard{shard_index}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
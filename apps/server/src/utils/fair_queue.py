@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# 评估任务分发队列：按优先级通道、通道内按用户加权公平地把排队任务派发到Celery
+
+import json
+from typing import Dict, List, Optional
+
+# 分发队列的键前缀，脚本按前缀拼出各通道的键（与RedisManager.get_dispatch_*_key一致）：
+#   {prefix}{lane}:users          ZSET  有排队任务的用户 -> 虚拟时间（已获得的加权服务量）
+#   {prefix}{lane}:user:{user}    LIST  用户在该通道排队的任务ID
+#   {prefix}{lane}:clock          STRING  通道的虚拟时钟（最近一次派发时用户的虚拟时间）
+#   {prefix}pending               HASH  排队中的任务ID -> {user_id, lane, enqueued_at}
+#   {prefix}inflight              ZSET  已派发未结束的任务ID -> 派发时间
+DISPATCH_KEY_PREFIX = "dispatch:"
+
+# KEYS[1] 通道用户ZSET  KEYS[2] 用户队列  KEYS[3] 通道虚拟时钟  KEYS[4] 排队任务HASH
+# ARGV[1] 用户ID  ARGV[2] 任务ID  ARGV[3] 任务元信息JSON
+# 新加入（此前没有排队任务）的用户从通道当前虚拟时钟开始，不会因为之前空闲而累积配额
+# 返回 任务在用户队列中的长度，已在队列中时返回0
+ENQUEUE_LUA = """
+if redis.call('HEXISTS', KEYS[4], ARGV[2]) == 1 then
+    return 0
+end
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    local clock = tonumber(redis.call('GET', KEYS[3]) or '0')
+    redis.call('ZADD', KEYS[1], clock, ARGV[1])
+end
+redis.call('HSET', KEYS[4], ARGV[2], ARGV[3])
+return redis.call('RPUSH', KEYS[2], ARGV[2])
+"""
+
+# KEYS[1] 已派发任务ZSET  KEYS[2] 排队任务HASH
+# ARGV[1] 同时派发的任务数上限（<=0不限制）  ARGV[2] 当前时间戳  ARGV[3] 键前缀
+# ARGV[4] 用户权重JSON {user_id: weight}  ARGV[5] 默认权重  ARGV[6...] 优先级通道（从高到低）
+# 按通道优先级取第一个有排队任务的通道，取其中虚拟时间最小的用户（相同时按用户ID），
+# 弹出该用户最早的任务，用户虚拟时间增加 1/权重
+# 返回 {任务ID, 通道, 用户ID}，没有可派发的任务时返回false
+DISPATCH_LUA = """
+local limit = tonumber(ARGV[1])
+if limit > 0 and redis.call('ZCARD', KEYS[1]) >= limit then
+    return false
+end
+local weights = cjson.decode(ARGV[4])
+local default_weight = tonumber(ARGV[5])
+local prefix = ARGV[3]
+for i = 6, #ARGV do
+    local lane = ARGV[i]
+    local users_key = prefix .. lane .. ':users'
+    while true do
+        local head = redis.call('ZRANGE', users_key, 0, 0, 'WITHSCORES')
+        if #head == 0 then
+            break
+        end
+        local user, pass = head[1], tonumber(head[2])
+        local queue_key = prefix .. lane .. ':user:' .. user
+        local eval_id = redis.call('LPOP', queue_key)
+        if redis.call('LLEN', queue_key) == 0 then
+            redis.call('ZREM', users_key, user)
+        else
+            local weight = tonumber(weights[user]) or default_weight
+            if weight <= 0 then weight = default_weight end
+            redis.call('ZADD', users_key, pass + 1 / weight, user)
+        end
+        if eval_id then
+            redis.call('SET', prefix .. lane .. ':clock', pass)
+            redis.call('HDEL', KEYS[2], eval_id)
+            redis.call('ZADD', KEYS[1], ARGV[2], eval_id)
+            return {eval_id, lane, user}
+        end
+    end
+end
+return false
+"""
+
+# KEYS[1] 排队任务HASH  ARGV[1] 任务ID  ARGV[2] 键前缀
+# 返回 1已移出队列，0任务不在队列中
+CANCEL_LUA = """
+local meta = redis.call('HGET', KEYS[1], ARGV[1])
+if not meta then
+    return 0
+end
+meta = cjson.decode(meta)
+local user = tostring(meta['user_id'])
+local queue_key = ARGV[2] .. meta['lane'] .. ':user:' .. user
+redis.call('LREM', queue_key, 0, ARGV[1])
+if redis.call('LLEN', queue_key) == 0 then
+    redis.call('ZREM', ARGV[2] .. meta['lane'] .. ':users', user)
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def load_user_weights(raw: str) -> Dict[str, float]:
+    """解析用户权重配置
+
+    Args:
+        raw: JSON格式的 {user_id: weight}
+
+    Returns:
+        Dict[str, float]: 用户ID（字符串） -> 权重，配置无效时为空字典
+    """
+    if not raw:
+        return {}
+    try:
+        weights = json.loads(raw)
+    except ValueError:
+        return {}
+    if not isinstance(weights, dict):
+        return {}
+    return {str(user): float(weight) for user, weight in weights.items()}
+
+
+def dispatch_order(passes: Dict[str, float], queues: Dict[str, List[str]],
+                   weights: Dict[str, float], default_weight: float = 1.0,
+                   until: Optional[str] = None) -> List[str]:
+    """按DISPATCH_LUA的规则推演一个通道内排队任务的派发顺序
+
+    Args:
+        passes: 用户ID -> 虚拟时间
+        queues: 用户ID -> 排队的任务ID（按提交顺序）
+        weights: 用户权重
+        default_weight: 未配置权重的用户的权重
+        until: 推演到该任务为止
+
+    Returns:
+        List[str]: 任务ID的派发顺序
+    """
+    passes = {user: float(value) for user, value in passes.items() if queues.get(user)}
+    positions = {user: 0 for user in passes}
+    order = []
+    while passes:
+        user = min(passes, key=lambda item: (passes[item], item))
+        eval_id = queues[user][positions[user]]
+        order.append(eval_id)
+        if eval_id == until:
+            break
+        positions[user] += 1
+        if positions[user] >= len(queues[user]):
+            del passes[user]
+        else:
+            weight = weights.get(user, default_weight)
+            passes[user] += 1 / (weight if weight > 0 else default_weight)
+    return order
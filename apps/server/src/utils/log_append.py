@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# 服务端原子日志追加：去重、编号、写入、裁剪指纹与发布（仅list后端）在一次Lua脚本调用中完成
+
+import hashlib
+from typing import List, Sequence
+
+# 每个任务保留的最近日志指纹数量，去重窗口（max_recent_logs）不能超过该值
+FINGERPRINT_CAPACITY = 64
+
+# KEYS[1] 日志列表或Stream  KEYS[2] 指纹列表  KEYS[3] 日志元信息（seq字段）  KEYS[4] 订阅者集合
+# KEYS[5] 已落盘行数（list后端计算全局行号）
+# ARGV[1] 发布通道  ARGV[2] 模式（list/stream）  ARGV[3] 去重窗口
+# ARGV[4] 是否分配序号（1/0）  ARGV[5] Stream近似最大长度  ARGV[6] 每行参数个数
+# ARGV[7] 无订阅者时的发布间隔：1始终发布，0不发布，N每N行发布一行
+# ARGV[8...] 每行：指纹, 记录头部, 记录尾部[, 日志文本, 时间戳（Stream的JSON字段）]
+# 返回 {写入行数, 写入后的日志长度}
+APPEND_LOGS_LUA = """
+local window = tonumber(ARGV[3])
+local uses_seq = ARGV[4] == '1'
+local stride = tonumber(ARGV[6])
+
+-- 最近指纹的滑动窗口（有序数组 + 计数表），语义与逐行检查最近N行一致
+local order = redis.call('LRANGE', KEYS[2], -window, -1)
+local counts = {}
+for _, digest in ipairs(order) do
+    counts[digest] = (counts[digest] or 0) + 1
+end
+local head = 1
+
+local accepted = {}
+for i = 8, #ARGV, stride do
+    local digest = ARGV[i]
+    if not counts[digest] then
+        accepted[#accepted + 1] = i
+        order[#order + 1] = digest
+        counts[digest] = 1
+        if #order - head + 1 > window then
+            local old = order[head]
+            counts[old] = counts[old] - 1
+            if counts[old] == 0 then counts[old] = nil end
+            head = head + 1
+        end
+    end
+end
+
+if #accepted == 0 then
+    return {0, 0}
+end
+
+local seq = 0
+if uses_seq then
+    seq = redis.call('HINCRBY', KEYS[3], 'seq', #accepted) - #accepted
+end
+
+local digests = {}
+local records = {}
+for n, i in ipairs(accepted) do
+    local record = ARGV[i + 1]
+    if uses_seq then
+        record = record .. string.format('%%x', seq + n) .. ARGV[i + 2]
+    end
+    records[n] = record
+    digests[n] = ARGV[i]
+end
+
+local length
+if ARGV[2] == 'stream' then
+    for n, i in ipairs(accepted) do
+        if stride >= 5 then
+            redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[5], '*', 'log', ARGV[i + 3], 'timestamp', ARGV[i + 4])
+        else
+            redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[5], '*', 'r', records[n])
+        end
+    end
+    length = redis.call('XLEN', KEYS[1])
+else
+    -- 分批RPUSH，避免unpack超出Lua栈上限
+    for start = 1, #records, 1000 do
+        length = redis.call('RPUSH', KEYS[1], unpack(records, start, math.min(start + 999, #records)))
+    end
+end
+
+for start = 1, #digests, 1000 do
+    redis.call('RPUSH', KEYS[2], unpack(digests, start, math.min(start + 999, #digests)))
+end
+redis.call('LTRIM', KEYS[2], -%d, -1)
+
+-- Stream后端的读取方通过XREAD读取新条目，不发布通道消息
+if ARGV[2] == 'stream' then
+    return {#records, length}
+end
+
+-- 只在有在线订阅者时逐行发布，否则按配置跳过或降采样（日志已写入存储，订阅者加入时可补读）
+-- 订阅者的过期时间按Redis服务器时钟记录，这里同样使用服务器时钟比较，不受各主机时钟偏差影响
+local publish_every = tonumber(ARGV[7])
+if publish_every ~= 1 then
+    local now = redis.call('TIME')
+    if redis.call('ZCOUNT', KEYS[4], string.format('%%d.%%06d', now[1], now[2]), '+inf') > 0 then
+        publish_every = 1
+    end
+end
+local first = length - #records
+-- list后端的JSON记录不含序号，发布时附加存储位置（全局行号+1），订阅者据此发现缺失的日志
+local position = nil
+if not uses_seq then
+    position = first + tonumber(redis.call('GET', KEYS[5]) or 0)
+end
+local function publish(n)
+    local record = records[n]
+    if position then
+        record = '{"seq": ' .. (position + n) .. ', ' .. string.sub(record, 2)
+    end
+    redis.call('PUBLISH', ARGV[1], record)
+end
+if publish_every == 1 then
+    for n = 1, #records do
+        publish(n)
+    end
+elseif publish_every > 1 then
+    for n = 1, #records do
+        if (first + n) %% publish_every == 0 then
+            publish(n)
+        end
+    end
+end
+
+return {#records, length}
+""" % FINGERPRINT_CAPACITY
+
+
+def line_digest(line: str) -> str:
+    """计算日志行的去重指纹
+
+    Args:
+        line: 日志行
+
+    Returns:
+        str: 16位十六进制指纹
+    """
+    return hashlib.blake2b(line.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def build_append_args(codec, records: Sequence, stream_json: bool = False) -> List[str]:
+    """构造追加脚本的逐行参数
+
+    Args:
+        codec: 编解码器
+        records: 日志记录（序号由脚本分配）
+        stream_json: 是否为JSON编码的Stream条目（需要单独的log/timestamp字段）
+
+    Returns:
+        List[str]: 按行展开的参数
+    """
+    args = []
+    for record in records:
+        record_head, record_tail = codec.encode_template(record)
+        args.append(line_digest(record.log))
+        args.append(record_head)
+        args.append(record_tail)
+        if stream_json:
+            args.append(record.log)
+            args.append(record.timestamp)
+    return args
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# 日志记录编解码
+
+import json
+import time
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# 紧凑格式的字段分隔符（ASCII单元分隔符）
+# 日志行写入前已经过strip()，而\x1f属于空白字符，因此合法日志行不会以它开头，
+# 可以据此把紧凑记录与JSON记录、旧版纯文本记录区分开
+_SEP = "\x1f"
+
+# 日志级别与单字符缩写
+LOG_LEVELS = {"D": "DEBUG", "I": "INFO", "W": "WARNING", "E": "ERROR"}
+_LEVEL_MARKERS = (
+    ("E", ("ERROR", "Traceback", "CRITICAL", "Exception")),
+    ("W", ("WARNING", "WARN")),
+    ("D", ("DEBUG",)),
+    ("I", ("INFO",)),
+)
+
+
+def detect_level(line: str) -> str:
+    """根据日志行开头的关键字粗略识别日志级别
+
+    Args:
+        line: 日志行
+
+    Returns:
+        str: 级别缩写（D/I/W/E），无法识别时为空字符串
+    """
+    head = line[:96]
+    for level, markers in _LEVEL_MARKERS:
+        for marker in markers:
+            if marker in head:
+                return level
+    return ""
+
+
+class LogRecord(NamedTuple):
+    """一条日志记录"""
+    log: str
+    ts_ms: int = 0
+    seq: int = 0
+    level: str = ""
+
+    @property
+    def timestamp(self) -> str:
+        """ISO格式时间戳（与旧版JSON记录的timestamp字段一致）"""
+        if not self.ts_ms:
+            return ""
+        return datetime.fromtimestamp(self.ts_ms / 1000).isoformat()
+
+
+def new_record(line: str, seq: int = 0) -> LogRecord:
+    """为当前时刻的日志行创建记录
+
+    Args:
+        line: 日志行
+        seq: 记录序号，0表示不分配
+
+    Returns:
+        LogRecord: 日志记录
+    """
+    return LogRecord(line, int(time.time() * 1000), seq, detect_level(line))
+
+
+class JsonLogCodec:
+    """JSON编解码（旧版格式）：{"log": ..., "timestamp": ISO时间}"""
+
+    name = "json"
+    uses_seq = False
+
+    def encode(self, record: LogRecord) -> str:
+        return json.dumps({"log": record.log, "timestamp": record.timestamp})
+
+    def encode_template(self, record: LogRecord) -> Tuple[str, str]:
+        """编码为不含序号的 (头部, 尾部)，JSON编码不使用序号，尾部为空"""
+        return self.encode(record), ""
+
+    def decode(self, raw: str) -> LogRecord:
+        data = json.loads(raw)
+        timestamp = data.get("timestamp") or ""
+        try:
+            ts_ms = int(datetime.fromisoformat(timestamp).timestamp() * 1000) if timestamp else 0
+        except (TypeError, ValueError):
+            ts_ms = 0
+        return LogRecord(data.get("log", raw), ts_ms, int(data.get("seq", 0) or 0), data.get("level", ""))
+
+
+class CompactLogCodec:
+    """紧凑文本编码：\\x1f<毫秒时间戳hex>\\x1f<序号hex>\\x1f<级别>\\x1f<日志>
+
+    Redis客户端使用decode_responses=True，记录必须是合法的UTF-8文本，
+    因此采用分隔符头部而不是二进制格式；头部固定4个分隔符，解码只需一次split。
+    """
+
+    name = "compact"
+    uses_seq = True
+
+    def encode(self, record: LogRecord) -> str:
+        return f"{_SEP}{record.ts_ms:x}{_SEP}{record.seq:x}{_SEP}{record.level}{_SEP}{record.log}"
+
+    def encode_template(self, record: LogRecord) -> Tuple[str, str]:
+        """编码为不含序号的 (头部, 尾部)，由服务端脚本在两者之间填入十六进制序号"""
+        return f"{_SEP}{record.ts_ms:x}{_SEP}", f"{_SEP}{record.level}{_SEP}{record.log}"
+
+    def decode(self, raw: str) -> LogRecord:
+        _, ts_hex, seq_hex, level, log = raw.split(_SEP, 4)
+        return LogRecord(log, int(ts_hex, 16), int(seq_hex, 16), level)
+
+
+_CODECS = {codec.name: codec for codec in (JsonLogCodec(), CompactLogCodec())}
+
+
+def get_codec(name: Optional[str]):
+    """按名称获取编解码器，未知名称回退到JSON
+
+    Args:
+        name: 编解码器名称（json或compact）
+
+    Returns:
+        编解码器实例
+    """
+    return _CODECS.get(str(name or "").lower(), _CODECS["json"])
+
+
+def decode_record(raw: str) -> LogRecord:
+    """自动识别格式并解码一条日志记录
+
+    依次识别紧凑格式、JSON格式，均不匹配时按旧版纯文本处理
+
+    Args:
+        raw: Redis中存储或发布的日志记录
+
+    Returns:
+        LogRecord: 日志记录
+    """
+    if not raw:
+        return LogRecord(raw or "")
+    if raw[0] == _SEP:
+        try:
+            return _CODECS["compact"].decode(raw)
+        except ValueError:
+            return LogRecord(raw)
+    if raw[0] == "{":
+        try:
+            return _CODECS["json"].decode(raw)
+        except (json.JSONDecodeError, AttributeError):
+            pass
+    return LogRecord(raw)
+
+
+def decode_text(raw: str) -> str:
+    """只提取日志文本（去重、推送等只需要文本的场景）
+
+    Args:
+        raw: Redis中存储或发布的日志记录
+
+    Returns:
+        str: 日志文本
+    """
+    if raw and raw[0] == _SEP:
+        parts = raw.split(_SEP, 4)
+        return parts[4] if len(parts) == 5 else raw
+    if raw and raw[0] == "{":
+        try:
+            data = json.loads(raw)
+            return data.get("log", raw) if isinstance(data, dict) else raw
+        except json.JSONDecodeError:
+            pass
+    return raw
+
+
+def with_position(raw: str, seq: int) -> str:
+    """为发布的日志记录附加存储位置
+
+    JSON记录本身不含序号，发布时附加seq字段（全局行号+1），订阅者据此判断实时日志是否有缺失；
+    紧凑记录已带有序号，原样返回。
+
+    Args:
+        raw: 日志记录
+        seq: 存储位置（全局行号+1）
+
+    Returns:
+        str: 发布使用的日志记录
+    """
+    if raw and raw[0] == "{":
+        return f'{{"seq": {int(seq)}, {raw[1:]}' if len(raw) > 2 else raw
+    return raw
+
+
+def encode_stream_fields(codec, record: LogRecord) -> Dict[str, str]:
+    """编码为Stream条目字段
+
+    JSON编码沿用 {log, timestamp} 两个字段；紧凑编码只写一个字段r，减少每条目的字段开销
+
+    Args:
+        codec: 编解码器
+        record: 日志记录
+
+    Returns:
+        Dict[str, str]: Stream条目字段
+    """
+    if codec.name == "json":
+        return {"log": record.log, "timestamp": record.timestamp}
+    return {"r": codec.encode(record)}
+
+
+def decode_stream_fields(fields: Dict[str, str]) -> LogRecord:
+    """解码Stream条目字段
+
+    Args:
+        fields: Stream条目字段
+
+    Returns:
+        LogRecord: 日志记录
+    """
+    if "r" in fields:
+        return decode_record(fields["r"])
+    timestamp = fields.get("timestamp") or ""
+    try:
+        ts_ms = int(datetime.fromisoformat(timestamp).timestamp() * 1000) if timestamp else 0
+    except ValueError:
+        ts_ms = 0
+    return LogRecord(fields.get("log", ""), ts_ms)
+
+
+def stream_fields_to_raw(fields: Dict[str, str]) -> str:
+    """把Stream条目字段还原为记录原文（与list后端存储、发布的记录格式一致）
+
+    Args:
+        fields: Stream条目字段
+
+    Returns:
+        str: 记录原文
+    """
+    if "r" in fields:
+        return fields["r"]
+    return json.dumps({"log": fields.get("log", ""), "timestamp": fields.get("timestamp") or ""})
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# 日志导出：以固定内存流式输出完整日志（纯文本或gzip）
+
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Union
+from utils.rotating_log import open_log_reader
+
+
+def iter_file_blocks(path: Union[str, Path], block_size: int = 64 * 1024) -> Iterator[bytes]:
+    """按固定大小的块读取日志文件（依次读取所有轮转分段，压缩分段按块解压）
+
+    Args:
+        path: 日志文件路径
+        block_size: 块大小（字节）
+
+    Yields:
+        bytes: 文件内容块
+    """
+    with open_log_reader(path) as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def iter_line_chunks(chunks: Iterable[List[str]]) -> Iterator[bytes]:
+    """把按窗口读取的日志行编码为文本块（每行以换行结尾）
+
+    Args:
+        chunks: 日志行窗口序列
+
+    Yields:
+        bytes: UTF-8文本块
+    """
+    for lines in chunks:
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def gzip_stream(blocks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """流式gzip压缩
+
+    Args:
+        blocks: 原始内容块
+        level: 压缩级别
+
+    Yields:
+        bytes: gzip格式的压缩数据块
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# 单任务日志速率控制：折叠重复行 + 令牌桶限流
+
+import re
+import time
+import threading
+from typing import Callable, Dict, Any, Optional
+from core.config import settings
+from utils.log_codec import detect_level
+
+# 可折叠的重复输出：(类别, 快速子串判断, 正则)
+# tqdm刷新与API速率报告按类别折叠；其他行把数字归一化后与上一行比较（重试、轮询类刷屏）
+_COLLAPSE_PATTERNS = (
+    ("tqdm", "%|", re.compile(r"\d+%\|")),
+    ("rpm", "RPM", re.compile(r"Current RPM")),
+)
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def collapse_key(line: str) -> str:
+    """计算日志行的折叠键，相邻且折叠键相同的行视为同一类重复输出
+
+    Args:
+        line: 日志行
+
+    Returns:
+        str: 折叠键
+    """
+    for name, marker, pattern in _COLLAPSE_PATTERNS:
+        if marker in line and pattern.search(line):
+            return name
+    return _DIGITS_RE.sub("#", line)
+
+
+class LogRateGovernor:
+    """单个评估任务的日志速率控制器，位于 LogHandler -> LogShipper 之间
+
+    1. 折叠：相邻且折叠键相同的行（tqdm刷新、RPM报告、只有数字不同的重试日志）合并，
+       每 collapse_interval 秒最多输出一条该类最新的行，附带 "(xN)" 表示代表的行数
+    2. 限流：令牌桶（rate 行/秒，容量 burst）限制输出速率，超出的行丢弃并计数，
+       恢复输出时（或令牌恢复、结束时flush）先补一条提示行说明丢弃了多少行；错误级别的行不受限流影响
+
+    完整输出仍由执行器写入日志文件，这里只约束写入Redis和推送到WebSocket的量。
+    """
+
+    def __init__(self,
+                 emit: Callable[[str], None],
+                 rate: Optional[float] = None,
+                 burst: Optional[int] = None,
+                 collapse_interval: Optional[float] = None):
+        """初始化
+
+        Args:
+            emit: 输出一行日志的回调（通常为 LogShipper.ship）
+            rate: 每秒允许输出的行数，0表示不限流，默认取 settings.log_rate_limit_lines
+            burst: 令牌桶容量，默认取 settings.log_rate_burst_lines
+            collapse_interval: 同类重复行的最短输出间隔（秒），默认取 settings.log_collapse_interval
+        """
+        self.emit = emit
+        self.rate = float(rate if rate is not None else settings.log_rate_limit_lines)
+        self.burst = float(burst if burst is not None else settings.log_rate_burst_lines)
+        self.collapse_interval = float(collapse_interval if collapse_interval is not None else settings.log_collapse_interval)
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._dropped_pending = 0
+
+        # 当前折叠中的重复行：折叠键、最新的行、尚未输出的行数、上次输出时间
+        self._run_key: Optional[str] = None
+        self._run_line: Optional[str] = None
+        self._run_count = 0
+        self._run_emitted = 0.0
+
+        # 统计计数
+        self.lines_in = 0          # 收到的行数
+        self.lines_out = 0         # 输出的行数（不含提示行）
+        self.lines_collapsed = 0   # 被折叠到其他行中的行数
+        self.lines_dropped = 0     # 被限流丢弃的行数
+
+    def feed(self, line: str) -> None:
+        """处理一行日志
+
+        Args:
+            line: 日志行（已去除首尾空白）
+        """
+        with self._lock:
+            self.lines_in += 1
+            now = time.monotonic()
+            key = collapse_key(line)
+            if key == self._run_key:
+                # 同类重复行：只保留最新的一行，按间隔输出
+                self._run_line = line
+                self._run_count += 1
+                if now - self._run_emitted >= self.collapse_interval:
+                    self._emit_run(now)
+                return
+
+            # 新的一类输出：先结束上一段折叠
+            self._emit_run(now)
+            self._run_key = key
+            self._run_line = None
+            self._run_count = 0
+            self._run_emitted = now
+            self._admit(line, 1, now)
+
+    def tick(self) -> None:
+        """输出间隔已到的折叠行（监督循环定期调用，保证长时间的进度条刷新也能看到最新状态）
+
+        限流后一直没有新行时，令牌恢复后也在这里补发丢弃提示。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._run_count and now - self._run_emitted >= self.collapse_interval:
+                self._emit_run(now)
+            if self._dropped_pending and self._refill(now) >= 1:
+                self._tokens -= 1
+                self._emit_dropped_notice()
+
+    def flush(self) -> None:
+        """立即输出尚未输出的折叠行与丢弃提示（执行结束时调用，提示不受限流影响）"""
+        with self._lock:
+            self._emit_run(time.monotonic())
+            self._emit_dropped_notice()
+
+    def _emit_run(self, now: float) -> None:
+        """输出当前折叠段中最新的一行，并标注它代表的行数"""
+        if not self._run_count:
+            return
+        count, line = self._run_count, self._run_line
+        self._run_count = 0
+        self._run_line = None
+        self._run_emitted = now
+        self.lines_collapsed += count - 1
+        self._admit(f"{line} (x{count})" if count > 1 else line, count, now)
+
+    def _admit(self, line: str, represents: int, now: float) -> None:
+        """经令牌桶输出一行
+
+        Args:
+            line: 要输出的行
+            represents: 该行代表的原始行数（被丢弃时计入丢弃数）
+            now: 当前单调时钟
+        """
+        if self.rate > 0:
+            if self._refill(now) < 1 and detect_level(line) != "E":
+                self._dropped_pending += represents
+                self.lines_dropped += represents
+                return
+            self._tokens -= 1
+            self._emit_dropped_notice()
+        self.lines_out += 1
+        self.emit(line)
+
+    def _refill(self, now: float) -> float:
+        """按经过的时间补充令牌，返回当前令牌数"""
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        return self._tokens
+
+    def _emit_dropped_notice(self) -> None:
+        """输出丢弃提示行（没有待提示的丢弃行时不输出）"""
+        if self._dropped_pending:
+            self.emit(f"[日志限流] 输出过快，已省略 {self._dropped_pending} 行，完整日志见日志文件")
+            self._dropped_pending = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取速率控制统计信息
+
+        Returns:
+            Dict[str, Any]: 统计信息字典
+        """
+        return {
+            "lines_in": self.lines_in,
+            "lines_out": self.lines_out,
+            "lines_collapsed": self.lines_collapsed,
+            "lines_dropped": self.lines_dropped
+        }
@@ -1,16 +1,54 @@
-from utils.redis_manager import RedisManager
+from typing import Dict, Any
+from utils.log_shipper import LogShipper
+from utils.log_governor import LogRateGovernor
+from utils.progress_tracker import ProgressReporter
 
 class LogHandler:
     def __init__(self, eval_id: int):
         self.eval_id = eval_id
-    
+        # 批量投递器，按行数/时间间隔批量写入Redis
+        self.shipper = LogShipper(eval_id)
+        # 折叠重复行并限流后再交给投递器
+        self.governor = LogRateGovernor(self.shipper.ship)
+        # 进度解析与节流上报
+        self.progress = ProgressReporter(eval_id)
+
     def process_line(self, raw_line: str):
         """处理单行日志"""
         # 基础清洗
         cleaned_line = raw_line.strip()
         if not cleaned_line:
             return
-        
-        # 实时发布
-        RedisManager.append_log(self.eval_id, cleaned_line)
-    
+
+        # 增量解析进度（解析完整输出，不受折叠与限流影响）
+        self.progress.feed(cleaned_line)
+        # 经速率控制后提交到批量投递器
+        self.governor.feed(cleaned_line)
+
+    def set_expected_datasets(self, count: int) -> None:
+        """设置预期的数据集数量，用于估算总进度"""
+        self.progress.parser.expected_datasets = max(0, int(count or 0))
+
+    def tick(self) -> None:
+        """上报节流期间积压的进度变化，输出间隔已到的折叠行"""
+        self.progress.tick()
+        self.governor.tick()
+
+    def flush(self) -> int:
+        """立即刷新尚未投递的日志与进度"""
+        self.progress.tick(force=True)
+        self.governor.flush()
+        return self.shipper.flush()
+
+    def close(self) -> Dict[str, Any]:
+        """结束投递并返回统计信息"""
+        self.governor.flush()
+        stats = self.shipper.close()
+        stats.update(self.governor.get_stats())
+        return stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取日志投递与速率控制统计信息"""
+        stats = self.shipper.get_stats()
+        stats.update(self.governor.get_stats())
+        return stats
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# 评估日志文件的磁盘倒排索引
+
+import os
+import re
+import json
+import time
+import logging
+import itertools
+from array import array
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from core.config import settings
+from utils.rotating_log import open_log_reader, log_exists
+
+logger = logging.getLogger(__name__)
+
+# 索引词：小写字母数字串（下划线、点、横线等均作为分隔符，demo_gsm8k_gen 会被拆成 demo/gsm8k/gen）
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+_MIN_TOKEN_LEN = 2
+_MAX_TOKEN_LEN = 64
+# 含超长字母数字串（不单独索引）的行登记在该词下；不含字母数字，不会被查询词按子串命中
+_OVERLONG_TOKEN = "~"
+
+_MANIFEST = "manifest.json"
+_OFFSETS = "offsets.bin"
+
+
+def index_dir_for(log_path) -> Path:
+    """日志文件对应的索引目录（与日志文件放在一起）"""
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.name + ".idx")
+
+
+def tokenize(text: str) -> Iterable[str]:
+    """提取可索引的词（去除纯数字和过短、过长的词）"""
+    for token in _TOKEN_RE.findall(text.lower()):
+        if _MIN_TOKEN_LEN <= len(token) <= _MAX_TOKEN_LEN and not token.isdigit():
+            yield token
+
+
+def index_terms(line: str) -> set:
+    """提取一行日志的索引词（超长的字母数字串以 _OVERLONG_TOKEN 代替）"""
+    terms = set()
+    for token in _TOKEN_RE.findall(line.lower()):
+        if len(token) > _MAX_TOKEN_LEN:
+            terms.add(_OVERLONG_TOKEN)
+        elif len(token) >= _MIN_TOKEN_LEN and not token.isdigit():
+            terms.add(token)
+    return terms
+
+
+def find_latest_log_file(eval_id) -> Optional[Path]:
+    """查找评估任务最近一次执行的日志文件
+
+    日志文件由任务执行器创建：settings.logs_dir/eval_{id}_{时间戳}.log；
+    分片执行时各分片的日志为 eval_{id}_shard{序号}_{时间戳}.log，只包含部分输出，不作为任务的日志文件
+
+    Args:
+        eval_id: 评估任务ID
+
+    Returns:
+        Optional[Path]: 日志文件路径，不存在时返回None
+    """
+    logs_dir = Path(settings.logs_dir)
+    if not logs_dir.exists():
+        return None
+    pattern = re.compile(rf"eval_{re.escape(str(eval_id))}_\d{{8}}_\d{{6}}\.log")
+    candidates = sorted(path for path in logs_dir.glob(f"eval_{eval_id}_*.log") if pattern.fullmatch(path.name))
+    return candidates[-1] if candidates else None
+
+
+class LogIndexWriter:
+    """增量构建日志索引
+
+    索引目录 <日志文件>.idx 下包含：
+    - offsets.bin：第i个uint64为第i行在日志文件中的起始字节偏移
+    - seg_<起始行>.tok / .post：一个分段的词典（词 -> [在.post中的位置, 数量]）与
+      倒排表（uint32行号数组）
+    - manifest.json：已索引的行数、字节数与分段列表，是索引提交点
+
+    日志行累积 flush_lines 行或距上次刷新超过 flush_interval 秒后，由 flush_if_due() 写出一个分段；
+    close() 时把所有分段合并为一个，减少查询时需要打开的文件数。
+    """
+
+    def __init__(self, log_path, flush_lines: Optional[int] = None, flush_interval: Optional[float] = None):
+        """初始化
+
+        Args:
+            log_path: 日志文件路径
+            flush_lines: 累积多少行写出一个分段，默认取 settings.log_index_flush_lines
+            flush_interval: 最长多久写出一个分段（秒），默认取 settings.log_index_flush_interval
+        """
+        self.log_path = Path(log_path)
+        self.index_dir = index_dir_for(log_path)
+        self.flush_lines = max(1, int(flush_lines or settings.log_index_flush_lines))
+        self.flush_interval = float(flush_interval if flush_interval is not None else settings.log_index_flush_interval)
+
+        self.lines = 0            # 已提交到分段的行数
+        self.bytes = 0            # 已提交行在日志文件中的结束偏移
+        self.segments: List[Dict[str, Any]] = []
+
+        self._pending_offsets = array("Q")
+        self._pending_postings: Dict[str, array] = {}
+        self._pending_end = 0
+        self._last_flush = time.monotonic()
+
+        # 重新执行时日志文件被覆盖，旧索引一并清除
+        if self.index_dir.exists():
+            for path in self.index_dir.iterdir():
+                path.unlink()
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def add(self, line: str, offset: int, length: int) -> None:
+        """登记一行日志
+
+        Args:
+            line: 日志行（不含换行符）
+            offset: 该行在日志文件中的起始字节偏移
+            length: 该行占用的字节数（含换行符）
+        """
+        line_no = self.lines + len(self._pending_offsets)
+        self._pending_offsets.append(offset)
+        self._pending_end = offset + length
+        for token in index_terms(line):
+            postings = self._pending_postings.get(token)
+            if postings is None:
+                postings = self._pending_postings[token] = array("I")
+            postings.append(line_no)
+
+    def flush_if_due(self) -> None:
+        """待提交行数达到 flush_lines 或距上次刷新超过 flush_interval 时写出分段
+
+        索引中的偏移必须指向已写入文件的数据，调用方需先刷新日志文件
+        """
+        pending = len(self._pending_offsets)
+        if pending >= self.flush_lines or (pending and time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """把待提交的行写成一个分段并更新manifest（调用方需先刷新日志文件）"""
+        self._last_flush = time.monotonic()
+        if not self._pending_offsets:
+            return
+        start = self.lines
+        with open(self.index_dir / _OFFSETS, "ab") as f:
+            self._pending_offsets.tofile(f)
+        self.segments.append(self._write_segment(f"seg_{start:09d}", start, self._pending_postings))
+
+        self.lines += len(self._pending_offsets)
+        self.bytes = self._pending_end
+        self._pending_offsets = array("Q")
+        self._pending_postings = {}
+        self._write_manifest()
+
+    def close(self) -> None:
+        """刷新剩余的行并合并分段"""
+        try:
+            self.flush()
+            if len(self.segments) > 1:
+                self._merge_segments()
+        except Exception as e:
+            logger.warning(f"关闭日志索引失败 [{self.log_path}]: {str(e)}")
+
+    def _write_segment(self, name: str, start: int, postings: Dict[str, array]) -> Dict[str, Any]:
+        """写出一个分段（词典 + 倒排表）"""
+        lexicon = {}
+        position = 0
+        with open(self.index_dir / f"{name}.post", "wb") as f:
+            for token in sorted(postings):
+                items = postings[token]
+                items.tofile(f)
+                lexicon[token] = [position, len(items)]
+                position += len(items)
+        with open(self.index_dir / f"{name}.tok", "w", encoding="utf-8") as f:
+            json.dump(lexicon, f, separators=(",", ":"))
+        return {"name": name, "start": start}
+
+    def _merge_segments(self) -> None:
+        """把所有分段合并为一个"""
+        merged: Dict[str, array] = {}
+        for segment in self.segments:
+            for token, postings in _read_segment(self.index_dir, segment["name"]):
+                target = merged.get(token)
+                if target is None:
+                    merged[token] = postings
+                else:
+                    target.extend(postings)
+        old = [segment["name"] for segment in self.segments]
+        self.segments = [self._write_segment("seg_merged", 0, merged)]
+        self._write_manifest()
+        for name in old:
+            for suffix in (".tok", ".post"):
+                (self.index_dir / f"{name}{suffix}").unlink(missing_ok=True)
+
+    def _write_manifest(self) -> None:
+        """原子地写入manifest"""
+        manifest = {"version": 1, "lines": self.lines, "bytes": self.bytes, "segments": self.segments}
+        tmp_path = self.index_dir / (_MANIFEST + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.index_dir / _MANIFEST)
+
+
+def _read_segment(index_dir: Path, name: str) -> Iterable[Tuple[str, array]]:
+    """读取分段中的全部倒排表（合并分段时使用）"""
+    with open(index_dir / f"{name}.tok", encoding="utf-8") as f:
+        lexicon = json.load(f)
+    with open(index_dir / f"{name}.post", "rb") as f:
+        for token, (position, count) in lexicon.items():
+            f.seek(position * 4)
+            postings = array("I")
+            postings.fromfile(f, count)
+            yield token, postings
+
+
+class LogIndex:
+    """基于索引的日志检索
+
+    查询按子串匹配（不区分大小写），与日志是否已索引无关：查询中的每个词可能只是日志中某个词的一部分
+    （如 gsm 之于 demo_gsm8k_gen、memor 之于 memory），因此取词典中包含该词的所有索引词的倒排表并集，
+    各查询词的并集求交得到候选行，再按行偏移seek读取候选行做子串校验；多词查询按短语匹配。
+    尚未写入分段的尾部日志直接顺序扫描。整个过程只按需读取命中的行及其上下文，不会把日志文件整体读入内存。
+    """
+
+    def __init__(self, log_path):
+        """初始化
+
+        Args:
+            log_path: 日志文件路径
+        """
+        self.log_path = Path(log_path)
+        self.index_dir = index_dir_for(log_path)
+        self.manifest = self._load_manifest()
+        self._tail_offsets: Optional[List[int]] = None
+        self._end = 0
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.index_dir / _MANIFEST, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {"lines": 0, "bytes": 0, "segments": []}
+
+    def search(self, query: str, limit: int = 100, context: int = 2) -> Dict[str, Any]:
+        """检索日志
+
+        Args:
+            query: 查询字符串
+            limit: 最多返回的匹配数
+            context: 每个匹配前后附带的上下文行数
+
+        Returns:
+            Dict[str, Any]: {matches: [{line_no, line, before, after}], total_lines, indexed_lines, truncated}
+        """
+        try:
+            return self._search(query, limit, context)
+        except FileNotFoundError:
+            # 查询期间写入方合并了分段，重新加载manifest后重试一次
+            self.manifest = self._load_manifest()
+            return self._search(query, limit, context)
+
+    def _search(self, query: str, limit: int, context: int) -> Dict[str, Any]:
+        needle = query.strip().lower()
+        indexed_lines = int(self.manifest.get("lines", 0))
+        result = {"query": query, "matches": [], "indexed_lines": indexed_lines, "truncated": False}
+        if not needle or not log_exists(self.log_path):
+            result["total_lines"] = 0
+            return result
+
+        # 日志可能已轮转为多个（压缩）分段，统一按完整日志的偏移读取
+        with open_log_reader(self.log_path) as log_file, open_log_reader(self.log_path) as scan_file, \
+                self._open_offsets() as offsets_file:
+            self._log_file, self._offsets_file = log_file, offsets_file
+            self._scan_tail()
+            total_lines = indexed_lines + len(self._tail_offsets)
+            result["total_lines"] = total_lines
+
+            tokens = list(dict.fromkeys(tokenize(needle)))
+            if tokens and indexed_lines:
+                # 已索引部分：倒排表求交后逐行校验
+                indexed = ((line_no, self._read_lines(line_no, line_no + 1)[0])
+                           for line_no in self._indexed_candidates(tokens))
+            else:
+                # 查询不含可索引的词（如纯数字）或没有索引：顺序扫描
+                indexed = self._scan_lines(scan_file, 0, 0, indexed_lines)
+            tail = self._scan_lines(scan_file, indexed_lines, int(self.manifest.get("bytes", 0)), total_lines)
+
+            for line_no, line in itertools.chain(indexed, tail):
+                if needle not in line.lower():
+                    continue
+                if len(result["matches"]) >= limit:
+                    result["truncated"] = True
+                    break
+                before = self._read_lines(max(line_no - context, 0), line_no) if context else []
+                after = self._read_lines(line_no + 1, min(line_no + 1 + context, total_lines)) if context else []
+                result["matches"].append({"line_no": line_no + 1, "line": line, "before": before, "after": after})
+        return result
+
+    @staticmethod
+    def _scan_lines(scan_file, start_line: int, start_offset: int, end_line: int) -> Iterable[Tuple[int, str]]:
+        """从指定偏移开始顺序读取 [start_line, end_line) 行"""
+        scan_file.seek(start_offset)
+        for line_no in range(start_line, end_line):
+            yield line_no, scan_file.readline().decode("utf-8", errors="replace").rstrip("\n")
+
+    def _open_offsets(self):
+        path = self.index_dir / _OFFSETS
+        return open(path, "rb") if path.exists() else open(os.devnull, "rb")
+
+    def _scan_tail(self) -> None:
+        """顺序扫描尚未索引的尾部日志，记录每行的起始偏移（忽略正在写入的不完整行）"""
+        start = int(self.manifest.get("bytes", 0))
+        self._tail_offsets = []
+        self._log_file.seek(start)
+        position = start
+        for raw in iter(self._log_file.readline, b""):
+            if not raw.endswith(b"\n"):
+                break
+            self._tail_offsets.append(position)
+            position += len(raw)
+        self._end = position
+
+    def _indexed_candidates(self, tokens: List[str]) -> Iterable[int]:
+        """对已索引的行求查询词候选行的交集
+
+        每个查询词的候选行为词典中包含该词的索引词（以及超长串标记）的倒排表并集
+        """
+        for segment in self.manifest.get("segments", []):
+            name = segment["name"]
+            with open(self.index_dir / f"{name}.tok", encoding="utf-8") as f:
+                lexicon = json.load(f)
+            overlong = lexicon.get(_OVERLONG_TOKEN)
+            groups = []
+            for token in tokens:
+                entries = [entry for term, entry in lexicon.items() if token in term]
+                if overlong:
+                    entries.append(overlong)
+                groups.append(entries)
+            if not all(groups):
+                continue
+            # 从倒排表总长度最小的查询词开始求交
+            groups.sort(key=lambda entries: sum(entry[1] for entry in entries))
+            with open(self.index_dir / f"{name}.post", "rb") as f:
+                candidates = None
+                for entries in groups:
+                    matched = set()
+                    for position, count in entries:
+                        f.seek(position * 4)
+                        postings = array("I")
+                        postings.fromfile(f, count)
+                        matched.update(postings)
+                    candidates = matched if candidates is None else candidates & matched
+                    if not candidates:
+                        break
+            yield from sorted(candidates or ())
+
+    def _line_offset(self, line_no: int) -> int:
+        """获取行的起始偏移，超出最后一行时返回已完成部分的结束偏移"""
+        indexed_lines = int(self.manifest.get("lines", 0))
+        if line_no < indexed_lines:
+            self._offsets_file.seek(line_no * 8)
+            return array("Q", self._offsets_file.read(8))[0]
+        tail_index = line_no - indexed_lines
+        if tail_index < len(self._tail_offsets):
+            return self._tail_offsets[tail_index]
+        return self._end
+
+    def _read_lines(self, start: int, end: int) -> List[str]:
+        """读取 [start, end) 行（一次seek读取整段字节）"""
+        if end <= start:
+            return []
+        begin, finish = self._line_offset(start), self._line_offset(end)
+        self._log_file.seek(begin)
+        data = self._log_file.read(finish - begin)
+        return data.decode("utf-8", errors="replace").split("\n")[:end - start]
+
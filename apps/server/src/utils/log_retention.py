@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# 日志分层保留：Redis热尾部 + 磁盘压缩分段
+
+import os
+import gzip
+import json
+import uuid
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Tuple
+from core.config import settings
+from utils.log_codec import decode_record, decode_stream_fields
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 只释放自己持有的落盘锁：锁已过期并被其他写入方获得时不删除
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LogRetentionManager:
+    """日志分层保留管理器
+
+    Redis中每个评估任务只保留最近 log_hot_tail_lines 行（热尾部），超出
+    log_hot_tail_lines + log_spill_batch_lines 后，将较早的日志写入
+    settings.workspace/logs/eval_{id}/log_segments 下的压缩分段文件并从Redis中裁剪。
+
+    全局行号（绝对下标）= 已落盘行数(offset) + 行在Redis中的下标，offset保存在
+    eval:{id}:log_offset 中；分段索引 segments.json 记录每个分段的起始行号、行数和游标范围，
+    使读取方可以按行号或游标透明地跨两层读取。
+    """
+
+    INDEX_FILE = "segments.json"
+
+    # 保护分段索引文件的进程内锁
+    _index_lock = threading.Lock()
+
+    # 释放落盘锁的Lua脚本（首次使用时注册）
+    _release_script = None
+
+    #------------------
+    # 路径与键名
+    #------------------
+
+    @classmethod
+    def get_segment_dir(cls, eval_id) -> Path:
+        """获取日志分段目录
+
+        Args:
+            eval_id: 评估任务ID
+
+        Returns:
+            Path: 分段目录路径
+        """
+        return Path(settings.workspace) / "logs" / f"eval_{eval_id}" / "log_segments"
+
+    @classmethod
+    def get_offset_key(cls, eval_id) -> str:
+        """获取已落盘行数的存储键名
+
+        Args:
+            eval_id: 评估任务ID
+
+        Returns:
+            str: 键名
+        """
+        return f"eval:{eval_id}:log_offset"
+
+    @classmethod
+    def get_spill_lock_key(cls, eval_id) -> str:
+        """获取落盘操作互斥锁的键名
+
+        Args:
+            eval_id: 评估任务ID
+
+        Returns:
+            str: 键名
+        """
+        return f"eval:{eval_id}:log_spill_lock"
+
+    @classmethod
+    def get_compression(cls) -> str:
+        """获取实际使用的分段压缩格式
+
+        Returns:
+            str: "zstd" 或 "gzip"
+        """
+        if str(settings.log_segment_compression).lower() == "zstd" and zstandard is not None:
+            return "zstd"
+        return "gzip"
+
+    #------------------
+    # 写入：落盘与结束处理
+    #------------------
+
+    @classmethod
+    def maybe_spill(cls, eval_id, current_length: int) -> int:
+        """写入后检查Redis中的日志长度，超过阈值时落盘
+
+        Args:
+            eval_id: 评估任务ID
+            current_length: 写入后Redis中的日志条数
+
+        Returns:
+            int: 本次落盘的行数
+        """
+        hot_tail = int(settings.log_hot_tail_lines)
+        if current_length <= hot_tail + int(settings.log_spill_batch_lines):
+            return 0
+        return cls.spill(eval_id, keep=hot_tail)
+
+    @classmethod
+    def spill(cls, eval_id, keep: int) -> int:
+        """将Redis中除最近keep行以外的日志写入压缩分段并裁剪
+
+        先写文件再裁剪Redis：若在两者之间中断，下次落盘会以相同起始行号覆盖同一分段，不会重复。
+
+        Args:
+            eval_id: 评估任务ID
+            keep: Redis中保留的行数
+
+        Returns:
+            int: 落盘的行数
+        """
+        from utils.redis_manager import RedisManager
+
+        redis_client = RedisManager.get_instance()
+        if not redis_client:
+            logger.error("无法获取Redis连接")
+            return 0
+
+        lock_key = cls.get_spill_lock_key(eval_id)
+        token = uuid.uuid4().hex
+        if not redis_client.set(lock_key, token, nx=True, ex=120):
+            # 其他写入方正在落盘
+            return 0
+
+        try:
+            offset = int(redis_client.get(cls.get_offset_key(eval_id)) or 0)
+            if RedisManager.is_stream_backend():
+                return cls._spill_stream(redis_client, eval_id, offset, keep)
+            return cls._spill_list(redis_client, eval_id, offset, keep)
+        except Exception as e:
+            logger.error(f"日志落盘失败 [eval_id={eval_id}]: {str(e)}")
+            return 0
+        finally:
+            cls._release_lock(redis_client, lock_key, token)
+
+    @classmethod
+    def _release_lock(cls, redis_client, lock_key: str, token: str) -> None:
+        """释放落盘锁（比较令牌后删除，落盘超过锁有效期时不会删掉其他写入方的锁）"""
+        try:
+            if cls._release_script is None:
+                cls._release_script = redis_client.register_script(RELEASE_LOCK_LUA)
+            cls._release_script(keys=[lock_key], args=[token], client=redis_client)
+        except Exception as e:
+            logger.warning(f"释放日志落盘锁失败 [{lock_key}]: {str(e)}")
+
+    @classmethod
+    def _spill_list(cls, redis_client, eval_id, offset: int, keep: int) -> int:
+        """列表后端落盘"""
+        from utils.redis_manager import RedisManager
+
+        log_key = RedisManager.get_log_key(eval_id)
+        count = redis_client.llen(log_key) - keep
+        if count <= 0:
+            return 0
+
+        entries = redis_client.lrange(log_key, 0, count - 1)
+        records = []
+        for i, entry in enumerate(entries):
+            line, timestamp = cls._decode_list_entry(entry)
+            records.append({"id": str(offset + i), "log": line, "timestamp": timestamp})
+        cls._write_segment(eval_id, offset, records)
+
+        # 原子地裁剪列表并推进offset
+        with redis_client.pipeline() as pipe:
+            pipe.ltrim(log_key, len(entries), -1)
+            pipe.incrby(cls.get_offset_key(eval_id), len(entries))
+            pipe.execute()
+
+        logger.info(f"任务 {eval_id} 已落盘 {len(entries)} 行日志（起始行 {offset}）")
+        return len(entries)
+
+    @classmethod
+    def _spill_stream(cls, redis_client, eval_id, offset: int, keep: int) -> int:
+        """Stream后端落盘"""
+        from utils.redis_manager import RedisManager
+
+        stream_key = RedisManager.get_log_stream_key(eval_id)
+        count = redis_client.xlen(stream_key) - keep
+        if count <= 0:
+            return 0
+
+        entries = redis_client.xrange(stream_key, count=count)
+        if not entries:
+            return 0
+        records = [cls._decode_stream_entry(entry_id, fields) for entry_id, fields in entries]
+        cls._write_segment(eval_id, offset, records)
+
+        # 裁剪掉已落盘条目：MINID为最后一个落盘条目的下一个ID
+        ms, seq = cls.cursor_sort_key(records[-1]["id"])
+        with redis_client.pipeline() as pipe:
+            pipe.xtrim(stream_key, minid=f"{ms}-{seq + 1}", approximate=False)
+            pipe.incrby(cls.get_offset_key(eval_id), len(records))
+            pipe.execute()
+
+        logger.info(f"任务 {eval_id} 已落盘 {len(records)} 条Stream日志（起始行 {offset}）")
+        return len(records)
+
+    @classmethod
+    def finalize(cls, eval_id) -> None:
+        """任务进入最终状态时调用
+
+        1. 将热尾部之前的日志落盘
+        2. 将热尾部也写入一个归档分段，保证Redis数据过期后日志仍完整可读
+        3. 为Redis中该任务的日志与状态数据设置过期时间
+
+        Args:
+            eval_id: 评估任务ID
+        """
+        from utils.redis_manager import RedisManager
+
+        try:
+            redis_client = RedisManager.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return
+
+            cls.spill(eval_id, keep=int(settings.log_hot_tail_lines))
+
+            # 归档热尾部（不裁剪Redis，过期前仍由Redis提供读取）
+            offset = int(redis_client.get(cls.get_offset_key(eval_id)) or 0)
+            if RedisManager.is_stream_backend():
+                tail = [
+                    cls._decode_stream_entry(entry_id, fields)
+                    for entry_id, fields in redis_client.xrange(RedisManager.get_log_stream_key(eval_id))
+                ]
+            else:
+                tail = []
+                for i, entry in enumerate(redis_client.lrange(RedisManager.get_log_key(eval_id), 0, -1)):
+                    line, timestamp = cls._decode_list_entry(entry)
+                    tail.append({"id": str(offset + i), "log": line, "timestamp": timestamp})
+            if tail:
+                cls._write_segment(eval_id, offset, tail)
+            cls._mark_finalized(eval_id)
+
+            # 设置过期时间
+            ttl = int(settings.log_final_ttl_seconds)
+            with redis_client.pipeline() as pipe:
+                for key in (
+                    RedisManager.get_log_key(eval_id),
+                    RedisManager.get_log_stream_key(eval_id),
+                    RedisManager.get_log_meta_key(eval_id),
+                    RedisManager.get_log_fingerprint_key(eval_id),
+                    cls.get_offset_key(eval_id),
+                    RedisManager.get_status_key(eval_id),
+                    RedisManager.get_runtime_key(eval_id),
+                    RedisManager.get_connection_key(eval_id),
+                    RedisManager.get_subscribers_key(eval_id),
+                    RedisManager.get_shards_key(eval_id)
+                ):
+                    pipe.expire(key, ttl)
+                pipe.execute()
+            logger.info(f"任务 {eval_id} 日志已归档，Redis数据将在 {ttl} 秒后过期")
+        except Exception as e:
+            logger.error(f"归档任务日志失败 [eval_id={eval_id}]: {str(e)}")
+
+    @classmethod
+    def purge(cls, eval_id) -> None:
+        """删除任务的落盘日志与offset（重新执行或删除任务时调用）
+
+        Args:
+            eval_id: 评估任务ID
+        """
+        from utils.redis_manager import RedisManager
+
+        try:
+            redis_client = RedisManager.get_instance()
+            if redis_client:
+                redis_client.delete(cls.get_offset_key(eval_id))
+            segment_dir = cls.get_segment_dir(eval_id)
+            if segment_dir.exists():
+                shutil.rmtree(segment_dir, ignore_errors=True)
+        except Exception as e:
+            logger.error(f"清理落盘日志失败 [eval_id={eval_id}]: {str(e)}")
+
+    #------------------
+    # 读取
+    #------------------
+
+    @classmethod
+    def resolve_offset(cls, eval_id, raw_offset: Optional[str], redis_length: int) -> Tuple[int, int]:
+        """根据Redis中的offset与日志长度确定两层的分界
+
+        Redis数据过期后offset键不存在，此时全部日志由磁盘提供。
+
+        Args:
+            eval_id: 评估任务ID
+            raw_offset: Redis中offset键的原始值
+            redis_length: Redis中的日志条数
+
+        Returns:
+            Tuple[int, int]: (磁盘层行数, 参与读取的Redis行数)
+        """
+        if raw_offset is not None:
+            return int(raw_offset), redis_length
+
+        index = cls._load_index(eval_id)
+        if not index["segments"]:
+            return 0, redis_length
+        disk_total = cls._disk_total(index)
+        if index.get("finalized") or redis_length == 0:
+            # 归档分段已包含全部日志
+            return disk_total, 0
+        return 0, redis_length
+
+    @classmethod
+    def read_range(cls, eval_id, start: int, end: int) -> List[Tuple[str, str]]:
+        """按全局行号读取磁盘中的日志 [start, end)
+
+        Args:
+            eval_id: 评估任务ID
+            start: 起始行号（包含）
+            end: 结束行号（不包含）
+
+        Returns:
+            List[Tuple[str, str]]: (游标, 日志行) 列表
+        """
+        if end <= start:
+            return []
+        results = []
+        for segment in cls._load_index(eval_id)["segments"]:
+            seg_start = segment["start"]
+            seg_end = seg_start + segment["count"]
+            if seg_end <= start or seg_start >= end:
+                continue
+            records = cls._read_segment(eval_id, segment)
+            for record in records[max(start - seg_start, 0):min(end, seg_end) - seg_start]:
+                results.append((record["id"], record["log"]))
+        return results
+
+    @classmethod
+    def read_after(cls, eval_id, cursor: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """读取磁盘中游标之后的日志
+
+        Args:
+            eval_id: 评估任务ID
+            cursor: 游标（不包含）
+            limit: 最多返回的行数
+
+        Returns:
+            List[Tuple[str, str]]: (游标, 日志行) 列表
+        """
+        cursor_key = cls.cursor_sort_key(cursor)
+        results = []
+        for segment in cls._load_index(eval_id)["segments"]:
+            if cls.cursor_sort_key(segment["last_id"]) <= cursor_key:
+                continue
+            for record in cls._read_segment(eval_id, segment):
+                if cls.cursor_sort_key(record["id"]) > cursor_key:
+                    results.append((record["id"], record["log"]))
+                    if limit and len(results) >= limit:
+                        return results
+        return results
+
+    @classmethod
+    def cursor_sort_key(cls, cursor) -> Tuple[int, int]:
+        """将游标转换为可比较的元组
+
+        Stream条目ID为 "毫秒-序号"，列表游标为行号
+
+        Args:
+            cursor: 游标
+
+        Returns:
+            Tuple[int, int]: 可比较的键
+        """
+        text = str(cursor)
+        if "-" in text:
+            ms, seq = text.split("-", 1)
+            return int(ms), int(seq)
+        return int(text), 0
+
+    #------------------
+    # 分段文件
+    #------------------
+
+    @classmethod
+    def _decode_list_entry(cls, entry: str) -> Tuple[str, str]:
+        """解析列表中的日志记录（紧凑、JSON或旧版纯文本）
+
+        Returns:
+            Tuple[str, str]: (日志行, 时间戳)
+        """
+        record = decode_record(entry)
+        return record.log, record.timestamp
+
+    @classmethod
+    def _decode_stream_entry(cls, entry_id: str, fields: Dict[str, str]) -> Dict[str, Any]:
+        """将Stream条目转换为分段记录"""
+        record = decode_stream_fields(fields)
+        return {"id": entry_id, "log": record.log, "timestamp": record.timestamp}
+
+    @classmethod
+    def _write_segment(cls, eval_id, start: int, records: List[Dict[str, Any]]) -> None:
+        """写入一个压缩分段并更新索引（相同起始行号的分段会被覆盖）"""
+        segment_dir = cls.get_segment_dir(eval_id)
+        os.makedirs(segment_dir, exist_ok=True)
+
+        compression = cls.get_compression()
+        suffix = "zst" if compression == "zstd" else "gz"
+        file_name = f"segment_{start:012d}.jsonl.{suffix}"
+
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        if compression == "zstd":
+            data = zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            data = gzip.compress(data, compresslevel=6)
+
+        tmp_path = segment_dir / f"{file_name}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, segment_dir / file_name)
+
+        with cls._index_lock:
+            index = cls._load_index(eval_id)
+            segments = [s for s in index["segments"] if s["start"] != start]
+            segments.append({
+                "file": file_name,
+                "start": start,
+                "count": len(records),
+                "first_id": records[0]["id"],
+                "last_id": records[-1]["id"],
+                "compression": compression
+            })
+            segments.sort(key=lambda s: s["start"])
+            index["segments"] = segments
+            cls._save_index(eval_id, index)
+
+    @classmethod
+    def _read_segment(cls, eval_id, segment: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """读取并解压一个分段"""
+        path = cls.get_segment_dir(eval_id) / segment["file"]
+        with open(path, "rb") as f:
+            data = f.read()
+        if segment.get("compression") == "zstd":
+            if zstandard is None:
+                raise RuntimeError("读取zstd日志分段需要安装zstandard")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            data = gzip.decompress(data)
+        return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+
+    @classmethod
+    def _load_index(cls, eval_id) -> Dict[str, Any]:
+        """读取分段索引"""
+        path = cls.get_segment_dir(eval_id) / cls.INDEX_FILE
+        if not path.exists():
+            return {"segments": [], "finalized": False}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取日志分段索引失败 [eval_id={eval_id}]: {str(e)}")
+            return {"segments": [], "finalized": False}
+
+    @classmethod
+    def _save_index(cls, eval_id, index: Dict[str, Any]) -> None:
+        """原子地写入分段索引"""
+        path = cls.get_segment_dir(eval_id) / cls.INDEX_FILE
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _mark_finalized(cls, eval_id) -> None:
+        """标记该任务的磁盘日志已完整归档"""
+        with cls._index_lock:
+            index = cls._load_index(eval_id)
+            if not index["segments"]:
+                return
+            index["finalized"] = True
+            cls._save_index(eval_id, index)
+
+    @classmethod
+    def _disk_total(cls, index: Dict[str, Any]) -> int:
+        """磁盘中日志的总行数"""
+        if not index["segments"]:
+            return 0
+        last = index["segments"][-1]
+        return last["start"] + last["count"]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# 批量日志投递器
+
+import time
+import logging
+import threading
+from typing import List, Optional, Dict, Any
+from core.config import settings
+from utils.redis_manager import RedisManager
+
+logger = logging.getLogger(__name__)
+
+
+class LogShipper:
+    """批量日志投递器
+
+    将子进程输出的日志行累积在内存缓冲区中，满足以下任一条件时通过
+    RedisManager.batch_append_logs 一次性管道写入Redis：
+    1. 缓冲区累积到 batch_size 行
+    2. 距离上次刷新超过 flush_interval_ms 毫秒（由后台刷新线程触发）
+    3. 显式调用 flush() / close()（任务结束或被终止时的最终刷新）
+    """
+
+    def __init__(self,
+                 eval_id: Optional[int],
+                 batch_size: Optional[int] = None,
+                 flush_interval_ms: Optional[int] = None,
+                 max_recent_logs: int = 5):
+        """初始化
+
+        Args:
+            eval_id: 评估任务ID
+            batch_size: 触发刷新的行数阈值，默认取 settings.log_ship_batch_size
+            flush_interval_ms: 定时刷新间隔（毫秒），默认取 settings.log_ship_interval_ms
+            max_recent_logs: 去重时检查的最近日志数量，与 append_log 保持一致
+        """
+        self.eval_id = eval_id
+        self.batch_size = max(1, int(batch_size or settings.log_ship_batch_size))
+        self.flush_interval = max(1, int(flush_interval_ms or settings.log_ship_interval_ms)) / 1000.0
+        self.max_recent_logs = max_recent_logs
+
+        # 待投递的日志缓冲区
+        self._buffer: List[str] = []
+        # 保护缓冲区的锁
+        self._buffer_lock = threading.Lock()
+        # 串行化刷新操作，保证日志顺序
+        self._flush_lock = threading.Lock()
+        # 唤醒后台刷新线程
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+
+        # 统计计数
+        self.lines_received = 0       # 收到的日志行数
+        self.lines_shipped = 0        # 已提交到Redis的日志行数
+        self.lines_written = 0        # 去重后实际写入的日志行数
+        self.batches = 0              # 刷新批次数
+        self.total_flush_ms = 0.0     # 累计刷新耗时（毫秒）
+        self.max_flush_ms = 0.0       # 单次刷新最大耗时（毫秒）
+        self.last_flush_ms = 0.0      # 最近一次刷新耗时（毫秒）
+
+    def ship(self, line: str) -> None:
+        """提交一行日志
+
+        Args:
+            line: 已清洗的日志行
+        """
+        if not line or self._closed:
+            return
+
+        with self._buffer_lock:
+            self._buffer.append(line)
+            self.lines_received += 1
+            is_full = len(self._buffer) >= self.batch_size
+
+        # 延迟启动后台刷新线程，避免未产生日志的执行器创建多余线程
+        if self._flusher is None:
+            self._start_flusher()
+
+        # 达到批量阈值时在当前线程同步刷新，对读取端形成自然的背压
+        if is_full:
+            self.flush()
+
+    def flush(self) -> int:
+        """立即将缓冲区中的日志写入Redis
+
+        Returns:
+            int: 本次实际写入的日志数量
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                if not self._buffer:
+                    return 0
+                batch = self._buffer
+                self._buffer = []
+
+            start = time.perf_counter()
+            written = RedisManager.batch_append_logs(
+                self.eval_id, batch, max_recent_logs=self.max_recent_logs
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            self.lines_shipped += len(batch)
+            self.lines_written += written
+            self.batches += 1
+            self.total_flush_ms += elapsed_ms
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            return written
+
+    def close(self) -> Dict[str, Any]:
+        """停止后台刷新线程并执行最终刷新
+
+        Returns:
+            Dict[str, Any]: 投递统计信息
+        """
+        self._closed = True
+        self._wakeup.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=self.flush_interval + 5)
+        self.flush()
+        return self.get_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取投递统计信息
+
+        Returns:
+            Dict[str, Any]: 统计信息字典
+        """
+        return {
+            "lines_received": self.lines_received,
+            "lines_shipped": self.lines_shipped,
+            "lines_written": self.lines_written,
+            "pending_lines": len(self._buffer),
+            "batches": self.batches,
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 3) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "last_flush_ms": round(self.last_flush_ms, 3)
+        }
+
+    def _start_flusher(self) -> None:
+        """启动后台定时刷新线程"""
+        with self._buffer_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._run_flusher,
+                name=f"log-shipper-{self.eval_id}",
+                daemon=True
+            )
+            self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        """后台刷新循环：每隔 flush_interval 秒刷新一次缓冲区"""
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._closed:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"定时刷新日志失败 [eval_id={self.eval_id}]: {str(e)}")
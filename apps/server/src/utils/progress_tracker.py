@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# OpenCompass进度解析与上报
+
+import re
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional
+from core.config import settings
+from utils.redis_manager import RedisManager
+
+logger = logging.getLogger(__name__)
+
+# 任务划分：Partitioned into 4 tasks.
+_PARTITION_RE = re.compile(r"Partitioned into (\d+) tasks")
+# 任务名称：OpenICLInfer[model/dataset,model/dataset2] / OpenICLEval[...]
+_TASK_RE = re.compile(r"OpenICL(Infer|Eval)\[([^\]]+)\]")
+# 调试模式下单个任务开始：Start inferencing model/dataset
+_START_RE = re.compile(r"Start (inferencing|evaluating) (\S+)")
+# tqdm进度条：45%|████▌     | 29/64 [00:05<00:06,  5.21it/s]
+_TQDM_RE = re.compile(r"(\d+)%\|[^|]*\|\s*(\d+)/(\d+)")
+# API模型请求速率（rpm_verbose）：Current RPM 12.
+_RPM_RE = re.compile(r"Current RPM (\d+(?:\.\d+)?)")
+
+# 推理与评估阶段在总进度中的权重
+_STAGE_WEIGHTS = {"infer": 0.9, "eval": 0.1}
+
+
+class OpenCompassProgressParser:
+    """OpenCompass输出的流式进度解析器
+
+    逐行增量解析，不回看历史日志：
+    1. "Partitioned into N tasks" 确定当前阶段（推理/评估）的任务数
+    2. OpenICLInfer[...] / OpenICLEval[...] 与 "Start inferencing ..." 确定当前阶段和数据集
+    3. tqdm进度条：有当前数据集时（--debug，任务在主进程内执行）记为该数据集的进度，
+       否则记为阶段内已完成的任务数
+    4. "Current RPM N" 记录API请求速率
+    """
+
+    def __init__(self, expected_datasets: int = 0):
+        """初始化
+
+        Args:
+            expected_datasets: 预期的数据集数量，用于在数据集尚未全部出现时估算总进度
+        """
+        self.expected_datasets = max(0, int(expected_datasets or 0))
+        self.stage: Optional[str] = None
+        self.stage_tasks: Dict[str, int] = {}
+        self.stage_done: Dict[str, int] = {}
+        self.current_dataset: Optional[str] = None
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        self.rpm: Optional[float] = None
+        self.progress = 0.0
+
+    def feed(self, line: str) -> bool:
+        """解析一行输出
+
+        Args:
+            line: 日志行
+
+        Returns:
+            bool: 进度状态是否发生变化
+        """
+        # 先做廉价的子串判断，绝大多数日志行不需要执行正则
+        if "%|" in line:
+            return self._feed_tqdm(line)
+        if "OpenICL" in line:
+            match = _TASK_RE.search(line)
+            if match:
+                return self._enter_task("infer" if match.group(1) == "Infer" else "eval", match.group(2).split(","))
+        if "Start " in line:
+            match = _START_RE.search(line)
+            if match:
+                return self._enter_task("infer" if match.group(1) == "inferencing" else "eval", [match.group(2)])
+        if "Partitioned" in line:
+            match = _PARTITION_RE.search(line)
+            if match:
+                # 推理阶段先于评估阶段划分任务
+                stage = "eval" if "infer" in self.stage_tasks else "infer"
+                tasks = int(match.group(1))
+                changed = self.stage != stage or self.stage_tasks.get(stage) != tasks
+                self.stage = stage
+                self.stage_tasks[stage] = tasks
+                self.stage_done.setdefault(stage, 0)
+                self.current_dataset = None
+                return self._recompute(changed)
+        if "RPM" in line:
+            match = _RPM_RE.search(line)
+            if match:
+                rpm = float(match.group(1))
+                if rpm == self.rpm:
+                    return False
+                self.rpm = rpm
+                return True
+        return False
+
+    def _enter_task(self, stage: str, names) -> bool:
+        """进入新的推理/评估任务"""
+        changed = self.stage != stage
+        self.stage = stage
+        dataset = None
+        for name in names:
+            dataset = name.strip().strip("[]").split("/")[-1]
+            entry = self.datasets.get(dataset)
+            if entry is None:
+                entry = self.datasets[dataset] = {"stage": stage, "done": 0, "total": 0, "percent": 0.0}
+                changed = True
+            if stage == "eval" and entry["stage"] == "infer":
+                # 进入评估阶段说明推理已经完成
+                entry.update(stage="eval", percent=100.0)
+                changed = True
+        self.current_dataset = dataset if len(names) == 1 else None
+        return self._recompute(changed)
+
+    def _feed_tqdm(self, line: str) -> bool:
+        """解析tqdm进度条"""
+        match = _TQDM_RE.search(line)
+        if not match:
+            return False
+        done, total = int(match.group(2)), int(match.group(3))
+        if total <= 0:
+            return False
+        if self.current_dataset and self.stage == "infer":
+            entry = self.datasets[self.current_dataset]
+            if entry["done"] == done and entry["total"] == total:
+                return False
+            entry.update(done=done, total=total, percent=round(done * 100.0 / total, 1))
+        elif self.stage:
+            if self.stage_done.get(self.stage) == done:
+                return False
+            self.stage_done[self.stage] = done
+            self.stage_tasks[self.stage] = max(self.stage_tasks.get(self.stage, 0), total)
+        else:
+            return False
+        return self._recompute(True)
+
+    def _stage_fraction(self, stage: str) -> float:
+        """计算某个阶段的完成比例"""
+        fractions = []
+        total_tasks = self.stage_tasks.get(stage, 0)
+        if total_tasks:
+            fractions.append(min(self.stage_done.get(stage, 0) / total_tasks, 1.0))
+        if stage == "infer" and self.datasets:
+            count = max(len(self.datasets), self.expected_datasets)
+            fractions.append(sum(entry["percent"] for entry in self.datasets.values()) / 100.0 / count)
+        return max(fractions) if fractions else 0.0
+
+    def _recompute(self, changed: bool = False) -> bool:
+        """重新计算总进度（单调不减）
+
+        Args:
+            changed: 调用方是否已改变快照中的其他状态（阶段、任务数、数据集进度）
+
+        Returns:
+            bool: 快照是否发生变化，即是否需要上报
+        """
+        if self.stage == "eval":
+            infer_fraction = 1.0
+            eval_fraction = self._stage_fraction("eval")
+        else:
+            infer_fraction = self._stage_fraction("infer")
+            eval_fraction = 0.0
+        progress = round((infer_fraction * _STAGE_WEIGHTS["infer"] + eval_fraction * _STAGE_WEIGHTS["eval"]) * 100, 1)
+        # 完成前不显示100%，最终状态由任务执行器设置
+        progress = max(self.progress, min(progress, 99.0))
+        changed = changed or progress != self.progress
+        self.progress = progress
+        return changed
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取当前进度快照"""
+        return {
+            "progress": self.progress,
+            "stage": self.stage,
+            "tasks": {stage: {"done": self.stage_done.get(stage, 0), "total": total}
+                      for stage, total in self.stage_tasks.items()},
+            "datasets": {name: dict(entry) for name, entry in self.datasets.items()},
+            "rpm": self.rpm
+        }
+
+
+class ProgressReporter:
+    """进度上报器
+
+    解析器状态变化后按节流间隔发布到状态通道（RedisManager.update_runtime_info，type=progress），
+    并按更长的间隔把总进度写入数据库 evaluations.progress。
+    """
+
+    def __init__(self,
+                 eval_id: Optional[int],
+                 expected_datasets: int = 0,
+                 publish_interval: Optional[float] = None,
+                 persist_interval: Optional[float] = None):
+        """初始化
+
+        Args:
+            eval_id: 评估任务ID
+            expected_datasets: 预期的数据集数量
+            publish_interval: 发布到状态通道的最小间隔（秒），默认取 settings.progress_publish_interval
+            persist_interval: 写入数据库的最小间隔（秒），默认取 settings.progress_persist_interval
+        """
+        self.eval_id = eval_id
+        self.parser = OpenCompassProgressParser(expected_datasets)
+        self.publish_interval = float(publish_interval if publish_interval is not None else settings.progress_publish_interval)
+        self.persist_interval = float(persist_interval if persist_interval is not None else settings.progress_persist_interval)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_publish: Optional[float] = None
+        self._last_persist: Optional[float] = None
+        self._persisted_progress: Optional[float] = None
+        self.publishes = 0
+        self.persists = 0
+
+    def feed(self, line: str) -> None:
+        """解析一行输出，进度变化时按节流间隔上报"""
+        if self.parser.feed(line):
+            self._dirty = True
+            self.tick()
+
+    def tick(self, force: bool = False) -> None:
+        """检查是否有待上报的进度（监督循环定期调用，保证最后一次变化也能发出）
+
+        Args:
+            force: 忽略节流间隔立即上报
+        """
+        if not self._dirty or self.eval_id is None:
+            return
+        now = time.monotonic()
+        if not force and self._last_publish is not None and now - self._last_publish < self.publish_interval:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._last_publish = now
+            snapshot = self.parser.snapshot()
+        progress = self._publish(snapshot)
+        self.publishes += 1
+
+        if force or self._last_persist is None or now - self._last_persist >= self.persist_interval:
+            self._last_persist = now
+            self._persist(progress)
+
+    def _publish(self, snapshot: Dict[str, Any]) -> float:
+        """发布进度快照到状态通道
+
+        Args:
+            snapshot: 解析器的进度快照
+
+        Returns:
+            float: 需要写入数据库的总进度
+        """
+        RedisManager.update_runtime_info(self.eval_id, {"type": "progress", **snapshot})
+        return snapshot["progress"]
+
+    def _persist(self, progress: float) -> None:
+        """把总进度写入数据库"""
+        if progress == self._persisted_progress:
+            return
+        try:
+            from core.database import SessionLocal
+            from models.eval import Evaluation
+
+            with SessionLocal() as db:
+                db.query(Evaluation).filter(Evaluation.id == self.eval_id).update(
+                    {Evaluation.progress: progress}, synchronize_session=False
+                )
+                db.commit()
+            self._persisted_progress = progress
+            self.persists += 1
+        except Exception as e:
+            logger.warning(f"保存任务 {self.eval_id} 进度失败: {str(e)}")
+
+
+class ShardProgressReporter(ProgressReporter):
+    """分片执行时的进度上报器
+
+    每个分片只解析自己的输出，进度记录到任务的分片状态中（RedisManager.update_shard），
+    再按各分片的数据集数加权汇总为任务总进度，发布到状态通道并写入数据库，
+    各分片上报的是同一个汇总值，不会互相覆盖。
+    """
+
+    def __init__(self, eval_id: Optional[int], shard_index: int, expected_datasets: int = 0, **kwargs):
+        """初始化
+
+        Args:
+            eval_id: 评估任务ID
+            shard_index: 分片序号
+            expected_datasets: 本分片的数据集数量
+        """
+        super().__init__(eval_id, expected_datasets, **kwargs)
+        self.shard_index = shard_index
+
+    def publish_status(self) -> None:
+        """分片状态变化（如分片结束）时立即发布并保存汇总进度"""
+        if self.eval_id is None:
+            return
+        with self._lock:
+            snapshot = self.parser.snapshot()
+        self._persist(self._publish(snapshot))
+
+    def _publish(self, snapshot: Dict[str, Any]) -> float:
+        shards = RedisManager.update_shard(self.eval_id, self.shard_index, {
+            "progress": snapshot["progress"],
+            "stage": snapshot["stage"],
+            "datasets_progress": snapshot["datasets"],
+            "rpm": snapshot["rpm"]
+        })
+        progress = aggregate_shard_progress(shards)
+        datasets = {}
+        for shard in shards.values():
+            datasets.update(shard.get("datasets_progress") or {})
+        RedisManager.update_runtime_info(self.eval_id, {
+            "type": "progress",
+            "progress": progress,
+            "datasets": datasets,
+            "shards": {index: {"status": shard.get("status"), "progress": shard.get("progress", 0.0)}
+                       for index, shard in sorted(shards.items())}
+        })
+        return progress
+
+
+def aggregate_shard_progress(shards: Dict[int, Dict[str, Any]]) -> float:
+    """按数据集数加权汇总各分片进度（已结束的分片计为100%，总进度在合并结果前不超过99%）
+
+    Args:
+        shards: {分片序号: 分片状态}
+
+    Returns:
+        float: 任务总进度（0-99）
+    """
+    total_weight = 0
+    weighted = 0.0
+    for shard in shards.values():
+        weight = max(len(shard.get("datasets") or []), 1)
+        progress = 100.0 if shard.get("status") in ("completed", "failed") else float(shard.get("progress") or 0.0)
+        total_weight += weight
+        weighted += progress * weight
+    if not total_weight:
+        return 0.0
+    return min(round(weighted / total_weight, 1), 99.0)
@@ -1,14 +1,22 @@
 import redis
 import aioredis
+import re
 import json
 import logging
 import time
-from typing import List, Optional, Dict, Any, Set, Tuple, Union
+import uuid
+from typing import List, Optional, Dict, Any, Set, Tuple, Union, Iterator
 import threading
 import os
+import socket
 import asyncio
+from collections import OrderedDict, deque
 from datetime import datetime
-from fastapi import WebSocket
+from core.config import settings
+from utils.log_retention import LogRetentionManager
+from utils.log_codec import get_codec, new_record, decode_record, decode_text, encode_stream_fields, decode_stream_fields, stream_fields_to_raw, with_position
+from utils.log_append import APPEND_LOGS_LUA, FINGERPRINT_CAPACITY, build_append_args
+from utils.fair_queue import DISPATCH_KEY_PREFIX, ENQUEUE_LUA, DISPATCH_LUA, CANCEL_LUA
 
 logger = logging.getLogger(__name__)
 
@@ -19,30 +27,62 @@ class RedisManager:
     所有方法都是类方法，用于集中管理Redis资源。
     """
     
-    # Redis连接实例（单例模式）
+    # Redis连接实例（每个进程一个，fork后在子进程中重新创建）
     _redis_instance = None
     _async_redis_instance = None
     
-    # WebSocket连接注册表 {eval_id: {client_id: pubsub}}
-    _websocket_registry = {}
+    # 创建连接实例的进程ID，与当前进程不一致说明发生了fork
+    _pid = None
     
-    # 活跃的通道追踪 {eval_id: set(client_ids)}
-    _active_channels = {}
+    # 当前API进程的唯一标识（主机名:进程ID:随机后缀），用于跨进程的连接注册表
+    _process_id = None
     
     # 类方法锁，用于线程安全操作
     _lock = threading.Lock()
     
+    # 各任务日志键协商出的编解码器 {eval_id: codec}，按最近使用顺序只保留LOG_CODEC_CACHE_SIZE个任务
+    _log_codecs = OrderedDict()
+    _log_codecs_lock = threading.Lock()
+    LOG_CODEC_CACHE_SIZE = 1024
+    
+    # 已注册的日志追加脚本（EVALSHA，脚本缓存丢失时自动回退EVAL）
+    _append_script = None
+    
+    # 已注册的分发队列脚本 {名称: Script}
+    _dispatch_scripts = {}
+    
     #------------------
     # 连接管理方法
     #------------------
     
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        """丢弃从父进程继承的连接与锁（fork后在子进程中调用）
+        
+        父进程的连接套接字被子进程共享，继续使用会导致响应串读；锁可能在fork时处于持有状态。
+        """
+        cls._lock = threading.Lock()
+        cls._redis_instance = None
+        cls._async_redis_instance = None
+        cls._append_script = None
+        cls._dispatch_scripts = {}
+        cls._process_id = None
+        cls._pid = os.getpid()
+    
+    @classmethod
+    def _check_fork(cls) -> None:
+        """当前进程与创建连接的进程不一致时重置连接（兜底未经os.fork钩子的场景）"""
+        if cls._pid != os.getpid():
+            cls._reset_after_fork()
+    
     @classmethod
     def get_instance(cls) -> Optional[redis.Redis]:
-        """获取Redis同步连接实例（单例模式）
+        """获取Redis同步连接实例（进程内单例，首次使用时创建，fork安全）
         
         Returns:
             Optional[redis.Redis]: Redis连接实例，连接失败则返回None
         """
+        cls._check_fork()
         if cls._redis_instance is None:
             with cls._lock:
                 if cls._redis_instance is None:
@@ -59,11 +99,12 @@ class RedisManager:
     
     @classmethod
     async def get_async_instance(cls) -> Optional[aioredis.Redis]:
-        """获取Redis异步连接实例（单例模式）
+        """获取Redis异步连接实例（进程内单例，首次使用时创建，fork安全）
         
         Returns:
             Optional[aioredis.Redis]: Redis异步连接实例，连接失败则返回None
         """
+        cls._check_fork()
         if cls._async_redis_instance is None:
             try:
                 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -76,6 +117,18 @@ class RedisManager:
                 cls._async_redis_instance = None
         return cls._async_redis_instance
     
+    @classmethod
+    def get_process_id(cls) -> str:
+        """获取当前进程的唯一标识（多个API Worker进程各不相同，fork后重新生成）
+        
+        Returns:
+            str: 进程标识，格式为 主机名:进程ID:随机后缀
+        """
+        cls._check_fork()
+        if cls._process_id is None:
+            cls._process_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        return cls._process_id
+    
     #------------------
     # 频道和键名管理
     #------------------
@@ -116,6 +169,81 @@ class RedisManager:
         """
         return f"eval:{eval_id}:log_data"
     
+    @classmethod
+    def get_log_stream_key(cls, eval_id) -> str:
+        """获取日志Stream存储键名（stream后端）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 日志Stream键名
+        """
+        return f"eval:{eval_id}:log_stream"
+    
+    @classmethod
+    def get_log_meta_key(cls, eval_id) -> str:
+        """获取日志元信息（编码格式、记录序号）存储键名
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 日志元信息键名
+        """
+        return f"eval:{eval_id}:log_meta"
+    
+    @classmethod
+    def get_log_fingerprint_key(cls, eval_id) -> str:
+        """获取最近日志指纹（服务端去重窗口）存储键名
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 日志指纹列表键名
+        """
+        return f"eval:{eval_id}:log_fp"
+    
+    @classmethod
+    def is_stream_backend(cls) -> bool:
+        """当前是否使用Redis Streams作为日志存储后端
+        
+        Returns:
+            bool: 配置为stream后端时返回True
+        """
+        return str(settings.log_backend).lower() == "stream"
+    
+    @classmethod
+    def reads_from_stream(cls, eval_id, redis_client=None) -> bool:
+        """任务日志是否从Stream读取
+        
+        stream后端下尚未迁移的旧任务仍从列表读取，游标为全局行号。
+        
+        Args:
+            eval_id: 评估任务ID
+            redis_client: Redis连接，默认使用单例连接
+            
+        Returns:
+            bool: 从Stream读取时返回True
+        """
+        if not cls.is_stream_backend():
+            return False
+        redis_client = redis_client or cls.get_instance()
+        return not redis_client.exists(cls.get_log_key(eval_id))
+    
+    @staticmethod
+    def is_stream_cursor(cursor) -> bool:
+        """游标是否为Stream条目ID（毫秒-序号），list后端的游标为全局行号
+        
+        Args:
+            cursor: 日志游标
+            
+        Returns:
+            bool: 是Stream条目ID时返回True
+        """
+        return re.fullmatch(r"\d+-\d+", str(cursor or "")) is not None
+    
     @classmethod
     def get_status_key(cls, eval_id) -> str:
         """获取状态存储键名
@@ -128,6 +256,18 @@ class RedisManager:
         """
         return f"eval:{eval_id}:status"
         
+    @classmethod
+    def get_runtime_key(cls, eval_id) -> str:
+        """获取运行时信息（心跳、统计）存储键名
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 运行时信息存储键名
+        """
+        return f"eval:{eval_id}:runtime"
+    
     @classmethod
     def get_connection_key(cls, eval_id) -> str:
         """获取连接信息存储键名
@@ -140,196 +280,1355 @@ class RedisManager:
         """
         return f"eval:{eval_id}:connections"
     
+    @classmethod
+    def get_viewers_channel(cls, eval_id) -> str:
+        """获取查看者控制通道名称（跨进程广播"关闭该任务的所有查看连接"等指令）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 查看者控制通道名称
+        """
+        return f"eval:{eval_id}:viewers"
+    
+    @classmethod
+    def get_process_lease_key(cls, process_id: str) -> str:
+        """获取API进程租约键名
+        
+        Args:
+            process_id: 进程标识
+            
+        Returns:
+            str: 进程租约键名
+        """
+        return f"api:process:{process_id}"
+    
+    @classmethod
+    def get_shards_key(cls, eval_id) -> str:
+        """获取分片执行状态存储键名（HASH，字段为分片序号，值为分片状态JSON）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 分片状态键名
+        """
+        return f"eval:{eval_id}:shards"
+    
+    @classmethod
+    def get_worker_slots_key(cls, worker_id: str) -> str:
+        """获取Worker资源占用快照的存储键名
+        
+        Args:
+            worker_id: Worker进程标识
+            
+        Returns:
+            str: 资源占用快照键名
+        """
+        return f"worker:{worker_id}:slots"
+    
+    @classmethod
+    def get_dispatch_users_key(cls, lane: str) -> str:
+        """获取分发队列中优先级通道的用户键名（ZSET，成员为用户ID，分数为虚拟时间）
+        
+        Args:
+            lane: 优先级通道
+            
+        Returns:
+            str: 通道用户键名
+        """
+        return f"{DISPATCH_KEY_PREFIX}{lane}:users"
+    
+    @classmethod
+    def get_dispatch_queue_key(cls, lane: str, user_id) -> str:
+        """获取用户在优先级通道中的排队任务键名（LIST，任务ID按提交顺序）
+        
+        Args:
+            lane: 优先级通道
+            user_id: 用户ID
+            
+        Returns:
+            str: 用户队列键名
+        """
+        return f"{DISPATCH_KEY_PREFIX}{lane}:user:{user_id}"
+    
+    @classmethod
+    def get_dispatch_clock_key(cls, lane: str) -> str:
+        """获取优先级通道的虚拟时钟键名
+        
+        Args:
+            lane: 优先级通道
+            
+        Returns:
+            str: 虚拟时钟键名
+        """
+        return f"{DISPATCH_KEY_PREFIX}{lane}:clock"
+    
+    @classmethod
+    def get_dispatch_pending_key(cls) -> str:
+        """获取排队任务键名（HASH，字段为任务ID，值为用户ID、通道与入队时间）"""
+        return f"{DISPATCH_KEY_PREFIX}pending"
+    
+    @classmethod
+    def get_dispatch_inflight_key(cls) -> str:
+        """获取已派发任务键名（ZSET，成员为任务ID，分数为派发时间）"""
+        return f"{DISPATCH_KEY_PREFIX}inflight"
+    
+    @classmethod
+    def get_subscribers_key(cls, eval_id) -> str:
+        """获取日志订阅者在线状态存储键名（ZSET，成员为客户端ID，分数为过期时间戳）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 订阅者集合键名
+        """
+        return f"eval:{eval_id}:subscribers"
+    
+    @classmethod
+    def get_control_channel(cls, eval_id) -> str:
+        """获取任务控制指令通道名称
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 控制通道名称
+        """
+        return f"eval:{eval_id}:control"
+    
+    @classmethod
+    def get_control_key(cls, eval_id) -> str:
+        """获取最近一条控制指令的存储键名（供执行器兜底轮询）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 控制指令存储键名
+        """
+        return f"eval:{eval_id}:control"
+    
+    @classmethod
+    def get_control_seq_key(cls, eval_id) -> str:
+        """获取控制指令序号计数器的键名
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            str: 控制指令序号键名
+        """
+        return f"eval:{eval_id}:control_seq"
+    
+    #------------------
+    # WebSocket连接注册表（跨进程）
+    #------------------
+    
+    @classmethod
+    def renew_process_lease(cls) -> bool:
+        """登记或续期当前API进程的租约
+        
+        连接注册表中的每条记录都归属一个进程，进程需在 api_process_lease_seconds 内续期；
+        进程崩溃或被强制结束后租约到期，其名下的连接记录在读取时被视为失效并清理。
+        
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            process_id = cls.get_process_id()
+            cls.get_instance().set(
+                cls.get_process_lease_key(process_id),
+                json.dumps({"pid": os.getpid(), "host": socket.gethostname(), "renewed_at": time.time()}),
+                ex=int(settings.api_process_lease_seconds)
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"续期API进程租约失败: {str(e)}")
+            return False
+    
+    @classmethod
+    def release_process_lease(cls) -> None:
+        """释放当前API进程的租约（进程正常退出时调用）"""
+        try:
+            cls.get_instance().delete(cls.get_process_lease_key(cls.get_process_id()))
+        except Exception as e:
+            logger.warning(f"释放API进程租约失败: {str(e)}")
+    
+    @classmethod
+    def register_connection(cls, eval_id, client_id: str, kind: str) -> bool:
+        """在注册表中登记一个查看连接
+        
+        Args:
+            eval_id: 评估任务ID
+            client_id: 客户端唯一标识
+            kind: 连接类型（ws_logs、sse、multiplex）
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            cls.get_instance().hset(cls.get_connection_key(eval_id), client_id, json.dumps({
+                "process": cls.get_process_id(),
+                "kind": kind,
+                "connected_at": time.time()
+            }))
+            return True
+        except Exception as e:
+            logger.warning(f"登记查看连接失败 [eval_id={eval_id}, client_id={client_id}]: {str(e)}")
+            return False
+    
+    @classmethod
+    def unregister_connection(cls, eval_id, client_id: str) -> None:
+        """从注册表中注销一个查看连接
+        
+        Args:
+            eval_id: 评估任务ID
+            client_id: 客户端唯一标识
+        """
+        try:
+            cls.get_instance().hdel(cls.get_connection_key(eval_id), client_id)
+        except Exception as e:
+            logger.warning(f"注销查看连接失败 [eval_id={eval_id}, client_id={client_id}]: {str(e)}")
+    
+    @classmethod
+    def list_connections(cls, eval_id) -> Dict[str, Dict[str, Any]]:
+        """列出任务当前的查看连接（所有API进程），并清理租约已过期进程名下的记录
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            Dict[str, Dict[str, Any]]: {client_id: {"process", "kind", "connected_at"}}
+        """
+        try:
+            redis_client = cls.get_instance()
+            key = cls.get_connection_key(eval_id)
+            connections = {}
+            for client_id, raw in redis_client.hgetall(key).items():
+                try:
+                    connections[client_id] = json.loads(raw)
+                except ValueError:
+                    connections[client_id] = {}
+            
+            processes = sorted({info.get("process") for info in connections.values() if info.get("process")})
+            with redis_client.pipeline(transaction=False) as pipe:
+                for process_id in processes:
+                    pipe.exists(cls.get_process_lease_key(process_id))
+                alive = {process_id for process_id, exists in zip(processes, pipe.execute()) if exists}
+            
+            stale = [client_id for client_id, info in connections.items() if info.get("process") not in alive]
+            if stale:
+                redis_client.hdel(key, *stale)
+                logger.info(f"已清理 {len(stale)} 条失效的查看连接记录 [eval_id={eval_id}]")
+            return {client_id: info for client_id, info in connections.items() if client_id not in stale}
+        except Exception as e:
+            logger.error(f"获取查看连接列表失败 [eval_id={eval_id}]: {str(e)}")
+            return {}
+    
+    @classmethod
+    def close_viewers(cls, eval_id, reason: str = "closed") -> int:
+        """广播指令，让所有API进程关闭该任务的查看连接
+        
+        Args:
+            eval_id: 评估任务ID
+            reason: 关闭原因，会转告客户端
+            
+        Returns:
+            int: 收到指令的订阅方数量（每个API进程一个），失败返回0
+        """
+        try:
+            return cls.get_instance().publish(
+                cls.get_viewers_channel(eval_id),
+                json.dumps({"action": "close", "reason": reason}, ensure_ascii=False)
+            )
+        except Exception as e:
+            logger.error(f"广播关闭查看连接指令失败 [eval_id={eval_id}]: {str(e)}")
+            return 0
+    
     #------------------
-    # WebSocket连接管理
+    # 分片执行状态
     #------------------
     
     @classmethod
-    def register_websocket(cls, task_id: int, client_id: str, websocket: WebSocket) -> None:
-        """注册WebSocket连接（已弃用，请直接使用EvaluationService.register_websocket）
+    def init_shards(cls, eval_id, shards: List[List[str]], task_ids: Optional[List[str]] = None) -> bool:
+        """登记任务的分片计划，各分片初始状态为pending
+        
+        分片状态按字段存储在哈希 eval:{id}:shards 中（字段名为 "分片序号:字段名"，值为JSON），
+        更新只写入变化的字段，多个写入方并发更新同一分片时不会互相覆盖。
+        
+        Args:
+            eval_id: 评估任务ID
+            shards: 每个分片包含的数据集列表
+            task_ids: 每个分片的Celery任务ID（供回收丢失的分片任务）
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            key = cls.get_shards_key(eval_id)
+            mapping = {}
+            for index, datasets in enumerate(shards):
+                fields = {"status": "pending", "progress": 0.0, "datasets": datasets, "updated_at": time.time()}
+                if task_ids:
+                    fields["task_id"] = task_ids[index]
+                mapping.update(cls._shard_fields(index, fields))
+            with cls.get_instance().pipeline() as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping=mapping)
+                pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"登记分片计划失败 [eval_id={eval_id}]: {str(e)}")
+            return False
+    
+    @classmethod
+    def update_shard(cls, eval_id, shard_index: int, info: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        """更新一个分片的状态（与已有字段合并），并返回所有分片的最新状态
+        
+        只通过HSET写入info中的字段，写入与读取在同一事务中执行，不存在读-改-写竞争。
+        
+        Args:
+            eval_id: 评估任务ID
+            shard_index: 分片序号
+            info: 要更新的字段，如 status、progress、datasets_progress、exit_code
+            
+        Returns:
+            Dict[int, Dict[str, Any]]: {分片序号: 分片状态}，失败返回空字典
+        """
+        try:
+            key = cls.get_shards_key(eval_id)
+            with cls.get_instance().pipeline() as pipe:
+                pipe.hset(key, mapping=cls._shard_fields(shard_index, {**info, "updated_at": time.time()}))
+                pipe.hgetall(key)
+                _, raw = pipe.execute()
+            return cls._parse_shards(raw)
+        except Exception as e:
+            logger.error(f"更新分片状态失败 [eval_id={eval_id}, shard={shard_index}]: {str(e)}")
+            return {}
+    
+    @classmethod
+    def get_shards(cls, eval_id) -> Dict[int, Dict[str, Any]]:
+        """获取任务所有分片的状态
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            Dict[int, Dict[str, Any]]: {分片序号: 分片状态}，未分片执行时为空字典
+        """
+        try:
+            return cls._parse_shards(cls.get_instance().hgetall(cls.get_shards_key(eval_id)))
+        except Exception as e:
+            logger.error(f"获取分片状态失败 [eval_id={eval_id}]: {str(e)}")
+            return {}
+    
+    @staticmethod
+    def _shard_fields(shard_index: int, info: Dict[str, Any]) -> Dict[str, str]:
+        """把分片状态展开为哈希字段"""
+        return {f"{shard_index}:{name}": json.dumps(value, ensure_ascii=False) for name, value in info.items()}
+    
+    @staticmethod
+    def _parse_shards(raw: Dict[str, str]) -> Dict[int, Dict[str, Any]]:
+        """把哈希字段还原为 {分片序号: 分片状态}（兼容旧版按分片整体存储的JSON）"""
+        shards: Dict[int, Dict[str, Any]] = {}
+        for field, value in sorted(raw.items(), key=lambda item: ":" in item[0]):
+            index, _, name = field.partition(":")
+            shard = shards.setdefault(int(index), {})
+            if name:
+                shard[name] = json.loads(value)
+            else:
+                shard.update(json.loads(value))
+        return shards
+    
+    #------------------
+    # Worker资源占用
+    #------------------
+    
+    @classmethod
+    def set_worker_slots(cls, worker_id: str, usage: Dict[str, Any], ttl: int) -> bool:
+        """保存Worker的资源占用快照（Worker需在ttl内刷新，停止后自动过期）
+        
+        Args:
+            worker_id: Worker进程标识
+            usage: 资源占用快照
+            ttl: 有效期（秒）
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            cls.get_instance().set(cls.get_worker_slots_key(worker_id), json.dumps(usage, ensure_ascii=False), ex=max(int(ttl), 1))
+            return True
+        except Exception as e:
+            logger.warning(f"保存Worker资源占用失败 [worker={worker_id}]: {str(e)}")
+            return False
+    
+    @classmethod
+    def get_worker_slots(cls) -> List[Dict[str, Any]]:
+        """获取所有在线Worker的资源占用快照
+        
+        Returns:
+            List[Dict[str, Any]]: 资源占用快照列表，按Worker标识排序
+        """
+        try:
+            redis_client = cls.get_instance()
+            keys = sorted(redis_client.scan_iter(match=cls.get_worker_slots_key("*"), count=100))
+            if not keys:
+                return []
+            return [json.loads(raw) for raw in redis_client.mget(keys) if raw]
+        except Exception as e:
+            logger.error(f"获取Worker资源占用失败: {str(e)}")
+            return []
+    
+    #------------------
+    # 任务分发队列（跨进程）
+    #------------------
+    
+    @classmethod
+    def _dispatch_script(cls, redis_client, name: str, source: str):
+        if name not in cls._dispatch_scripts:
+            cls._dispatch_scripts[name] = redis_client.register_script(source)
+        return cls._dispatch_scripts[name]
+    
+    @classmethod
+    def enqueue_dispatch(cls, eval_id, user_id, lane: str) -> bool:
+        """把任务加入用户在优先级通道中的排队队列
+        
+        Args:
+            eval_id: 评估任务ID
+            user_id: 提交任务的用户ID
+            lane: 优先级通道
+            
+        Returns:
+            bool: 是否加入（任务已在队列中时返回False）
+        """
+        redis_client = cls.get_instance()
+        script = cls._dispatch_script(redis_client, "enqueue", ENQUEUE_LUA)
+        meta = json.dumps({"user_id": str(user_id), "lane": lane, "enqueued_at": time.time()})
+        return bool(script(
+            keys=[
+                cls.get_dispatch_users_key(lane),
+                cls.get_dispatch_queue_key(lane, user_id),
+                cls.get_dispatch_clock_key(lane),
+                cls.get_dispatch_pending_key()
+            ],
+            args=[str(user_id), str(eval_id), meta],
+            client=redis_client
+        ))
+    
+    @classmethod
+    def pop_dispatch(cls, limit: int, lanes: List[str], weights: Dict[str, float],
+                     default_weight: float = 1.0) -> Optional[Tuple[int, str, str]]:
+        """取出下一个应派发的任务并记为已派发（见 utils.fair_queue.DISPATCH_LUA）
+        
+        Args:
+            limit: 同时派发的任务数上限，<=0不限制
+            lanes: 优先级通道，从高到低
+            weights: 用户权重
+            default_weight: 未配置权重的用户的权重
+            
+        Returns:
+            Optional[Tuple[int, str, str]]: (任务ID, 通道, 用户ID)，没有可派发的任务或已达上限时返回None
+        """
+        redis_client = cls.get_instance()
+        script = cls._dispatch_script(redis_client, "dispatch", DISPATCH_LUA)
+        picked = script(
+            keys=[cls.get_dispatch_inflight_key(), cls.get_dispatch_pending_key()],
+            args=[int(limit), time.time(), DISPATCH_KEY_PREFIX, json.dumps(weights), float(default_weight), *lanes],
+            client=redis_client
+        )
+        if not picked:
+            return None
+        eval_id, lane, user_id = picked
+        return int(eval_id), lane, user_id
+    
+    @classmethod
+    def cancel_dispatch(cls, eval_id) -> bool:
+        """把尚未派发的任务移出排队队列
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            bool: 任务是否在队列中
+        """
+        redis_client = cls.get_instance()
+        script = cls._dispatch_script(redis_client, "cancel", CANCEL_LUA)
+        return bool(script(keys=[cls.get_dispatch_pending_key()], args=[str(eval_id), DISPATCH_KEY_PREFIX],
+                           client=redis_client))
+    
+    @classmethod
+    def release_dispatch(cls, eval_id) -> bool:
+        """任务结束后释放其派发名额
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            bool: 任务是否占用了名额
+        """
+        try:
+            return bool(cls.get_instance().zrem(cls.get_dispatch_inflight_key(), str(eval_id)))
+        except Exception as e:
+            logger.error(f"释放派发名额失败 [eval_id={eval_id}]: {str(e)}")
+            return False
+    
+    @classmethod
+    def get_dispatch_inflight(cls) -> Dict[str, float]:
+        """读取已派发未结束的任务
+        
+        Returns:
+            Dict[str, float]: 任务ID -> 派发时间戳
+        """
+        return dict(cls.get_instance().zrange(cls.get_dispatch_inflight_key(), 0, -1, withscores=True))
+    
+    @classmethod
+    def get_dispatch_state(cls, lanes: List[str]) -> Dict[str, Any]:
+        """读取分发队列的完整状态（用于计算排队位置与展示队列）
+        
+        Args:
+            lanes: 优先级通道
+            
+        Returns:
+            Dict[str, Any]: lanes（通道 -> passes用户虚拟时间、queues用户排队任务）、pending、inflight
+        """
+        redis_client = cls.get_instance()
+        state = {"lanes": {}}
+        for lane in lanes:
+            passes = dict(redis_client.zrange(cls.get_dispatch_users_key(lane), 0, -1, withscores=True))
+            with redis_client.pipeline(transaction=False) as pipe:
+                for user_id in passes:
+                    pipe.lrange(cls.get_dispatch_queue_key(lane, user_id), 0, -1)
+                queues = dict(zip(passes, pipe.execute()))
+            state["lanes"][lane] = {"passes": passes, "queues": queues}
+        state["pending"] = {eval_id: json.loads(meta) for eval_id, meta in
+                            redis_client.hgetall(cls.get_dispatch_pending_key()).items()}
+        state["inflight"] = redis_client.zrange(cls.get_dispatch_inflight_key(), 0, -1)
+        return state
+    
+    #------------------
+    # 日志订阅者在线状态（跨进程）
+    #------------------
+    
+    @staticmethod
+    def server_time(redis_client) -> float:
+        """读取Redis服务器时间（秒）
+        
+        Args:
+            redis_client: Redis连接
+            
+        Returns:
+            float: 服务器当前时间戳
+        """
+        seconds, microseconds = redis_client.time()
+        return seconds + microseconds / 1_000_000
+    
+    @classmethod
+    def touch_log_subscriber(cls, eval_id, client_id: str) -> bool:
+        """登记或续期日志订阅者
+        
+        在线状态保存在Redis中，执行器所在的Worker进程据此判断是否需要发布日志；
+        订阅者需在 log_presence_ttl_seconds 内续期，进程崩溃未注销的订阅者到期后自动失效。
+        过期时间按Redis服务器时钟计算，API进程与Worker进程所在主机的时钟偏差不影响判断。
+        
+        Args:
+            eval_id: 评估任务ID
+            client_id: 客户端唯一标识
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            redis_client = cls.get_instance()
+            ttl = int(settings.log_presence_ttl_seconds)
+            now = cls.server_time(redis_client)
+            key = cls.get_subscribers_key(eval_id)
+            with redis_client.pipeline() as pipe:
+                pipe.zadd(key, {client_id: now + ttl})
+                pipe.zremrangebyscore(key, "-inf", now)
+                pipe.expire(key, ttl * 2)
+                pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"更新日志订阅者在线状态失败 [eval_id={eval_id}, client_id={client_id}]: {str(e)}")
+            return False
+    
+    @classmethod
+    def remove_log_subscriber(cls, eval_id, client_id: str) -> None:
+        """注销日志订阅者
+        
+        Args:
+            eval_id: 评估任务ID
+            client_id: 客户端唯一标识
+        """
+        try:
+            cls.get_instance().zrem(cls.get_subscribers_key(eval_id), client_id)
+        except Exception as e:
+            logger.warning(f"注销日志订阅者失败 [eval_id={eval_id}, client_id={client_id}]: {str(e)}")
+    
+    @classmethod
+    def count_log_subscribers(cls, eval_id, redis_client=None) -> int:
+        """统计任务当前在线的日志订阅者数量
+        
+        Args:
+            eval_id: 评估任务ID
+            redis_client: Redis连接，默认使用单例连接
+            
+        Returns:
+            int: 在线订阅者数量
+        """
+        redis_client = redis_client or cls.get_instance()
+        return redis_client.zcount(cls.get_subscribers_key(eval_id), cls.server_time(redis_client), "+inf")
+    
+    @classmethod
+    def _unwatched_publish_every(cls) -> int:
+        """无在线订阅者时的发布间隔：1始终发布，0不发布，N每N行发布一行"""
+        if str(settings.log_publish_mode).lower() == "always":
+            return 1
+        return max(int(settings.log_unwatched_publish_every), 0)
+    
+    @classmethod
+    def _publish_every(cls, redis_client, eval_id) -> int:
+        """客户端追加路径使用的发布间隔（有在线订阅者时逐行发布）"""
+        publish_every = cls._unwatched_publish_every()
+        if publish_every != 1 and cls.count_log_subscribers(eval_id, redis_client) > 0:
+            return 1
+        return publish_every
+    
+    #------------------
+    # 日志管理
+    #------------------
+    
+    @classmethod
+    def append_log(cls, eval_id, log_line, max_recent_logs=5) -> bool:
+        """添加单条日志到Redis并发布到通道
+        
+        Args:
+            eval_id: 评估任务ID
+            log_line: 日志行
+            max_recent_logs: 检查最近日志的数量，用于去重
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            if not log_line or not log_line.strip():
+                return False
+                
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return False
+            
+            # 服务端脚本原子地完成去重、写入与发布
+            if cls.use_append_script():
+                return cls._script_append_logs(redis_client, eval_id, [log_line], max_recent_logs) > 0
+            
+            # Stream后端
+            if cls.is_stream_backend():
+                return cls._append_stream_logs(redis_client, eval_id, [log_line], max_recent_logs) > 0
+            
+            log_key = cls.get_log_key(eval_id)
+            channel = cls.get_log_channel(eval_id)
+            
+            # 获取最近的日志进行去重（兼容紧凑、JSON和旧版纯文本记录）
+            recent_logs = redis_client.lrange(log_key, -max_recent_logs, -1)
+            is_duplicate = any(decode_text(recent_log) == log_line for recent_log in recent_logs)
+            
+            # 如果不是重复日志，则添加并发布
+            if not is_duplicate:
+                # 按任务协商的编码创建日志记录
+                log_data = cls._encode_log_lines(redis_client, eval_id, [log_line])[0]
+                
+                # 添加到列表，同时读取已落盘行数以得到全局行号
+                with redis_client.pipeline() as pipe:
+                    pipe.rpush(log_key, log_data)
+                    pipe.get(LogRetentionManager.get_offset_key(eval_id))
+                    length, raw_offset = pipe.execute()
+                
+                # 有在线订阅者时发布到通道（附带存储位置，订阅者据此发现缺失的日志）
+                publish_every = cls._publish_every(redis_client, eval_id)
+                if publish_every and length % publish_every == 0:
+                    redis_client.publish(channel, with_position(log_data, int(raw_offset or 0) + length))
+                
+                # 超出热尾部时将较早的日志落盘
+                LogRetentionManager.maybe_spill(eval_id, length)
+                return True
+            
+            return False
+        except Exception as e:
+            logger.error(f"添加日志到Redis出错: {str(e)}")
+            return False
+    
+    @classmethod
+    def batch_append_logs(cls, eval_id, log_lines, max_recent_logs=10) -> int:
+        """批量添加日志到Redis并发布到通道
+        
+        高效地批量处理多条日志，避免重复和多次连接
+        
+        Args:
+            eval_id: 评估任务ID
+            log_lines: 日志行列表
+            max_recent_logs: 检查最近日志的数量，用于去重
+            
+        Returns:
+            int: 成功添加的日志数量
+        """
+        if not log_lines:
+            return 0
+            
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return 0
+            
+            # 服务端脚本原子地完成去重、写入与发布
+            if cls.use_append_script():
+                return cls._script_append_logs(redis_client, eval_id, log_lines, max_recent_logs)
+            
+            # Stream后端
+            if cls.is_stream_backend():
+                return cls._append_stream_logs(redis_client, eval_id, log_lines, max_recent_logs)
+            
+            log_key = cls.get_log_key(eval_id)
+            channel = cls.get_log_channel(eval_id)
+            
+            # 获取最近的日志进行去重
+            recent_logs = redis_client.lrange(log_key, -max_recent_logs, -1)
+            
+            # 最近日志的滑动窗口，与append_log逐行去重的语义保持一致
+            recent_window = deque((decode_text(log_entry) for log_entry in recent_logs), maxlen=max_recent_logs)
+            
+            # 过滤掉空行和重复行
+            unique_lines = []
+            for log_line in log_lines:
+                if log_line and log_line.strip() and log_line not in recent_window:
+                    unique_lines.append(log_line)
+                    recent_window.append(log_line)  # 防止批量中的重复
+            
+            if not unique_lines:
+                return 0
+            
+            # 按任务协商的编码创建日志记录
+            unique_logs = cls._encode_log_lines(redis_client, eval_id, unique_lines)
+                
+            publish_every = cls._publish_every(redis_client, eval_id)
+            
+            # 使用管道批量操作，提高效率
+            with redis_client.pipeline() as pipe:
+                # 添加到列表，同时读取已落盘行数以得到全局行号
+                pipe.rpush(log_key, *unique_logs)
+                pipe.get(LogRetentionManager.get_offset_key(eval_id))
+                length, raw_offset = pipe.execute()
+            
+            # 有在线订阅者时发布到通道（附带存储位置，订阅者据此发现缺失的日志）
+            if publish_every:
+                first = int(raw_offset or 0) + length - len(unique_logs)
+                with redis_client.pipeline() as pipe:
+                    for i, log_data in enumerate(unique_logs):
+                        if i % publish_every == 0:
+                            pipe.publish(channel, with_position(log_data, first + i + 1))
+                    pipe.execute()
+            
+            # 超出热尾部时将较早的日志落盘
+            LogRetentionManager.maybe_spill(eval_id, length)
+            return len(unique_logs)
+        except Exception as e:
+            logger.error(f"批量添加日志到Redis出错: {str(e)}")
+            return 0
+    
+    @classmethod
+    def use_append_script(cls) -> bool:
+        """是否通过服务端Lua脚本追加日志
+        
+        Returns:
+            bool: LOG_APPEND_MODE不为client时返回True
+        """
+        return str(settings.log_append_mode).lower() != "client"
+    
+    @classmethod
+    def _script_append_logs(cls, redis_client, eval_id, log_lines, max_recent_logs) -> int:
+        """通过Lua脚本追加日志（list与stream后端通用）
+        
+        去重、序号分配、写入、指纹裁剪和发布在一次EVALSHA调用中原子完成，
+        多个写入方同时写同一任务时不会出现客户端读-改-写的竞争。
+        去重基于 eval:{id}:log_fp 中最近日志的指纹，而不是读取并解码最近的日志记录；
+        list后端没有在线订阅者（eval:{id}:subscribers）时不逐行发布，参见touch_log_subscriber；stream后端不发布。
+        
+        Args:
+            redis_client: Redis连接
+            eval_id: 评估任务ID
+            log_lines: 日志行列表
+            max_recent_logs: 去重窗口大小（不超过FINGERPRINT_CAPACITY）
+            
+        Returns:
+            int: 成功添加的日志数量
+        """
+        lines = [line for line in log_lines if line and line.strip()]
+        if not lines:
+            return 0
+        
+        codec = cls.get_log_codec(eval_id, redis_client)
+        stream = cls.is_stream_backend()
+        stream_json = stream and codec.name == "json"
+        line_args = build_append_args(codec, [new_record(line) for line in lines], stream_json)
+        
+        if cls._append_script is None:
+            cls._append_script = redis_client.register_script(APPEND_LOGS_LUA)
+        added, length = cls._append_script(
+            keys=[
+                cls.get_log_stream_key(eval_id) if stream else cls.get_log_key(eval_id),
+                cls.get_log_fingerprint_key(eval_id),
+                cls.get_log_meta_key(eval_id),
+                cls.get_subscribers_key(eval_id),
+                LogRetentionManager.get_offset_key(eval_id)
+            ],
+            args=[
+                cls.get_log_channel(eval_id),
+                "stream" if stream else "list",
+                min(max(int(max_recent_logs), 1), FINGERPRINT_CAPACITY),
+                1 if codec.uses_seq else 0,
+                int(settings.log_stream_maxlen),
+                5 if stream_json else 3,
+                cls._unwatched_publish_every(),
+                *line_args
+            ],
+            client=redis_client
+        )
+        
+        # 超出热尾部时将较早的日志落盘
+        if added:
+            LogRetentionManager.maybe_spill(eval_id, length)
+        return added
+    
+    @classmethod
+    def _append_stream_logs(cls, redis_client, eval_id, log_lines, max_recent_logs) -> int:
+        """追加日志到Redis Stream（stream后端）
+        
+        读取方通过XREAD读取Stream中的新条目（API进程的LogBroadcaster同样如此），不再发布日志通道消息。
+        
+        Args:
+            redis_client: Redis连接
+            eval_id: 评估任务ID
+            log_lines: 日志行列表
+            max_recent_logs: 检查最近日志的数量，用于去重
+            
+        Returns:
+            int: 成功添加的日志数量
+        """
+        stream_key = cls.get_log_stream_key(eval_id)
+        
+        # 最近日志的滑动窗口，用于去重
+        recent_entries = redis_client.xrevrange(stream_key, count=max_recent_logs)
+        recent_window = deque(
+            (decode_stream_fields(fields).log for _, fields in reversed(recent_entries)),
+            maxlen=max_recent_logs
+        )
+        
+        unique_lines = []
+        for log_line in log_lines:
+            if log_line and log_line.strip() and log_line not in recent_window:
+                unique_lines.append(log_line)
+                recent_window.append(log_line)
+        
+        if not unique_lines:
+            return 0
+        
+        codec = cls.get_log_codec(eval_id, redis_client)
+        records = cls._new_log_records(redis_client, eval_id, codec, unique_lines)
+        
+        # 使用管道批量写入Stream
+        with redis_client.pipeline() as pipe:
+            for record in records:
+                pipe.xadd(stream_key, encode_stream_fields(codec, record),
+                          maxlen=int(settings.log_stream_maxlen), approximate=True)
+            pipe.xlen(stream_key)
+            length = pipe.execute()[-1]
+        
+        # 超出热尾部时将较早的日志落盘
+        LogRetentionManager.maybe_spill(eval_id, length)
+        return len(records)
+    
+    @classmethod
+    def get_log_codec(cls, eval_id, redis_client=None):
+        """协商任务日志使用的编解码器
+        
+        首个写入方以HSETNX把配置的编码（LOG_CODEC）记录到日志元信息中，之后所有写入方
+        都沿用该编码，保证同一个键内编码一致；读取方按记录内容自动识别，无需查询元信息。
+        
+        Args:
+            eval_id: 评估任务ID
+            redis_client: Redis连接，默认使用单例连接
+            
+        Returns:
+            编解码器实例（JsonLogCodec或CompactLogCodec）
+        """
+        cache_key = str(eval_id)
+        with cls._log_codecs_lock:
+            codec = cls._log_codecs.get(cache_key)
+            if codec is not None:
+                cls._log_codecs.move_to_end(cache_key)
+                return codec
+        
+        redis_client = redis_client or cls.get_instance()
+        meta_key = cls.get_log_meta_key(eval_id)
+        with redis_client.pipeline() as pipe:
+            pipe.hsetnx(meta_key, "codec", get_codec(settings.log_codec).name)
+            pipe.hget(meta_key, "codec")
+            _, codec_name = pipe.execute()
+        codec = get_codec(codec_name)
+        with cls._log_codecs_lock:
+            cls._log_codecs[cache_key] = codec
+            # 长期运行的Worker会处理大量任务，淘汰最久未使用的条目，被淘汰的任务下次写入时重新查询元信息
+            while len(cls._log_codecs) > cls.LOG_CODEC_CACHE_SIZE:
+                cls._log_codecs.popitem(last=False)
+        return codec
+    
+    @classmethod
+    def _new_log_records(cls, redis_client, eval_id, codec, log_lines) -> list:
+        """为日志行创建记录，编码需要序号时一次性预留一段序号
+        
+        Args:
+            redis_client: Redis连接
+            eval_id: 评估任务ID
+            codec: 编解码器
+            log_lines: 日志行列表
+            
+        Returns:
+            List[LogRecord]: 日志记录列表
+        """
+        first_seq = 0
+        if codec.uses_seq:
+            last_seq = redis_client.hincrby(cls.get_log_meta_key(eval_id), "seq", len(log_lines))
+            first_seq = last_seq - len(log_lines) + 1
+        return [new_record(line, first_seq + i if first_seq else 0) for i, line in enumerate(log_lines)]
+    
+    @classmethod
+    def _encode_log_lines(cls, redis_client, eval_id, log_lines) -> List[str]:
+        """按任务协商的编码把日志行编码为列表存储和发布使用的记录
+        
+        Args:
+            redis_client: Redis连接
+            eval_id: 评估任务ID
+            log_lines: 日志行列表
+            
+        Returns:
+            List[str]: 编码后的日志记录
+        """
+        codec = cls.get_log_codec(eval_id, redis_client)
+        return [codec.encode(record) for record in cls._new_log_records(redis_client, eval_id, codec, log_lines)]
+    
+    @classmethod
+    def _parse_log_entry(cls, log_entry: str) -> str:
+        """从列表存储的日志记录中提取日志文本
+        
+        Args:
+            log_entry: 紧凑格式、JSON格式或旧格式（纯文本）的日志记录
+            
+        Returns:
+            str: 日志文本
+        """
+        return decode_text(log_entry)
+    
+    @classmethod
+    def get_logs(cls, eval_id, max_lines=None, since=None) -> List[str]:
+        """获取任务的日志
+        
+        Args:
+            eval_id: 评估任务ID
+            max_lines: 最大返回行数，None表示返回全部
+            since: 游标，只返回该游标之后的日志（参见get_log_entries）
+            
+        Returns:
+            List[str]: 日志行列表
+        """
+        return [line for _, line in cls.get_log_entries(eval_id, max_lines=max_lines, since=since)]
+    
+    @classmethod
+    def iter_logs(cls, eval_id, chunk_lines: int = 5000) -> Iterator[List[str]]:
+        """按固定大小的窗口遍历任务的全部日志
+        
+        以游标分页读取（Redis部分按LRANGE/XRANGE窗口，已落盘部分按分段），内存占用与日志总量无关；
+        只输出开始遍历时已有的日志行数，运行中的任务不会无限追加。
+        
+        Args:
+            eval_id: 评估任务ID
+            chunk_lines: 每个窗口的行数
+            
+        Yields:
+            List[str]: 一个窗口内的日志行
+        """
+        remaining = cls.get_log_window(eval_id, from_line=0, lines=0)["total_lines"]
+        if remaining <= 0:
+            return
+        
+        # 从头读取的起始游标：list后端为行号-1，stream后端为0-0（与get_log_entries的后端判断一致）
+        cursor = "0-0" if cls.reads_from_stream(eval_id) else "-1"
+        while remaining > 0:
+            entries = cls.get_log_entries(eval_id, max_lines=min(chunk_lines, remaining), since=cursor)
+            if not entries:
+                break
+            remaining -= len(entries)
+            cursor = entries[-1][0]
+            yield [line for _, line in entries]
+    
+    @classmethod
+    def get_log_entries(cls, eval_id, max_lines=None, since=None) -> List[Tuple[str, str]]:
+        """获取带游标的日志记录
+        
+        游标是每行日志的稳定ID：stream后端为Stream条目ID，list后端为全局行号（含已落盘的日志）。
+        未指定since时返回最后max_lines行；指定since时从游标之后顺序返回最多max_lines行，
+        客户端以最后一条记录的ID作为下一次请求的since即可无重复、无遗漏地续传。
+        
+        Args:
+            eval_id: 评估任务ID
+            max_lines: 最大返回行数，None表示返回全部
+            since: 游标，只返回该游标之后的日志
+            
+        Returns:
+            List[Tuple[str, str]]: (游标ID, 日志行) 列表
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return []
+            
+            # stream后端下，尚未迁移的旧任务仍从列表读取
+            if cls.reads_from_stream(eval_id, redis_client):
+                return cls._get_stream_entries(redis_client, eval_id, max_lines, since)
+            return cls._get_list_entries(redis_client, eval_id, max_lines, since)
+        except Exception as e:
+            logger.error(f"获取Redis日志出错: {str(e)}")
+            return []
+    
+    @classmethod
+    def _get_list_entries(cls, redis_client, eval_id, max_lines, since) -> List[Tuple[str, str]]:
+        """读取列表后端的日志记录，游标为全局行号
+        
+        行号小于offset的日志位于磁盘分段，其余位于Redis列表（热尾部）
+        """
+        def bounds(total):
+            # 计算请求的行号区间 [start, end)
+            if since is not None:
+                try:
+                    start = int(since) + 1
+                except (TypeError, ValueError):
+                    logger.warning(f"无效的日志游标: {since}，将从头读取")
+                    start = 0
+                return start, min(total, start + max_lines) if max_lines else total
+            return max(total - max_lines, 0) if max_lines is not None else 0, total
+        
+        entries, _ = cls._read_list_slice(redis_client, eval_id, bounds)
+        return entries
+    
+    @classmethod
+    def _read_list_slice(cls, redis_client, eval_id, bounds) -> Tuple[List[Tuple[str, str]], int]:
+        """按全局行号读取列表后端的一段日志
+        
+        Args:
+            redis_client: Redis客户端
+            eval_id: 评估任务ID
+            bounds: 根据总行数计算 [start, end) 区间的函数
+            
+        Returns:
+            Tuple[List[Tuple[str, str]], int]: ((游标, 日志行) 列表, 总行数)
+        """
+        log_key = cls.get_log_key(eval_id)
+        offset_key = LogRetentionManager.get_offset_key(eval_id)
+        
+        # 落盘会同时移动offset并裁剪列表，读取期间offset变化时重试
+        for _ in range(3):
+            with redis_client.pipeline() as pipe:
+                pipe.get(offset_key)
+                pipe.llen(log_key)
+                raw_offset, length = pipe.execute()
+            offset, length = LogRetentionManager.resolve_offset(eval_id, raw_offset, length)
+            total = offset + length
+            
+            start, end = bounds(total)
+            start, end = max(start, 0), min(end, total)
+            if start >= end:
+                return [], total
+            
+            # 读取Redis部分，并在同一事务中确认offset未因落盘而变化
+            redis_logs = []
+            if end > offset:
+                with redis_client.pipeline() as pipe:
+                    pipe.get(offset_key)
+                    pipe.lrange(log_key, max(start, offset) - offset, end - offset - 1)
+                    check_offset, redis_logs = pipe.execute()
+                if raw_offset is not None and check_offset != raw_offset:
+                    continue
+            
+            entries = LogRetentionManager.read_range(eval_id, start, min(end, offset))
+            first_redis = max(start, offset)
+            entries.extend(
+                (str(first_redis + i), cls._parse_log_entry(entry)) for i, entry in enumerate(redis_logs)
+            )
+            return entries, total
+        
+        logger.warning(f"读取日志时落盘频繁，返回空结果 [eval_id={eval_id}]")
+        return [], 0
+    
+    @classmethod
+    def _get_stream_entries(cls, redis_client, eval_id, max_lines, since) -> List[Tuple[str, str]]:
+        """读取Stream后端的日志记录，游标为Stream条目ID
+        
+        已落盘的条目从磁盘分段读取，其余从Stream读取
+        """
+        stream_key = cls.get_log_stream_key(eval_id)
+        
+        with redis_client.pipeline() as pipe:
+            pipe.get(LogRetentionManager.get_offset_key(eval_id))
+            pipe.xlen(stream_key)
+            raw_offset, length = pipe.execute()
+        offset, _ = LogRetentionManager.resolve_offset(eval_id, raw_offset, length)
+        
+        if since is not None and not cls.is_stream_cursor(since):
+            since = cls._line_to_stream_cursor(redis_client, eval_id, since, offset)
+        if since is not None:
+            # 先读磁盘中游标之后的条目，再读Stream（排他区间）
+            entries = LogRetentionManager.read_after(eval_id, since, max_lines) if offset else []
+            if max_lines and len(entries) >= max_lines:
+                return entries
+            cursor = entries[-1][0] if entries else since
+            remaining = max_lines - len(entries) if max_lines else None
+            stream_entries = redis_client.xrange(stream_key, min=f"({cursor}", max="+", count=remaining)
+        elif max_lines is not None:
+            stream_entries = list(reversed(redis_client.xrevrange(stream_key, count=max_lines)))
+            missing = max_lines - len(stream_entries)
+            entries = LogRetentionManager.read_range(eval_id, max(offset - missing, 0), offset) if missing > 0 else []
+        else:
+            entries = LogRetentionManager.read_range(eval_id, 0, offset)
+            stream_entries = redis_client.xrange(stream_key)
+        
+        entries.extend((entry_id, decode_stream_fields(fields).log) for entry_id, fields in stream_entries)
+        return entries
+    
+    @classmethod
+    def _line_to_stream_cursor(cls, redis_client, eval_id, line, offset: int) -> str:
+        """把全局行号游标换算为该行的Stream条目ID（如切换后端或迁移前客户端保存的列表游标）
+        
+        Args:
+            redis_client: Redis连接
+            eval_id: 评估任务ID
+            line: 全局行号游标
+            offset: 已落盘的条目数
+            
+        Returns:
+            str: 该行的条目ID；行号无效时为 "0-0"（从头读取），超出末尾时为最后一个条目ID
+        """
+        try:
+            position = int(line)
+        except (TypeError, ValueError):
+            logger.warning(f"无效的日志游标: {line}，将从头读取")
+            return "0-0"
+        if position < 0:
+            return "0-0"
+        if position < offset:
+            entries = LogRetentionManager.read_range(eval_id, position, position + 1)
+        else:
+            entries = redis_client.xrange(cls.get_log_stream_key(eval_id), count=position - offset + 1)
+            entries = entries[-1:] if entries else LogRetentionManager.read_range(eval_id, offset - 1, offset)
+        return entries[-1][0] if entries else "0-0"
+    
+    @classmethod
+    def to_stream_cursor(cls, eval_id, cursor: Optional[str]) -> str:
+        """把日志游标转换为XREAD可用的Stream条目ID
+        
+        stream后端下尚未迁移的任务从列表读取历史，得到的是行号游标；这时Stream中的条目都写在列表之后，
+        从头读取即可。其余行号游标按位置换算为对应的条目ID。
+        
+        Args:
+            eval_id: 评估任务ID
+            cursor: get_log_entries返回的游标，None表示尚未读取任何日志
+            
+        Returns:
+            str: Stream条目ID，"0-0"表示从头读取
+        """
+        if cursor is None:
+            return "0-0"
+        if cls.is_stream_cursor(cursor):
+            return str(cursor)
+        redis_client = cls.get_instance()
+        if not cls.reads_from_stream(eval_id, redis_client):
+            return "0-0"
+        with redis_client.pipeline() as pipe:
+            pipe.get(LogRetentionManager.get_offset_key(eval_id))
+            pipe.xlen(cls.get_log_stream_key(eval_id))
+            raw_offset, length = pipe.execute()
+        offset, _ = LogRetentionManager.resolve_offset(eval_id, raw_offset, length)
+        return cls._line_to_stream_cursor(redis_client, eval_id, cursor, offset)
+    
+    @classmethod
+    def get_log_window(cls, eval_id, from_line: int = 0, lines: int = 50, reverse: bool = False) -> Dict[str, Any]:
+        """按行号窗口读取日志，供前端虚拟滚动分页
+        
+        只读取窗口内的日志：Redis中的热尾部用LRANGE按下标读取，已落盘的部分只解压窗口覆盖的分段。
+        
+        Args:
+            eval_id: 评估任务ID
+            from_line: 起始行号（从0开始）；reverse为True时表示距末尾的行数
+            lines: 窗口大小
+            reverse: 是否从末尾向前翻页
+            
+        Returns:
+            Dict[str, Any]: logs（按时间顺序）、from_line（窗口首行的行号）、total_lines、has_more
+        """
+        from_line = max(int(from_line or 0), 0)
+        lines = max(int(lines or 0), 0)
+        
+        def bounds(total):
+            if reverse:
+                end = max(total - from_line, 0)
+                return max(end - lines, 0), end
+            return from_line, min(from_line + lines, total)
+        
+        entries, total = [], 0
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+            elif cls.reads_from_stream(eval_id, redis_client):
+                entries, total = cls._read_stream_slice(redis_client, eval_id, bounds)
+            else:
+                entries, total = cls._read_list_slice(redis_client, eval_id, bounds)
+        except Exception as e:
+            logger.error(f"按窗口获取Redis日志出错: {str(e)}")
+        
+        start, end = bounds(total)
+        start = min(start, total)
+        return {
+            "logs": [line for _, line in entries],
+            "from_line": start,
+            "total_lines": total,
+            "has_more": start > 0 if reverse else end < total
+        }
+    
+    @classmethod
+    def _read_stream_slice(cls, redis_client, eval_id, bounds) -> Tuple[List[Tuple[str, str]], int]:
+        """按全局行号读取Stream后端的一段日志
+        
+        Stream不支持按下标读取，热尾部中的窗口从距离较近的一端用XRANGE/XREVRANGE按条数截取，
+        开销与热尾部长度相关而与完整日志长度无关。
         
         Args:
-            task_id: 任务ID
-            client_id: 客户端ID
-            websocket: WebSocket连接对象
+            redis_client: Redis客户端
+            eval_id: 评估任务ID
+            bounds: 根据总行数计算 [start, end) 区间的函数
+            
+        Returns:
+            Tuple[List[Tuple[str, str]], int]: ((游标, 日志行) 列表, 总行数)
         """
-        # 已弃用的警告
-        logger.warning("RedisManager.register_websocket方法已弃用，请直接使用EvaluationService.register_websocket")
+        stream_key = cls.get_log_stream_key(eval_id)
         
-        # 初始化任务的WebSocket注册表
-        if task_id not in cls._websocket_registry:
-            cls._websocket_registry[task_id] = {}
-            
-        # 添加WebSocket连接
-        cls._websocket_registry[task_id][client_id] = websocket
-        logger.debug(f"已注册WebSocket连接 - 任务ID: {task_id}, 客户端ID: {client_id}")
+        with redis_client.pipeline() as pipe:
+            pipe.get(LogRetentionManager.get_offset_key(eval_id))
+            pipe.xlen(stream_key)
+            raw_offset, length = pipe.execute()
+        offset, length = LogRetentionManager.resolve_offset(eval_id, raw_offset, length)
+        total = offset + length
         
-        # 更新Redis中的连接信息
-        try:
-            redis_client = cls.get_instance()
-            if redis_client:
-                connection_key = cls.get_connection_key(task_id)
-                redis_client.hset(connection_key, client_id, "active")
-        except Exception as e:
-            logger.error(f"更新Redis连接信息失败: {str(e)}")
-
+        start, end = bounds(total)
+        start, end = max(start, 0), min(end, total)
+        if start >= end:
+            return [], total
+        
+        entries = LogRetentionManager.read_range(eval_id, start, min(end, offset))
+        if end > offset:
+            first = max(start, offset)
+            if first - offset <= total - end:
+                stream_entries = redis_client.xrange(stream_key, count=end - offset)[first - offset:]
+            else:
+                stream_entries = list(reversed(redis_client.xrevrange(stream_key, count=total - first)))
+                stream_entries = stream_entries[:end - first]
+            entries.extend((entry_id, decode_stream_fields(fields).log) for entry_id, fields in stream_entries)
+        return entries, total
+    
     @classmethod
-    async def unregister_websocket(cls, task_id: int, client_id: str) -> None:
-        """注销WebSocket连接（已弃用，请直接使用EvaluationService.register_websocket）
+    async def read_log_stream(cls, eval_id, last_id: str, block_ms: Optional[int] = 5000, count: int = 500) -> List[Tuple[str, str]]:
+        """阻塞读取Stream中游标之后的新日志（XREAD BLOCK）
         
         Args:
-            task_id: 任务ID
-            client_id: 客户端ID
+            eval_id: 评估任务ID
+            last_id: 已读取的最后一个条目ID，"0-0"表示从头读取
+            block_ms: 最长阻塞时间（毫秒），None表示不阻塞（补读已写入的日志）
+            count: 单次最多读取的条目数
+            
+        Returns:
+            List[Tuple[str, str]]: (条目ID, 日志行) 列表，超时无新日志时为空
         """
-        # 已弃用的警告
-        logger.warning("RedisManager.unregister_websocket方法已弃用，请直接使用EvaluationService.register_websocket")
+        redis = await cls.get_async_instance()
+        if not redis:
+            logger.error("无法获取异步Redis连接")
+            return []
         
-        try:
-            # 从注册表中移除连接
-            if task_id in cls._websocket_registry and client_id in cls._websocket_registry[task_id]:
-                # 关闭WebSocket连接
-                websocket = cls._websocket_registry[task_id][client_id]
-                if not websocket.client_state.value.startswith("DISCONNECTED"):
-                    await websocket.close()
-                
-                # 从注册表中删除
-                del cls._websocket_registry[task_id][client_id]
-                
-                # 如果任务没有更多连接，清理注册表
-                if not cls._websocket_registry[task_id]:
-                    del cls._websocket_registry[task_id]
-                
-                logger.debug(f"已注销WebSocket连接 - 任务ID: {task_id}, 客户端ID: {client_id}")
-                
-                # 更新Redis中的连接信息
-                redis_client = cls.get_instance()
-                if redis_client:
-                    connection_key = cls.get_connection_key(task_id)
-                    redis_client.hdel(connection_key, client_id)
-                    
-        except Exception as e:
-            logger.error(f"注销WebSocket连接失败: {str(e)}")
-            # 即使出错也尝试清理注册表
-            if task_id in cls._websocket_registry and client_id in cls._websocket_registry[task_id]:
-                del cls._websocket_registry[task_id][client_id]
+        stream_key = cls.get_log_stream_key(eval_id)
+        result = await redis.xread({stream_key: last_id}, count=count, block=block_ms)
+        
+        entries = []
+        for _, stream_entries in result or []:
+            for entry_id, fields in stream_entries:
+                entries.append((entry_id, decode_stream_fields(fields).log))
+        return entries
     
     @classmethod
-    async def subscribe_to_logs(cls, eval_id, client_id) -> Optional[aioredis.client.PubSub]:
-        """订阅日志通道
-        
-        创建PubSub订阅并注册到WebSocket连接
+    async def read_log_streams(cls, last_ids: Dict[Any, str], block_ms: int = 1000, count: int = 500) -> Dict[Any, List[Tuple[str, str]]]:
+        """一次XREAD BLOCK读取多个任务Stream中游标之后的新条目（供API进程的LogBroadcaster分发）
         
         Args:
-            eval_id: 评估任务ID
-            client_id: 客户端唯一标识
+            last_ids: 任务ID -> 已读取的最后一个条目ID
+            block_ms: 最长阻塞时间（毫秒）
+            count: 每个Stream单次最多读取的条目数
             
         Returns:
-            Optional[aioredis.client.PubSub]: Redis PubSub对象，失败则返回None
+            Dict[Any, List[Tuple[str, str]]]: 任务ID -> (条目ID, 记录原文) 列表，记录原文与list后端的记录格式一致
         """
-        try:
-            redis = await cls.get_async_instance()
-            if not redis:
-                logger.error("无法获取Redis连接")
-                return None
-            
-            channel = cls.get_log_channel(eval_id)
-            
-            # 创建PubSub对象
-            pubsub = redis.pubsub()
-            await pubsub.subscribe(channel)
-            
-            # 注册WebSocket连接
-            cls.register_websocket(eval_id, client_id, pubsub)
-            
-            logger.debug(f"已订阅日志通道: {channel}, 客户端={client_id}")
-            return pubsub
-        except Exception as e:
-            logger.error(f"订阅日志通道出错: {str(e)}")
-            return None
-    
-    #------------------
-    # 日志管理
-    #------------------
+        redis = await cls.get_async_instance()
+        if not redis:
+            logger.error("无法获取异步Redis连接")
+            return {}
+        
+        eval_ids = {cls.get_log_stream_key(eval_id): eval_id for eval_id in last_ids}
+        result = await redis.xread({key: last_ids[eval_id] for key, eval_id in eval_ids.items()},
+                                   count=count, block=block_ms)
+        return {
+            eval_ids[key]: [(entry_id, stream_fields_to_raw(fields)) for entry_id, fields in stream_entries]
+            for key, stream_entries in result or []
+            if stream_entries
+        }
     
     @classmethod
-    def append_log(cls, eval_id, log_line, max_recent_logs=5) -> bool:
-        """添加单条日志到Redis并发布到通道
+    async def get_log_stream_last_id(cls, eval_id) -> str:
+        """获取任务Stream中最后一个条目ID
         
         Args:
             eval_id: 评估任务ID
-            log_line: 日志行
-            max_recent_logs: 检查最近日志的数量，用于去重
             
         Returns:
-            bool: 操作是否成功
+            str: 最后一个条目ID，Stream为空时为 "0-0"
         """
-        try:
-            if not log_line or not log_line.strip():
-                return False
-                
-            redis_client = cls.get_instance()
-            if not redis_client:
-                logger.error("无法获取Redis连接")
-                return False
-            
-            log_key = cls.get_log_key(eval_id)
-            channel = cls.get_log_channel(eval_id)
-            
-            # 检查是否为重复日志
-            is_duplicate = False
-            
-            # 获取最近的日志进行去重
-            recent_logs = redis_client.lrange(log_key, -max_recent_logs, -1)
-            for recent_log in recent_logs:
-                try:
-                    # 解析为JSON，比较log字段
-                    log_data = json.loads(recent_log)
-                    if log_data.get("log") == log_line:
-                        is_duplicate = True
-                        break
-                except json.JSONDecodeError:
-                    # 旧格式，直接比较
-                    if recent_log == log_line:
-                        is_duplicate = True
-                        break
-            
-            # 如果不是重复日志，则添加并发布
-            if not is_duplicate:
-                # 创建包含时间戳的日志对象
-                log_data = json.dumps({
-                    "log": log_line,
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                # 添加到列表
-                redis_client.rpush(log_key, log_data)
-                
-                # 发布到通道
-                redis_client.publish(channel, log_data)
-                return True
-            
-            return False
-        except Exception as e:
-            logger.error(f"添加日志到Redis出错: {str(e)}")
-            return False
+        redis = await cls.get_async_instance()
+        entries = await redis.xrevrange(cls.get_log_stream_key(eval_id), count=1)
+        return entries[0][0] if entries else "0-0"
     
     @classmethod
-    def batch_append_logs(cls, eval_id, log_lines, max_recent_logs=10) -> int:
-        """批量添加日志到Redis并发布到通道
-        
-        高效地批量处理多条日志，避免重复和多次连接
+    def migrate_list_logs_to_stream(cls, eval_id, delete_source: bool = True, batch_size: int = 1000) -> int:
+        """将单个任务的列表日志迁移到Redis Stream
         
         Args:
             eval_id: 评估任务ID
-            log_lines: 日志行列表
-            max_recent_logs: 检查最近日志的数量，用于去重
+            delete_source: 迁移成功后是否删除原列表
+            batch_size: 每批迁移的行数
             
         Returns:
-            int: 成功添加的日志数量
+            int: 迁移的日志行数，跳过或失败时返回0
         """
-        if not log_lines:
-            return 0
-            
         try:
             redis_client = cls.get_instance()
             if not redis_client:
@@ -337,93 +1636,58 @@ class RedisManager:
                 return 0
             
             log_key = cls.get_log_key(eval_id)
-            channel = cls.get_log_channel(eval_id)
+            stream_key = cls.get_log_stream_key(eval_id)
             
-            # 获取最近的日志进行去重
-            recent_logs = redis_client.lrange(log_key, -max_recent_logs, -1)
+            # Stream中已有新日志时无法保证顺序，跳过迁移
+            if redis_client.exists(stream_key):
+                logger.warning(f"任务 {eval_id} 的日志Stream已存在，跳过迁移")
+                return 0
             
-            # 创建已存在日志的集合用于去重
-            recent_log_set = set()
-            for log_entry in recent_logs:
-                try:
-                    # 尝试解析JSON
-                    log_data = json.loads(log_entry)
-                    recent_log_set.add(log_data.get("log", ""))
-                except json.JSONDecodeError:
-                    # 旧格式，直接添加
-                    recent_log_set.add(log_entry)
+            total = redis_client.llen(log_key)
+            migrated = 0
+            for offset in range(0, total, batch_size):
+                logs = redis_client.lrange(log_key, offset, offset + batch_size - 1)
+                with redis_client.pipeline() as pipe:
+                    for log_entry in logs:
+                        # 记录原样迁移：紧凑记录写入r字段，JSON和旧版记录写入log/timestamp字段
+                        if log_entry.startswith("\x1f"):
+                            fields = {"r": log_entry}
+                        else:
+                            record = decode_record(log_entry)
+                            fields = {"log": record.log, "timestamp": record.timestamp}
+                        pipe.xadd(stream_key, fields, maxlen=int(settings.log_stream_maxlen), approximate=True)
+                    pipe.execute()
+                migrated += len(logs)
             
-            # 过滤掉空行和重复行
-            unique_logs = []
-            for log_line in log_lines:
-                if log_line and log_line.strip() and log_line not in recent_log_set:
-                    # 创建包含时间戳的日志对象
-                    log_data = json.dumps({
-                        "log": log_line,
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    unique_logs.append(log_data)
-                    recent_log_set.add(log_line)  # 防止批量中的重复
-            
-            if not unique_logs:
-                return 0
-                
-            # 使用管道批量操作，提高效率
-            with redis_client.pipeline() as pipe:
-                # 添加到列表
-                pipe.rpush(log_key, *unique_logs)
-                
-                # 发布到通道
-                for log_data in unique_logs:
-                    pipe.publish(channel, log_data)
-                
-                pipe.execute()
+            if delete_source and migrated:
+                redis_client.delete(log_key)
             
-            return len(unique_logs)
+            logger.info(f"已迁移任务 {eval_id} 的 {migrated} 行日志到Stream")
+            return migrated
         except Exception as e:
-            logger.error(f"批量添加日志到Redis出错: {str(e)}")
+            logger.error(f"迁移任务 {eval_id} 日志到Stream失败: {str(e)}")
             return 0
     
     @classmethod
-    def get_logs(cls, eval_id, max_lines=None) -> List[str]:
-        """获取任务的日志
+    def migrate_all_list_logs(cls, delete_source: bool = True) -> Dict[str, int]:
+        """将所有 eval:*:log_data 列表日志迁移到Redis Stream
         
         Args:
-            eval_id: 评估任务ID
-            max_lines: 最大返回行数，None表示返回全部
+            delete_source: 迁移成功后是否删除原列表
             
         Returns:
-            List[str]: 日志行列表
+            Dict[str, int]: {任务ID: 迁移行数}
         """
-        try:
-            redis_client = cls.get_instance()
-            if not redis_client:
-                logger.error("无法获取Redis连接")
-                return []
-            
-            log_key = cls.get_log_key(eval_id)
-            
-            # 获取所有日志或有限数量的日志
-            if max_lines is not None:
-                logs = redis_client.lrange(log_key, -max_lines, -1)
-            else:
-                logs = redis_client.lrange(log_key, 0, -1)
-            
-            # 解析JSON格式的日志
-            parsed_logs = []
-            for log_entry in logs:
-                try:
-                    # 尝试解析JSON格式
-                    log_data = json.loads(log_entry)
-                    parsed_logs.append(log_data.get("log", log_entry))
-                except json.JSONDecodeError:
-                    # 兼容旧格式：直接添加文本
-                    parsed_logs.append(log_entry)
-            
-            return parsed_logs
-        except Exception as e:
-            logger.error(f"获取Redis日志出错: {str(e)}")
-            return []
+        redis_client = cls.get_instance()
+        if not redis_client:
+            logger.error("无法获取Redis连接")
+            return {}
+        
+        results = {}
+        for log_key in redis_client.scan_iter(match="eval:*:log_data", count=500):
+            eval_id = log_key.split(":")[1]
+            results[eval_id] = cls.migrate_list_logs_to_stream(eval_id, delete_source=delete_source)
+        return results
     
     @classmethod
     def clear_logs(cls, eval_id) -> bool:
@@ -442,7 +1706,13 @@ class RedisManager:
                 return False
             
             log_key = cls.get_log_key(eval_id)
-            redis_client.delete(log_key)
+            redis_client.delete(log_key, cls.get_log_stream_key(eval_id), cls.get_log_meta_key(eval_id),
+                                cls.get_log_fingerprint_key(eval_id))
+            with cls._log_codecs_lock:
+                cls._log_codecs.pop(str(eval_id), None)
+            
+            # 同时清理已落盘的日志分段
+            LogRetentionManager.purge(eval_id)
             
             # 发布清除日志的消息
             channel = cls.get_log_channel(eval_id)
@@ -551,6 +1821,204 @@ class RedisManager:
             logger.error(f"从Redis获取任务状态失败: {str(e)}")
             return None
     
+    @classmethod
+    def update_runtime_info(cls, eval_id, info: Dict[str, Any]) -> bool:
+        """更新任务运行时信息并发布到状态通道
+        
+        运行时信息（心跳、统计计数等）以哈希形式按字段存储，不会覆盖状态键中的
+        终止标志等字段；发布到状态通道的消息带有type字段以区别于状态更新。
+        type只标识本条消息的类型，不写入哈希，否则各类消息会互相覆盖该字段。
+        
+        Args:
+            eval_id: 评估任务ID
+            info: 运行时信息，type字段标识消息类型（如heartbeat）
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return False
+            
+            message = dict(info)
+            message.setdefault("timestamp", datetime.now().isoformat())
+            
+            # 哈希字段值统一序列化为JSON
+            mapping = {key: json.dumps(value) for key, value in message.items() if key != "type"}
+            with redis_client.pipeline() as pipe:
+                pipe.hset(cls.get_runtime_key(eval_id), mapping=mapping)
+                pipe.publish(cls.get_status_channel(eval_id), json.dumps(message))
+                pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"更新任务运行时信息出错: {str(e)}")
+            return False
+    
+    @classmethod
+    def publish_status_event(cls, eval_id, event: Dict[str, Any]) -> bool:
+        """只向状态通道发布一条事件消息（如results_ready），不写入运行时信息哈希
+        
+        事件是一次性通知，写入哈希会覆盖其中心跳、进度等运行时信息的type字段。
+        
+        Args:
+            eval_id: 评估任务ID
+            event: 事件消息，type字段标识事件类型
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return False
+            
+            message = dict(event)
+            message.setdefault("timestamp", datetime.now().isoformat())
+            redis_client.publish(cls.get_status_channel(eval_id), json.dumps(message))
+            return True
+        except Exception as e:
+            logger.error(f"发布任务状态事件出错: {str(e)}")
+            return False
+    
+    @classmethod
+    def get_runtime_info(cls, eval_id) -> Dict[str, Any]:
+        """获取任务运行时信息
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            Dict[str, Any]: 运行时信息，不存在时为空字典
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return {}
+            
+            raw = redis_client.hgetall(cls.get_runtime_key(eval_id))
+            info = {}
+            for key, value in raw.items():
+                try:
+                    info[key] = json.loads(value)
+                except json.JSONDecodeError:
+                    info[key] = value
+            return info
+        except Exception as e:
+            logger.error(f"获取任务运行时信息出错: {str(e)}")
+            return {}
+    
+    @classmethod
+    def clear_runtime_info(cls, eval_id) -> bool:
+        """清除任务运行时信息（重新执行任务前调用）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return False
+            redis_client.delete(cls.get_runtime_key(eval_id))
+            return True
+        except Exception as e:
+            logger.error(f"清除任务运行时信息出错: {str(e)}")
+            return False
+    
+    #------------------
+    # 任务控制指令
+    #------------------
+    
+    @classmethod
+    def send_control_command(cls, eval_id, command: str, **params) -> Optional[Dict[str, Any]]:
+        """发送任务控制指令（terminate/kill/pause/resume）
+        
+        指令保存到控制键后发布到控制通道：执行器订阅通道即时收到指令，
+        错过发布消息时通过低频轮询控制键补偿。
+        每条指令带有按任务单调递增的序号（seq），执行器只应用序号大于本次执行开始时序号的指令，
+        不依赖各主机的时钟。
+        
+        Args:
+            eval_id: 评估任务ID
+            command: 控制指令
+            **params: 指令附加参数
+            
+        Returns:
+            Optional[Dict[str, Any]]: 已发送的指令消息，失败时返回None
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return None
+            
+            message = {
+                "id": uuid.uuid4().hex,
+                "seq": redis_client.incr(cls.get_control_seq_key(eval_id)),
+                "command": command,
+                "params": params,
+                "timestamp": time.time()
+            }
+            message_json = json.dumps(message)
+            with redis_client.pipeline() as pipe:
+                pipe.set(cls.get_control_key(eval_id), message_json, ex=86400)
+                pipe.publish(cls.get_control_channel(eval_id), message_json)
+                _, receivers = pipe.execute()
+            logger.info(f"已向任务 {eval_id} 发送控制指令 {command}，在线接收方 {receivers} 个")
+            return message
+        except Exception as e:
+            logger.error(f"发送任务控制指令出错: {str(e)}")
+            return None
+    
+    @classmethod
+    def get_control_seq(cls, eval_id) -> int:
+        """获取任务最近一条控制指令的序号（执行开始时记录，之前的指令不再应用）
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            int: 控制指令序号，没有指令或读取失败时返回0
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return 0
+            return int(redis_client.get(cls.get_control_seq_key(eval_id)) or 0)
+        except Exception as e:
+            logger.error(f"获取任务控制指令序号失败: {str(e)}")
+            return 0
+    
+    @classmethod
+    def get_control_command(cls, eval_id) -> Optional[Dict[str, Any]]:
+        """获取最近一条控制指令
+        
+        Args:
+            eval_id: 评估任务ID
+            
+        Returns:
+            Optional[Dict[str, Any]]: 控制指令消息，不存在则返回None
+        """
+        try:
+            redis_client = cls.get_instance()
+            if not redis_client:
+                logger.error("无法获取Redis连接")
+                return None
+            
+            message_json = redis_client.get(cls.get_control_key(eval_id))
+            return json.loads(message_json) if message_json else None
+        except Exception as e:
+            logger.error(f"获取任务控制指令失败: {str(e)}")
+            return None
+    
     @classmethod
     def set_task_status(cls, task_id: int, status: Dict[str, Any]) -> None:
         """直接设置任务状态，带过期时间
@@ -582,10 +2050,10 @@ class RedisManager:
     #------------------
     
     @classmethod
-    async def delete_task_data(cls, task_id: int) -> None:
+    def delete_task_data(cls, task_id: int) -> None:
         """删除任务相关的所有Redis数据
         
-        包括日志、状态和连接信息的清理，同时关闭相关的WebSocket连接
+        包括日志、状态和连接信息的清理，并广播指令让所有API进程关闭该任务的查看连接
         
         Args:
             task_id: 任务ID
@@ -599,24 +2067,29 @@ class RedisManager:
                 
             # 删除Redis中的数据
             redis_client.delete(cls.get_log_key(task_id))
+            redis_client.delete(cls.get_log_stream_key(task_id))
+            redis_client.delete(cls.get_log_meta_key(task_id))
+            redis_client.delete(cls.get_log_fingerprint_key(task_id))
+            with cls._log_codecs_lock:
+                cls._log_codecs.pop(str(task_id), None)
+            LogRetentionManager.purge(task_id)
             redis_client.delete(cls.get_status_key(task_id))
             redis_client.delete(cls.get_connection_key(task_id))
+            redis_client.delete(cls.get_subscribers_key(task_id))
+            redis_client.delete(cls.get_runtime_key(task_id))
+            redis_client.delete(cls.get_control_key(task_id))
+            redis_client.delete(cls.get_control_seq_key(task_id))
+            redis_client.delete(cls.get_shards_key(task_id))
             
             # 记录删除操作
             logger.info(f"已删除任务 {task_id} 的Redis数据")
             
-            # 清理WebSocket连接
-            # 获取所有相关的客户端ID
-            if task_id in cls._websocket_registry:
-                client_ids = list(cls._websocket_registry[task_id].keys())
-                
-                # 逐个注销WebSocket连接
-                for client_id in client_ids:
-                    await cls.unregister_websocket(task_id, client_id)
-            
-            # 清理活跃通道记录
-            if task_id in cls._active_channels:
-                del cls._active_channels[task_id]
-                    
+            # 通知所有API进程关闭该任务的查看连接
+            cls.close_viewers(task_id, "deleted")
         except Exception as e:
-            logger.error(f"删除任务Redis数据失败: {str(e)}") 
\ No newline at end of file
+            logger.error(f"删除任务Redis数据失败: {str(e)}") 
+
+
+# 通过os.fork创建的子进程（如gunicorn preload、Celery prefork）丢弃继承的连接
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=RedisManager._reset_after_fork)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# 执行器日志文件：带缓冲写入、按大小轮转、后台压缩，以及跨分段的只读视图
+
+import io
+import os
+import gzip
+import json
+import time
+import bisect
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from core.config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 压缩分段按固定大小的块独立压缩（gzip多成员 / zstd多帧），读取任意偏移只需解压一个块
+_BLOCK_SIZE = 1024 * 1024
+
+# 所有写入方共享的后台压缩线程，压缩不阻塞监督循环
+_compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+
+
+def manifest_path_for(log_path) -> Path:
+    """日志文件对应的分段清单（与日志文件放在一起）"""
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.name + ".segments.json")
+
+
+def log_exists(log_path) -> bool:
+    """日志（当前文件或已轮转的分段）是否存在"""
+    return Path(log_path).exists() or manifest_path_for(log_path).exists()
+
+
+def _get_compression() -> Optional[str]:
+    """获取已轮转分段的压缩方式，zstandard不可用时回退gzip"""
+    name = str(settings.runner_log_compression).lower()
+    if name in ("", "none"):
+        return None
+    if name == "zstd" and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def _compress_block(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress_block(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取zstd日志分段需要安装zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class RotatingLogWriter:
+    """执行器日志文件写入器
+
+    - 写入先进入用户态缓冲，由监督循环按 flush_interval 刷新，按 fsync_interval 落盘
+    - 当前文件超过 max_bytes 后轮转：<日志>重命名为<日志>.0001、.0002…，新的输出继续写入<日志>
+    - 轮转出的分段由后台线程压缩为 .gz/.zst（按块独立压缩）后删除原文件
+    - <日志>.segments.json 记录每个分段在完整日志中的起始偏移、大小与块索引，
+      RotatingLogReader 据此把所有分段当作一个连续文件读取（偏移与LogIndex中的一致）
+    """
+
+    def __init__(self,
+                 log_path,
+                 max_bytes: Optional[int] = None,
+                 buffer_bytes: Optional[int] = None,
+                 flush_interval: Optional[float] = None,
+                 fsync_interval: Optional[float] = None):
+        """初始化，打开（覆盖）日志文件并清理上一次执行留下的分段
+
+        Args:
+            log_path: 日志文件路径
+            max_bytes: 单个文件的最大字节数，超过后轮转，0表示不轮转，默认取 settings.runner_log_max_bytes
+            buffer_bytes: 写缓冲大小（字节），默认取 settings.runner_log_buffer_bytes
+            flush_interval: 缓冲刷新到文件的最长间隔（秒），默认取 settings.runner_log_flush_interval
+            fsync_interval: fsync的最长间隔（秒），0表示只在轮转与关闭时fsync，默认取 settings.runner_log_fsync_interval
+        """
+        self.log_path = Path(log_path)
+        self.manifest_path = manifest_path_for(log_path)
+        self.max_bytes = int(max_bytes if max_bytes is not None else settings.runner_log_max_bytes)
+        self.buffer_bytes = int(buffer_bytes if buffer_bytes is not None else settings.runner_log_buffer_bytes)
+        self.flush_interval = float(flush_interval if flush_interval is not None else settings.runner_log_flush_interval)
+        self.fsync_interval = float(fsync_interval if fsync_interval is not None else settings.runner_log_fsync_interval)
+        self.compression = _get_compression()
+
+        self.offset = 0           # 完整日志中已写入的字节数（含缓冲中的数据）
+        self.flushed_offset = 0   # 已刷新到文件的字节数
+        self.segments: List[Dict[str, Any]] = []
+        self._segment_start = 0
+        self._lock = threading.Lock()
+        self._pending = []
+        self._active_inode = None
+        self._last_flush = time.monotonic()
+        self._last_fsync = time.monotonic()
+        self.rotations = 0
+
+        os.makedirs(self.log_path.parent, exist_ok=True)
+        self._remove_old_segments()
+        self._open_active()
+        self._write_manifest()
+
+    def _open_active(self) -> None:
+        """打开（新的）当前文件并记录其inode"""
+        self._file = open(self.log_path, "wb", buffering=max(self.buffer_bytes, io.DEFAULT_BUFFER_SIZE))
+        self._active_inode = os.fstat(self._file.fileno()).st_ino
+
+    def _remove_old_segments(self) -> None:
+        """重新执行时日志文件被覆盖，旧的分段与清单一并清除"""
+        for path in self.log_path.parent.glob(self.log_path.name + ".*"):
+            if path.name[len(self.log_path.name) + 1:].split(".")[0].isdigit():
+                path.unlink()
+        if self.manifest_path.exists():
+            self.manifest_path.unlink()
+
+    def write(self, data: bytes) -> int:
+        """写入数据（调用方保证按整行写入，轮转不会把一行拆到两个分段）
+
+        Args:
+            data: 要写入的字节
+
+        Returns:
+            int: 数据在完整日志中的起始偏移
+        """
+        if self.max_bytes and self.offset > self._segment_start and \
+                self.offset - self._segment_start + len(data) > self.max_bytes:
+            self._rotate()
+        start = self.offset
+        self._file.write(data)
+        self.offset += len(data)
+        return start
+
+    def flush_if_due(self) -> bool:
+        """距上次刷新超过 flush_interval 时刷新缓冲，距上次fsync超过 fsync_interval 时fsync
+
+        Returns:
+            bool: 调用后缓冲中是否已没有未刷新的数据
+        """
+        now = time.monotonic()
+        if self.offset != self.flushed_offset and now - self._last_flush >= self.flush_interval:
+            self.flush()
+        if self.fsync_interval > 0 and now - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+        return self.offset == self.flushed_offset
+
+    def flush(self) -> None:
+        """把缓冲中的数据写入文件"""
+        self._file.flush()
+        self.flushed_offset = self.offset
+        self._last_flush = time.monotonic()
+
+    def _fsync(self) -> None:
+        self._file.flush()
+        self.flushed_offset = self.offset
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def _rotate(self) -> None:
+        """轮转当前文件，并提交后台压缩"""
+        self._fsync()
+        self._file.close()
+
+        number = len(self.segments) + 1
+        segment_path = self.log_path.with_name(f"{self.log_path.name}.{number:04d}")
+        os.replace(self.log_path, segment_path)
+        segment = {
+            "file": segment_path.name,
+            "start": self._segment_start,
+            "size": self.offset - self._segment_start,
+            "compression": None
+        }
+        self._segment_start = self.offset
+        with self._lock:
+            self._open_active()
+            self.segments.append(segment)
+            self._write_manifest()
+        self.rotations += 1
+
+        if self.compression:
+            self._pending.append(_compressor.submit(self._compress_segment, segment, self.compression))
+
+    def _compress_segment(self, segment: Dict[str, Any], compression: str) -> None:
+        """按块压缩一个已轮转的分段，更新清单后删除原文件"""
+        source = self.log_path.with_name(segment["file"])
+        target = source.with_name(source.name + (".zst" if compression == "zstd" else ".gz"))
+        try:
+            blocks = []
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                raw_offset = 0
+                while True:
+                    data = src.read(_BLOCK_SIZE)
+                    if not data:
+                        break
+                    blocks.append([raw_offset, dst.tell()])
+                    dst.write(_compress_block(data, compression))
+                    raw_offset += len(data)
+                dst.flush()
+                os.fsync(dst.fileno())
+            with self._lock:
+                segment.update(file=target.name, compression=compression, blocks=blocks,
+                               compressed_size=target.stat().st_size)
+                self._write_manifest()
+            source.unlink()
+        except Exception as e:
+            logger.warning(f"压缩日志分段失败 [{source}]: {str(e)}")
+            if target.exists():
+                target.unlink()
+
+    def _write_manifest(self) -> None:
+        """原子地写入分段清单（记录当前文件的inode，读取方据此识别并发的轮转）"""
+        manifest = {
+            "segments": self.segments,
+            "active_start": self._segment_start,
+            "active_inode": self._active_inode
+        }
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def close(self, wait: bool = True) -> None:
+        """刷新并关闭日志文件
+
+        Args:
+            wait: 是否等待后台压缩完成
+        """
+        try:
+            self._fsync()
+        finally:
+            self._file.close()
+        if wait:
+            for future in self._pending:
+                future.result()
+        self._pending = []
+
+
+class RotatingLogReader(io.RawIOBase):
+    """把轮转分段与当前文件当作一个连续的只读文件
+
+    支持seek/read，偏移为完整日志中的字节偏移；压缩分段按块解压并缓存最近一个块。
+    没有分段清单时（未发生轮转或旧版日志）等同于直接读取日志文件。
+    """
+
+    def __init__(self, log_path):
+        super().__init__()
+        self.log_path = Path(log_path)
+        self._position = 0
+        self._handles: Dict[str, Any] = {}
+        self._block_cache = (None, 0, b"")
+        self._load()
+
+    def _load(self) -> None:
+        """加载分段清单并打开当前文件；清单与当前文件不一致（正在轮转）时重试"""
+        for attempt in range(50):
+            self._close_handles()
+            manifest_path = manifest_path_for(self.log_path)
+            manifest = None
+            if manifest_path.exists():
+                try:
+                    with open(manifest_path, encoding="utf-8") as f:
+                        manifest = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    time.sleep(0.01)
+                    continue
+            try:
+                active = open(self.log_path, "rb")
+            except FileNotFoundError:
+                if manifest is None:
+                    raise
+                if attempt < 49:
+                    # 轮转中：旧文件已重命名，新文件尚未创建
+                    time.sleep(0.01)
+                    continue
+                active = None
+            if manifest and active is not None and os.fstat(active.fileno()).st_ino != manifest.get("active_inode"):
+                active.close()
+                time.sleep(0.01)
+                continue
+            self.segments = list((manifest or {}).get("segments", []))
+            active_start = int((manifest or {}).get("active_start", 0))
+            active_size = os.fstat(active.fileno()).st_size if active is not None else 0
+            self.segments.append({"file": self.log_path.name, "start": active_start, "size": active_size,
+                                  "compression": None, "active": True})
+            if active is not None:
+                self._handles[self.log_path.name] = active
+            self._starts = [segment["start"] for segment in self.segments]
+            return
+        raise OSError(f"日志文件正在轮转，读取失败: {self.log_path}")
+
+    def _close_handles(self) -> None:
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+
+    @property
+    def size(self) -> int:
+        """完整日志的字节数（当前文件按打开时刻之后继续增长的实际大小计算）"""
+        last = self.segments[-1]
+        handle = self._handles.get(last["file"])
+        if handle is not None:
+            last["size"] = os.fstat(handle.fileno()).st_size
+        return last["start"] + last["size"]
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        index = bisect.bisect_right(self._starts, self._position) - 1
+        if index < 0:
+            return 0
+        segment = self.segments[index]
+        relative = self._position - segment["start"]
+        if segment.get("active"):
+            data = self._read_plain(segment, relative, len(buffer))
+        else:
+            if relative >= segment["size"]:
+                return 0
+            length = min(len(buffer), segment["size"] - relative)
+            if segment.get("compression"):
+                data = self._read_compressed(segment, relative, length)
+            else:
+                try:
+                    data = self._read_plain(segment, relative, length)
+                except FileNotFoundError:
+                    # 分段在加载清单后被压缩并删除，重新加载后按压缩分段读取
+                    self._load()
+                    return self.readinto(buffer)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def _read_plain(self, segment: Dict[str, Any], relative: int, length: int) -> bytes:
+        handle = self._handles.get(segment["file"])
+        if handle is None:
+            handle = self._handles[segment["file"]] = open(self.log_path.with_name(segment["file"]), "rb")
+        handle.seek(relative)
+        return handle.read(length)
+
+    def _read_compressed(self, segment: Dict[str, Any], relative: int, length: int) -> bytes:
+        blocks = segment["blocks"]
+        block_index = bisect.bisect_right([block[0] for block in blocks], relative) - 1
+        raw_start, compressed_start = blocks[block_index]
+        cache_key = (segment["file"], block_index)
+        if self._block_cache[0] != cache_key:
+            if block_index + 1 < len(blocks):
+                compressed_end = blocks[block_index + 1][1]
+            else:
+                compressed_end = segment["compressed_size"]
+            handle = self._handles.get(segment["file"])
+            if handle is None:
+                handle = self._handles[segment["file"]] = open(self.log_path.with_name(segment["file"]), "rb")
+            handle.seek(compressed_start)
+            data = _decompress_block(handle.read(compressed_end - compressed_start), segment["compression"])
+            self._block_cache = (cache_key, raw_start, data)
+        _, raw_start, data = self._block_cache
+        offset = relative - raw_start
+        return data[offset:offset + length]
+
+    def close(self) -> None:
+        self._close_handles()
+        super().close()
+
+
+def open_log_reader(log_path) -> io.BufferedReader:
+    """以带缓冲的只读文件对象打开完整日志（跨所有轮转分段）
+
+    Args:
+        log_path: 日志文件路径
+
+    Returns:
+        io.BufferedReader: 支持seek/read/readline的文件对象
+    """
+    return io.BufferedReader(RotatingLogReader(log_path), buffer_size=256 * 1024)
@@ -19,8 +19,7 @@ def main():
         "-A", "celery_app:celery_app",
         "worker",
         "--loglevel=DEBUG",
-        "--concurrency=1",
-        "--pool=prefork",
+        "--pool=threads",   # 并发数取CELERY_CONCURRENCY，任务按资源调度器的准入结果执行
         "-Q", "eval_tasks"
     ]
 
@@ -0,0 +1,157 @@
+import os
+import json
+import contextlib
+from collections import OrderedDict
+import pytest
+import redis
+from fastapi.websockets import WebSocketState
+from utils.redis_manager import RedisManager
+
+# 需要真实Redis的测试使用独立的库，测试前后清空；Redis不可用时跳过
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """连接测试库的Redis客户端，RedisManager的同步与异步连接都指向测试库"""
+    client = redis.Redis.from_url(TEST_REDIS_URL, decode_responses=True)
+    try:
+        client.ping()
+    except redis.ConnectionError:
+        pytest.skip("Redis不可用")
+    client.flushdb()
+    monkeypatch.setenv("REDIS_URL", TEST_REDIS_URL)
+    monkeypatch.setattr(RedisManager, "_pid", os.getpid())
+    monkeypatch.setattr(RedisManager, "_redis_instance", client)
+    monkeypatch.setattr(RedisManager, "_async_redis_instance", None)
+    monkeypatch.setattr(RedisManager, "_append_script", None)
+    monkeypatch.setattr(RedisManager, "_dispatch_scripts", {})
+    monkeypatch.setattr(RedisManager, "_log_codecs", OrderedDict())
+    yield client
+    client.flushdb()
+    client.close()
+
+
+class FakeRedis:
+    """内存中的Redis替身，只实现部分命令（字符串、列表、哈希），用于不需要真实Redis的测试"""
+
+    def __init__(self):
+        self.strings = {}
+        self.lists = {}
+        self.hashes = {}
+
+    def get(self, key):
+        return self.strings.get(key)
+
+    def exists(self, *keys):
+        return sum(key in self.strings or key in self.lists or key in self.hashes for key in keys)
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, end):
+        return self.lists.get(key, [])[start:end + 1 if end != -1 else None]
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        values = self.hashes.get(key, {})
+        return sum(values.pop(field, None) is not None for field in fields)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """按顺序记录命令，execute时返回各命令的结果"""
+
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.results.append(command(*args, **kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """RedisManager.get_instance返回的内存Redis替身"""
+    client = FakeRedis()
+    monkeypatch.setattr(RedisManager, "get_instance", classmethod(lambda cls: client))
+    return client
+
+
+class _FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+        self.eval_id = None
+
+    def filter(self, condition):
+        # 只支持 Evaluation.id == eval_id 形式的条件
+        self.eval_id = condition.right.value
+        return self
+
+    def first(self):
+        return self.rows.get(self.eval_id)
+
+
+class FakeDB:
+    """按任务ID查询评估任务的数据库会话替身，evaluations 为 任务ID -> 任务对象"""
+
+    def __init__(self):
+        self.evaluations = {}
+        self.commits = 0
+
+    def query(self, model):
+        return _FakeQuery(self.evaluations)
+
+    def commit(self):
+        self.commits += 1
+
+    @contextlib.contextmanager
+    def session(self):
+        yield self
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDB()
+
+
+class RecordingWebSocket:
+    """记录发送内容的WebSocket替身：frames为发送的原始帧，messages为解析后的JSON消息"""
+    client_state = WebSocketState.CONNECTED
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def send_json(self, data):
+        self.frames.append(data)
+
+    @property
+    def messages(self):
+        return [json.loads(frame) if isinstance(frame, str) else frame for frame in self.frames]
+
+
+@pytest.fixture
+def websocket():
+    return RecordingWebSocket()
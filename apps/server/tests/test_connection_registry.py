@@ -0,0 +1,62 @@
+import json
+import asyncio
+from utils.redis_manager import RedisManager
+from services.log_broadcaster import LogBroadcaster
+from api.routers.eval import get_evaluation_viewers
+
+
+def test_list_connections_prunes_expired_processes(fake_redis):
+    key = RedisManager.get_connection_key(1)
+    fake_redis.hashes[key] = {
+        "a": json.dumps({"process": "host:1:aaaa", "kind": "ws_logs"}),
+        "b": json.dumps({"process": "host:2:bbbb", "kind": "sse"}),
+    }
+    fake_redis.strings[RedisManager.get_process_lease_key("host:1:aaaa")] = "1"
+
+    connections = RedisManager.list_connections(1)
+    assert list(connections) == ["a"]
+    assert list(fake_redis.hashes[key]) == ["a"]
+
+    # 查看连接接口只返回存活进程名下的连接
+    assert get_evaluation_viewers(1) == {
+        "count": 1, "connections": [{"client_id": "a", "process": "host:1:aaaa", "kind": "ws_logs"}]
+    }
+
+
+def test_clients_and_process_id_are_recreated_after_fork(monkeypatch):
+    RedisManager.get_instance()
+    process_id = RedisManager.get_process_id()
+    assert RedisManager._redis_instance is not None
+
+    monkeypatch.setattr("os.getpid", lambda: -1)
+    RedisManager._check_fork()
+    assert RedisManager._redis_instance is None
+    assert RedisManager._async_redis_instance is None
+    assert RedisManager.get_process_id() != process_id
+
+
+def test_close_command_notifies_local_viewers(monkeypatch):
+    registered = []
+    monkeypatch.setattr(RedisManager, "register_connection", classmethod(lambda cls, eval_id, client_id, kind: registered.append((eval_id, client_id))))
+    monkeypatch.setattr(RedisManager, "unregister_connection", classmethod(lambda cls, eval_id, client_id: registered.remove((eval_id, client_id))))
+
+    async def no_listener(self):
+        return None
+
+    monkeypatch.setattr(LogBroadcaster, "_ensure_listener", no_listener)
+
+    async def scenario():
+        broadcaster = LogBroadcaster()
+        closed = []
+        await broadcaster.register_viewer(7, "c1", "ws_logs", on_close=lambda reason: closed.append(("c1", reason)))
+        await broadcaster.register_viewer(8, "c2", "sse", on_close=lambda reason: closed.append(("c2", reason)))
+
+        broadcaster._dispatch(RedisManager.get_viewers_channel(7), json.dumps({"action": "close", "reason": "deleted"}))
+        assert closed == [("c1", "deleted")]
+
+        # 连接在自身清理时注销
+        broadcaster.unregister_viewer(7, "c1")
+        assert registered == [(8, "c2")]
+        assert broadcaster.get_metrics()["viewers"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import threading
+from core.config import settings
+from utils.redis_manager import RedisManager
+from utils.log_codec import decode_record
+
+
+def _use_script(monkeypatch, codec="compact", backend="list"):
+    monkeypatch.setattr(settings, "log_append_mode", "script")
+    monkeypatch.setattr(settings, "log_backend", backend)
+    monkeypatch.setattr(settings, "log_codec", codec)
+    monkeypatch.setattr(settings, "log_publish_mode", "subscribed")
+    monkeypatch.setattr(settings, "log_unwatched_publish_every", 0)
+
+
+def _records(redis_client, eval_id):
+    return [decode_record(raw) for raw in redis_client.lrange(RedisManager.get_log_key(eval_id), 0, -1)]
+
+
+def _published(pubsub):
+    messages = []
+    while True:
+        message = pubsub.get_message(timeout=0.2)
+        if message is None:
+            return messages
+        if message["type"] == "message":
+            messages.append(decode_record(message["data"]))
+
+
+def test_script_dedupes_within_recent_window(redis_client, monkeypatch):
+    _use_script(monkeypatch)
+    # 同一批内与跨批次的重复行都按最近窗口去重
+    assert RedisManager.batch_append_logs(1, ["a", "b", "a", "c"], max_recent_logs=3) == 3
+    assert RedisManager.batch_append_logs(1, ["c", "b", "d"], max_recent_logs=3) == 1
+    assert not RedisManager.append_log(1, "d", max_recent_logs=3)
+    # 超出窗口的重复行照常写入
+    assert RedisManager.batch_append_logs(1, ["a"], max_recent_logs=3) == 1
+    assert [record.log for record in _records(redis_client, 1)] == ["a", "b", "c", "d", "a"]
+
+    # 窗口为1时只去掉相邻的重复行
+    assert RedisManager.batch_append_logs(2, ["x", "x", "y", "x"], max_recent_logs=1) == 3
+
+
+def test_script_reserves_contiguous_sequence_numbers(redis_client, monkeypatch):
+    _use_script(monkeypatch)
+    RedisManager.batch_append_logs(3, ["a", "b", "a"])
+    RedisManager.append_log(3, "c")
+    # 被去重的行不占用序号
+    assert [(record.seq, record.log) for record in _records(redis_client, 3)] == [(1, "a"), (2, "b"), (3, "c")]
+    assert int(redis_client.hget(RedisManager.get_log_meta_key(3), "seq")) == 3
+
+
+def test_script_publishes_by_presence_and_sampling(redis_client, monkeypatch):
+    _use_script(monkeypatch)
+    pubsub = redis_client.pubsub()
+    pubsub.subscribe(RedisManager.get_log_channel(4))
+    pubsub.get_message(timeout=1)
+
+    RedisManager.batch_append_logs(4, ["a", "b"])
+    assert _published(pubsub) == []
+
+    # 无订阅者时每2行发布一行（按写入后的位置取样）
+    monkeypatch.setattr(settings, "log_unwatched_publish_every", 2)
+    RedisManager.batch_append_logs(4, ["c", "d", "e"])
+    assert [record.log for record in _published(pubsub)] == ["d"]
+
+    # 有在线订阅者时逐行发布，发布的记录与存储中的记录一致
+    RedisManager.touch_log_subscriber(4, "c1")
+    RedisManager.batch_append_logs(4, ["f", "g"])
+    assert _published(pubsub) == _records(redis_client, 4)[-2:]
+    pubsub.close()
+
+
+def test_concurrent_writers_get_unique_sequence_numbers(redis_client, monkeypatch):
+    _use_script(monkeypatch)
+
+    def write(worker):
+        for batch in range(10):
+            RedisManager.batch_append_logs(5, [f"worker {worker} batch {batch} line {i}" for i in range(5)])
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    records = _records(redis_client, 5)
+    assert len(records) == len({record.log for record in records}) == 200
+    assert [record.seq for record in records] == list(range(1, 201))
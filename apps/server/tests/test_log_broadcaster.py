@@ -0,0 +1,100 @@
+import asyncio
+from services.log_broadcaster import LogBroadcaster, LogSubscription, SubscriptionQueue
+
+
+def test_dispatch_fans_out_by_eval_id():
+    broadcaster = LogBroadcaster()
+    first, second, other = LogSubscription(7), LogSubscription(7), LogSubscription(8)
+    shared = SubscriptionQueue()
+    status = LogSubscription(7, "status", shared)
+    for subscription in (first, second, other, status):
+        broadcaster._subscriptions.setdefault((subscription.topic, subscription.eval_id), set()).add(subscription)
+
+    broadcaster._dispatch("eval:7:logs", "line a")
+    broadcaster._dispatch("eval:8:logs", "line b")
+    broadcaster._dispatch("eval:bad:logs", "ignored")
+    broadcaster._dispatch("eval:7:status", '{"status": "running"}')
+
+    assert asyncio.run(first.get()) == "line a"
+    assert asyncio.run(second.get()) == "line a"
+    assert asyncio.run(other.get()) == "line b"
+    assert shared.get_nowait() == (7, "status", '{"status": "running"}')
+    assert broadcaster.messages_received == 4
+    assert broadcaster.messages_dispatched == 4
+
+    broadcaster.unsubscribe(first)
+    broadcaster.unsubscribe(other)
+    assert broadcaster.subscriber_count() == 1
+    assert broadcaster.subscriber_count(8) == 0
+
+
+def test_bounded_queue_drops_oldest_and_reports_skipped():
+    saturated = []
+    subscription = LogSubscription(1, max_lines=4, policy="drop_oldest", on_saturated=saturated.append)
+    subscription.saturation_timeout = 3600
+
+    dropped = sum(subscription.put(f"line {i}") for i in range(10))
+
+    assert dropped == 6
+    assert list(subscription.queue._queue) == ["line 6", "line 7", "line 8", "line 9"]
+    assert subscription.take_skipped() == 6
+    assert subscription.take_skipped() == 0
+    assert subscription.saturated_since is not None
+    assert not subscription.closed
+
+    # 满载持续超过阈值后关闭订阅并回调
+    subscription.saturation_timeout = 0.001
+    subscription.saturated_since -= 1
+    subscription.put("line 10")
+    assert subscription.closed
+    assert saturated == [subscription]
+    assert subscription.depth() == 0
+    assert subscription.put("ignored") == 0
+
+
+def test_shared_queue_only_drops_the_overflowing_subscriptions_lines():
+    shared = SubscriptionQueue()
+    status = LogSubscription(1, "status", shared, max_lines=2)
+    logs = LogSubscription(1, "logs", shared, max_lines=2, policy="drop_oldest")
+    other = LogSubscription(2, "logs", shared, max_lines=2, policy="drop_oldest")
+    for subscription in (logs, other):
+        subscription.saturation_timeout = 0
+
+    other.put("other 0")
+    status.put('{"status": "running"}')
+    for i in range(5):
+        logs.put(f"line {i}")
+    status.put('{"status": "completed"}')
+    status.put('{"type": "heartbeat"}')
+
+    # 日志订阅溢出只丢弃自己最旧的日志行，状态消息与其他订阅的消息保留
+    assert list(shared._queue) == [
+        (2, "logs", "other 0"),
+        (1, "status", '{"status": "running"}'),
+        (1, "logs", "line 3"),
+        (1, "logs", "line 4"),
+        (1, "status", '{"status": "completed"}'),
+        (1, "status", '{"type": "heartbeat"}'),
+    ]
+    assert logs.take_skipped() == 3
+    assert other.take_skipped() == 0 and status.take_skipped() == 0
+    assert (logs.depth(), other.depth(), status.depth()) == (2, 1, 3)
+    shared.get_nowait()
+    assert other.depth() == 0
+
+
+def test_sample_policy_keeps_every_nth_line_while_backlogged():
+    subscription = LogSubscription(1, max_lines=10, policy="sample")
+    subscription.sample_every = 5
+    subscription.saturation_timeout = 0
+
+    for i in range(10):
+        subscription.put(f"line {i}")
+    subscription.put("line 10")          # 队列已满：丢弃最旧一条并进入抽样模式
+    assert subscription.sampling
+    for i in range(11, 21):
+        subscription.put(f"line {i}")    # 抽样：每5条保留一条
+
+    queued = [subscription.queue.get_nowait() for _ in range(subscription.depth())]
+    assert queued[-2:] == ["line 15", "line 20"]
+    assert subscription.dropped == 1 + 2 + 8
@@ -0,0 +1,49 @@
+import json
+from core.config import settings
+from utils.redis_manager import RedisManager
+from utils.log_codec import get_codec, new_record, decode_record, decode_text, encode_stream_fields, decode_stream_fields
+
+
+def test_compact_round_trip():
+    codec = get_codec("compact")
+    record = new_record("05/01 - OpenCompass - WARNING - a\x1fb", seq=42)
+
+    decoded = codec.decode(codec.encode(record))
+
+    assert decoded == record
+    assert decoded.level == "W"
+    assert decode_stream_fields(encode_stream_fields(codec, record)) == record
+
+
+def test_auto_detect_falls_back_to_json_and_plain_text():
+    legacy_json = json.dumps({"log": "hello", "timestamp": "2024-05-01T10:00:00"})
+
+    assert decode_record(legacy_json).log == "hello"
+    assert decode_record(legacy_json).timestamp == "2024-05-01T10:00:00"
+    assert decode_text(legacy_json) == "hello"
+    assert decode_text("{not json") == "{not json"
+    assert decode_record("plain old line").log == "plain old line"
+    assert get_codec("unknown").name == "json"
+
+
+def test_encode_template_matches_encode_once_seq_is_filled_in():
+    record = new_record("05/01 - OpenCompass - INFO - step", seq=0x2a)
+
+    head, tail = get_codec("compact").encode_template(record)
+    assert f"{head}{record.seq:x}{tail}" == get_codec("compact").encode(record)
+    assert get_codec("json").encode_template(record) == (get_codec("json").encode(record), "")
+
+
+def test_negotiated_codecs_are_cached_least_recently_used(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "log_codec", "compact")
+    monkeypatch.setattr(RedisManager, "LOG_CODEC_CACHE_SIZE", 2)
+    for eval_id in (1, 2):
+        RedisManager.get_log_codec(eval_id)
+    RedisManager.get_log_codec(1)
+    RedisManager.get_log_codec(3)
+    assert list(RedisManager._log_codecs) == ["1", "3"]
+
+    # 被淘汰的任务重新查询元信息，沿用首次协商的编码
+    monkeypatch.setattr(settings, "log_codec", "json")
+    assert RedisManager.get_log_codec(2).name == "compact"
+    assert list(RedisManager._log_codecs) == ["3", "2"]
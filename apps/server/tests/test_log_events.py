@@ -0,0 +1,95 @@
+import json
+import asyncio
+import pytest
+from core.config import settings
+from utils.redis_manager import RedisManager
+from services import log_events_service
+from services.log_broadcaster import LogBroadcaster
+from services.log_events_service import LogEventStreamService, format_event
+
+
+def test_format_event_splits_multiline_data():
+    assert format_event("line", event="log", event_id="12") == "id: 12\nevent: log\ndata: line\n\n"
+    assert format_event("a\nb") == "data: a\ndata: b\n\n"
+
+
+def test_end_status_ignores_runtime_messages():
+    service = LogEventStreamService()
+    assert service._is_end_status({"status": "completed"})
+    assert not service._is_end_status({"status": "running"})
+    assert not service._is_end_status({"type": "log_stats", "status": "failed"})
+    assert not service._is_end_status(None)
+
+
+@pytest.fixture
+def broadcaster(redis_client, monkeypatch):
+    """不启动通道监听的广播器，测试中直接分发通道消息"""
+    async def no_listener(self):
+        return None
+
+    monkeypatch.setattr(LogBroadcaster, "_ensure_listener", no_listener)
+    monkeypatch.setattr(settings, "log_backend", "list")
+    monkeypatch.setattr(settings, "ws_log_frame_interval_ms", 10)
+    instance = LogBroadcaster()
+    monkeypatch.setattr(log_events_service, "log_broadcaster", instance)
+    return instance
+
+
+def _parse(text):
+    """解析SSE事件文本为 (事件类型, 事件ID, 数据)"""
+    fields = dict(line.split(": ", 1) for line in text.strip().split("\n") if not line.startswith(":"))
+    return fields.get("event"), fields.get("id"), fields.get("data")
+
+
+def test_resume_from_last_event_id_and_end_when_finished(broadcaster):
+    RedisManager.batch_append_logs(1, [f"line {i}" for i in range(5)])
+    RedisManager.update_task_status(1, {"status": "completed"})
+
+    async def collect():
+        return [_parse(text) async for text in LogEventStreamService().stream_events(1, last_event_id="1")
+                if not text.startswith("retry")]
+
+    events = asyncio.run(collect())
+    assert events[0][0] == "status"
+    assert [(event, event_id, data) for event, event_id, data in events[1:-1]] == \
+        [("log", str(i), f"line {i}") for i in (2, 3, 4)]
+    assert events[-1][0] == "end" and json.loads(events[-1][2]) == {"eval_id": 1, "cursor": "4"}
+
+
+def test_live_logs_then_end_after_final_status(broadcaster, monkeypatch):
+    monkeypatch.setattr(log_events_service, "END_GRACE_SECONDS", 0.1)
+    RedisManager.batch_append_logs(2, ["first"])
+    RedisManager.update_task_status(2, {"status": "running"})
+
+    async def collect():
+        events = []
+        stream = LogEventStreamService().stream_events(2)
+        async for text in stream:
+            if text.startswith("retry"):
+                continue
+            events.append(_parse(text))
+            if events[-1][2] == "first":
+                # 日志通道消息只用于唤醒，日志按游标从存储读取；结束状态后补发剩余日志再结束
+                RedisManager.batch_append_logs(2, ["second"])
+                broadcaster._dispatch(RedisManager.get_log_channel(2), "wake")
+                broadcaster._dispatch(RedisManager.get_status_channel(2), json.dumps({"status": "completed"}))
+                RedisManager.batch_append_logs(2, ["third"])
+        return events
+
+    events = asyncio.run(asyncio.wait_for(collect(), timeout=5))
+    assert [(event, data) for event, _, data in events if event == "log"] == \
+        [("log", "first"), ("log", "second"), ("log", "third")]
+    assert [event for event, _, _ in events if event != "log"] == ["status", "status", "end"]
+    assert json.loads(events[-1][2])["cursor"] == "2"
+    assert broadcaster.subscriber_count(2) == 0
+
+
+def test_initial_cursor_follows_unmigrated_list(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "log_backend", "stream")
+    service = LogEventStreamService()
+    assert service._initial_cursor(3) == "0-0"
+    # stream后端下尚未迁移的任务仍从列表读取，游标为行号
+    redis_client.rpush(RedisManager.get_log_key(3), "old")
+    assert service._initial_cursor(3) == "-1"
+    monkeypatch.setattr(settings, "log_backend", "list")
+    assert service._initial_cursor(4) == "-1"
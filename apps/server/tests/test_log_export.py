@@ -0,0 +1,13 @@
+import gzip
+from utils.log_export import iter_file_blocks, iter_line_chunks, gzip_stream
+
+
+def test_streams_store_windows_and_file_blocks_as_gzip(tmp_path):
+    chunks = [["line 0", "line 1"], [], ["line 2"]]
+    assert b"".join(iter_line_chunks(chunks)) == b"line 0\nline 1\nline 2\n"
+    assert gzip.decompress(b"".join(gzip_stream(iter_line_chunks(chunks)))) == b"line 0\nline 1\nline 2\n"
+
+    log_path = tmp_path / "eval_1_20240501_100000.log"
+    log_path.write_bytes(b"x" * 10000)
+    blocks = list(iter_file_blocks(log_path, block_size=4096))
+    assert [len(block) for block in blocks] == [4096, 4096, 1808]
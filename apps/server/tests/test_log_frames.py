@@ -0,0 +1,89 @@
+import json
+import asyncio
+from core.config import settings
+from utils.redis_manager import RedisManager
+from utils.log_codec import decode_record
+from services.log_broadcaster import LogSubscription
+from services.rlog_service import LogFrameSender, entry_position
+
+
+def test_batch_frames_carry_contiguous_sequence_numbers(websocket):
+    sender = LogFrameSender(websocket, batched=True)
+
+    async def scenario():
+        await sender.send(["a", "b", "c"], kind="history", cursor="3")
+        await sender.send([])
+        await sender.send(["d", "e"])
+
+    asyncio.run(scenario())
+    frames = [json.loads(frame) for frame in websocket.frames]
+    assert frames == [
+        {"type": "history", "seq": 1, "lines": ["a", "b", "c"], "cursor": "3"},
+        {"type": "logs", "seq": 4, "lines": ["d", "e"]},
+    ]
+
+    # line协议保持每行一个文本帧
+    websocket.frames.clear()
+    asyncio.run(LogFrameSender(websocket).send(["a", "b"], cursor="2"))
+    assert websocket.frames == ["a", "b"]
+
+
+def test_frame_sequence_follows_store_positions(websocket):
+    sender = LogFrameSender(websocket, batched=True)
+
+    async def scenario():
+        await sender.send(["a", "b"], kind="history", cursor="41", seqs=[41, 42])
+        # 第43行未推送（如订阅前写入），第45行未知位置时沿用上一行序号
+        await sender.send(["d", "e", "f"], seqs=[44, 0, 47])
+
+    asyncio.run(scenario())
+    frames = [json.loads(frame) for frame in websocket.frames]
+    assert [(frame["seq"], frame["lines"]) for frame in frames] == [(41, ["a", "b"]), (44, ["d", "e"]), (47, ["f"])]
+    assert sender.next_seq == 48
+    assert entry_position("40") == 41 and entry_position("1700000000000-0") == 0
+
+
+def test_published_records_carry_history_positions(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "log_backend", "list")
+    monkeypatch.setattr(settings, "log_publish_mode", "always")
+    monkeypatch.setattr(settings, "log_codec", "json")
+    for mode in ("script", "client"):
+        monkeypatch.setattr(settings, "log_append_mode", mode)
+        eval_id = f"frames-{mode}"
+        pubsub = redis_client.pubsub()
+        pubsub.subscribe(RedisManager.get_log_channel(eval_id))
+        pubsub.get_message(timeout=1)
+
+        redis_client.set(f"eval:{eval_id}:log_offset", 10)
+        RedisManager.batch_append_logs(eval_id, ["one", "two"])
+        RedisManager.append_log(eval_id, "three")
+
+        published = []
+        while len(published) < 3:
+            message = pubsub.get_message(timeout=1)
+            assert message is not None
+            if message["type"] == "message":
+                published.append(decode_record(message["data"]))
+        pubsub.close()
+
+        history = RedisManager.get_log_entries(eval_id, since="9")
+        assert [(record.seq, record.log) for record in published] == \
+            [(entry_position(cursor), line) for cursor, line in history] == [(11, "one"), (12, "two"), (13, "three")]
+
+
+def test_subscription_coalesces_burst_within_window():
+    async def scenario():
+        subscription = LogSubscription(1)
+        for i in range(5):
+            subscription.put(f"line {i}")
+        first = await subscription.get_batch(max_items=3, max_wait=0.05)
+        second = await subscription.get_batch(max_items=3, max_wait=0.01)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, subscription.put, "late")
+        third = await subscription.get_batch(max_items=3, max_wait=0)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == ["line 0", "line 1", "line 2"]
+    assert second == ["line 3", "line 4"]
+    assert third == ["late"]
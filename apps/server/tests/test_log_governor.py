@@ -0,0 +1,62 @@
+from utils.log_governor import LogRateGovernor, collapse_key
+
+
+def test_collapses_progress_bars_and_numbered_retries():
+    emitted = []
+    governor = LogRateGovernor(emitted.append, rate=0, collapse_interval=3600)
+
+    governor.feed("[INFO] Start inferencing [demo_model/gsm8k]")
+    for i in range(1, 65):
+        governor.feed(f"{i * 100 // 64}%|██▌       | {i}/64 [00:05<00:05,  6.10it/s]")
+    governor.feed("Retry 1/5: connection reset")
+    governor.feed("Retry 2/5: connection reset")
+    governor.flush()
+
+    # 第一条进度条立即输出，其余63条折叠为最新的一条
+    assert emitted == [
+        "[INFO] Start inferencing [demo_model/gsm8k]",
+        "1%|██▌       | 1/64 [00:05<00:05,  6.10it/s]",
+        "100%|██▌       | 64/64 [00:05<00:05,  6.10it/s] (x63)",
+        "Retry 1/5: connection reset",
+        "Retry 2/5: connection reset",
+    ]
+    assert governor.get_stats() == {"lines_in": 67, "lines_out": 5, "lines_collapsed": 62, "lines_dropped": 0}
+    assert collapse_key("Current RPM 12.") == collapse_key("[api] Current RPM 30.")
+
+
+def test_token_bucket_drops_excess_lines_but_keeps_errors():
+    emitted = []
+    governor = LogRateGovernor(emitted.append, rate=0.001, burst=3, collapse_interval=0)
+
+    for word in ("alpha", "beta", "gamma", "delta", "epsilon"):
+        governor.feed(f"[INFO] {word}")
+    governor.feed("[ERROR] CUDA out of memory")
+
+    assert emitted[:3] == ["[INFO] alpha", "[INFO] beta", "[INFO] gamma"]
+    assert emitted[3].startswith("[日志限流]") and "2" in emitted[3]
+    assert emitted[4] == "[ERROR] CUDA out of memory"
+    assert governor.get_stats()["lines_dropped"] == 2
+
+
+def test_dropped_notice_is_emitted_on_flush_and_after_refill(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("utils.log_governor.time.monotonic", lambda: clock[0])
+    emitted = []
+    governor = LogRateGovernor(emitted.append, rate=1, burst=1, collapse_interval=0)
+
+    governor.feed("[INFO] alpha")
+    governor.feed("[INFO] beta")
+    governor.tick()
+    assert emitted == ["[INFO] alpha"]
+
+    # 没有新行时，令牌恢复后由tick补发提示
+    clock[0] = 1.0
+    governor.tick()
+    assert emitted[1].startswith("[日志限流]") and "1" in emitted[1]
+
+    # 结束时flush不等待令牌，直接输出提示
+    governor.feed("[INFO] gamma")
+    governor.flush()
+    assert emitted[2].startswith("[日志限流]") and "1" in emitted[2]
+    governor.flush()
+    assert len(emitted) == 3
@@ -0,0 +1,68 @@
+from core.config import settings
+from utils.log_index import LogIndexWriter, LogIndex, find_latest_log_file
+
+
+def _write_log(path, lines, writer, flush_every):
+    offset = 0
+    with open(path, "wb") as f:
+        for i, line in enumerate(lines, 1):
+            data = (line + "\n").encode("utf-8")
+            f.write(data)
+            writer.add(line, offset, len(data))
+            offset += len(data)
+            if i % flush_every == 0:
+                f.flush()
+                writer.flush()
+
+
+def test_search_indexed_segments_and_unindexed_tail(tmp_path):
+    log_path = tmp_path / "eval_1_20240501_100000.log"
+    lines = [f"[INFO] step {i} dataset=demo_gsm8k_gen" for i in range(250)]
+    lines[10] = "[ERROR] CUDA out of memory on demo_math_gen"
+    lines[240] = "[ERROR] CUDA out of memory again"
+    writer = LogIndexWriter(log_path, flush_lines=100, flush_interval=3600)
+    _write_log(log_path, lines, writer, flush_every=100)
+
+    # 前200行已写入两个分段，最后50行尚未索引
+    result = LogIndex(log_path).search("cuda OUT of memory", context=1)
+    assert result["indexed_lines"] == 200
+    assert result["total_lines"] == 250
+    assert [m["line_no"] for m in result["matches"]] == [11, 241]
+    assert result["matches"][0]["before"] == [lines[9]]
+    assert result["matches"][0]["after"] == [lines[11]]
+
+    # 查询词是下划线分隔词的一部分，以及纯数字查询回退到顺序扫描
+    assert len(LogIndex(log_path).search("math").get("matches")) == 1
+    assert [m["line_no"] for m in LogIndex(log_path).search("step 123", context=0)["matches"]] == [124]
+
+    writer.close()
+    merged = LogIndex(log_path)
+    assert [s["name"] for s in merged.manifest["segments"]] == ["seg_merged"]
+    result = merged.search("gsm8k", limit=5)
+    assert result["truncated"] is True
+    assert [m["line_no"] for m in result["matches"]] == [1, 2, 3, 4, 5]
+
+
+def test_partial_words_match_regardless_of_indexing(tmp_path):
+    log_path = tmp_path / "eval_2_20240501_100000.log"
+    lines = [f"[INFO] step {i} dataset=demo_gsm8k_gen" for i in range(20)]
+    lines[3] = "[ERROR] CUDA out of memory"
+    lines[5] = "[INFO] checkpoint " + "ab" * 40 + "cdef"
+    writer = LogIndexWriter(log_path, flush_lines=10, flush_interval=3600)
+    _write_log(log_path, lines + lines + lines[:8], writer, flush_every=10)
+
+    # 前40行已索引，第44、46行位于未索引的尾部，两部分的匹配结果一致
+    index = LogIndex(log_path)
+    assert index.manifest["lines"] == 40
+    for query in ("memor", "of mem", "OUT OF MEMORY"):
+        assert [m["line_no"] for m in index.search(query, context=0)["matches"]] == [4, 24, 44]
+    assert len(index.search("gsm", limit=100)["matches"]) == 42
+    assert [m["line_no"] for m in index.search("abcdef", context=0)["matches"]] == [6, 26, 46]
+
+
+def test_latest_log_file_ignores_shard_logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "logs_dir", tmp_path)
+    for name in ("eval_3_20240501_100000.log", "eval_3_shard1_20240502_100000.log", "eval_31_20240503_100000.log"):
+        (tmp_path / name).write_text("x\n")
+    assert find_latest_log_file(3).name == "eval_3_20240501_100000.log"
+    assert find_latest_log_file(4) is None
@@ -0,0 +1,140 @@
+import json
+import asyncio
+from types import SimpleNamespace
+from core.config import settings
+from utils import redis_manager
+from utils.redis_manager import RedisManager
+from utils.log_codec import decode_text
+from services.log_broadcaster import LogSubscription
+from services.rlog_service import LogFrameSender, WebSocketLogService, entry_position, stream_position
+
+
+def _published(pubsub):
+    messages = []
+    while True:
+        message = pubsub.get_message(timeout=0.2)
+        if message is None:
+            return messages
+        if message["type"] == "message":
+            messages.append(message["data"])
+
+
+def _subscribe(redis_client, eval_id):
+    pubsub = redis_client.pubsub()
+    pubsub.subscribe(RedisManager.get_log_channel(eval_id))
+    pubsub.get_message(timeout=1)
+    return pubsub
+
+
+def test_logs_are_published_only_while_subscribers_are_online(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "log_backend", "list")
+    monkeypatch.setattr(settings, "log_publish_mode", "subscribed")
+    monkeypatch.setattr(settings, "log_unwatched_publish_every", 0)
+    for mode in ("script", "client"):
+        monkeypatch.setattr(settings, "log_append_mode", mode)
+        eval_id = f"presence-{mode}"
+        pubsub = _subscribe(redis_client, eval_id)
+
+        RedisManager.append_log(eval_id, "unwatched")
+        assert _published(pubsub) == []
+
+        RedisManager.touch_log_subscriber(eval_id, "c1")
+        RedisManager.batch_append_logs(eval_id, ["watched 1", "watched 2"])
+        assert [decode_text(data) for data in _published(pubsub)] == ["watched 1", "watched 2"]
+
+        # 注销或过期的订阅者不再计入
+        RedisManager.remove_log_subscriber(eval_id, "c1")
+        redis_client.zadd(RedisManager.get_subscribers_key(eval_id), {"c2": RedisManager.server_time(redis_client) - 1})
+        RedisManager.append_log(eval_id, "unwatched again")
+        assert _published(pubsub) == []
+        assert RedisManager.count_log_subscribers(eval_id) == 0
+        # 日志仍写入存储
+        assert len(RedisManager.get_log_entries(eval_id)) == 4
+        pubsub.close()
+
+
+def test_presence_ignores_host_clock_skew(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "log_backend", "list")
+    monkeypatch.setattr(settings, "log_publish_mode", "subscribed")
+    monkeypatch.setattr(settings, "log_unwatched_publish_every", 0)
+    monkeypatch.setattr(settings, "log_append_mode", "client")
+    pubsub = _subscribe(redis_client, 7)
+
+    # API主机的时钟慢一小时，Worker主机的时钟快一小时
+    monkeypatch.setattr(redis_manager, "time", SimpleNamespace(time=lambda: RedisManager.server_time(redis_client) - 3600))
+    RedisManager.touch_log_subscriber(7, "c1")
+    monkeypatch.setattr(redis_manager, "time", SimpleNamespace(time=lambda: RedisManager.server_time(redis_client) + 3600))
+    assert RedisManager.count_log_subscribers(7) == 1
+    RedisManager.append_log(7, "watched")
+    assert [decode_text(data) for data in _published(pubsub)] == ["watched"]
+    pubsub.close()
+
+
+def test_lines_written_before_subscribing_are_caught_up_once(redis_client, monkeypatch, websocket):
+    monkeypatch.setattr(settings, "log_backend", "list")
+    monkeypatch.setattr(settings, "log_publish_mode", "always")
+    monkeypatch.setattr(settings, "log_codec", "json")
+    monkeypatch.setattr(settings, "ws_log_frame_interval_ms", 10)
+    pubsub = _subscribe(redis_client, 8)
+    service = WebSocketLogService()
+    sender = LogFrameSender(websocket, batched=True)
+    subscription = LogSubscription(8)
+
+    async def scenario():
+        RedisManager.batch_append_logs(8, ["a", "b"])
+        cursor = await service._send_historical_logs(sender, 8)
+        # 读取历史之后、订阅之前写入的日志不会从通道收到
+        RedisManager.append_log(8, "c")
+        _published(pubsub)
+        # 订阅之后写入的日志既在补读结果中，也会从通道收到
+        RedisManager.append_log(8, "d")
+        for data in _published(pubsub):
+            subscription.put(data)
+        cursor = await service._send_catch_up_logs(sender, 8, cursor)
+
+        listener = asyncio.create_task(service._listen_for_log_messages(
+            sender, subscription, "c1", 8, sent_position=entry_position(cursor)))
+        RedisManager.append_log(8, "e")
+        for data in _published(pubsub):
+            subscription.put(data)
+        await asyncio.sleep(0.1)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+    asyncio.run(scenario())
+    pubsub.close()
+    frames = [(frame["type"], frame["seq"], frame["lines"]) for frame in websocket.messages if "lines" in frame]
+    assert frames == [("history", 1, ["a", "b"]), ("logs", 3, ["c", "d"]), ("logs", 5, ["e"])]
+
+
+def test_stream_viewer_catches_up_by_cursor_and_skips_sent_entries(redis_client, monkeypatch, websocket):
+    monkeypatch.setattr(settings, "log_backend", "stream")
+    monkeypatch.setattr(settings, "ws_log_frame_interval_ms", 10)
+    service = WebSocketLogService()
+    sender = LogFrameSender(websocket, batched=True)
+    subscription = LogSubscription(9, with_ids=True)
+
+    def entry(line):
+        RedisManager.append_log(9, line)
+        entry_id, _ = RedisManager.get_log_entries(9, max_lines=1)[-1]
+        return entry_id, json.dumps({"log": line, "timestamp": ""})
+
+    async def scenario():
+        entry("a")
+        cursor = await service._send_historical_logs(sender, 9)
+        entry("b")
+        # 共享订阅器的读取位置落后于补读结果时，订阅中会收到已补发的条目
+        subscription.put(*reversed(entry("c")))
+        cursor = await service._send_stream_catch_up(sender, 9, cursor)
+
+        listener = asyncio.create_task(service._listen_for_stream_entries(sender, subscription, "c1", 9, cursor))
+        subscription.put(*reversed(entry("d")))
+        await asyncio.sleep(0.1)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        return cursor
+
+    cursor = asyncio.run(scenario())
+    frames = [(frame["type"], frame["lines"]) for frame in websocket.messages if "lines" in frame]
+    assert frames == [("history", ["a"]), ("logs", ["b", "c"]), ("logs", ["d"])]
+    assert stream_position(websocket.messages[-1]["cursor"]) > stream_position(cursor)
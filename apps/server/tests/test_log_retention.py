@@ -0,0 +1,98 @@
+import pytest
+from core.config import settings
+from utils.redis_manager import RedisManager
+from utils.log_retention import LogRetentionManager
+
+LINES = [f"line {i}" for i in range(12)]
+
+
+@pytest.fixture
+def tiers(redis_client, monkeypatch, tmp_path):
+    """热尾部5行，超出8行时落盘"""
+    monkeypatch.setattr(settings, "workspace", tmp_path)
+    monkeypatch.setattr(settings, "log_hot_tail_lines", 5)
+    monkeypatch.setattr(settings, "log_spill_batch_lines", 3)
+    monkeypatch.setattr(settings, "log_segment_compression", "gzip")
+    monkeypatch.setattr(settings, "log_final_ttl_seconds", 600)
+    monkeypatch.setattr(settings, "log_append_mode", "script")
+    monkeypatch.setattr(settings, "log_codec", "json")
+    return redis_client
+
+
+def _write(eval_id):
+    for start in range(0, len(LINES), 3):
+        RedisManager.batch_append_logs(eval_id, LINES[start:start + 3])
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+def test_reads_span_disk_and_redis_at_spill_boundary(tiers, monkeypatch, backend):
+    monkeypatch.setattr(settings, "log_backend", backend)
+    _write(1)
+
+    # 写到第9行时超出阈值，较早的4行落盘，Redis中保留5行及之后写入的3行
+    assert int(tiers.get(LogRetentionManager.get_offset_key(1))) == 4
+    assert (LogRetentionManager.get_segment_dir(1) / LogRetentionManager.INDEX_FILE).exists()
+    entries = RedisManager.get_log_entries(1)
+    assert [line for _, line in entries] == LINES
+
+    # 最近N行与游标续读都跨越两层
+    assert RedisManager.get_log_entries(1, max_lines=10) == entries[2:]
+    assert RedisManager.get_log_entries(1, since=entries[2][0], max_lines=3) == entries[3:6]
+    assert RedisManager.get_log_entries(1, since=entries[3][0]) == entries[4:]
+    if backend == "list":
+        assert [cursor for cursor, _ in entries] == [str(i) for i in range(12)]
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+def test_finalize_archives_tail_and_expires_redis_data(tiers, monkeypatch, backend):
+    monkeypatch.setattr(settings, "log_backend", backend)
+    _write(2)
+    entries = RedisManager.get_log_entries(2)
+
+    LogRetentionManager.finalize(2)
+    log_key = RedisManager.get_log_stream_key(2) if backend == "stream" else RedisManager.get_log_key(2)
+    for key in (log_key, LogRetentionManager.get_offset_key(2), RedisManager.get_log_meta_key(2)):
+        assert 0 < tiers.ttl(key) <= 600
+    # 过期前仍从两层读取，结果不变
+    assert RedisManager.get_log_entries(2) == entries
+
+    # Redis数据过期后全部由磁盘归档提供
+    tiers.delete(log_key, LogRetentionManager.get_offset_key(2))
+    assert RedisManager.get_log_entries(2) == entries
+    assert RedisManager.get_log_entries(2, max_lines=3) == entries[-3:]
+    assert RedisManager.get_log_entries(2, since=entries[7][0]) == entries[8:]
+
+
+def test_clear_logs_purges_both_tiers(tiers, monkeypatch):
+    monkeypatch.setattr(settings, "log_backend", "list")
+    _write(3)
+    assert LogRetentionManager.get_segment_dir(3).exists()
+
+    RedisManager.clear_logs(3)
+    assert not LogRetentionManager.get_segment_dir(3).exists()
+    assert tiers.get(LogRetentionManager.get_offset_key(3)) is None
+    assert RedisManager.get_log_entries(3) == []
+
+    # 重新执行时行号从0开始
+    RedisManager.batch_append_logs(3, ["again"])
+    assert RedisManager.get_log_entries(3) == [("0", "again")]
+
+
+def test_spill_releases_only_its_own_lock(tiers, monkeypatch):
+    monkeypatch.setattr(settings, "log_backend", "list")
+    lock_key = LogRetentionManager.get_spill_lock_key(4)
+
+    def slow_spill(cls, redis_client, eval_id, offset, keep):
+        # 落盘超过锁有效期，锁已被其他写入方获得
+        redis_client.set(lock_key, "other")
+        return 0
+
+    monkeypatch.setattr(LogRetentionManager, "_spill_list", classmethod(slow_spill))
+    LogRetentionManager.spill(4, keep=5)
+    assert tiers.get(lock_key) == "other"
+
+    # 自己持有的锁在落盘结束后释放
+    tiers.delete(lock_key)
+    monkeypatch.setattr(LogRetentionManager, "_spill_list", classmethod(lambda cls, *args: 0))
+    LogRetentionManager.spill(4, keep=5)
+    assert tiers.get(lock_key) is None
@@ -0,0 +1,43 @@
+import time
+from utils.redis_manager import RedisManager
+from utils.log_shipper import LogShipper
+
+
+def _capture_batches(monkeypatch):
+    batches = []
+
+    def fake_batch_append_logs(eval_id, log_lines, max_recent_logs=10):
+        batches.append(list(log_lines))
+        return len(log_lines)
+
+    monkeypatch.setattr(RedisManager, "batch_append_logs", fake_batch_append_logs)
+    return batches
+
+
+def test_flush_by_batch_size(monkeypatch):
+    batches = _capture_batches(monkeypatch)
+    shipper = LogShipper(1, batch_size=3, flush_interval_ms=60000)
+
+    for i in range(7):
+        shipper.ship(f"line {i}")
+
+    assert batches == [["line 0", "line 1", "line 2"], ["line 3", "line 4", "line 5"]]
+
+    stats = shipper.close()
+    assert batches[-1] == ["line 6"]
+    assert stats["lines_shipped"] == 7
+    assert stats["batches"] == 3
+    assert stats["pending_lines"] == 0
+
+
+def test_flush_by_interval(monkeypatch):
+    batches = _capture_batches(monkeypatch)
+    shipper = LogShipper(1, batch_size=1000, flush_interval_ms=50)
+
+    shipper.ship("only line")
+    deadline = time.time() + 2
+    while not batches and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert batches == [["only line"]]
+    shipper.close()
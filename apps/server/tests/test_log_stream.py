@@ -0,0 +1,67 @@
+import asyncio
+from core.config import settings
+from utils.redis_manager import RedisManager
+from utils.log_codec import decode_text
+from services.log_broadcaster import LogBroadcaster
+
+
+def _use_stream(monkeypatch, append_mode="script"):
+    monkeypatch.setattr(settings, "log_backend", "stream")
+    monkeypatch.setattr(settings, "log_publish_mode", "always")
+    monkeypatch.setattr(settings, "log_append_mode", append_mode)
+
+
+def test_stream_entries_resume_from_stream_and_line_cursors(redis_client, monkeypatch):
+    for mode in ("script", "client"):
+        _use_stream(monkeypatch, mode)
+        eval_id = f"stream-{mode}"
+        pubsub = redis_client.pubsub()
+        pubsub.subscribe(RedisManager.get_log_channel(eval_id))
+        pubsub.get_message(timeout=1)
+
+        assert RedisManager.batch_append_logs(eval_id, ["a", "b", "c"]) == 3
+        entries = RedisManager.get_log_entries(eval_id)
+        assert [line for _, line in entries] == ["a", "b", "c"]
+        assert all(RedisManager.is_stream_cursor(cursor) for cursor, _ in entries)
+        # 读取方通过XREAD读取Stream，写入方不再发布通道消息
+        assert pubsub.get_message(timeout=0.2) is None
+        pubsub.close()
+
+        assert RedisManager.get_log_entries(eval_id, since=entries[0][0]) == entries[1:]
+        # 行号游标（如切换后端前客户端保存的游标）按位置换算为条目ID
+        assert RedisManager.get_log_entries(eval_id, since="0") == entries[1:]
+        assert RedisManager.to_stream_cursor(eval_id, "1") == entries[1][0]
+        assert RedisManager.to_stream_cursor(eval_id, "99") == entries[-1][0]
+        assert RedisManager.to_stream_cursor(eval_id, None) == "0-0"
+        assert RedisManager.to_stream_cursor(eval_id, entries[2][0]) == entries[2][0]
+
+
+def test_unmigrated_list_cursor_reads_stream_from_start(redis_client, monkeypatch):
+    _use_stream(monkeypatch)
+    redis_client.rpush(RedisManager.get_log_key(9), "old 1", "old 2")
+    RedisManager.batch_append_logs(9, ["new"])
+
+    # 历史来自尚未迁移的列表，游标为行号；Stream中的条目都写在列表之后
+    history = RedisManager.get_log_entries(9)
+    assert history == [("0", "old 1"), ("1", "old 2")]
+    assert RedisManager.to_stream_cursor(9, history[-1][0]) == "0-0"
+
+
+def test_broadcaster_tails_streams_for_log_subscribers(redis_client, monkeypatch):
+    _use_stream(monkeypatch)
+    RedisManager.batch_append_logs(11, ["before"])
+
+    async def scenario():
+        broadcaster = LogBroadcaster()
+        subscription = await broadcaster.subscribe(11, "logs")
+        await asyncio.to_thread(RedisManager.batch_append_logs, 11, ["x", "y"])
+        batch = await asyncio.wait_for(subscription.get_batch(2, 2), timeout=5)
+        metrics = broadcaster.get_metrics()
+        broadcaster.unsubscribe(subscription)
+        remaining = broadcaster.get_metrics()["stream_tails"]
+        await broadcaster.stop()
+        return batch, metrics, remaining
+
+    batch, metrics, remaining = asyncio.run(scenario())
+    assert [decode_text(data) for data in batch] == ["x", "y"]
+    assert metrics["stream_tails"] == 1 and remaining == 0
@@ -0,0 +1,23 @@
+from utils.redis_manager import RedisManager
+from utils.log_retention import LogRetentionManager
+
+
+def test_window_spans_disk_and_redis(fake_redis, monkeypatch):
+    # 行0-3已落盘，行4-9在Redis热尾部
+    disk = [f"line {i}" for i in range(4)]
+    fake_redis.strings[LogRetentionManager.get_offset_key(1)] = "4"
+    fake_redis.lists[RedisManager.get_log_key(1)] = [f"line {i}" for i in range(4, 10)]
+    monkeypatch.setattr(RedisManager, "is_stream_backend", classmethod(lambda cls: False))
+    monkeypatch.setattr(LogRetentionManager, "read_range",
+                        classmethod(lambda cls, eval_id, start, end: [(str(i), disk[i]) for i in range(start, end)]))
+
+    window = RedisManager.get_log_window(1, from_line=2, lines=4)
+    assert window == {"logs": ["line 2", "line 3", "line 4", "line 5"], "from_line": 2, "total_lines": 10, "has_more": True}
+
+    # 从末尾向前翻页：最后3行，再往前3行
+    assert RedisManager.get_log_window(1, from_line=0, lines=3, reverse=True)["logs"] == ["line 7", "line 8", "line 9"]
+    window = RedisManager.get_log_window(1, from_line=8, lines=3, reverse=True)
+    assert window == {"logs": ["line 0", "line 1"], "from_line": 0, "total_lines": 10, "has_more": False}
+
+    assert RedisManager.get_log_window(1, from_line=8, lines=5)["has_more"] is False
+    assert RedisManager.get_log_window(1, from_line=20, lines=5)["logs"] == []
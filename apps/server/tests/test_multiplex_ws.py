@@ -0,0 +1,154 @@
+import json
+import asyncio
+import pytest
+from core.config import settings
+from utils.redis_manager import RedisManager
+from services import multiplex_ws_service
+from services.log_broadcaster import LogBroadcaster
+from services.multiplex_ws_service import MultiplexConnection, MultiplexWebSocketService, classify_status_message
+
+
+def test_classify_status_channel_messages():
+    assert classify_status_message({"status": "running"}) == "status"
+    assert classify_status_message({"type": "progress", "progress": 40.0}) == "progress"
+    assert classify_status_message({"type": "results_ready"}) == "results"
+    assert classify_status_message({"type": "heartbeat"}) == "runtime"
+
+
+def test_topics_map_to_underlying_channels():
+    connection = MultiplexConnection(websocket=None, client_id="c")
+    connection.topics = {1: {"status", "progress"}, 2: {"logs"}, 3: {"logs", "results"}}
+    assert connection.channel_topics(1) == {"status"}
+    assert connection.channel_topics(2) == {"logs"}
+    assert connection.channel_topics(3) == {"logs", "status"}
+    assert connection.channel_topics(4) == set()
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    """不连接Redis的广播器，记录查看连接与日志订阅者的登记"""
+    async def no_listener(self):
+        return None
+
+    registry = {"viewers": set(), "log_subscribers": set()}
+    monkeypatch.setattr(LogBroadcaster, "_ensure_listener", no_listener)
+    monkeypatch.setattr(RedisManager, "register_connection", classmethod(lambda cls, eval_id, client_id, kind: registry["viewers"].add(eval_id)))
+    monkeypatch.setattr(RedisManager, "unregister_connection", classmethod(lambda cls, eval_id, client_id: registry["viewers"].discard(eval_id)))
+    monkeypatch.setattr(RedisManager, "touch_log_subscriber", classmethod(lambda cls, eval_id, client_id: registry["log_subscribers"].add(eval_id)))
+    monkeypatch.setattr(RedisManager, "remove_log_subscriber", classmethod(lambda cls, eval_id, client_id: registry["log_subscribers"].discard(eval_id)))
+    monkeypatch.setattr(RedisManager, "get_task_status", classmethod(lambda cls, eval_id: {"status": "running"}))
+    monkeypatch.setattr(RedisManager, "get_runtime_info", classmethod(lambda cls, eval_id: {"progress": 40.0, "type": "progress"} if eval_id == 1 else {}))
+    instance = LogBroadcaster()
+    instance.registry = registry
+    monkeypatch.setattr(multiplex_ws_service, "log_broadcaster", instance)
+    return instance
+
+
+def test_subscribe_sends_snapshots_and_unsubscribe_releases_channels(broadcaster, websocket):
+    service = MultiplexWebSocketService()
+    connection = MultiplexConnection(websocket, "c")
+
+    async def scenario():
+        await service._handle_client_message(connection, json.dumps(
+            {"action": "subscribe", "eval_ids": [1, 2], "topics": ["status", "progress", "logs"]}))
+        assert set(connection.subscriptions) == {(1, "status"), (1, "logs"), (2, "status"), (2, "logs")}
+        assert broadcaster.registry == {"viewers": {1, 2}, "log_subscribers": {1, 2}}
+
+        # 取消部分类别只释放不再需要的底层通道
+        await service._handle_client_message(connection, json.dumps({"action": "unsubscribe", "eval_ids": [1], "topics": ["logs"]}))
+        assert set(connection.subscriptions) == {(1, "status"), (2, "status"), (2, "logs")}
+        await service._handle_client_message(connection, json.dumps({"action": "unsubscribe", "eval_ids": [2]}))
+        assert set(connection.subscriptions) == {(1, "status")}
+        assert broadcaster.registry == {"viewers": {1}, "log_subscribers": set()}
+        assert broadcaster.subscriber_count(2, "status") == 0
+
+    asyncio.run(scenario())
+    assert websocket.messages == [
+        {"type": "subscribed", "eval_ids": [1, 2], "topics": ["status", "progress", "logs"]},
+        {"type": "status", "eval_id": 1, "data": {"status": "running"}},
+        {"type": "progress", "eval_id": 1, "data": {"progress": 40.0, "type": "progress"}},
+        {"type": "status", "eval_id": 2, "data": {"status": "running"}},
+        {"type": "unsubscribed", "eval_ids": [1], "topics": ["logs"]},
+        {"type": "unsubscribed", "eval_ids": [2], "topics": ["status", "progress", "results", "runtime", "logs"]},
+    ]
+
+
+def test_forward_messages_filters_topics_and_merges_logs(broadcaster, monkeypatch, websocket):
+    monkeypatch.setattr(settings, "ws_log_frame_interval_ms", 10)
+    service = MultiplexWebSocketService()
+    connection = MultiplexConnection(websocket, "c")
+
+    async def scenario():
+        await service._subscribe(connection, 1, ["progress", "logs"])
+        await service._subscribe(connection, 2, ["results"])
+        forward = asyncio.create_task(service._forward_messages(connection))
+        for channel, data in (
+            (RedisManager.get_log_channel(1), json.dumps({"log": "a", "timestamp": ""})),
+            (RedisManager.get_status_channel(1), json.dumps({"status": "running"})),
+            (RedisManager.get_status_channel(1), json.dumps({"type": "progress", "progress": 50.0})),
+            (RedisManager.get_log_channel(1), "b"),
+            (RedisManager.get_status_channel(2), json.dumps({"type": "results_ready", "has_error": False})),
+            (RedisManager.get_status_channel(2), json.dumps({"type": "heartbeat"})),
+        ):
+            broadcaster._dispatch(channel, data)
+        await asyncio.sleep(0.1)
+        forward.cancel()
+        await asyncio.gather(forward, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert websocket.messages == [
+        {"type": "progress", "eval_id": 1, "data": {"type": "progress", "progress": 50.0}},
+        {"type": "results", "eval_id": 2, "data": {"type": "results_ready", "has_error": False}},
+        {"type": "logs", "eval_id": 1, "lines": ["a", "b"]},
+    ]
+
+
+def test_forward_messages_reports_skipped_messages(broadcaster, monkeypatch, websocket):
+    monkeypatch.setattr(settings, "ws_log_frame_interval_ms", 10)
+    service = MultiplexWebSocketService()
+    connection = MultiplexConnection(websocket, "c")
+
+    async def scenario():
+        await service._subscribe(connection, 1, ["logs"])
+        # 跳过的行数随下一批消息一起提示
+        connection.subscriptions[(1, "logs")]._skipped = 3
+        broadcaster._dispatch(RedisManager.get_log_channel(1), "c")
+        forward = asyncio.create_task(service._forward_messages(connection))
+        await asyncio.sleep(0.1)
+        forward.cancel()
+        await asyncio.gather(forward, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert websocket.messages == [
+        {"type": "skipped", "eval_id": 1, "topic": "logs", "count": 3},
+        {"type": "logs", "eval_id": 1, "lines": ["c"]},
+    ]
+
+
+def test_connection_queue_filters_coalesces_and_is_bounded(broadcaster, monkeypatch, websocket):
+    monkeypatch.setattr(settings, "ws_multiplex_queue_max_messages", 4)
+    monkeypatch.setattr(settings, "ws_log_saturation_timeout", 30.0)
+    service = MultiplexWebSocketService()
+    connection = MultiplexConnection(websocket, "c")
+
+    async def scenario():
+        await service._subscribe(connection, 1, ["progress", "logs"])
+        # 未订阅的类别不入队，同一类别只保留最新一条
+        for progress in (10.0, 20.0, 30.0):
+            broadcaster._dispatch(RedisManager.get_status_channel(1), json.dumps({"type": "progress", "progress": progress}))
+        broadcaster._dispatch(RedisManager.get_status_channel(1), json.dumps({"type": "heartbeat"}))
+        broadcaster._dispatch(RedisManager.get_status_channel(1), json.dumps({"status": "running"}))
+        assert connection.queue.qsize() == 1
+
+        # 连接队列整体达到上限后，日志订阅丢弃自己最旧的行
+        for line in "abcdef":
+            broadcaster._dispatch(RedisManager.get_log_channel(1), line)
+        assert connection.queue.qsize() == 4
+        assert connection.subscriptions[(1, "logs")].take_skipped() == 3
+        return [connection.queue.get_nowait() for _ in range(4)]
+
+    items = asyncio.run(scenario())
+    assert items == [
+        (1, "status", json.dumps({"type": "progress", "progress": 30.0})),
+        (1, "logs", "d"), (1, "logs", "e"), (1, "logs", "f"),
+    ]
@@ -0,0 +1,71 @@
+from utils.redis_manager import RedisManager
+from utils.progress_tracker import OpenCompassProgressParser, ProgressReporter
+
+DEBUG_OUTPUT = [
+    "[2024-05-01 10:00:00,000] [opencompass.partitioners.num_worker] [INFO] Partitioned into 2 tasks.",
+    "[2024-05-01 10:00:01,000] [opencompass.tasks.openicl_infer] [INFO] Start inferencing [demo_model/gsm8k]",
+    " 50%|█████     | 32/64 [00:05<00:05,  6.10it/s]",
+    "100%|██████████| 64/64 [00:10<00:00,  6.10it/s]",
+    "[2024-05-01 10:00:12,000] [opencompass.tasks.openicl_infer] [INFO] Start inferencing [demo_model/math]",
+    " 25%|██▌       | 10/40 [00:02<00:06,  5.00it/s]",
+    "[2024-05-01 10:00:14,000] [opencompass.models.base_api] [INFO] Current RPM 12.",
+]
+
+
+def test_parser_tracks_datasets_and_overall_progress():
+    parser = OpenCompassProgressParser(expected_datasets=2)
+    for line in DEBUG_OUTPUT:
+        parser.feed(line)
+
+    snapshot = parser.snapshot()
+    assert snapshot["stage"] == "infer"
+    assert snapshot["datasets"]["gsm8k"]["percent"] == 100.0
+    assert snapshot["datasets"]["math"] == {"stage": "infer", "done": 10, "total": 40, "percent": 25.0}
+    assert snapshot["progress"] == 56.2  # (100 + 25) / 2 * 0.9
+    assert snapshot["rpm"] == 12.0
+
+    # 评估阶段：推理视为完成，进度单调不减且完成前不超过99
+    parser.feed("[2024-05-01 10:01:00,000] [opencompass.partitioners.naive] [INFO] Partitioned into 2 tasks.")
+    parser.feed("launch OpenICLEval[demo_model/gsm8k] on CPU")
+    parser.feed("100%|██████████| 2/2 [00:03<00:00,  1.50s/it]")
+    assert parser.snapshot()["stage"] == "eval"
+    assert parser.progress == 99.0
+
+
+def test_reporter_throttles_publishes(monkeypatch):
+    published = []
+    monkeypatch.setattr(RedisManager, "update_runtime_info",
+                        classmethod(lambda cls, eval_id, info: published.append(info) or True))
+    reporter = ProgressReporter(7, expected_datasets=2, publish_interval=60, persist_interval=3600)
+    persisted = []
+    monkeypatch.setattr(reporter, "_persist", persisted.append)
+
+    for line in DEBUG_OUTPUT:
+        reporter.feed(line)
+
+    # 首次变化立即发布，之后在节流间隔内只标记待发布
+    assert len(published) == 1
+    assert published[0]["type"] == "progress"
+
+    reporter.tick(force=True)
+    assert len(published) == 2
+    assert published[-1]["progress"] == 56.2
+    assert persisted == [0.0, 56.2]
+
+
+def test_parser_reports_only_real_changes():
+    parser = OpenCompassProgressParser(expected_datasets=2)
+    changes = [parser.feed(line) for line in DEBUG_OUTPUT]
+    assert changes == [True, True, True, True, True, True, True]
+
+    # 重复的数据集、进度与速率不再触发上报
+    assert [parser.feed(line) for line in DEBUG_OUTPUT[4:]] == [False, False, False]
+    assert not parser.feed("plain log line")
+
+
+def test_runtime_hash_keeps_fields_across_message_types(redis_client):
+    RedisManager.update_runtime_info(8, {"type": "heartbeat", "cpu": 12.5})
+    RedisManager.update_runtime_info(8, {"type": "progress", "progress": 40.0})
+    runtime = RedisManager.get_runtime_info(8)
+    assert "type" not in runtime
+    assert runtime["cpu"] == 12.5 and runtime["progress"] == 40.0
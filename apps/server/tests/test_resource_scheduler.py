@@ -0,0 +1,198 @@
+import os
+import stat
+import time
+import threading
+from types import SimpleNamespace
+from core.config import settings
+from models.eval import EvaluationStatus
+from tasks import task_evaluator
+from tasks.resource_scheduler import ResourceScheduler, ResourceDemand, estimate_demand, normalize_endpoint
+from tasks.runners.runner_opencompass import OpenCompassRunner
+
+API_A = "https://api-a.example.com/v1"
+API_B = "https://api-b.example.com/v1"
+
+
+def _start(scheduler, eval_id, demand, admitted):
+    def run():
+        scheduler.acquire(eval_id, demand)
+        admitted.append(eval_id)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_tasks_queue_until_cpu_is_released():
+    scheduler = ResourceScheduler(cpus=4, memory_mb=8192, endpoint_concurrency=10, endpoint_limits={})
+    admitted = []
+    assert scheduler.acquire(1, ResourceDemand(2, 1024))
+    assert scheduler.acquire(2, ResourceDemand(2, 1024))
+
+    _start(scheduler, 3, ResourceDemand(2, 1024), admitted)
+    assert _wait_for(lambda: len(scheduler.usage()["waiting"]) == 1)
+    assert admitted == []
+
+    scheduler.release(1)
+    assert _wait_for(lambda: admitted == [3])
+    usage = scheduler.usage()
+    assert usage["used"] == {"cpus": 4.0, "memory_mb": 2048}
+    assert sorted(entry["eval_id"] for entry in usage["running"]) == [2, 3]
+
+
+def test_endpoint_budget_lets_other_endpoints_go_first():
+    scheduler = ResourceScheduler(cpus=8, memory_mb=8192, endpoint_concurrency=1, endpoint_limits={API_B: 2})
+    admitted = []
+    assert scheduler.acquire(1, ResourceDemand(1, 512, normalize_endpoint(API_A)))
+
+    # 同一接口的第二个任务等待并发预算，后到的其他接口任务不受影响
+    _start(scheduler, 2, ResourceDemand(1, 512, normalize_endpoint(API_A)), admitted)
+    assert _wait_for(lambda: len(scheduler.usage()["waiting"]) == 1)
+    assert scheduler.acquire(3, ResourceDemand(1, 512, normalize_endpoint(API_B)), timeout=1)
+    assert scheduler.acquire(4, ResourceDemand(1, 512, normalize_endpoint(API_B)), timeout=1)
+    assert not scheduler.acquire(5, ResourceDemand(1, 512, normalize_endpoint(API_B)), timeout=0.1)
+    assert admitted == []
+
+    scheduler.release(1)
+    assert _wait_for(lambda: admitted == [2])
+    assert scheduler.usage()["endpoints"][normalize_endpoint(API_A)] == {"running": 1, "limit": 1}
+
+
+def test_compute_bound_waiter_is_not_overtaken():
+    scheduler = ResourceScheduler(cpus=4, memory_mb=8192, endpoint_concurrency=10, endpoint_limits={})
+    admitted = []
+    assert scheduler.acquire(1, ResourceDemand(3, 1024))
+    _start(scheduler, 2, ResourceDemand(4, 1024), admitted)
+    assert _wait_for(lambda: len(scheduler.usage()["waiting"]) == 1)
+
+    # 小任务虽然放得下，也不能越过等待CPU的大任务
+    assert not scheduler.acquire(3, ResourceDemand(1, 512), timeout=0.1)
+    scheduler.release(1)
+    assert _wait_for(lambda: admitted == [2])
+
+
+def test_reports_are_made_outside_the_scheduler_lock():
+    scheduler = ResourceScheduler(cpus=2, memory_mb=8192, endpoint_concurrency=10, endpoint_limits={})
+    lock_free = []
+
+    def lock_available(*_):
+        # 其他线程此时能获得调度器锁，说明上报没有持有锁
+        def try_lock():
+            acquired = scheduler._condition.acquire(blocking=False)
+            if acquired:
+                scheduler._condition.release()
+            lock_free.append(acquired)
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+
+    scheduler.on_change = lock_available
+    assert scheduler.acquire(1, ResourceDemand(2, 1024))
+    admitted = []
+    _start(scheduler, 2, ResourceDemand(2, 1024), admitted)
+    assert _wait_for(lambda: len(scheduler.usage()["waiting"]) == 1)
+    scheduler.release(1)
+    assert _wait_for(lambda: admitted == [2])
+    scheduler.release(2)
+    assert len(lock_free) >= 4 and all(lock_free)
+
+
+def test_estimate_demand_prefers_declared_resources():
+    api = estimate_demand({"resources": {"cpus": 0.5}}, {"API_URL": "HTTPS://API-A.example.com/v1/"})
+    assert api.cpus == 0.5
+    assert api.endpoint == API_A
+
+    local = estimate_demand({"gpu_count": 1}, {})
+    assert local.endpoint is None
+    assert local.cpus > api.cpus
+
+
+def test_terminated_task_gives_up_queue_and_is_not_run(monkeypatch):
+    monkeypatch.setattr(settings, "eval_admission_poll_interval", 0.02)
+    scheduler = ResourceScheduler(cpus=2, memory_mb=8192, endpoint_concurrency=10, endpoint_limits={})
+    assert scheduler.acquire(1, ResourceDemand(2, 1024))
+
+    terminated = threading.Event()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(
+        scheduler.acquire(2, ResourceDemand(2, 1024), cancelled=terminated.is_set)), daemon=True)
+    thread.start()
+    assert _wait_for(lambda: len(scheduler.usage()["waiting"]) == 1)
+
+    # 排队期间被终止：不等资源释放就放弃排队
+    terminated.set()
+    thread.join(timeout=2)
+    assert result == [False]
+    assert scheduler.usage()["waiting"] == []
+
+    # 获得资源时已被终止：释放资源，代码块不执行任务
+    scheduler.release(1)
+    with scheduler.admit(3, ResourceDemand(2, 1024), cancelled=lambda: True) as admitted:
+        assert not admitted
+    assert scheduler.usage()["running"] == []
+
+
+def test_terminated_task_is_not_restarted_by_evaluator(monkeypatch, fake_db):
+    eval_task = SimpleNamespace(id=1, status=EvaluationStatus.TERMINATED.value)
+    fake_db.evaluations[1] = eval_task
+    monkeypatch.setattr(task_evaluator, "db_session", fake_db.session)
+
+    result = task_evaluator.TaskEvaluator(None, 1).execute_sync()
+    assert result["terminated"] and result["exit_code"] == 143
+    assert eval_task.status == EvaluationStatus.TERMINATED.value
+    assert fake_db.commits == 0
+
+
+def _fake_opencompass(bin_dir, marker_dir):
+    """写入一个假的opencompass可执行文件：记录开始/结束时间并输出几行日志"""
+    script = bin_dir / "opencompass"
+    script.write_text(
+        "#!/bin/sh\n"
+        f"echo \"$API_URL $(date +%s.%N)\" >> {marker_dir}/start\n"
+        "for i in 1 2 3; do echo \"OpenICLInfer[demo] step $i\"; sleep 0.15; done\n"
+        f"echo \"$API_URL $(date +%s.%N)\" >> {marker_dir}/end\n"
+    )
+    script.chmod(script.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def test_runners_share_endpoint_budget_with_fake_opencompass(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    _fake_opencompass(bin_dir, tmp_path)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    scheduler = ResourceScheduler(cpus=4, memory_mb=8192, endpoint_concurrency=1, endpoint_limits={})
+    exit_codes = {}
+
+    def run(eval_id, api_url):
+        eval_task = SimpleNamespace(model_name="demo_api", dataset_names=["demo_gsm8k"],
+                                    eval_config={}, env_vars={"API_URL": api_url})
+        with scheduler.admit(eval_id, estimate_demand(eval_task.eval_config, eval_task.env_vars)):
+            runner = OpenCompassRunner(eval_id=eval_id, working_dir=tmp_path)
+            exit_codes[eval_id] = runner.execute(eval_task)
+
+    threads = [threading.Thread(target=run, args=args) for args in
+               ((990000901, API_A), (990000902, API_A), (990000903, API_B))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert exit_codes == {990000901: 0, 990000902: 0, 990000903: 0}
+    starts = sorted((float(ts), url) for url, ts in (line.split() for line in (tmp_path / "start").read_text().splitlines()))
+    ends = sorted((float(ts), url) for url, ts in (line.split() for line in (tmp_path / "end").read_text().splitlines()))
+    a_starts = [ts for ts, url in starts if url == API_A]
+    a_ends = [ts for ts, url in ends if url == API_A]
+    b_start = next(ts for ts, url in starts if url == API_B)
+    # 同一接口的两个任务串行，另一接口的任务与第一个并行
+    assert a_starts[1] >= a_ends[0]
+    assert b_start < a_ends[0]
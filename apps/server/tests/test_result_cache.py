@@ -0,0 +1,114 @@
+import csv
+import json
+from types import SimpleNamespace
+from core.config import settings
+from services.evaluation.result_cache import ResultCache, dataset_fingerprint, get_cache_mode, invalidate_cache
+from services.evaluation.result_collector import ResultCollector, new_timestamp_dir
+
+
+def _task(**overrides):
+    task = dict(
+        model_name="demo",
+        dataset_names=["gsm8k"],
+        eval_config={"debug": False, "dump_eval_details": True},
+        env_vars={"API_KEY": "sk-1", "BASE_URL": "http://model"},
+        model_configuration={"path": "demo", "token": "t-1"},
+    )
+    task.update(overrides)
+    return SimpleNamespace(**task)
+
+
+def _write_output(output, model, dataset, accuracy):
+    """模拟一次只执行一个数据集的OpenCompass输出目录"""
+    for name, data in (("results", {"accuracy": accuracy}), ("predictions", {"0": {"prediction": "x"}})):
+        (output / name / model).mkdir(parents=True, exist_ok=True)
+        (output / name / model / f"{dataset}.json").write_text(json.dumps(data))
+    (output / "summary").mkdir(parents=True)
+    with open(output / "summary" / f"summary_{output.name}.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["dataset", "version", "metric", "mode", model])
+        writer.writerow([dataset, "abc", "accuracy", "gen", f"{accuracy:.2f}"])
+
+
+def test_fingerprint_ignores_secrets_and_execution_flags():
+    base = dataset_fingerprint(_task(), "gsm8k")
+    assert dataset_fingerprint(_task(env_vars={"API_KEY": "sk-2", "BASE_URL": "http://model"}), "gsm8k") == base
+    assert dataset_fingerprint(_task(model_configuration={"path": "demo", "token": "t-2"}), "gsm8k") == base
+    assert dataset_fingerprint(_task(eval_config={"debug": True, "dump_eval_details": True, "timeout": 60}), "gsm8k") == base
+
+    assert dataset_fingerprint(_task(), "math") != base
+    assert dataset_fingerprint(_task(env_vars={"API_KEY": "sk-1", "BASE_URL": "http://other"}), "gsm8k") != base
+    assert dataset_fingerprint(_task(eval_config={"dump_eval_details": False}), "gsm8k") != base
+
+
+def test_fingerprint_keeps_generation_settings_that_look_like_secrets():
+    base = dataset_fingerprint(_task(env_vars={"OPENAI_API_KEY": "sk-1", "HF_TOKEN": "hf-1", "MAX_TOKENS": "512"}), "gsm8k")
+    assert dataset_fingerprint(_task(env_vars={"OPENAI_API_KEY": "sk-2", "HF_TOKEN": "hf-2", "MAX_TOKENS": "512"}),
+                               "gsm8k") == base
+    assert dataset_fingerprint(_task(env_vars={"OPENAI_API_KEY": "sk-1", "HF_TOKEN": "hf-1", "MAX_TOKENS": "4096"}),
+                               "gsm8k") != base
+
+    config = {"path": "demo", "max_tokens": 512, "tokenizer_path": "/models/a", "api_key": "k"}
+    base = dataset_fingerprint(_task(model_configuration=config), "gsm8k")
+    assert dataset_fingerprint(_task(model_configuration={**config, "api_key": "other"}), "gsm8k") == base
+    assert dataset_fingerprint(_task(model_configuration={**config, "max_tokens": 4096}), "gsm8k") != base
+    assert dataset_fingerprint(_task(model_configuration={**config, "tokenizer_path": "/models/b"}), "gsm8k") != base
+
+
+def test_cache_mode(monkeypatch):
+    monkeypatch.setattr(settings, "eval_result_cache", "on")
+    assert get_cache_mode({}) == "on"
+    assert get_cache_mode({"cache": False}) == "off"
+    assert get_cache_mode({"cache": "refresh"}) == "refresh"
+    assert get_cache_mode({"dry_run": True}) == "off"
+    # 默认关闭，任务可以单独开启；disabled时全部关闭
+    monkeypatch.setattr(settings, "eval_result_cache", "off")
+    assert get_cache_mode({}) == "off"
+    assert get_cache_mode({"cache": "on"}) == "on"
+    assert get_cache_mode({"cache": "unknown"}) == "off"
+    monkeypatch.setattr(settings, "eval_result_cache", "disabled")
+    assert get_cache_mode({"cache": "on"}) == "off"
+
+
+def test_cached_results_are_linked_into_new_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "eval_result_cache", "on")
+    cache_dir = tmp_path / "cache"
+    first = tmp_path / "logs" / "eval_1" / "20260101_000000"
+    _write_output(first, "demo", "gsm8k", 61.5)
+    assert ResultCache(_task(), 1, cache_dir).store(first, ["gsm8k"]) == ["gsm8k"]
+
+    # 第二个任务只有math需要执行
+    task = _task(dataset_names=["gsm8k", "math"])
+    cache = ResultCache(task, 2, cache_dir)
+    cached, to_run = cache.plan(["gsm8k", "math"])
+    assert list(cached) == ["gsm8k"] and to_run == ["math"]
+
+    second = tmp_path / "logs" / "eval_2" / "20260102_000000"
+    _write_output(second, "demo", "math", 40.0)
+    cache.link(second, cached)
+
+    collector = ResultCollector(2, tmp_path)
+    assert collector._process_results()["demo"]["gsm8k"]["accuracy"] == 61.5
+    assert sorted(row["dataset"] for row in collector._parse_summary()) == ["gsm8k", "math"]
+    assert json.loads((second / "cache.json").read_text())["gsm8k"]["source_eval_id"] == 1
+
+    # 全部命中时链接到新建的输出目录
+    third = new_timestamp_dir(tmp_path / "logs" / "eval_3")
+    ResultCache(_task(), 3, cache_dir).link(third, ResultCache(_task(), 3, cache_dir).plan(["gsm8k"])[0])
+    assert ResultCollector(3, tmp_path)._process_results()["demo"]["gsm8k"]["accuracy"] == 61.5
+
+
+def test_bypass_and_invalidation(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "eval_result_cache", "on")
+    cache_dir = tmp_path / "cache"
+    output = tmp_path / "out" / "20260101_000000"
+    _write_output(output, "demo", "gsm8k", 61.5)
+    ResultCache(_task(), 1, cache_dir).store(output, ["gsm8k"])
+
+    refresh = ResultCache(_task(eval_config={"cache": "refresh", "dump_eval_details": True}), 2, cache_dir)
+    assert refresh.plan(["gsm8k"]) == ({}, ["gsm8k"])
+    assert ResultCache(_task(eval_config={"cache": "off"}), 2, cache_dir).store(output, ["gsm8k"]) == []
+
+    assert invalidate_cache(model_name="other", cache_dir=cache_dir) == 0
+    assert invalidate_cache(dataset="gsm8k", cache_dir=cache_dir) == 1
+    assert ResultCache(_task(), 3, cache_dir).plan(["gsm8k"]) == ({}, ["gsm8k"])
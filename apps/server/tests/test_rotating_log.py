@@ -0,0 +1,38 @@
+from core.config import settings
+from utils.rotating_log import RotatingLogWriter, open_log_reader
+from utils.log_index import LogIndexWriter, LogIndex
+from utils.log_export import iter_file_blocks
+
+
+def test_rotated_compressed_segments_read_as_one_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "runner_log_compression", "gzip")
+    log_path = tmp_path / "eval_1_20240501_100000.log"
+    writer = RotatingLogWriter(log_path, max_bytes=4096, buffer_bytes=1024, flush_interval=0, fsync_interval=0)
+    index = LogIndexWriter(log_path, flush_lines=100, flush_interval=3600)
+
+    lines = [f"[INFO] step {i} dataset=demo_gsm8k_gen" for i in range(1000)]
+    lines[777] = "[ERROR] CUDA out of memory"
+    for line in lines:
+        data = (line + "\n").encode("utf-8")
+        index.add(line, writer.write(data), len(data))
+    writer.flush()
+    index.flush()
+    writer.close(wait=True)
+
+    # 轮转出的分段已压缩，原文件被删除，当前文件只包含最后一段
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert writer.rotations > 5
+    assert "eval_1_20240501_100000.log.0001.gz" in names
+    assert "eval_1_20240501_100000.log.0001" not in names
+
+    content = "".join(line + "\n" for line in lines).encode("utf-8")
+    assert b"".join(iter_file_blocks(log_path, block_size=1000)) == content
+    with open_log_reader(log_path) as reader:
+        reader.seek(5000)
+        assert reader.read(300) == content[5000:5300]
+        reader.seek(-10, 2)
+        assert reader.read() == content[-10:]
+
+    result = LogIndex(log_path).search("cuda out of memory", context=1)
+    assert [m["line_no"] for m in result["matches"]] == [778]
+    assert result["matches"][0]["before"] == [lines[776]]
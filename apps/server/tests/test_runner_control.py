@@ -0,0 +1,97 @@
+import queue
+import threading
+from types import SimpleNamespace
+from pathlib import Path
+from utils.redis_manager import RedisManager
+from tasks.runners.runner_base import RunnerBase
+from tasks.runners.control_listener import ControlListener
+
+
+def _runner(tmp_path: Path) -> RunnerBase:
+    return RunnerBase(eval_id=42, working_dir=tmp_path)
+
+
+def test_pushed_command_is_applied_once(tmp_path):
+    runner = _runner(tmp_path)
+    message = {"id": "abc", "command": "terminate", "timestamp": 0}
+
+    runner._on_control_command(message)
+    assert runner._apply_control_commands() == "terminated"
+
+    # 同一指令经兜底轮询再次出现时不会重复执行
+    runner._control_queue.put(message)
+    assert runner._apply_control_commands() is None
+
+
+def test_poll_ignores_commands_issued_before_run(tmp_path, monkeypatch):
+    runner = _runner(tmp_path)
+    runner.control_after = 7
+    stale = {"id": "old", "seq": 7, "command": "kill", "timestamp": 50.0}
+    monkeypatch.setattr(RedisManager, "get_control_command", classmethod(lambda cls, eval_id: stale))
+    monkeypatch.setattr(RedisManager, "get_task_status", classmethod(lambda cls, eval_id: {"status": "running"}))
+
+    runner._poll_control()
+    assert runner._apply_control_commands() is None
+
+    # 判断只依据序号，与发送方的时钟无关
+    stale["seq"] = 8
+    runner._poll_control()
+    assert runner._apply_control_commands() == "killed"
+
+
+def test_command_sent_before_runner_starts_is_applied(tmp_path, redis_client, monkeypatch):
+    monkeypatch.setattr(ControlListener, "start", lambda self, wait_ready=2.0: None)
+    RedisManager.send_control_command(42, "terminate")  # 上一次执行遗留的指令
+
+    runner = _runner(tmp_path)
+    runner.control_after = RedisManager.get_control_seq(42)
+    # 派发之后、执行器启动订阅之前发出的终止指令
+    RedisManager.send_control_command(42, "terminate")
+    runner._start_control_listener()
+    runner._poll_control()
+    assert runner._apply_control_commands() == "terminated"
+
+    # 未由执行器设置时以启动监听时的序号为界，遗留指令不再应用
+    late = _runner(tmp_path)
+    late._start_control_listener()
+    late._poll_control()
+    assert late._apply_control_commands() is None
+
+
+def test_supervisor_ends_when_reader_exits_with_full_queue(tmp_path):
+    runner = _runner(tmp_path)
+    runner.eval_id = None
+    runner.output_queue_size = 3
+    runner.supervisor_tick = 0.01
+
+    class _Stdout:
+        lines = iter(["a\n", "b\n", "c\n", "d\n", ""])
+
+        def readline(self):
+            return next(self.lines)
+
+    runner.process = SimpleNamespace(stdout=_Stdout())
+    handled = []
+    runner._handle_output_line = handled.append
+    runner._start_output_reader()
+    # 队列已满时读取线程等待空位放入结束标记；结束标记丢失（读取线程退出）时监督循环也会结束
+    runner._reader_thread.join(timeout=0.2)
+    assert runner._output_queue.full()
+
+    result = []
+    supervisor = threading.Thread(target=lambda: result.append(runner._supervise()), daemon=True)
+    supervisor.start()
+    supervisor.join(timeout=5)
+    assert result == ["eof"]
+    assert handled == ["a\n", "b\n", "c\n", "d\n"]
+
+    lost = _runner(tmp_path)
+    lost.eval_id = None
+    lost.supervisor_tick = 0.01
+    lost._output_queue = queue.Queue(maxsize=2)
+    lost._output_queue.put("x\n")
+    lost._reader_thread = threading.Thread(target=lambda: None)
+    lost._reader_thread.start()
+    lost._reader_thread.join()
+    lost._handle_output_line = lambda line: None
+    assert lost._supervise() == "eof"
@@ -0,0 +1,161 @@
+from types import SimpleNamespace
+from core.config import settings
+from models.eval import EvaluationStatus
+from tasks import task_evaluator, task_dispatcher
+from utils.fair_queue import dispatch_order, load_user_weights
+from utils.redis_manager import RedisManager
+from tasks.task_dispatcher import TaskDispatcher, get_priority
+
+
+def test_dispatch_order_is_weighted_fair_across_users():
+    queues = {"1": ["a1", "a2", "a3", "a4"], "2": ["b1", "b2"], "3": ["c1", "c2", "c3"]}
+    passes = {"1": 0.0, "2": 0.0, "3": 0.0}
+
+    # 用户1集中提交的任务不会挡住其他用户，同一用户的任务按提交顺序
+    assert dispatch_order(passes, queues, {}) == ["a1", "b1", "c1", "a2", "b2", "c2", "a3", "c3", "a4"]
+    # 权重为2的用户每轮派发两个任务
+    assert dispatch_order(passes, queues, {"3": 2.0})[:5] == ["a1", "b1", "c1", "c2", "a2"]
+    assert dispatch_order(passes, queues, {}, until="b2") == ["a1", "b1", "c1", "a2", "b2"]
+
+
+def test_priority_lanes_and_weights_config():
+    assert get_priority({"priority": "interactive"}) == "interactive"
+    assert get_priority({"priority": "urgent"}) == "default"
+    assert get_priority(None) == "default"
+    assert load_user_weights('{"7": 3}') == {"7": 3.0}
+    assert load_user_weights("not json") == {}
+
+
+def test_queue_position_counts_higher_lanes_first(monkeypatch):
+    state = {
+        "lanes": {
+            "interactive": {"passes": {"5": 0.0}, "queues": {"5": ["50"]}},
+            "default": {"passes": {"1": 2.0, "2": 0.0}, "queues": {"1": ["10", "11"], "2": ["20", "21"]}},
+            "batch": {"passes": {}, "queues": {}},
+        },
+        "pending": {eval_id: {"lane": lane, "enqueued_at": 0} for eval_id, lane in
+                    (("50", "interactive"), ("10", "default"), ("11", "default"), ("20", "default"), ("21", "default"))},
+        "inflight": ["1", "2"],
+    }
+    monkeypatch.setattr(RedisManager, "get_dispatch_state", classmethod(lambda cls, lanes: state))
+
+    dispatcher = TaskDispatcher()
+    dispatcher.weights = {}
+    # 用户2的虚拟时间更小，两个任务都排在用户1之前
+    assert dispatcher.queue_position(21)["position"] == 3
+    assert dispatcher.queue_position(10)["position"] == 4
+    assert dispatcher.queue_position(50)["position"] == 1
+    assert dispatcher.queue_position(99) is None
+
+
+LANES = ["interactive", "default", "batch"]
+
+
+def _pop_all(limit=0):
+    picked = []
+    while True:
+        item = RedisManager.pop_dispatch(limit, LANES, {})
+        if item is None:
+            return picked
+        picked.append(item[0])
+
+
+def test_dispatch_script_enforces_limit_and_lane_priority(redis_client):
+    RedisManager.enqueue_dispatch(1, "u1", "batch")
+    RedisManager.enqueue_dispatch(2, "u1", "default")
+    RedisManager.enqueue_dispatch(3, "u2", "interactive")
+    assert not RedisManager.enqueue_dispatch(3, "u2", "interactive")
+
+    # 高优先级通道严格优先，已派发任务数达到上限时不再派发
+    assert _pop_all(limit=2) == [3, 2]
+    assert RedisManager.pop_dispatch(2, LANES, {}) is None
+    assert RedisManager.release_dispatch(3)
+    assert not RedisManager.release_dispatch(3)
+    assert _pop_all(limit=2) == [1]
+    assert set(RedisManager.get_dispatch_inflight()) == {"1", "2"}
+    assert redis_client.hlen(RedisManager.get_dispatch_pending_key()) == 0
+
+
+def test_dispatch_script_starts_new_users_at_lane_clock(redis_client):
+    for eval_id in (11, 12, 13, 14):
+        RedisManager.enqueue_dispatch(eval_id, "1", "default")
+    assert _pop_all(limit=2) == [11, 12]
+
+    # 用户2在用户1已派发两个任务后加入，从通道虚拟时钟开始，不会连续派发积累的配额
+    RedisManager.enqueue_dispatch(21, "2", "default")
+    RedisManager.enqueue_dispatch(22, "2", "default")
+    assert _pop_all() == [21, 13, 22, 14]
+
+
+def test_cancel_script_cleans_up_queue(redis_client):
+    RedisManager.enqueue_dispatch(1, "u1", "default")
+    RedisManager.enqueue_dispatch(2, "u1", "default")
+    users_key = RedisManager.get_dispatch_users_key("default")
+
+    assert RedisManager.cancel_dispatch(1)
+    assert redis_client.lrange(RedisManager.get_dispatch_queue_key("default", "u1"), 0, -1) == ["2"]
+    assert RedisManager.cancel_dispatch(2)
+    assert not RedisManager.cancel_dispatch(2)
+    assert redis_client.zcard(users_key) == 0
+    assert redis_client.hlen(RedisManager.get_dispatch_pending_key()) == 0
+    assert _pop_all() == []
+
+
+def test_reap_releases_leaked_slots(redis_client, fake_db, monkeypatch):
+    for eval_id in (1, 2, 3, 4):
+        RedisManager.enqueue_dispatch(eval_id, "u1", "default")
+    assert _pop_all() == [1, 2, 3, 4]
+    fake_db.evaluations.update({
+        1: SimpleNamespace(status=EvaluationStatus.COMPLETED.value, task_id="t1"),    # 释放名额的调用丢失
+        2: SimpleNamespace(status=EvaluationStatus.PENDING.value, task_id="t2"),      # 消息丢失，从未开始
+        3: SimpleNamespace(status=EvaluationStatus.RUNNING.value, task_id="t3"),      # Worker异常结束
+        4: SimpleNamespace(status=EvaluationStatus.RUNNING.value, task_id="t4"),      # 正常运行中
+    })
+    states = {"t2": "PENDING", "t3": "FAILURE", "t4": "STARTED"}
+    failed = []
+
+    def fail(self, db, eval_id, status, results=None):
+        fake_db.evaluations[eval_id].status = status
+        failed.append(eval_id)
+        RedisManager.release_dispatch(eval_id)
+
+    monkeypatch.setattr(task_evaluator, "db_session", fake_db.session)
+    monkeypatch.setattr(task_evaluator.TaskEvaluator, "_update_task_status", fail)
+    monkeypatch.setattr(task_evaluator.TaskEvaluator, "_update_task_error", lambda self, db, eval_id, error: None)
+    monkeypatch.setattr(task_dispatcher.celery_app, "AsyncResult", lambda task_id: SimpleNamespace(state=states[task_id]))
+
+    dispatcher = TaskDispatcher()
+    # 未超时时只回收已结束的任务
+    assert dispatcher.reap(timeout=3600) == [1]
+    assert sorted(dispatcher.reap(timeout=0)) == [2, 3]
+    assert failed == [2, 3]
+    assert list(RedisManager.get_dispatch_inflight()) == ["4"]
+
+
+def test_reap_fails_sharded_task_with_lost_shard(redis_client, fake_db, monkeypatch):
+    RedisManager.enqueue_dispatch(5, "u1", "default")
+    assert _pop_all() == [5]
+    fake_db.evaluations[5] = SimpleNamespace(status=EvaluationStatus.RUNNING.value, task_id="merge")
+    RedisManager.init_shards(5, [["a"], ["b"]], task_ids=["s0", "s1"])
+    RedisManager.update_shard(5, 0, {"status": "running"})
+    states = {"merge": "PENDING", "s0": "STARTED", "s1": "PENDING"}
+    failed = []
+
+    def fail(self, db, eval_id, status, results=None):
+        fake_db.evaluations[eval_id].status = status
+        failed.append(eval_id)
+        RedisManager.release_dispatch(eval_id)
+
+    monkeypatch.setattr(task_evaluator, "db_session", fake_db.session)
+    monkeypatch.setattr(task_evaluator.TaskEvaluator, "_update_task_status", fail)
+    monkeypatch.setattr(task_evaluator.TaskEvaluator, "_update_task_error", lambda self, db, eval_id, error: None)
+    monkeypatch.setattr(task_dispatcher.celery_app, "AsyncResult", lambda task_id: SimpleNamespace(state=states[task_id]))
+
+    # 分片1尚在Celery队列中等待Worker接收，未超过丢失判定时间
+    monkeypatch.setattr(settings, "eval_shard_lost_timeout", 3600)
+    assert TaskDispatcher().reap(timeout=0) == []
+
+    # 分片任务被撤销：chord不会触发合并，任务标记为失败
+    states["s1"] = "REVOKED"
+    assert TaskDispatcher().reap(timeout=0) == [5]
+    assert failed == [5]
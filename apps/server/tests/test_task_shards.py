@@ -0,0 +1,80 @@
+import csv
+import json
+import threading
+from services.evaluation.result_collector import ResultCollector
+from services.evaluation.shard_merger import ShardResultMerger
+from tasks.task_shards import plan_shards, get_shard_size
+from utils.redis_manager import RedisManager
+from utils.progress_tracker import aggregate_shard_progress
+
+
+def test_plan_shards_splits_by_dataset_count():
+    assert plan_shards('["a", "b", "c"]', 0) == [["a", "b", "c"]]
+    assert plan_shards(["a", "b", "c"], 3) == [["a", "b", "c"]]
+    assert plan_shards(["a", "b", "c", "d", "e"], 2) == [["a", "b"], ["c", "d"], ["e"]]
+    assert get_shard_size({"shard_size": "2"}) == 2
+    assert get_shard_size({"shard_size": None}) == 0
+
+
+def _write_shard_output(shard_dir, timestamp, model, datasets):
+    """模拟一个分片的OpenCompass输出目录"""
+    output = shard_dir / timestamp
+    for dataset in datasets:
+        for name, data in (("results", {"accuracy": 50.0}), ("predictions", {"0": {"prediction": "x"}})):
+            (output / name / model).mkdir(parents=True, exist_ok=True)
+            (output / name / model / f"{dataset}.json").write_text(json.dumps(data))
+    (output / "summary").mkdir(parents=True)
+    with open(output / "summary" / f"summary_{timestamp}.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["dataset", "version", "metric", "mode", model])
+        for dataset in datasets:
+            writer.writerow([dataset, "abc", "accuracy", "gen", "50.00"])
+    (output / "summary" / f"summary_{timestamp}.txt").write_text("\n".join(datasets))
+
+
+def test_merged_output_is_readable_by_result_collector(tmp_path):
+    base = tmp_path / "logs" / "eval_7" / "shards"
+    _write_shard_output(base / "shard_0", "20260101_000000", "demo", ["gsm8k", "math"])
+    _write_shard_output(base / "shard_1", "20260101_000005", "demo", ["mmlu"])
+
+    merged = ShardResultMerger(7, tmp_path).merge([
+        {"shard": 1, "datasets": ["mmlu"], "output_dir": str(base / "shard_1")},
+        {"shard": 0, "datasets": ["gsm8k", "math"], "output_dir": str(base / "shard_0")},
+    ])
+
+    collector = ResultCollector(7, tmp_path)
+    assert collector.timestamp_dir == merged
+    assert sorted(collector._process_results()["demo"]) == ["gsm8k", "math", "mmlu"]
+    assert [row["dataset"] for row in collector._parse_summary()] == ["gsm8k", "math", "mmlu"]
+    assert sorted(item["dataset"] for item in collector._collect_predictions()["demo"]) == ["gsm8k", "math", "mmlu"]
+    assert (merged / "summary" / "shard_1_summary_20260101_000005.txt").exists()
+    assert [item["shard"] for item in json.loads((merged / "shards.json").read_text())] == [0, 1]
+
+
+def test_shard_progress_is_weighted_by_datasets():
+    shards = {
+        0: {"status": "completed", "progress": 80.0, "datasets": ["a", "b", "c"]},
+        1: {"status": "running", "progress": 20.0, "datasets": ["d"]},
+    }
+    assert aggregate_shard_progress(shards) == 80.0
+    shards[1]["status"] = "completed"
+    assert aggregate_shard_progress(shards) == 99.0
+    assert aggregate_shard_progress({}) == 0.0
+
+
+def test_concurrent_shard_updates_do_not_overwrite_each_other(redis_client):
+    RedisManager.init_shards(9, [["a"], ["b"]], task_ids=["s0", "s1"])
+
+    def update(shard_index, field):
+        for i in range(50):
+            RedisManager.update_shard(9, shard_index, {field: i})
+
+    writers = [threading.Thread(target=update, args=args) for args in ((0, "progress"), (0, "position"), (1, "progress"))]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    shards = RedisManager.get_shards(9)
+    assert shards[0]["progress"] == 49 and shards[0]["position"] == 49 and shards[1]["progress"] == 49
+    assert shards[0]["datasets"] == ["a"] and shards[1]["task_id"] == "s1" and shards[0]["status"] == "pending"
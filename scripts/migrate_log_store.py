@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+日志存储迁移脚本
+将Redis中 eval:*:log_data 列表格式的历史日志迁移到 eval:*:log_stream（Redis Streams）
+切换 LOG_BACKEND=stream 前执行一次即可，未迁移的任务仍可按列表格式读取
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# 将服务端源码目录加入模块搜索路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(current_dir), 'apps', 'server', 'src'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将Redis列表日志迁移到Redis Streams')
+    parser.add_argument('--eval-id', type=str, help='只迁移指定评估任务的日志')
+    parser.add_argument('--keep-source', action='store_true', help='迁移后保留原列表数据')
+    args = parser.parse_args()
+
+    load_dotenv()
+    from utils.redis_manager import RedisManager
+
+    delete_source = not args.keep_source
+    if args.eval_id:
+        results = {args.eval_id: RedisManager.migrate_list_logs_to_stream(args.eval_id, delete_source=delete_source)}
+    else:
+        results = RedisManager.migrate_all_list_logs(delete_source=delete_source)
+
+    total = sum(results.values())
+    for eval_id, count in sorted(results.items()):
+        print(f"任务 {eval_id}: 迁移 {count} 行")
+    print(f"\n迁移完成，共 {len(results)} 个任务，{total} 行日志")
+
+
+if __name__ == '__main__':
+    main()